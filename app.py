@@ -1,16 +1,110 @@
+# Copyright (c) 2025 Jaakko Vuori
+import atexit
+import functools
+import hashlib
+import hmac
 import logging
 import os
-import re
 import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
+from time import perf_counter, time
 
-from flask import Flask, g, redirect, render_template, request, url_for
+from flask import (
+    Flask,
+    Response,
+    g,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
+from flask.typing import ResponseReturnValue
+from markupsafe import Markup
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from audit_log import (
+    DEFAULT_BACKUP_COUNT,
+    POLICY_BLOCK,
+    AsyncAuditHandler,
+    AuditFormatter,
+)
+from compression import CompressedStore, compress_response
+from conditional import cache_for, make_etag, not_modified, set_validators
+from db_pool import ConnectionPool, PoolConfig, PoolTimeoutError
+from history import DAY, HOUR, Retention, day_of, hour_of
+from ingest import (
+    CONTENT_TYPES,
+    FORMAT_NDJSON,
+    BatchError,
+    BatchTooLargeError,
+    JsonArrayReader,
+    iter_ndjson,
+    read_batch,
+)
+from leaderboard import (
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    with_percentages,
+)
+from live_updates import FrameSource, LiveUpdates
+from metrics import (
+    CONTENT_TYPE,
+    DB_SECONDS,
+    REGISTRY,
+    RENDER_SECONDS,
+    REQUEST_SECONDS,
+    REQUESTS,
+    VALIDATION_REJECTIONS,
+)
+from profiling import ProfileConfig, ProfilingMiddleware
+from rate_limit import (
+    STORE_MEMORY,
+    STORES,
+    Limit,
+    MemoryBucketStore,
+    RateLimiter,
+    SQLiteBucketStore,
+)
+from render_cache import RenderedPage, VersionedPageCache
+from resp import RespError, RespPool, ServerAddress
+from settings import env_flag, env_float, env_int, env_str
+from setup_db import upgrade_db
+from sharded_counter import ShardCompactor, compact, pending
+from storage import (
+    BACKEND_SQLITE,
+    BACKENDS,
+    RedisStorage,
+    SQLiteStorage,
+    Storage,
+)
+from suggest import MAX_SUGGESTIONS, SuggestIndex
+from validation import (
+    MAX_SURNAME_LENGTH,
+    MIN_SURNAME_LENGTH,
+    SURNAME_HTML_PATTERN,
+    is_valid_surname,  # noqa: F401
+    normalize_surname,
+    rejection_reason,
+)
+from variants import VariantIndex
+from write_behind import (
+    DURABILITY_FLUSH,
+    WriteBehindCounter,
+    register_shutdown_flush,
+)
+
 app = Flask(__name__)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)  # type: ignore[assignment]
 
 
+def get_logs_dir() -> Path:
+    return Path(os.getenv("LOGS_DIR", Path(__file__).parent / "logs"))
+
+
 # Setup audit logging
 def setup_audit_logger() -> logging.Logger:
     """Set up audit logger for user guess submissions."""
@@ -18,102 +112,505 @@ def setup_audit_logger() -> logging.Logger:
     audit_logger.setLevel(logging.INFO)
 
     # Create logs directory if it doesn't exist
-    logs_dir = Path(os.getenv("LOGS_DIR", Path(__file__).parent / "logs"))
+    logs_dir = get_logs_dir()
     logs_dir.mkdir(exist_ok=True)
 
-    # Create file handler for audit log
+    # Records are written to audit.log by a background thread so that
+    # submitting a guess never waits for the disk
     audit_log_path = logs_dir / "audit.log"
-    handler = logging.FileHandler(audit_log_path)
+    handler = AsyncAuditHandler(
+        audit_log_path,
+        queue_size=env_int("AUDIT_QUEUE_SIZE", 10_000),
+        full_policy=env_str("AUDIT_QUEUE_FULL_POLICY", POLICY_BLOCK).lower(),
+        block_timeout=env_float("AUDIT_BLOCK_TIMEOUT", 1.0),
+        max_bytes=env_int("AUDIT_LOG_MAX_BYTES", 10 * 1024 * 1024),
+        rotate_seconds=env_float("AUDIT_LOG_ROTATE_SECONDS", 0),
+        backup_count=env_int("AUDIT_LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT),
+        compress=env_flag("AUDIT_LOG_COMPRESS", default=True),
+    )
     handler.setLevel(logging.INFO)
 
     # Create formatter for audit logs
-    formatter = logging.Formatter("%(asctime)s - %(message)s")
+    formatter = AuditFormatter("%(asctime)s - %(message)s")
     handler.setFormatter(formatter)
 
     # Add handler to logger if not already added
     if not audit_logger.handlers:
         audit_logger.addHandler(handler)
+    else:
+        handler.close()
 
     return audit_logger
 
 
+def audit_log_stats() -> dict[str, int] | None:
+    """Return the audit queue counters, or None without an async handler."""
+    for handler in audit_logger.handlers:
+        if isinstance(handler, AsyncAuditHandler):
+            return handler.stats()
+    return None
+
+
 # Initialize audit logger
 audit_logger = setup_audit_logger()
 
+# Only wrapped when enabled, so that requests pay nothing for profiling
+# otherwise (PROFILE_* are read once, at startup)
+if env_flag("PROFILE"):
+    app.wsgi_app = ProfilingMiddleware(  # type: ignore[assignment]
+        app.wsgi_app,
+        ProfileConfig.from_env(get_logs_dir() / "profiles"),
+    )
+
 
 def log_user_guess(surname: str, client_ip: str) -> None:
     """Log user guess submission for audit purposes."""
     audit_logger.info("%s - %s", client_ip, surname)
 
 
-# Constants for validation
-MIN_SURNAME_LENGTH = 4  # Minimum for game requirements
-MAX_SURNAME_LENGTH = 50
+def log_user_guesses(guesses: dict[str, int], client_ip: str) -> None:
+    """Log a batch of guesses as one record, written as a line per guess."""
+    audit_logger.info("%s - ", client_ip, extra={"guesses": guesses})
 
 
-# Length constraints based on data analysis
-MIN_SURNAME_LENGTH = 6
-MAX_SURNAME_LENGTH = 15
+# Define the directory for the database, configurable via environment variable
+# Defaults to a 'data' subdirectory in the app's root if not set.
+def get_database_path() -> Path:
+    """Get the database path, allowing for runtime environment variable changes."""
+    database_dir = Path(os.getenv("DATABASE_DIR", Path(__file__).parent / "data"))
+    return database_dir / "ben.db"
 
 
-def is_valid_surname(surname: str) -> bool:
-    """Validate a surname based on real Lintukoto data analysis.
+_pool_lock = threading.Lock()
+# Pools inherited from a parent process. SQLite connections must not be used,
+# or even closed, across fork(), so they are kept alive but never touched.
+_inherited_pools: list[ConnectionPool] = []
 
-    - Must start with 'z', 's', 't', or 'c' (covers ~99.6% of valid submissions)
-    - Length 6-15 characters (filters out obvious test words)
-    - Only letters (including Nordic letters)
 
-    This approach is simple, effective, and based on actual user submission patterns.
+def get_pool() -> ConnectionPool:
+    """Return this process's connection pool for the current database path.
+
+    The pool is configured through DB_POOL_SIZE, DB_POOL_TIMEOUT_MS,
+    DB_JOURNAL_MODE, DB_BUSY_TIMEOUT_MS, DB_SYNCHRONOUS, DB_CACHE_SIZE_KIB,
+    DB_MMAP_SIZE and DB_STATEMENT_CACHE. The schema is brought up to date when a pool is
+    created.
     """
+    database_path = get_database_path()
+    pool = app.extensions.get("db_pool")
     if (
-        not surname
-        or len(surname) < MIN_SURNAME_LENGTH
-        or len(surname) > MAX_SURNAME_LENGTH
+        pool is not None
+        and pool.database_path == database_path
+        and pool.pid == os.getpid()
     ):
-        return False
+        return pool
+    with _pool_lock:
+        pool = app.extensions.get("db_pool")
+        if pool is not None and pool.pid != os.getpid():
+            _inherited_pools.append(pool)
+            pool = None
+        if pool is None or pool.database_path != database_path:
+            if pool is not None:
+                pool.close()
+            pool = ConnectionPool(database_path, PoolConfig.from_env())
+            writer = pool.acquire_writer()
+            try:
+                upgrade_db(writer)
+            finally:
+                pool.release_writer(writer)
+            app.extensions["db_pool"] = pool
+    return pool
 
-    # Convert to lowercase for checking
-    surname_lower = surname.lower()
 
-    # Must start with z, s, t, or c (covers 99.6% of real submissions)
-    if not surname_lower.startswith(("z", "s", "t", "c")):
-        return False
+def close_pool() -> None:
+    pool = app.extensions.pop("db_pool", None)
+    if pool is not None:
+        pool.close()
 
-    # Check if only letters (including Nordic letters and accented y)
-    return bool(re.match(r"^[a-zA-ZäöåÄÖÅüÜýÝÿŸ]+$", surname))
 
-
-# Define the directory for the database, configurable via environment variable
-# Defaults to a 'data' subdirectory in the app's root if not set.
-def get_database_path():
-    """Get the database path, allowing for runtime environment variable changes."""
-    database_dir = Path(os.getenv("DATABASE_DIR", Path(__file__).parent / "data"))
-    return database_dir / "ben.db"
+atexit.register(close_pool)
 
 
-def get_db():
+def get_db() -> sqlite3.Connection:
+    """Return a pooled connection for reading, held until the request ends."""
     db = getattr(g, "_database", None)
     if db is None:
-        database_path = get_database_path()
-        db = g._database = sqlite3.connect(database_path)
-        db.row_factory = sqlite3.Row  # Allows accessing columns by name
+        db = g._database = get_pool().acquire_reader()
+    return db
+
+
+@app.errorhandler(PoolTimeoutError)
+def pool_exhausted(error: PoolTimeoutError) -> ResponseReturnValue:
+    """Answer 503 when no reader connection became free in time."""
+    app.logger.warning("%s", error)
+    return (
+        "Palvelu on ruuhkautunut, yritä hetken päästä uudelleen.",
+        503,
+        {"Retry-After": "1"},
+    )
+
+
+def get_write_db() -> sqlite3.Connection:
+    """Return the pooled writer connection, held until the request ends."""
+    db = getattr(g, "_write_database", None)
+    if db is None:
+        # A request-scoped slot on g, named like _database above
+        db = g._write_database = get_pool().acquire_writer()  # noqa: SLF001
     return db
 
 
+@functools.cache
+def template_fingerprint(*names: str) -> tuple[str, float]:
+    """Return a digest of the templates' sources and their latest mtime."""
+    digest = hashlib.sha256()
+    mtime = 0.0
+    for name in names:
+        source, filename, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+        digest.update(source.encode())
+        if filename:
+            mtime = max(mtime, Path(filename).stat().st_mtime)
+    return digest.hexdigest(), mtime
+
+
 @app.teardown_appcontext
-def close_connection(exception):
-    db = getattr(g, "_database", None)
-    if db is not None:
+def close_connection(_exception: BaseException | None) -> None:
+    pool = app.extensions.get("db_pool")
+    db = g.pop("_database", None)
+    if db is not None and pool is not None:
+        pool.release_reader(db)
+    write_db = g.pop("_write_database", None)
+    if write_db is not None and pool is not None:
+        pool.release_writer(write_db)
+
+
+def get_write_behind() -> WriteBehindCounter | None:
+    """Return the write-behind guess counter, or None if the mode is disabled.
+
+    Enabled with WRITE_BEHIND=1, with the SQLite storage backend only.
+    Buffered guesses are flushed every
+    WRITE_BEHIND_INTERVAL seconds or once WRITE_BEHIND_MAX_PENDING guesses
+    are waiting. WRITE_BEHIND_DURABILITY is one of none, flush or fsync.
+    """
+    if not env_flag("WRITE_BEHIND") or storage_backend() != BACKEND_SQLITE:
+        return None
+    counter = app.extensions.get("write_behind")
+    if counter is None:
+        journal_dir = Path(
+            env_str("WRITE_BEHIND_JOURNAL_DIR", str(get_database_path().parent)),
+        )
+        counter = WriteBehindCounter(
+            get_pool().connect,
+            journal_dir,
+            flush_interval=env_float("WRITE_BEHIND_INTERVAL", 1.0),
+            max_pending=env_int("WRITE_BEHIND_MAX_PENDING", 1000),
+            durability=env_str("WRITE_BEHIND_DURABILITY", DURABILITY_FLUSH),
+        )
+        counter.recover()
+        register_shutdown_flush(counter)
+        app.extensions["write_behind"] = counter
+    return counter
+
+
+def get_compressed_store() -> CompressedStore | None:
+    """Return the store of compressed bodies, or None if it is disabled.
+
+    COMPRESSION_CACHE_BYTES bounds the total size of the stored bodies;
+    0 disables the store, so that every response is compressed afresh.
+    """
+    max_bytes = env_int("COMPRESSION_CACHE_BYTES", 16 * 1024 * 1024)
+    if max_bytes <= 0:
+        return None
+    store = app.extensions.get("compressed_store")
+    if store is None or store.max_bytes != max_bytes:
+        store = app.extensions["compressed_store"] = CompressedStore(max_bytes)
+    return store
+
+
+def default_max_streams() -> int:
+    """Return how many live streams a worker holds open by default.
+
+    Each held stream occupies one of the worker's WEB_THREADS threads, so
+    only half of them are given to streams and the rest stay free for
+    page and API requests. A single-threaded worker holds none.
+    """
+    return max(env_int("WEB_THREADS", 4), 1) // 2
+
+
+def get_live_updates() -> LiveUpdates | None:
+    """Return the live leaderboard poller, or None if LIVE_UPDATES=0.
+
+    LIVE_UPDATES_INTERVAL is the seconds between polls of the guess events,
+    LIVE_UPDATES_HOLD how long a stream is held open and
+    LIVE_UPDATES_MAX_STREAMS how many streams each process holds at once,
+    by default half of its WEB_THREADS (see default_max_streams).
+    """
+    if not env_flag("LIVE_UPDATES", default=True):
+        return None
+    live = app.extensions.get("live_updates")
+    if live is None:
+        live = app.extensions["live_updates"] = LiveUpdates(
+            poller_storage,
+            interval=env_float("LIVE_UPDATES_INTERVAL", 1.0),
+            hold=env_float("LIVE_UPDATES_HOLD", 25.0),
+            max_streams=env_int("LIVE_UPDATES_MAX_STREAMS", default_max_streams()),
+        )
+    return live
+
+
+@contextmanager
+def poller_storage() -> Iterator[FrameSource]:
+    """Give the live updates poller thread the storage to read events from.
+
+    With SQLite the poller reads through a connection of its own, since the
+    pooled ones belong to requests; a RedisStorage is shared as it is.
+    """
+    if storage_backend() != BACKEND_SQLITE:
+        yield get_storage()
+        return
+    db = get_pool().connect()
+    try:
+        yield SQLiteStorage(lambda: db, lambda: db)
+    finally:
         db.close()
 
 
+def get_rate_limiter() -> RateLimiter | None:
+    """Return the /submit rate limiter, or None if RATE_LIMIT=0.
+
+    Each client IP gets RATE_LIMIT_BURST guesses at once, refilled at
+    RATE_LIMIT_PER_SECOND. With RATE_LIMIT_SUBNET=1 each subnet also gets
+    RATE_LIMIT_SUBNET_BURST at RATE_LIMIT_SUBNET_PER_SECOND.
+    RATE_LIMIT_STORE is memory (per process, the default) or sqlite (limits
+    shared by all worker processes through RATE_LIMIT_DATABASE, at the cost
+    of a write transaction per guess); at most RATE_LIMIT_MAX_BUCKETS
+    buckets are kept.
+    """
+    if not env_flag("RATE_LIMIT", default=True):
+        return None
+    limiter = app.extensions.get("rate_limiter")
+    if limiter is None:
+        store_name = env_str("RATE_LIMIT_STORE", STORE_MEMORY).lower()
+        if store_name not in STORES:
+            msg = f"RATE_LIMIT_STORE must be one of {', '.join(STORES)}"
+            raise ValueError(msg)
+        max_keys = env_int("RATE_LIMIT_MAX_BUCKETS", 100_000)
+        if store_name == STORE_MEMORY:
+            store = MemoryBucketStore(max_keys)
+        else:
+            database = env_str(
+                "RATE_LIMIT_DATABASE",
+                str(get_database_path().parent / "ratelimit.db"),
+            )
+            store = SQLiteBucketStore(Path(database), max_keys)
+        limiter = app.extensions["rate_limiter"] = RateLimiter(
+            store,
+            ip_limit=Limit(
+                rate=env_float("RATE_LIMIT_PER_SECOND", 1.0),
+                burst=env_float("RATE_LIMIT_BURST", 20),
+            ),
+            subnet_limit=(
+                Limit(
+                    rate=env_float("RATE_LIMIT_SUBNET_PER_SECOND", 5.0),
+                    burst=env_float("RATE_LIMIT_SUBNET_BURST", 100),
+                )
+                if env_flag("RATE_LIMIT_SUBNET", default=False)
+                else None
+            ),
+        )
+    return limiter
+
+
+@app.before_request
+def start_timer() -> None:
+    g.request_started = perf_counter()
+
+
+# Registered before compress, so that it runs after it
+@app.after_request
+def record_request(response: Response) -> Response:
+    """Count the request and observe its latency for /metrics."""
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUESTS.inc(route, request.method, str(response.status_code))
+        REQUEST_SECONDS.observe(perf_counter() - started, route)
+    return response
+
+
+@app.after_request
+def compress(response: Response) -> Response:
+    """Compress responses with gzip or brotli, unless COMPRESSION=0."""
+    if not env_flag("COMPRESSION", default=True):
+        return response
+    return compress_response(
+        request,
+        response,
+        get_compressed_store(),
+        env_int("COMPRESSION_MIN_BYTES", 1024),
+        g.get("compressed_body_key"),
+    )
+
+
+def counter_shards() -> int:
+    """Return the counter slots per surname, or 0 unless COUNTER_SHARDS > 1."""
+    shards = env_int("COUNTER_SHARDS", 0)
+    return shards if shards > 1 else 0
+
+
+def get_shard_compactor() -> ShardCompactor | None:
+    """Return the counter slot compactor, or None unless COUNTER_SHARDS > 1.
+
+    With COUNTER_SHARDS=N every surname has N counter slots, folded back
+    into guesses every COUNTER_COMPACT_INTERVAL seconds.
+    """
+    if not counter_shards():
+        return None
+    compactor = app.extensions.get("shard_compactor")
+    if compactor is None:
+        compactor = app.extensions["shard_compactor"] = ShardCompactor(
+            get_pool().connect,
+            interval=env_float("COUNTER_COMPACT_INTERVAL", 5.0),
+        )
+    compactor.start()
+    return compactor
+
+
+def get_variant_index() -> VariantIndex:
+    """Return this process's closest-variant index for the current storage.
+
+    The index is built on first use and then only reads the guess events
+    published since, so every worker keeps up with the variants any of them
+    inserts.
+    """
+    location = get_storage().location
+    index = app.extensions.get("variant_index")
+    if index is None or index.location != location:
+        index = app.extensions["variant_index"] = VariantIndex(location)
+    return index
+
+
+def get_suggest_index() -> SuggestIndex:
+    """Return this process's prefix suggestion index for the current storage."""
+    location = get_storage().location
+    index = app.extensions.get("suggest_index")
+    if index is None or index.location != location:
+        index = app.extensions["suggest_index"] = SuggestIndex(location)
+    return index
+
+
+def storage_backend() -> str:
+    backend = env_str("STORAGE_BACKEND", BACKEND_SQLITE).lower()
+    if backend not in BACKENDS:
+        msg = f"STORAGE_BACKEND must be one of {', '.join(BACKENDS)}"
+        raise ValueError(msg)
+    return backend
+
+
+def get_storage() -> Storage:
+    """Return the storage the guess counts are read from and written to.
+
+    STORAGE_BACKEND=sqlite (the default) uses ben.db through this request's
+    pooled connections. STORAGE_BACKEND=redis uses the Redis-protocol server
+    at REDIS_URL, shared by every node, through a pool of at most
+    REDIS_MAX_CONNECTIONS connections per process; REDIS_PREFIX namespaces
+    its keys.
+    """
+    if storage_backend() == BACKEND_SQLITE:
+        return SQLiteStorage(
+            get_db,
+            get_write_db,
+            counter_shards(),
+            location=str(get_database_path()),
+        )
+    storage = app.extensions.get("storage")
+    if storage is None:
+        pool = RespPool(
+            ServerAddress.from_url(env_str("REDIS_URL", "redis://127.0.0.1:6379/0")),
+            max_connections=max(env_int("REDIS_MAX_CONNECTIONS", 8), 1),
+            timeout=env_float("REDIS_TIMEOUT", 5.0),
+        )
+        storage = app.extensions["storage"] = RedisStorage(
+            pool,
+            prefix=env_str("REDIS_PREFIX", "ben:"),
+        )
+    return storage
+
+
+def get_write_storage() -> Storage:
+    """Return the storage for adding guesses, with the slot compactor running.
+
+    The compactor is started by the first write to the counter slots rather
+    than by any use of the storage, so that reads and /health start nothing.
+    """
+    storage = get_storage()
+    if isinstance(storage, SQLiteStorage) and storage.shards:
+        get_shard_compactor()
+    return storage
+
+
+def increment_guess(surname: str) -> None:
+    """Count one guess for the surname, directly or through write-behind."""
+    counter = get_write_behind()
+    if counter is not None:
+        counter.add(surname)
+        return
+
+    storage = get_write_storage()
+    with DB_SECONDS.time("submit_guess", "query"):
+        storage.increment({surname: 1})
+    with DB_SECONDS.time("submit_guess", "commit"):
+        storage.commit()
+
+
+def render(template_name: str, **context: object) -> str:
+    """Render a template, timing it for /metrics."""
+    with RENDER_SECONDS.time(template_name):
+        return render_template(template_name, **context)
+
+
 @app.route("/")
-def index():
-    return render_template("index.html")
+def index() -> ResponseReturnValue:
+    # The page only changes with the template (and the URL prefix)
+    digest, last_modified = template_fingerprint("index.html")
+    etag = make_etag("index", digest, request.script_root)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+
+    response = app.make_response(
+        render(
+            "index.html",
+            surname_pattern=SURNAME_HTML_PATTERN,
+            min_length=MIN_SURNAME_LENGTH,
+            max_length=MAX_SURNAME_LENGTH,
+        ),
+    )
+    return set_validators(response, etag, last_modified)
+
+
+def audit_client_ip() -> str:
+    """Return the client IP recorded in the audit log."""
+    client_ip = request.environ.get("HTTP_X_FORWARDED_FOR", request.remote_addr)
+    if client_ip and "," in client_ip:
+        # If multiple IPs in X-Forwarded-For, take the first one (original client)
+        client_ip = client_ip.split(",")[0].strip()
+    return client_ip or "unknown"
 
 
 @app.route("/submit", methods=["POST"])
-def submit_guess():
+def submit_guess() -> ResponseReturnValue:
+    # Throttle before anything is validated, logged or written. The limit is
+    # keyed by the address ProxyFix trusts rather than the first
+    # X-Forwarded-For entry, which the client can set to anything.
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        decision = limiter.check(request.remote_addr or "unknown")
+        if not decision.allowed:
+            return (
+                "Liian monta arvausta, yritä hetken päästä uudelleen.",
+                429,
+                {"Retry-After": decision.retry_after_header},
+            )
+
     # Get the surname from form data
     raw_surname = request.form.get("surname", "").strip()
 
@@ -121,99 +618,511 @@ def submit_guess():
     surname = raw_surname.split()[0] if raw_surname else ""
 
     # Server-side validation: check if surname contains only letters
-    if not is_valid_surname(surname):
+    reason = rejection_reason(surname)
+    if reason is not None:
         # Redirect back to index if validation fails
+        VALIDATION_REJECTIONS.inc(reason)
         return redirect(url_for("index"))
 
     # Normalize to lowercase for database operations (consistent with parser)
-    surname_normalized = surname.lower()
-
-    # Get client IP for audit logging
-    client_ip = request.environ.get("HTTP_X_FORWARDED_FOR", request.remote_addr)
-    if client_ip and "," in client_ip:
-        # If multiple IPs in X-Forwarded-For, take the first one (original client)
-        client_ip = client_ip.split(",")[0].strip()
+    surname_normalized = normalize_surname(surname)
 
     # Log the guess for audit purposes
-    log_user_guess(surname_normalized, client_ip or "unknown")
+    log_user_guess(surname_normalized, audit_client_ip())
+
+    increment_guess(surname_normalized)
 
-    db = get_db()
-    cursor = db.cursor()
+    # Redirect to results page, passing the normalized surname for highlighting
+    return redirect(url_for("results", highlight=surname_normalized))
 
-    cursor.execute("SELECT count FROM guesses WHERE surname = ?", (surname_normalized,))
-    row = cursor.fetchone()
 
-    if row:
-        new_count = row["count"] + 1
-        cursor.execute(
-            "UPDATE guesses SET count = ? WHERE surname = ?",
-            (new_count, surname_normalized),
-        )
-    else:
-        cursor.execute(
-            "INSERT INTO guesses (surname, count) VALUES (?, ?)",
-            (surname_normalized, 1),
-        )
+ROWS_PLACEHOLDER = "<!-- leaderboard rows -->"
+ROW_SEPARATOR = "\x00"
 
-    db.commit()
+# Rows per page of /api/results and of incremental loading on /results
+API_PAGE_SIZE = 100
 
-    # Redirect to results page, passing the normalized surname for highlighting
-    return redirect(url_for("results", highlight=surname_normalized))
+
+def render_result_rows(
+    guesses: list[dict],
+    highlight_surname: str | None = None,
+) -> list[str]:
+    """Render leaderboard table rows and return one fragment per row."""
+    rendered = render(
+        "_result_rows.html",
+        guesses=guesses,
+        highlight_surname=highlight_surname,
+        row_separator=ROW_SEPARATOR,
+    )
+    return rendered.split(ROW_SEPARATOR)[: len(guesses)]
+
+
+def build_results_page(initial_rows: int) -> RenderedPage:
+    """Query the leaderboard and render it with no row highlighted.
+
+    With initial_rows > 0 only that many top rows are rendered and the page
+    loads the rest from /api/results as the user scrolls.
+    """
+    with DB_SECONDS.time("results", "query"):
+        # Read before the rows, so that the live stream replays any event the
+        # page already shows rather than missing one; frames carry absolute
+        # counts, so a replay is harmless
+        storage = get_storage()
+        events_since = storage.latest_event_id()
+        leaderboard = storage.read_page(initial_rows or None)
+    top_guesses = leaderboard.rows
+    total_variations = leaderboard.total_variations
+
+    guesses_with_percentages = with_percentages(top_guesses, leaderboard.total_count)
+    next_cursor = None
+    if initial_rows and len(top_guesses) < total_variations:
+        next_cursor = encode_cursor(top_guesses[-1])
+
+    page = render(
+        "results.html",
+        rows_html=Markup(ROWS_PLACEHOLDER),  # noqa: S704
+        total_variations=total_variations,
+        next_cursor=next_cursor,
+        page_size=API_PAGE_SIZE,
+        events_since=events_since,
+    )
+    head, tail = page.split(ROWS_PLACEHOLDER)
+    fragments = render_result_rows(guesses_with_percentages)
+    return RenderedPage.from_fragments(
+        leaderboard.version,
+        head,
+        tail,
+        guesses_with_percentages,
+        fragments,
+        variant=initial_rows,
+        updated_at=leaderboard.updated_at,
+    )
+
+
+results_cache = VersionedPageCache(build_results_page)
 
 
 @app.route("/results")
-def results():
+def results() -> ResponseReturnValue:
     highlight_surname = request.args.get("highlight")
-    db = get_db()
-    cursor = db.cursor()
 
-    # Get all guesses ordered by count
-    cursor.execute(
-        "SELECT surname, count FROM guesses ORDER BY count DESC, surname ASC",
+    # Read-your-writes: make sure the guess we are about to highlight has
+    # reached the database, flushing the whole write-behind batch with it
+    counter = get_write_behind()
+    if highlight_surname and counter is not None and counter.pending(highlight_surname):
+        counter.flush()
+    # Likewise for a guess in the counter slots, which moves the data version
+    # only once it is folded: fold the slots of the highlighted surname
+    storage = get_storage()
+    if (
+        highlight_surname
+        and isinstance(storage, SQLiteStorage)
+        and storage.shards > 1
+        and pending(get_db(), highlight_surname)
+    ):
+        compact(get_write_db(), highlight_surname)
+
+    # RESULTS_INITIAL_ROWS > 0 renders only the top rows (incremental mode)
+    initial_rows = env_int("RESULTS_INITIAL_ROWS", 0)
+
+    # Answer revalidation from the data version alone, before the
+    # leaderboard is queried or rendered
+    with DB_SECONDS.time("results", "query"):
+        version, updated_at = storage.data_modified()
+    digest, template_mtime = template_fingerprint("results.html", "_result_rows.html")
+    last_modified = max(updated_at, template_mtime)
+
+    def results_etag(version: int, highlight: str | None = highlight_surname) -> str:
+        return make_etag(
+            "results",
+            storage.name,
+            version,
+            highlight or "",
+            initial_rows,
+            digest,
+            request.script_root,
+        )
+
+    cached = not_modified(request, results_etag(version), last_modified)
+    if cached is not None:
+        return cached
+
+    page = results_cache.get(version, initial_rows)
+    # A highlighted row that is not on the page leaves the body as it is, so
+    # such pages share the compressed copy of the plain one
+    shown = highlight_surname if highlight_surname in page.offsets else None
+    g.compressed_body_key = results_etag(page.version, shown)
+    response = app.make_response(
+        page.render(
+            highlight_surname,
+            lambda guess: render_result_rows([guess], highlight_surname)[0],
+        ),
+    )
+    # The cached page may be newer than the version read above: describe
+    # the page that is sent, not the version the lookup asked for
+    return set_validators(
+        response,
+        results_etag(page.version),
+        max(page.updated_at, template_mtime),
     )
-    all_guesses = cursor.fetchall()
-
-    # Count total number of different variations
-    cursor.execute("SELECT COUNT(*) as total_variations FROM guesses")
-    total_variations = cursor.fetchone()["total_variations"]
-
-    # Calculate total count for percentage calculations
-    cursor.execute("SELECT SUM(count) as total_count FROM guesses")
-    total_count = cursor.fetchone()["total_count"]
-
-    # Add percentage to each guess
-    guesses_with_percentages = []
-    for guess in all_guesses:
-        percentage = (guess["count"] / total_count * 100) if total_count > 0 else 0
-        guesses_with_percentages.append(
-            {
-                "surname": guess["surname"],
-                "count": guess["count"],
-                "percentage": round(percentage, 2),
-            },
+
+
+@app.route("/results/stream")
+def results_stream() -> ResponseReturnValue:
+    """Stream leaderboard changes as Server-Sent Events.
+
+    The stream starts after the guess event given by the Last-Event-ID
+    header, which browsers send when they reconnect, or by ``since``, which
+    /results embeds in the page. Without either it starts from now.
+    """
+    live = get_live_updates()
+    if live is None:
+        return {"error": "live updates are disabled"}, 404
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(since) if since else get_storage().latest_event_id()
+    except ValueError:
+        return {"error": "invalid event id"}, 400
+
+    response = Response(live.stream(since), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    # Tell nginx not to buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/api/results")
+def api_results() -> ResponseReturnValue:
+    """Return one page of the leaderboard as JSON.
+
+    Pages use keyset pagination: pass the ``next`` or ``prev`` cursor of a
+    previous response as ``after`` or ``before``. With ``around=<surname>``
+    the page containing that surname is returned, centred on it.
+    """
+    try:
+        limit = int(request.args.get("limit", API_PAGE_SIZE))
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        after = request.args.get("after")
+        before = request.args.get("before")
+        after_key = decode_cursor(after) if after else None
+        before_key = decode_cursor(before) if before else None
+    except ValueError:
+        return {"error": "invalid pagination parameters"}, 400
+    around = normalize_surname(request.args.get("around", ""))
+
+    with DB_SECONDS.time("api_results", "query"):
+        page = get_storage().page(
+            limit,
+            after=after_key,
+            before=before_key,
+            around=around,
         )
+    if page is None:
+        return {"error": "unknown surname"}, 404
 
-    return render_template(
-        "results.html",
-        guesses=guesses_with_percentages,
-        highlight_surname=highlight_surname,
-        total_variations=total_variations,
+    rows = page.rows
+    return {
+        "rows": with_percentages(rows, page.total_count),
+        "prev": encode_cursor(rows[0]) if page.has_prev and rows else None,
+        "next": encode_cursor(rows[-1]) if page.has_next and rows else None,
+        "total_variations": page.total_variations,
+        "total_count": page.total_count,
+        "version": page.version,
+    }
+
+
+# Default and maximum number of variants returned by /api/variants
+VARIANTS_LIMIT = 5
+MAX_VARIANTS_LIMIT = 50
+
+
+@app.route("/api/variants")
+def api_variants() -> ResponseReturnValue:
+    """Return the known variants closest to a surname as JSON.
+
+    Variants one edit (Damerau-Levenshtein distance 1) away are listed, most
+    guessed first, up to ``limit``; if there are fewer than ``limit`` of
+    them, those two edits away follow. The surname itself is left out.
+    """
+    surname = request.args.get("surname", "").strip()
+    if rejection_reason(surname) is not None:
+        return {"error": "invalid surname"}, 400
+    try:
+        limit = int(request.args.get("limit", VARIANTS_LIMIT))
+    except ValueError:
+        return {"error": "invalid limit"}, 400
+    limit = min(max(limit, 1), MAX_VARIANTS_LIMIT)
+    surname = normalize_surname(surname)
+
+    storage = get_storage()
+    index = get_variant_index()
+    with DB_SECONDS.time("variants", "query"):
+        index.refresh(storage)
+    distances = dict(index.closest(surname, wanted=limit))
+    # Counts are read from the storage, which also leaves out any variant
+    # deleted since it was indexed
+    with DB_SECONDS.time("variants", "query"):
+        counts = storage.counts(list(distances))
+    variants = sorted(
+        (
+            {"surname": variant, "count": count, "distance": distances[variant]}
+            for variant, count in counts.items()
+        ),
+        key=lambda variant: (
+            variant["distance"],
+            -variant["count"],
+            variant["surname"],
+        ),
+    )
+    return {"surname": surname, "variants": variants[:limit]}
+
+
+# Default number of suggestions returned by /api/suggest
+SUGGEST_LIMIT = 8
+
+
+@app.route("/api/suggest")
+def api_suggest() -> ResponseReturnValue:
+    """Return the most guessed variants starting with a prefix as JSON.
+
+    The index.html form asks for suggestions on every keystroke, so
+    responses are compact and clients may reuse them for SUGGEST_MAX_AGE
+    seconds. The ETag is derived from the suggestions, so an answer that
+    has not changed is revalidated with a 304.
+    """
+    prefix = normalize_surname(request.args.get("q", "").strip())
+    if not prefix or len(prefix) > MAX_SURNAME_LENGTH:
+        return {"error": "invalid prefix"}, 400
+    try:
+        limit = int(request.args.get("limit", SUGGEST_LIMIT))
+    except ValueError:
+        return {"error": "invalid limit"}, 400
+    limit = min(max(limit, 1), MAX_SUGGESTIONS)
+
+    index = get_suggest_index()
+    with DB_SECONDS.time("suggest", "query"):
+        index.refresh(get_storage())
+    suggestions = index.suggest(prefix, limit)
+
+    etag = make_etag("suggest", prefix, limit, suggestions)
+    response = not_modified(request, etag, None) or app.make_response(
+        {"q": prefix, "suggestions": suggestions},
+    )
+    return cache_for(response, etag, env_int("SUGGEST_MAX_AGE", 30))
+
+
+# Defaults of /api/trending: the top surnames of the last TRENDING_HOURS
+# hours, and guess totals per hour and per day
+TRENDING_HOURS = 24
+TRENDING_DAYS = 7
+TRENDING_LIMIT = 10
+MAX_TRENDING_LIMIT = 100
+
+
+@app.route("/api/trending")
+def api_trending() -> ResponseReturnValue:
+    """Return the most guessed surnames and guesses per hour and day as JSON.
+
+    Everything is read from the hourly and daily history buckets. ``hours``
+    and ``days`` include the current, partial hour and day, and are capped
+    at the HISTORY_HOURS and HISTORY_DAYS retention. Hours and days are
+    given as the UTC epoch seconds they start at, oldest first.
+    """
+    retention = Retention.from_env()
+    try:
+        hours = int(request.args.get("hours", TRENDING_HOURS))
+        days = int(request.args.get("days", TRENDING_DAYS))
+        limit = int(request.args.get("limit", TRENDING_LIMIT))
+    except ValueError:
+        return {"error": "invalid parameters"}, 400
+    hours = min(max(hours, 1), retention.hours)
+    days = min(max(days, 1), retention.days)
+    limit = min(max(limit, 1), MAX_TRENDING_LIMIT)
+
+    now = time()
+    first_hour = hour_of(now) - (hours - 1) * HOUR
+    first_day = day_of(now) - (days - 1) * DAY
+    with DB_SECONDS.time("trending", "query"):
+        trending = get_storage().trending(first_hour, first_day, limit)
+
+    data = {
+        "hours": hours,
+        "days": days,
+        "top": [
+            {"surname": surname, "count": count} for surname, count in trending.top
+        ],
+        "per_hour": [
+            {"hour": hour, "count": trending.per_hour.get(hour, 0)}
+            for hour in range(first_hour, first_hour + hours * HOUR, HOUR)
+        ],
+        "per_day": [
+            {"day": day, "count": trending.per_day.get(day, 0)}
+            for day in range(first_day, first_day + days * DAY, DAY)
+        ],
+    }
+    etag = make_etag("trending", data)
+    response = not_modified(request, etag, None) or app.make_response(data)
+    return cache_for(response, etag, env_int("TRENDING_MAX_AGE", 60))
+
+
+def ingest_tokens() -> list[str]:
+    """Return the bearer tokens accepted by /api/guesses/batch (INGEST_TOKENS)."""
+    return [token for token in env_str("INGEST_TOKENS", "").split(",") if token]
+
+
+def is_authorized(tokens: list[str]) -> bool:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    # Compare with every token, so that the time taken does not tell which
+    # one was close
+    matches = [hmac.compare_digest(token.encode(), t.encode()) for t in tokens]
+    return any(matches)
+
+
+@app.route("/api/guesses/batch", methods=["POST"])
+def api_guesses_batch() -> ResponseReturnValue:
+    """Add a batch of guesses collected elsewhere, such as at a kiosk.
+
+    The body is a JSON array or NDJSON of surnames, [surname, count] pairs
+    or {"surname", "count"} objects (see ingest.py), sent with a bearer
+    token from INGEST_TOKENS. It is read as a stream and the valid items
+    are added in one transaction; invalid items are skipped, and the first
+    of them reported by index. A malformed body, or one of more than
+    INGEST_MAX_ITEMS items or INGEST_MAX_GUESSES guesses, is rejected whole.
+    """
+    tokens = ingest_tokens()
+    if not tokens:
+        return {"error": "batch ingestion is disabled"}, 404
+    if not is_authorized(tokens):
+        return {"error": "unauthorized"}, 401, {"WWW-Authenticate": "Bearer"}
+    body_format = CONTENT_TYPES.get(request.mimetype)
+    if body_format is None:
+        return {"error": f"use one of {', '.join(CONTENT_TYPES)}"}, 415
+
+    stream = request.stream
+    items = (
+        iter_ndjson(stream) if body_format == FORMAT_NDJSON else JsonArrayReader(stream)
     )
+    try:
+        batch = read_batch(
+            items,
+            max_items=env_int("INGEST_MAX_ITEMS", 100_000),
+            max_count=env_int("INGEST_MAX_COUNT", 1000),
+            max_guesses=env_int("INGEST_MAX_GUESSES", 100_000),
+        )
+    except BatchTooLargeError as e:
+        return {"error": str(e)}, 413
+    except BatchError as e:
+        return {"error": str(e)}, 400
+    for reason, count in batch.reasons.items():
+        VALIDATION_REJECTIONS.inc(reason, amount=count)
+
+    if batch.counts:
+        log_user_guesses(batch.counts, audit_client_ip())
+        storage = get_write_storage()
+        with DB_SECONDS.time("guesses_batch", "query"):
+            storage.increment(batch.counts)
+        with DB_SECONDS.time("guesses_batch", "commit"):
+            storage.commit()
+
+    return {
+        "items": batch.items,
+        "accepted": batch.accepted,
+        "guesses": batch.counts.total(),
+        "surnames": len(batch.counts),
+        "rejected": batch.rejections,
+        "rejected_count": batch.rejected,
+    }
+
+
+def init_worker() -> None:
+    """Set up per-process state in a freshly forked server worker.
+
+    The connection pool, rendered page and write-behind counter inherited
+    from the parent are discarded and created anew, so nothing opened before
+    fork() is shared between workers.
+    """
+    with _pool_lock:
+        pool = app.extensions.pop("db_pool", None)
+        if pool is not None and pool.pid != os.getpid():
+            _inherited_pools.append(pool)
+        elif pool is not None:
+            pool.close()
+    app.extensions.pop("write_behind", None)
+    app.extensions.pop("compressed_store", None)
+    app.extensions.pop("live_updates", None)
+    app.extensions.pop("shard_compactor", None)
+    app.extensions.pop("variant_index", None)
+    app.extensions.pop("suggest_index", None)
+    app.extensions.pop("storage", None)
+    limiter = app.extensions.get("rate_limiter")
+    if limiter is not None:
+        limiter.store.reset_after_fork()
+    results_cache.reset_after_fork()
+
+    get_pool()
+    get_write_behind()
+
+
+def shutdown_worker() -> None:
+    """End live streams, write out buffered guesses and audit logs, close the pool."""
+    live = app.extensions.get("live_updates")
+    if live is not None:
+        live.close()
+    compactor = app.extensions.get("shard_compactor")
+    if compactor is not None:
+        compactor.close()
+    counter = app.extensions.get("write_behind")
+    if counter is not None:
+        counter.close()
+    storage = app.extensions.get("storage")
+    if storage is not None:
+        storage.close()
+    close_pool()
+    for handler in audit_logger.handlers:
+        handler.flush()
+
+
+@app.route("/metrics")
+def metrics() -> ResponseReturnValue:
+    """Expose request, database, render and audit metrics to Prometheus."""
+    return Response(REGISTRY.expose(), content_type=CONTENT_TYPE)
+
+
+def extension_stats(name: str) -> dict[str, object] | None:
+    """Return the stats of an extension this process has started, or None."""
+    extension = app.extensions.get(name)
+    return extension.stats() if extension is not None else None
 
 
 @app.route("/health")
-def health():
-    """Health check endpoint for container orchestration."""
+def health() -> ResponseReturnValue:
+    """Health check endpoint for container orchestration.
+
+    Only the storage is pinged; everything else is reported if this process
+    has already started it, and left alone otherwise.
+    """
     try:
-        # Test database connectivity
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute("SELECT COUNT(*) FROM guesses LIMIT 1")
-        cursor.fetchone()
-    except sqlite3.Error as e:
+        # Test storage connectivity
+        storage = get_storage()
+        storage.ping()
+    except (sqlite3.Error, RespError) as e:
         return {"status": "unhealthy", "error": str(e)}, 500
     else:
-        return {"status": "healthy", "database": "connected"}, 200
+        return {
+            "status": "healthy",
+            "database": "connected",
+            "storage": storage.stats(),
+            "results_cache": results_cache.stats(),
+            "audit_log": audit_log_stats(),
+            "compression": extension_stats("compressed_store"),
+            "live_updates": extension_stats("live_updates"),
+            "rate_limit": extension_stats("rate_limiter"),
+            "counter_shards": extension_stats("shard_compactor"),
+            "variant_index": extension_stats("variant_index"),
+            "suggest_index": extension_stats("suggest_index"),
+        }, 200
 
 
 if __name__ == "__main__":
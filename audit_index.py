@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# Copyright (c) 2025 Jaakko Vuori
+"""Index audit.log for fast queries, and rebuild guess counts from it.
+
+audit.log and its rotated (optionally gzipped) files are the only record of
+individual submissions. ``index`` parses them in parallel, one file per
+process, into a SQLite index next to the logs (``audit-index.db``), with
+surnames and client IPs stored once each and entries indexed by time and by
+surname. Indexing is incremental: a growing audit.log is read on from where
+the last run stopped, a file rotated without compression keeps its
+entries, and the entries of a file that was compressed or deleted are
+replaced by those of its successor.
+
+``query`` and ``top`` bring the index up to date and then answer from it::
+
+    python audit_index.py query --surname zyskowicz --since 2025-07-28 --until 1h
+    python audit_index.py top --by ip --since 1h
+
+Times are local, like the log, either as ISO dates and times or relative to
+now (``90s``, ``30m``, ``1h``, ``2d``).
+
+``rebuild`` sets every guess count to the baseline of the last import
+(parse_surnames.py) plus the guesses in the audit log, writing only the
+differences. Records the audit queue dropped (see AUDIT_QUEUE_FULL_POLICY)
+are missing from the log, and so from a rebuild. Surnames that neither
+account for, for example because the rotated logs holding their guesses
+were pruned, are listed and left alone unless ``--prune`` is given.
+"""
+
+import argparse
+import gzip
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from leaderboard import UPSERT_SQL, counts_source
+from parse_surnames import DIFF_REPORT_LIMIT, ImportDiff, print_diff, table_exists
+from setup_db import get_database_path, upgrade_db
+from sharded_counter import compact
+
+INDEX_NAME = "audit-index.db"
+
+# Bytes at the start of a file compared to recognise it between runs
+HEAD_BYTES = 64
+
+SEPARATOR = b" - "
+# "2025-07-28 12:00:10,500": the hour, minutes, seconds and milliseconds
+HOUR_LENGTH = 13
+TIMESTAMP_LENGTH = 23
+
+RELATIVE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    head BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    -- Bytes of the file indexed so far, always at the end of a line
+    offset INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS surnames (
+    id INTEGER PRIMARY KEY,
+    surname TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS ips (
+    id INTEGER PRIMARY KEY,
+    ip TEXT NOT NULL UNIQUE
+);
+-- One row per logged guess, stored in time order (milliseconds since the
+-- epoch). The position of the line in its file makes the key unique.
+CREATE TABLE IF NOT EXISTS entries (
+    time INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    surname_id INTEGER NOT NULL,
+    ip_id INTEGER NOT NULL,
+    PRIMARY KEY (time, file_id, position)
+) WITHOUT ROWID;
+"""
+SURNAME_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS entries_surname ON entries (surname_id, time)"
+)
+
+
+@dataclass
+class ParsedFile:
+    """The entries of one file, as compact columns for the trip between processes."""
+
+    path: str
+    offset: int
+    times: array = field(default_factory=lambda: array("q"))
+    positions: array = field(default_factory=lambda: array("q"))
+    surnames: list[str] = field(default_factory=list)
+    surname_codes: array = field(default_factory=lambda: array("I"))
+    ips: list[str] = field(default_factory=list)
+    ip_codes: array = field(default_factory=lambda: array("I"))
+    skipped: int = 0
+
+
+@dataclass
+class IndexStats:
+    files_read: int = 0
+    files_dropped: int = 0
+    entries_added: int = 0
+    lines_skipped: int = 0
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix == ".gz"
+
+
+def parse_file(path: str, offset: int) -> ParsedFile:
+    """Parse the complete lines of an audit log from the byte offset on.
+
+    Plain files are streamed from the offset and stop before a trailing
+    partial line, which the writer may still be completing. Gzipped files
+    are always read whole.
+    """
+    parsed = ParsedFile(path, offset)
+    surname_codes: dict[str, int] = {}
+    ip_codes: dict[str, int] = {}
+    # Lines logged within the same hour share the costly time conversion,
+    # which is exact as clocks only change on the hour
+    last_hour, hour_epoch = b"", 0
+    position = offset
+
+    compressed = is_compressed(Path(path))
+    opener = gzip.open if compressed else open
+    with opener(path, "rb") as f:
+        if not compressed:
+            f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            line_position = position
+            position += len(line)
+            parts = line[:-1].split(SEPARATOR, 2)
+            if len(parts) != 3 or len(parts[0]) != TIMESTAMP_LENGTH:  # noqa: PLR2004
+                parsed.skipped += 1
+                continue
+            timestamp, ip, surname = parts
+            hour = timestamp[:HOUR_LENGTH]
+            try:
+                if hour != last_hour:
+                    hour_epoch = int(
+                        time.mktime(time.strptime(hour.decode(), "%Y-%m-%d %H")),
+                    )
+                    last_hour = hour
+                millis = (
+                    int(timestamp[14:16]) * 60_000
+                    + int(timestamp[17:19]) * 1000
+                    + int(timestamp[20:23])
+                )
+            except ValueError:
+                parsed.skipped += 1
+                continue
+
+            name = surname.decode("utf-8", "replace")
+            code = surname_codes.get(name)
+            if code is None:
+                code = surname_codes[name] = len(parsed.surnames)
+                parsed.surnames.append(name)
+            address = ip.decode("ascii", "replace")
+            ip_code = ip_codes.get(address)
+            if ip_code is None:
+                ip_code = ip_codes[address] = len(parsed.ips)
+                parsed.ips.append(address)
+
+            parsed.times.append(hour_epoch * 1000 + millis)
+            parsed.positions.append(line_position)
+            parsed.surname_codes.append(code)
+            parsed.ip_codes.append(ip_code)
+    # A gzipped file is done once read; its size tells if it is replaced
+    parsed.offset = Path(path).stat().st_size if compressed else position
+    return parsed
+
+
+def open_index(index_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(index_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    # The index can always be rebuilt from the logs, so skip the fsyncs
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -65536")
+    conn.executescript(INDEX_SCHEMA)
+    conn.execute(SURNAME_INDEX_SQL)
+    return conn
+
+
+def default_logs() -> list[Path]:
+    """Return audit.log and its rotated files in LOGS_DIR, oldest first."""
+    logs_dir = Path(os.getenv("LOGS_DIR", Path(__file__).parent / "logs"))
+    rotated = sorted(
+        path for path in logs_dir.glob("audit.log.*") if path.suffix != ".lock"
+    )
+    current = logs_dir / "audit.log"
+    return [*rotated, current] if current.exists() else rotated
+
+
+def default_index_path() -> Path:
+    logs_dir = Path(os.getenv("LOGS_DIR", Path(__file__).parent / "logs"))
+    return logs_dir / INDEX_NAME
+
+
+def read_head(path: Path) -> bytes:
+    with path.open("rb") as f:
+        return f.read(HEAD_BYTES)
+
+
+def same_start(head: bytes, indexed_head: bytes) -> bool:
+    """Return True if the first bytes of a file still match those indexed."""
+    length = min(len(head), len(indexed_head))
+    return head[:length] == indexed_head[:length]
+
+
+def plan_reads(
+    conn: sqlite3.Connection,
+    paths: Iterable[Path],
+) -> tuple[list[tuple[int, str, int]], list[int]]:
+    """Match files to the index and return what to read and what to drop.
+
+    Files are recognised by device, inode and first bytes, so a file renamed
+    by rotation keeps its entries. Returns (file id, path, offset) for every
+    file with unindexed lines, and the ids of indexed files that are gone:
+    deleted, or compressed into a new file.
+    """
+    known = {
+        (device, inode): (file_id, path, head, size, offset)
+        for file_id, path, device, inode, head, size, offset in conn.execute(
+            "SELECT id, path, device, inode, head, size, offset FROM files",
+        )
+    }
+    reads, seen = [], set()
+    for path in paths:
+        stat = path.stat()
+        head = read_head(path)
+        match = known.get((stat.st_dev, stat.st_ino))
+        if match is None or not same_start(head, match[2]):
+            file_id = conn.execute(
+                "INSERT INTO files (path, device, inode, head, size, offset) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (str(path), stat.st_dev, stat.st_ino, head, stat.st_size),
+            ).lastrowid
+            seen.add(file_id)
+            reads.append((file_id, str(path), 0))
+            continue
+
+        file_id, _, _, size, offset = match
+        seen.add(file_id)
+        conn.execute(
+            "UPDATE files SET path = ?, head = ?, size = ? WHERE id = ?",
+            (str(path), head, stat.st_size, file_id),
+        )
+        if stat.st_size == size == offset:
+            continue
+        if is_compressed(path) or stat.st_size < offset:
+            # Rewritten or truncated: read it again from the start
+            conn.execute("DELETE FROM entries WHERE file_id = ?", (file_id,))
+            offset = 0
+        reads.append((file_id, str(path), offset))
+
+    drop = []
+    for file_id, path, _, _, _ in known.values():
+        if file_id in seen:
+            continue
+        try:
+            stat = Path(path).stat()
+        except FileNotFoundError:
+            drop.append(file_id)
+            continue
+        if known.get((stat.st_dev, stat.st_ino), (None,))[0] != file_id:
+            # The path now holds another file, e.g. audit.log after rotation
+            drop.append(file_id)
+    return reads, drop
+
+
+def lookup_ids(
+    conn: sqlite3.Connection,
+    table: str,
+    column: str,
+    values: list[str],
+) -> list[int]:
+    """Return the ids of values in a dictionary table, adding new ones."""
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)",  # noqa: S608
+        ((value,) for value in values),
+    )
+    select = f"SELECT id FROM {table} WHERE {column} = ?"  # noqa: S608
+    return [conn.execute(select, (value,)).fetchone()[0] for value in values]
+
+
+def store_parsed(conn: sqlite3.Connection, file_id: int, parsed: ParsedFile) -> None:
+    surname_ids = lookup_ids(conn, "surnames", "surname", parsed.surnames)
+    ip_ids = lookup_ids(conn, "ips", "ip", parsed.ips)
+    conn.executemany(
+        "INSERT INTO entries (time, file_id, position, surname_id, ip_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            (logged_at, file_id, position, surname_ids[surname], ip_ids[ip])
+            for logged_at, position, surname, ip in zip(
+                parsed.times,
+                parsed.positions,
+                parsed.surname_codes,
+                parsed.ip_codes,
+                strict=True,
+            )
+        ),
+    )
+    conn.execute("UPDATE files SET offset = ? WHERE id = ?", (parsed.offset, file_id))
+
+
+def index_logs(
+    index_path: Path,
+    paths: Iterable[Path],
+    *,
+    jobs: int | None = None,
+) -> IndexStats:
+    """Bring the index up to date with the given audit logs."""
+    stats = IndexStats()
+    conn = open_index(index_path)
+    try:
+        with conn:
+            # One run at a time; readers still see the previous state
+            conn.execute("BEGIN IMMEDIATE")
+            reads, drop = plan_reads(conn, paths)
+            for file_id in drop:
+                conn.execute("DELETE FROM entries WHERE file_id = ?", (file_id,))
+                conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            stats.files_dropped = len(drop)
+
+            # Filling an empty index is faster with the surname index built
+            # once at the end than kept up to date row by row
+            bulk = (
+                bool(reads)
+                and not conn.execute(
+                    "SELECT EXISTS (SELECT 1 FROM entries)",
+                ).fetchone()[0]
+            )
+            if bulk:
+                conn.execute("DROP INDEX entries_surname")
+
+            file_ids = [file_id for file_id, _, _ in reads]
+            arguments = (
+                [path for _, path, _ in reads],
+                [offset for *_, offset in reads],
+            )
+            if len(reads) > 1 and jobs != 1:
+                with ProcessPoolExecutor(max_workers=jobs) as pool:
+                    results: Iterator[ParsedFile] = pool.map(parse_file, *arguments)
+                    store_all(conn, file_ids, results, stats)
+            else:
+                store_all(conn, file_ids, map(parse_file, *arguments), stats)
+            if bulk:
+                conn.execute(SURNAME_INDEX_SQL)
+    finally:
+        conn.close()
+    return stats
+
+
+def store_all(
+    conn: sqlite3.Connection,
+    file_ids: list[int],
+    results: Iterable[ParsedFile],
+    stats: IndexStats,
+) -> None:
+    for file_id, parsed in zip(file_ids, results, strict=True):
+        store_parsed(conn, file_id, parsed)
+        stats.files_read += 1
+        stats.entries_added += len(parsed.times)
+        stats.lines_skipped += parsed.skipped
+
+
+def parse_time(value: str, now: float | None = None) -> float:
+    """Return the epoch time of a local ISO time or a time relative to now."""
+    unit = RELATIVE_UNITS.get(value[-1:])
+    if unit is not None and value[:-1].isdigit():
+        return (time.time() if now is None else now) - int(value[:-1]) * unit
+    return datetime.fromisoformat(value).timestamp()
+
+
+def time_range(since: float | None, until: float | None) -> tuple[int, int]:
+    """Return the range in milliseconds, open ends as the extremes."""
+    return (
+        0 if since is None else int(since * 1000),
+        2**62 if until is None else int(until * 1000),
+    )
+
+
+def query_surname(
+    conn: sqlite3.Connection,
+    surname: str,
+    since: float | None = None,
+    until: float | None = None,
+    *,
+    limit: int = 0,
+) -> tuple[int, list[tuple[float, str]]]:
+    """Return the guesses for a surname in a time range and the latest ones.
+
+    Returns the number of guesses and up to limit (time, ip) pairs, newest
+    first.
+    """
+    start, end = time_range(since, until)
+    row = conn.execute(
+        "SELECT id FROM surnames WHERE surname = ?",
+        (surname,),
+    ).fetchone()
+    if row is None:
+        return 0, []
+    count = conn.execute(
+        "SELECT COUNT(*) FROM entries WHERE surname_id = ? AND time BETWEEN ? AND ?",
+        (row[0], start, end),
+    ).fetchone()[0]
+    latest = conn.execute(
+        "SELECT e.time, i.ip FROM entries AS e JOIN ips AS i ON i.id = e.ip_id "
+        "WHERE e.surname_id = ? AND e.time BETWEEN ? AND ? "
+        "ORDER BY e.time DESC LIMIT ?",
+        (row[0], start, end, limit),
+    ).fetchall()
+    return count, [(logged_at / 1000, ip) for logged_at, ip in latest]
+
+
+def top(
+    conn: sqlite3.Connection,
+    by: str,
+    since: float | None = None,
+    until: float | None = None,
+    *,
+    limit: int = 10,
+) -> list[tuple[str, int]]:
+    """Return the IPs or surnames with the most guesses in a time range."""
+    table, column, key = {
+        "ip": ("ips", "ip", "ip_id"),
+        "surname": ("surnames", "surname", "surname_id"),
+    }[by]
+    start, end = time_range(since, until)
+    return conn.execute(
+        f"SELECT d.{column}, t.guesses FROM ("  # noqa: S608
+        f"SELECT {key} AS id, COUNT(*) AS guesses FROM entries "
+        f"WHERE time BETWEEN ? AND ? GROUP BY {key} "
+        "ORDER BY guesses DESC LIMIT ?"
+        f") AS t JOIN {table} AS d ON d.id = t.id ORDER BY t.guesses DESC, d.{column}",
+        (start, end, limit),
+    ).fetchall()
+
+
+def audit_counts(index: sqlite3.Connection) -> dict[str, int]:
+    """Return the number of logged guesses for every surname."""
+    return dict(
+        index.execute(
+            "SELECT s.surname, t.guesses FROM ("
+            "SELECT surname_id, COUNT(*) AS guesses FROM entries GROUP BY surname_id"
+            ") AS t JOIN surnames AS s ON s.id = t.surname_id",
+        ),
+    )
+
+
+def diff_counts(
+    target: dict[str, int],
+    current: dict[str, int],
+    *,
+    prune: bool,
+) -> ImportDiff:
+    """Work out the writes that turn the current counts into the target."""
+    diff = ImportDiff()
+    for surname in target.keys() | current.keys():
+        wanted, existing = target.get(surname, 0), current.get(surname)
+        if existing is None:
+            if wanted > 0:
+                diff.added[surname] = wanted
+        elif wanted <= 0:
+            if prune:
+                diff.removed[surname] = existing
+            else:
+                diff.kept[surname] = existing
+        elif wanted != existing:
+            diff.changed[surname] = wanted - existing
+    return diff
+
+
+def rebuild_counts(
+    conn: sqlite3.Connection,
+    logged: dict[str, int],
+    *,
+    dry_run: bool = False,
+    prune: bool = False,
+) -> ImportDiff:
+    """Set the guess counts to the import baseline plus the logged guesses.
+
+    Only the differences to the current counts are written, in one
+    transaction; guess_stats follows through the triggers. Surnames left
+    without guesses are deleted only if prune is set, and otherwise kept
+    with their counts and reported in ImportDiff.kept.
+    """
+    if (
+        not table_exists(conn, "import_counts")
+        or not conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM imports)",
+        ).fetchone()[0]
+    ):
+        msg = "The database has no recorded import to rebuild from."
+        raise ValueError(msg)
+    if not dry_run:
+        upgrade_db(conn)
+        # Fold pending counter slots so that the counts live in guesses
+        compact(conn)
+
+    target = dict(conn.execute("SELECT surname, count FROM import_counts"))
+    for surname, count in logged.items():
+        target[surname] = target.get(surname, 0) + count
+    current = dict(
+        conn.execute(f"SELECT surname, count FROM {counts_source(conn)}"),  # noqa: S608
+    )
+
+    diff = diff_counts(target, current, prune=prune)
+    if dry_run:
+        return diff
+
+    with conn:
+        conn.executemany(UPSERT_SQL, [*diff.added.items(), *diff.changed.items()])
+        # Slots written since the compaction above go with their surname
+        removed = [(surname,) for surname in diff.removed]
+        conn.executemany("DELETE FROM guess_shards WHERE surname = ?", removed)
+        conn.executemany("DELETE FROM guesses WHERE surname = ?", removed)
+    return diff
+
+
+def format_time(epoch: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(epoch))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", type=Path, default=default_index_path())
+    parser.add_argument(
+        "--logs",
+        type=Path,
+        nargs="+",
+        help="audit logs to index (default: audit.log* in LOGS_DIR)",
+    )
+    parser.add_argument("--jobs", type=int, help="parser processes (default: CPUs)")
+    parser.add_argument(
+        "--no-update",
+        action="store_true",
+        help="answer from the index as it is, without reading new log lines",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("index", help="bring the index up to date")
+
+    query = commands.add_parser("query", help="guesses for a surname")
+    query.add_argument("--surname", required=True)
+    query.add_argument("--since", type=parse_time)
+    query.add_argument("--until", type=parse_time)
+    query.add_argument("--limit", type=int, default=20, help="latest guesses to list")
+
+    top_parser = commands.add_parser("top", help="most active IPs or surnames")
+    top_parser.add_argument("--by", choices=("ip", "surname"), default="ip")
+    top_parser.add_argument("--since", type=parse_time)
+    top_parser.add_argument("--until", type=parse_time)
+    top_parser.add_argument("--limit", type=int, default=10)
+
+    rebuild = commands.add_parser(
+        "rebuild",
+        help="set the guess counts to the last import plus the audit log",
+    )
+    rebuild.add_argument("--database", default=str(get_database_path()))
+    rebuild.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report which variants would change without writing anything",
+    )
+    rebuild.add_argument(
+        "--prune",
+        action="store_true",
+        help="delete variants that neither the import nor the log accounts for",
+    )
+    return parser
+
+
+def run_command(index: sqlite3.Connection, args: argparse.Namespace) -> None:
+    if args.command == "query":
+        surname = args.surname.lower()
+        count, latest = query_surname(
+            index,
+            surname,
+            args.since,
+            args.until,
+            limit=args.limit,
+        )
+        print(f"{count} guesses for {surname}")
+        for logged_at, ip in latest:
+            print(f"  {format_time(logged_at)}  {ip}")
+    elif args.command == "top":
+        rows = top(index, args.by, args.since, args.until, limit=args.limit)
+        for value, guesses in rows:
+            print(f"{guesses:>8}  {value}")
+    elif args.command == "rebuild":
+        conn = sqlite3.connect(args.database)
+        try:
+            diff = rebuild_counts(
+                conn,
+                audit_counts(index),
+                dry_run=args.dry_run,
+                prune=args.prune,
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        finally:
+            conn.close()
+        print_diff(diff)
+        if diff.kept:
+            print(
+                f"{len(diff.kept)} variants without guesses in the import or the "
+                "log were kept, pass --prune to delete them:",
+            )
+            for surname, count in list(diff.kept.items())[:DIFF_REPORT_LIMIT]:
+                print(f"  {surname} {count}")
+            if len(diff.kept) > DIFF_REPORT_LIMIT:
+                print(f"  ... and {len(diff.kept) - DIFF_REPORT_LIMIT} more")
+        print("Dry run, database not modified." if args.dry_run else "Counts rebuilt.")
+
+
+def main() -> None:
+    """Index the audit logs and run a command against the index."""
+    args = build_parser().parse_args()
+
+    if args.command == "index" or not args.no_update:
+        started = time.perf_counter()
+        stats = index_logs(args.index, args.logs or default_logs(), jobs=args.jobs)
+        print(
+            f"Indexed {stats.entries_added:,} new entries from {stats.files_read} "
+            f"files in {time.perf_counter() - started:.2f} s "
+            f"({stats.lines_skipped} unparsable lines, "
+            f"{stats.files_dropped} files dropped).",
+            file=sys.stderr,
+        )
+
+    index = sqlite3.connect(args.index)
+    started = time.perf_counter()
+    try:
+        run_command(index, args)
+    finally:
+        index.close()
+    if args.command in ("query", "top"):
+        print(f"({(time.perf_counter() - started) * 1000:.1f} ms)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
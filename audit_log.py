@@ -0,0 +1,332 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Non-blocking audit log handler.
+
+The request thread only puts the log record on a bounded queue. A
+background writer thread formats queued records in batches, writes each
+batch with a single buffered write, and rotates the file by size or age.
+Rotated files are named after the time of rotation, for example
+``audit.log.20250728-120000``, and can be gzip-compressed.
+
+When the queue is full, the ``block`` policy (the default) makes the
+request wait up to ``block_timeout`` seconds before discarding the record,
+and the ``drop`` policy discards it right away. Discarded records are
+counted in ``dropped`` and reported as a warning on stderr.
+
+A batch of guesses is logged as one record carrying a ``guesses`` mapping
+of surname to count, which AuditFormatter expands into one line per guess,
+so that a large batch takes one queue slot rather than one per guess. The
+writer formats and writes the lines in chunks of at most WRITE_CHUNK_LINES,
+so a large batch never sits in memory as one string.
+
+Several worker processes may share one audit log. Rotation is serialised
+with an exclusive lock on ``audit.log.lock``, and a writer whose file has
+been rotated away by another process reopens the path before writing.
+"""
+
+import fcntl
+import gzip
+import itertools
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TextIO
+
+from metrics import AUDIT_WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+POLICY_DROP = "drop"
+POLICY_BLOCK = "block"
+FULL_POLICIES = (POLICY_DROP, POLICY_BLOCK)
+
+# Rotated files kept by default
+DEFAULT_BACKUP_COUNT = 10
+
+# Minimum number of seconds between two "records dropped" warnings
+DROP_REPORT_INTERVAL = 60.0
+
+# Lines formatted and written at once
+WRITE_CHUNK_LINES = 10_000
+
+
+class AuditFormatter(logging.Formatter):
+    """Format a record, or one line per guess of a record with ``guesses``.
+
+    Each guess line is the formatted record followed by the surname, so the
+    message must come last in the format.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        return "".join(self.format_chunks(record))[:-1]
+
+    def format_chunks(
+        self,
+        record: logging.LogRecord,
+        lines: int = WRITE_CHUNK_LINES,
+    ) -> Iterator[str]:
+        """Yield the newline-terminated lines of the record, lines at a time."""
+        line = super().format(record)
+        guesses = getattr(record, "guesses", None)
+        if guesses is None:
+            yield line + "\n"
+            return
+        guess_lines = itertools.chain.from_iterable(
+            itertools.repeat(f"{line}{surname}\n", count)
+            for surname, count in guesses.items()
+        )
+        for chunk in itertools.batched(guess_lines, lines, strict=False):
+            yield "".join(chunk)
+
+
+class AsyncAuditHandler(logging.Handler):
+    def __init__(  # noqa: PLR0913
+        self,
+        path: Path,
+        *,
+        queue_size: int = 10_000,
+        full_policy: str = POLICY_BLOCK,
+        block_timeout: float = 1.0,
+        batch_size: int = 500,
+        max_bytes: int = 0,
+        rotate_seconds: float = 0,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+        compress: bool = False,
+    ) -> None:
+        """Create the handler.
+
+        A max_bytes, rotate_seconds or backup_count of 0 disables size
+        rotation, time rotation or pruning of rotated files respectively.
+        """
+        if full_policy not in FULL_POLICIES:
+            msg = f"Unknown queue full policy {full_policy!r}"
+            raise ValueError(msg)
+        super().__init__()
+        self.path = Path(path)
+        self.queue_size = queue_size
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.compress = compress
+
+        self.dropped = 0
+        self.written = 0
+        self._reported_dropped = 0
+        self._last_drop_report = 0.0
+        self._queue: queue.Queue[logging.LogRecord | None] = queue.Queue(queue_size)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stream: TextIO = self._open()
+        self._next_rollover = self._compute_rollover()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Queue the record for the writer thread; never touches the file."""
+        self._ensure_started()
+        try:
+            if self.full_policy == POLICY_BLOCK:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Wait until every queued record has been written to the file."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Write out queued records, stop the writer and close the file."""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(None)
+            thread.join()
+        self._thread = None
+        self._report_dropped(force=True)
+        if not self._stream.closed:
+            self._stream.close()
+        super().close()
+
+    def stats(self) -> dict[str, int]:
+        """Return counters for the health endpoint."""
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Forked: the queue and writer thread belong to the parent
+                self._pid = os.getpid()
+                self._queue = queue.Queue(self.queue_size)
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="audit-log-writer",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    with AUDIT_WRITE_SECONDS.time():
+                        self._write(records)
+            except Exception:
+                logger.exception("Failed to write audit records")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            self._report_dropped()
+            if len(records) < len(batch):
+                return
+
+    def _write(self, records: list[logging.LogRecord]) -> None:
+        self._reopen_if_rotated()
+        chunks: list[str] = []
+        lines = 0
+        for record in records:
+            record_chunks = self._format_chunks(record)
+            while True:
+                try:
+                    chunk = next(record_chunks, None)
+                except Exception:  # noqa: BLE001
+                    self.handleError(record)
+                    break
+                if chunk is None:
+                    break
+                chunks.append(chunk)
+                lines += chunk.count("\n")
+                if lines >= WRITE_CHUNK_LINES:
+                    self._write_data("".join(chunks))
+                    chunks, lines = [], 0
+        if chunks:
+            self._write_data("".join(chunks))
+
+    def _format_chunks(self, record: logging.LogRecord) -> Iterator[str]:
+        if isinstance(self.formatter, AuditFormatter):
+            yield from self.formatter.format_chunks(record, WRITE_CHUNK_LINES)
+        else:
+            yield self.format(record) + "\n"
+
+    def _write_data(self, data: str) -> None:
+        if self._should_rotate(len(data.encode())):
+            self._rotate(len(data.encode()))
+        self._stream.write(data)
+        self._stream.flush()
+        self.written += data.count("\n")
+
+    def _reopen_if_rotated(self) -> None:
+        try:
+            current = self.path.stat().st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self._stream.fileno()).st_ino:
+            self._stream.close()
+            self._stream = self._open()
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if self.rotate_seconds and time.time() >= self._next_rollover:
+            return True
+        if not self.max_bytes:
+            return False
+        size = os.fstat(self._stream.fileno()).st_size
+        return size > 0 and size + incoming > self.max_bytes
+
+    def _rotate(self, incoming: int) -> None:
+        lock_path = self.path.with_name(f"{self.path.name}.lock")
+        with lock_path.open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have rotated while we waited for the lock
+            self._reopen_if_rotated()
+            if not os.fstat(self._stream.fileno()).st_size:
+                self._next_rollover = self._compute_rollover()
+                return
+            if not self._should_rotate(incoming):
+                return
+            self._stream.close()
+            target = self._rotated_name()
+            self.path.rename(target)
+            self._stream = self._open()
+            self._next_rollover = self._compute_rollover()
+
+        if self.compress:
+            with target.open("rb") as src, gzip.open(f"{target}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            target.unlink()
+        self._prune()
+
+    def _rotated_name(self) -> Path:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target = self.path.with_name(f"{self.path.name}.{stamp}")
+        suffix = 1
+        while target.exists() or target.with_name(f"{target.name}.gz").exists():
+            target = self.path.with_name(f"{self.path.name}.{stamp}-{suffix}")
+            suffix += 1
+        return target
+
+    def _prune(self) -> None:
+        if not self.backup_count:
+            return
+        rotated = sorted(
+            (
+                path
+                for path in self.path.parent.glob(f"{self.path.name}.*")
+                if path.name[len(self.path.name) + 1 :][:1].isdigit()
+            ),
+            key=self._rotation_order,
+        )
+        for old in rotated[: -self.backup_count]:
+            old.unlink(missing_ok=True)
+
+    def _rotation_order(self, path: Path) -> tuple[str, int]:
+        # Names are audit.log.STAMP[-N][.gz]; compare the suffix N as a
+        # number, and before .gz, which sorts after "-" as text
+        name = path.name[len(self.path.name) + 1 :].removesuffix(".gz")
+        date, _, rest = name.partition("-")
+        time_part, _, suffix = rest.partition("-")
+        return f"{date}-{time_part}", int(suffix) if suffix.isdigit() else 0
+
+    def _open(self) -> TextIO:
+        return self.path.open("a", encoding="utf-8")
+
+    def _compute_rollover(self) -> float:
+        if not self.rotate_seconds:
+            return float("inf")
+        return time.time() + self.rotate_seconds
+
+    def _report_dropped(self, *, force: bool = False) -> None:
+        unreported = self.dropped - self._reported_dropped
+        if not unreported:
+            return
+        now = time.monotonic()
+        if force or now - self._last_drop_report >= DROP_REPORT_INTERVAL:
+            logger.warning(
+                "Audit queue full: dropped %d records (%d in total)",
+                unreported,
+                self.dropped,
+            )
+            self._reported_dropped += unreported
+            self._last_drop_report = now
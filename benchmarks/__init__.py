@@ -0,0 +1,7 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Micro-benchmarks for the Ben application.
+
+Run a benchmark from the repository root, for example::
+
+    uv run python -m benchmarks.bench_write_behind
+"""
@@ -0,0 +1,113 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Measure compression ratio and CPU time for the rendered pages.
+
+The leaderboard is populated from the bundled Lintukoto page. For / and
+/results the benchmark reports the compressed size and compression time of
+each level, then the request latency without compression, with a cold
+store (compressed during the request) and with a warm store (the stored
+body is reused).
+"""
+
+import argparse
+import contextlib
+import gzip
+import os
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from compression import available_encodings
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def compressors() -> dict[str, Callable[[bytes], bytes]]:
+    levels: dict[str, Callable[[bytes], bytes]] = {
+        f"gzip {level}": lambda data, level=level: gzip.compress(data, level, mtime=0)
+        for level in (1, 6, 9)
+    }
+    if brotli is not None:
+        for quality in (1, 4, 5, 8):
+            levels[f"br {quality}"] = lambda data, quality=quality: brotli.compress(
+                data,
+                quality=quality,
+                mode=brotli.MODE_TEXT,
+            )
+    return levels
+
+
+def best_ms(run: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def median_ms(run: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ["DATABASE_DIR"] = tmpdir
+        os.environ["LOGS_DIR"] = tmpdir
+
+        from app import app  # noqa: PLC0415
+        from parse_surnames import parse_html_table, populate_database  # noqa: PLC0415
+
+        with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+            surnames, _ = parse_html_table(str(HTML_PATH))
+            populate_database(surnames, str(Path(tmpdir) / "ben.db"))
+
+        client = app.test_client()
+        for path in ("/", "/results"):
+            body = client.get(path).data
+            print(f"\n{path}: {len(body):,} bytes uncompressed")
+            print(f"{'level':<10}{'bytes':>12}{'ratio':>8}{'ms':>10}")
+            for name, compress in compressors().items():
+                size = len(compress(body))
+                elapsed = best_ms(
+                    lambda compress=compress, body=body: compress(body),
+                    args.repeat,
+                )
+                print(f"{name:<10}{size:>12,}{len(body) / size:>8.1f}{elapsed:>10.1f}")
+
+            print(f"\n{'request':<24}{'median ms':>10}")
+            plain = median_ms(lambda path=path: client.get(path), args.repeat)
+            print(f"{'identity':<24}{plain:>10.1f}")
+            for encoding in available_encodings():
+                headers = {"Accept-Encoding": encoding}
+
+                def cold(path: str = path, headers: dict = headers) -> None:
+                    app.extensions["compressed_store"].clear()
+                    client.get(path, headers=headers)
+
+                def warm(path: str = path, headers: dict = headers) -> None:
+                    client.get(path, headers=headers)
+
+                client.get(path, headers=headers)
+                for label, run in (("cold", cold), ("warm", warm)):
+                    elapsed = median_ms(run, args.repeat)
+                    print(f"{f'{encoding} ({label} store)':<24}{elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
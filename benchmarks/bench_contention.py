@@ -0,0 +1,121 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Measure write contention on one hot surname, with and without counter slots.
+
+Several processes, like server workers, each open their own connection and
+submit guesses for the same surname as fast as they can, one transaction
+per guess as on the synchronous ``/submit`` path. The single-row layout
+upserts the guesses row; the sharded layout adds to one of --shards
+counter slots. Reported are the throughput and the latency percentiles of
+a write, then the cost of reading the whole leaderboard while slots are
+pending compared to after compaction.
+"""
+
+import argparse
+import multiprocessing
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from leaderboard import UPSERT_SQL, fetch_top
+from live_updates import publish
+from sharded_counter import add_to_shard, compact
+
+SCHEMA_PATH = Path(__file__).parent.parent / "schema.sql"
+HOT_SURNAME = "zyskowicz"
+
+
+def create_database(directory: Path, rows: int) -> Path:
+    """Create a database with a leaderboard of the given number of rows."""
+    db_path = directory / "ben.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA_PATH.read_text())
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executemany(
+        "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+        [(f"sylkowski{i}", 1 + i % 50) for i in range(rows)],
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def writer(db_path: Path, guesses: int, shards: int) -> list[float]:
+    """Submit guesses for the hot surname and return the latency of each."""
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    latencies = []
+    for _ in range(guesses):
+        start = time.perf_counter()
+        if shards > 1:
+            add_to_shard(conn, HOT_SURNAME, 1, shards)
+        else:
+            conn.execute(UPSERT_SQL, (HOT_SURNAME, 1))
+        publish(conn, {HOT_SURNAME: 1})
+        conn.commit()
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies
+
+
+def bench_writes(db_path: Path, processes: int, guesses: int, shards: int) -> None:
+    per_process = guesses // processes
+    with multiprocessing.Pool(processes) as pool:
+        start = time.perf_counter()
+        results = pool.starmap(
+            writer,
+            [(db_path, per_process, shards)] * processes,
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result)
+    percentiles = statistics.quantiles(latencies, n=100)
+    label = f"{shards} slots" if shards > 1 else "single row"
+    print(
+        f"{label:<12}{len(latencies) / elapsed:>12,.0f}"
+        f"{percentiles[49] * 1000:>10.2f}{percentiles[98] * 1000:>10.2f}",
+    )
+
+
+def bench_read(db_path: Path, repeat: int) -> None:
+    conn = sqlite3.connect(db_path)
+    timings = {}
+    for label in ("slots pending", "compacted"):
+        if label == "compacted":
+            compact(conn)
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fetch_top(conn)
+            runs.append(time.perf_counter() - start)
+        timings[label] = min(runs) * 1000
+    conn.close()
+    print(f"\n{'full leaderboard read':<24}{'ms':>8}")
+    for label, elapsed in timings.items():
+        print(f"{label:<24}{elapsed:>8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--guesses", type=int, default=8000)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--rows", type=int, default=25_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes, {args.guesses} guesses for one surname")
+    print(f"{'layout':<12}{'guesses/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for shards in (1, args.shards):
+            directory = Path(tmpdir) / str(shards)
+            directory.mkdir()
+            db_path = create_database(directory, args.rows)
+            bench_writes(db_path, args.processes, args.guesses, shards)
+            if shards > 1:
+                bench_read(db_path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Time history writes and the trending queries over a filled history.
+
+A database is filled with the requested number of days of guesses, spread
+evenly over the hours and drawn from the surnames of the bundled Lintukoto
+page weighted by their counts, and rolled up with the default retention
+as it goes. The submit transaction is timed with and without record(), and
+each /api/trending query on its own.
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Callable
+from pathlib import Path
+
+from history import (
+    DAY,
+    HOUR,
+    Retention,
+    daily_totals,
+    day_of,
+    hour_of,
+    hourly_totals,
+    record,
+    top_surnames,
+)
+from leaderboard import UPSERT_SQL
+from parse_surnames import aggregate_surnames, parse_html_table
+from setup_db import SCHEMA_PATH
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+
+
+def time_calls(call: Callable[[], object], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--guesses-per-hour", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)  # noqa: S311
+    with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+        surnames_data, _ = parse_html_table(str(HTML_PATH))
+    counts = aggregate_surnames(surnames_data)
+    surnames = list(counts)
+    weights = list(counts.values())
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = sqlite3.connect(Path(directory) / "ben.db", isolation_level=None)
+        db.executescript(SCHEMA_PATH.read_text())
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executemany(
+            "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+            counts.items(),
+        )
+
+        retention = Retention()
+        now = time.time()
+        start = time.perf_counter()
+        for hours_ago in range(args.days * 24, 0, -1):
+            guesses = Counter(
+                rng.choices(surnames, weights, k=args.guesses_per_hour),
+            )
+            db.execute("BEGIN")
+            record(db, guesses, now - hours_ago * HOUR, retention)
+            db.execute("COMMIT")
+        hours, days = (
+            db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]  # noqa: S608
+            for table in ("guess_hours", "guess_days")
+        )
+        print(
+            f"{args.days} days of {args.guesses_per_hour} guesses per hour "
+            f"filled in {time.perf_counter() - start:.1f} s: "
+            f"{hours} hourly and {days} daily rows\n",
+        )
+
+        def submit(*, with_history: bool) -> Callable[[], None]:
+            def call() -> None:
+                surname = rng.choices(surnames, weights)[0]
+                db.execute("BEGIN")
+                db.execute(UPSERT_SQL, (surname, 1))
+                if with_history:
+                    record(db, {surname: 1}, retention=retention)
+                db.execute("COMMIT")
+
+            return call
+
+        first_hour = hour_of(now) - 23 * HOUR
+        first_day = day_of(now) - 6 * DAY
+        cases = {
+            "submit": submit(with_history=False),
+            "submit+record": submit(with_history=True),
+            "top 24h": lambda: top_surnames(db, first_hour, 10),
+            "per hour 24h": lambda: hourly_totals(db, first_hour),
+            "per day 7d": lambda: daily_totals(db, first_day),
+            "per day 90d": lambda: daily_totals(db, day_of(now) - 89 * DAY),
+        }
+        print(f"{'operation':<16}{'mean ms':>10}{'p99 ms':>10}")
+        for name, call in cases.items():
+            timings = time_calls(call, args.repeat)
+            p99 = statistics.quantiles(timings, n=100, method="inclusive")[98]
+            print(
+                f"{name:<16}{statistics.mean(timings) * 1000:>10.3f}"
+                f"{p99 * 1000:>10.3f}",
+            )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Compare the streaming HTML importer with the BeautifulSoup parser.
+
+Both parsers run on the bundled Lintukoto page and on a synthetic page that
+repeats its ``vaalein`` rows --scale times. Each run is timed along with
+the peak memory allocated by Python, measured in a separate pass with
+tracemalloc so that tracing does not skew the timings.
+"""
+
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+
+from parse_surnames import parse_html_table
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+FIRST_ROW = b'<tr class="vaalein">'
+TABLE_END = b"</tbody></table>"
+
+
+def create_synthetic_page(directory: Path, scale: int) -> Path:
+    """Write a page whose result table holds the bundled rows scale times."""
+    content = HTML_PATH.read_bytes()
+    rows_start = content.index(FIRST_ROW)
+    rows_end = content.index(TABLE_END, rows_start)
+    path = directory / f"ben-x{scale}.html"
+    with path.open("wb") as f:
+        f.write(content[:rows_start])
+        for _ in range(scale):
+            f.write(content[rows_start:rows_end])
+        f.write(content[rows_end:])
+    return path
+
+
+def measure(parse: Callable[[], object]) -> tuple[float, int]:
+    """Return (seconds, peak traced bytes) for the parse callable."""
+    with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        parse()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        parse()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_file(path: Path, *, soup: bool) -> None:
+    size_mib = path.stat().st_size / 1024 / 1024
+    print(f"\n{path.name} ({size_mib:.1f} MiB)")
+    print(f"{'parser':<12}{'seconds':>10}{'MiB/s':>10}{'peak MiB':>12}")
+
+    results = {}
+    modes = ["stream", "soup"] if soup else ["stream"]
+    for mode in modes:
+
+        def parse(mode: str = mode) -> None:
+            results[mode] = parse_html_table(str(path), streaming=mode == "stream")
+
+        elapsed, peak = measure(parse)
+        peak_mib = peak / 1024 / 1024
+        print(f"{mode:<12}{elapsed:>10.3f}{size_mib / elapsed:>10.1f}{peak_mib:>12.1f}")
+
+    if soup and results["stream"] != results["soup"]:
+        print("  WARNING: the parsers returned different results")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, default=100)
+    parser.add_argument(
+        "--skip-soup",
+        action="store_true",
+        help="only run the streaming parser on the synthetic page",
+    )
+    args = parser.parse_args()
+
+    bench_file(HTML_PATH, soup=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = create_synthetic_page(Path(tmpdir), args.scale)
+        bench_file(path, soup=not args.skip_soup)
+
+
+if __name__ == "__main__":
+    main()
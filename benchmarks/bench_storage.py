@@ -0,0 +1,200 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Compare the SQLite and Redis-protocol storage backends under several workers.
+
+Both backends are seeded with the surnames of the bundled Lintukoto page.
+Several processes, like app workers on one node or on several, then each
+submit guesses drawn from those surnames, one commit per guess, and read
+the first --limit rows of the leaderboard every --read-every operations.
+The SQLite processes share one ben.db file, as the workers of a single
+node do; the Redis processes share one server through their own pools.
+Reported are the throughput and the latency percentiles of both
+operations, then the cost of committing a batch of surnames at once
+against committing them one by one.
+
+Without --url the loopback stand-in server from benchmarks.resp_server is
+started in its own process. Its numbers show the protocol and round-trip
+cost, not those of a real Redis; pass --url to measure one. The keys are
+written under --prefix, which is cleared first.
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+from db_pool import ConnectionPool, PoolConfig
+from parse_surnames import aggregate_surnames, parse_html_table
+from resp import RespPool, ServerAddress
+from setup_db import SCHEMA_PATH
+from storage import RedisStorage, SQLiteStorage, Storage, copy_counts
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+
+
+def load_counts() -> dict[str, int]:
+    with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+        surnames_data, _ = parse_html_table(str(HTML_PATH))
+    return aggregate_surnames(surnames_data)
+
+
+def create_database(db_path: Path, counts: dict[str, int]) -> None:
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA_PATH.read_text())
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executemany(
+        "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+        counts.items(),
+    )
+    conn.commit()
+    conn.close()
+
+
+@contextlib.contextmanager
+def stand_in_server() -> Iterator[str]:
+    """Run the stand-in server in a child process and yield its URL."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.resp_server", "--port", "0"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        yield process.stdout.readline().split()[-1]
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def open_storage(target: str, prefix: str) -> Storage:
+    """Open a storage for this process: a database path or a redis:// URL."""
+    if target.startswith("redis://"):
+        return RedisStorage(RespPool(ServerAddress.from_url(target)), prefix)
+    pool = ConnectionPool(Path(target), PoolConfig())
+    reader, writer = pool.connect(), pool.connect()
+    return SQLiteStorage(lambda: reader, lambda: writer)
+
+
+def worker(
+    target: str,
+    args: argparse.Namespace,
+    surnames: list[str],
+    seed: int,
+) -> tuple[list[float], list[float]]:
+    """Submit guesses and read pages; return the latencies of each."""
+    rng = random.Random(seed)  # noqa: S311
+    storage = open_storage(target, args.prefix)
+    submits, reads = [], []
+    for i in range(args.operations // args.processes):
+        start = time.perf_counter()
+        if i % args.read_every == 0:
+            storage.read_page(args.limit)
+            reads.append(time.perf_counter() - start)
+        else:
+            storage.increment({rng.choice(surnames): 1})
+            storage.commit()
+            submits.append(time.perf_counter() - start)
+    return submits, reads
+
+
+def bench_workers(
+    label: str,
+    target: str,
+    args: argparse.Namespace,
+    surnames: list[str],
+) -> None:
+    with multiprocessing.Pool(args.processes) as pool:
+        start = time.perf_counter()
+        results = pool.starmap(
+            worker,
+            [(target, args, surnames, seed) for seed in range(args.processes)],
+        )
+        elapsed = time.perf_counter() - start
+
+    submits = [latency for result in results for latency in result[0]]
+    reads = [latency for result in results for latency in result[1]]
+    row = f"{label:<8}{(len(submits) + len(reads)) / elapsed:>10,.0f}"
+    for latencies in (submits, reads):
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        row += f"{percentiles[49] * 1000:>10.2f}{percentiles[98] * 1000:>10.2f}"
+    print(row)
+
+
+def bench_batches(label: str, storage: Storage, surnames: list[str]) -> None:
+    """Time committing a batch of surnames at once and one by one."""
+    start = time.perf_counter()
+    storage.increment(dict.fromkeys(surnames, 1))
+    storage.commit()
+    batched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for surname in surnames:
+        storage.increment({surname: 1})
+        storage.commit()
+    one_by_one = time.perf_counter() - start
+    print(f"{label:<8}{batched * 1000:>12.2f}{one_by_one * 1000:>14.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="redis:// URL of a real server")
+    parser.add_argument("--prefix", default="ben-bench:")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=8000)
+    parser.add_argument("--read-every", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    counts = load_counts()
+    surnames = list(counts)
+    with contextlib.ExitStack() as stack:
+        directory = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        db_path = directory / "ben.db"
+        create_database(db_path, counts)
+        url = args.url or stack.enter_context(stand_in_server())
+
+        redis = RedisStorage(RespPool(ServerAddress.from_url(url)), args.prefix)
+        stack.callback(redis.close)
+        redis.pool.execute(
+            (
+                "DEL",
+                redis.guesses_key,
+                redis.total_key,
+                redis.version_key,
+                redis.updated_at_key,
+            ),
+        )
+        with contextlib.closing(sqlite3.connect(db_path)) as db:
+            copy_counts(db, redis)
+
+        print(
+            f"{len(surnames)} surnames, {args.processes} processes, "
+            f"{args.operations} operations, a read of {args.limit} rows "
+            f"every {args.read_every}",
+        )
+        print(
+            f"{'backend':<8}{'ops/s':>10}{'submit':>10}{'p99':>10}"
+            f"{'read':>10}{'p99':>10}  (ms, p50 unless noted)",
+        )
+        bench_workers("sqlite", str(db_path), args, surnames)
+        bench_workers("redis", url, args, surnames)
+
+        print(
+            f"\n{'backend':<8}{'one commit':>12}{'one by one':>14}"
+            f"  (ms for {args.batch} surnames)",
+        )
+        sample = random.Random(1).sample(surnames, args.batch)  # noqa: S311
+        bench_batches("sqlite", open_storage(str(db_path), args.prefix), sample)
+        bench_batches("redis", redis, sample)
+
+
+if __name__ == "__main__":
+    main()
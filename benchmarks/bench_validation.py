@@ -0,0 +1,64 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Micro-benchmarks for surname validation.
+
+Times the previous per-call ``re.match`` implementation against the
+precompiled single-rule validator, one candidate at a time and through the
+batch API, on every candidate name in the bundled Lintukoto page.
+"""
+
+import argparse
+import re
+import timeit
+from pathlib import Path
+
+from parse_surnames import clean_surname, iter_table_rows
+from validation import is_valid_surname, validate_batch
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+
+
+def legacy_is_valid_surname(surname: str) -> bool:
+    """Validate like app.py did before validation.py, for comparison."""
+    if not surname or len(surname) < 6 or len(surname) > 15:  # noqa: PLR2004
+        return False
+    if not surname.lower().startswith(("z", "s", "t", "c")):
+        return False
+    return bool(re.match(r"^[a-zA-ZäöåÄÖÅüÜýÝÿŸ]+$", surname))
+
+
+def load_candidates() -> list[str]:
+    candidates = []
+    for cells in iter_table_rows(str(HTML_PATH)):
+        candidates.extend(
+            surname for name in cells[1].split(",") if (surname := clean_surname(name))
+        )
+    return candidates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    candidates = load_candidates()
+    benchmarks = {
+        "legacy single": lambda: [
+            (c.lower(), None) if legacy_is_valid_surname(c) else (c, "?")
+            for c in candidates
+        ],
+        "single": lambda: [
+            (c.lower(), None) if is_valid_surname(c) else (c, "?") for c in candidates
+        ],
+        "batch": lambda: validate_batch(candidates),
+    }
+
+    print(f"{len(candidates)} candidates, best of {args.repeat}\n")
+    print(f"{'validator':<16}{'ms':>10}{'ns/name':>10}")
+    for name, run in benchmarks.items():
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        per_name = best / len(candidates) * 1e9
+        print(f"{name:<16}{best * 1000:>10.2f}{per_name:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
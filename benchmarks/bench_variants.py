@@ -0,0 +1,160 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Compare closest-variant lookups through VariantIndex with a brute-force scan.
+
+The index is built from every variant on the bundled Lintukoto page. The
+queries are a seeded sample of those variants and of one-edit typos of
+them, as a submitted misspelling would be. The scan computes the distance
+to every variant, and both must return the same variants.
+
+Lookups are timed as /api/variants makes them, widening to two edits when
+fewer than --wanted variants are one edit away, and within one edit only.
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+
+from parse_surnames import parse_html_table
+from variants import VariantIndex, damerau_levenshtein
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+
+
+def load_surnames() -> list[str]:
+    with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+        surnames_data, _ = parse_html_table(str(HTML_PATH))
+    return sorted({surname for surname, _ in surnames_data})
+
+
+def make_typo(surname: str, rng: random.Random) -> str:
+    """Return the surname with one letter inserted, deleted or replaced."""
+    position = rng.randrange(len(surname))
+    letter = rng.choice("cksvwxyz")
+    edit = rng.randrange(3)
+    if edit == 0:
+        return surname[:position] + letter + surname[position:]
+    if edit == 1:
+        return surname[:position] + surname[position + 1 :]
+    return surname[:position] + letter + surname[position + 1 :]
+
+
+def brute_force(
+    surnames: list[str],
+    query: str,
+    wanted: int,
+) -> list[tuple[str, int]]:
+    """Return what VariantIndex.closest does, from every distance."""
+    distances = [
+        (surname, damerau_levenshtein(query, surname))
+        for surname in surnames
+        if surname != query
+    ]
+    near = sum(distance == 1 for _, distance in distances)
+    radius = 1 if near >= wanted else 2
+    return sorted(
+        (surname, distance) for surname, distance in distances if distance <= radius
+    )
+
+
+def time_lookups(
+    lookup: Callable[[str], list[tuple[str, int]]],
+    queries: list[str],
+) -> tuple[list[float], list[list[tuple[str, int]]]]:
+    """Return the seconds taken by and the results of each lookup."""
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(lookup(query))
+        timings.append(time.perf_counter() - start)
+    return timings, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--scan-queries",
+        type=int,
+        default=20,
+        help="how many of the queries the brute-force scan also answers",
+    )
+    parser.add_argument(
+        "--wanted",
+        type=int,
+        default=5,
+        help="variants below which a lookup widens to two edits",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)  # noqa: S311
+    surnames = load_surnames()
+    sample = rng.sample(surnames, args.queries // 2)
+    queries = sample + [make_typo(surname, rng) for surname in sample]
+    rng.shuffle(queries)
+
+    # Built twice: once timed, once traced, so that tracing does not skew
+    # the build time
+    index = VariantIndex()
+    start = time.perf_counter()
+    for surname in surnames:
+        index.add(surname)
+    build_seconds = time.perf_counter() - start
+    tracemalloc.start()
+    traced = VariantIndex()
+    for surname in surnames:
+        traced.add(surname)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{len(surnames)} variants, {index.stats()['keys']} keys, "
+        f"built in {build_seconds:.2f} s, {size / 1024 / 1024:.1f} MiB\n",
+    )
+
+    near_timings, near_results = time_lookups(index.closest, queries)
+    index_timings, index_results = time_lookups(
+        lambda query: index.closest(query, args.wanted),
+        queries,
+    )
+    scanned = queries[: args.scan_queries]
+    scan_timings, scan_results = time_lookups(
+        lambda query: brute_force(surnames, query, args.wanted),
+        scanned,
+    )
+    if scan_results != index_results[: len(scanned)]:
+        print("WARNING: the index and the scan returned different variants\n")
+
+    print(f"{'lookup':<14}{'queries':>8}{'mean ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, timings in (
+        ("index, 1 edit", near_timings),
+        ("index", index_timings),
+        ("scan", scan_timings),
+    ):
+        p99 = (
+            statistics.quantiles(timings, n=100, method="inclusive")[98]
+            if len(timings) > 1
+            else 0
+        )
+        print(
+            f"{name:<14}{len(timings):>8}"
+            f"{statistics.mean(timings) * 1000:>10.3f}"
+            f"{p99 * 1000:>10.3f}"
+            f"{max(timings) * 1000:>10.3f}",
+        )
+    found = statistics.mean(len(result) for result in near_results)
+    widened = index.stats()["widened"]
+    print(
+        f"\n{found:.1f} variants within 1 edit per query on average; "
+        f"{widened} of {len(queries)} lookups widened to 2 edits",
+    )
+
+
+if __name__ == "__main__":
+    main()
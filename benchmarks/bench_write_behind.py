@@ -0,0 +1,122 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Compare per-request commits with the write-behind guess counter.
+
+Several threads submit guesses concurrently, drawn from a small set of
+surnames so that most writes hit the same hot rows. The per-request mode
+mirrors the synchronous ``/submit`` path: one connection, one upsert and
+one commit per guess.
+"""
+
+import argparse
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from leaderboard import UPSERT_SQL
+from write_behind import DURABILITY_LEVELS, WriteBehindCounter
+
+SCHEMA_PATH = Path(__file__).parent.parent / "schema.sql"
+SURNAMES = ["zyskowicz", "zyskovic", "zychkowich", "zyzkowiz", "syskowicz"]
+
+
+def create_database(directory: Path) -> Path:
+    db_path = directory / "ben.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA_PATH.read_text())
+    conn.close()
+    return db_path
+
+
+def run_threads(threads: int, guesses: int, submit: Callable[[str], None]) -> float:
+    """Run the submit callable from several threads and return elapsed time."""
+    per_thread = guesses // threads
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)  # noqa: S311 - picks surnames, not secrets
+        for _ in range(per_thread):
+            submit(rng.choice(SURNAMES))
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def bench_per_request(db_path: Path, threads: int, guesses: int) -> float:
+    def submit(surname: str) -> None:
+        conn = sqlite3.connect(db_path, timeout=60)
+        conn.execute(UPSERT_SQL, (surname, 1))
+        conn.commit()
+        conn.close()
+
+    return run_threads(threads, guesses, submit)
+
+
+def bench_write_behind(  # noqa: PLR0913
+    db_path: Path,
+    threads: int,
+    guesses: int,
+    *,
+    durability: str,
+    interval: float,
+    max_pending: int,
+) -> float:
+    counter = WriteBehindCounter(
+        lambda: sqlite3.connect(db_path, timeout=60),
+        db_path.parent / "journal",
+        flush_interval=interval,
+        max_pending=max_pending,
+        durability=durability,
+    )
+    start = time.perf_counter()
+    run_threads(threads, guesses, counter.add)
+    counter.close()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--guesses", type=int, default=4000)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--max-pending", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{args.guesses} guesses from {args.threads} threads\n")
+    print(f"{'mode':<28}{'seconds':>10}{'guesses/s':>14}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = create_database(Path(tmpdir))
+        elapsed = bench_per_request(db_path, args.threads, args.guesses)
+        mode = "per-request commit"
+        print(f"{mode:<28}{elapsed:>10.3f}{args.guesses / elapsed:>14,.0f}")
+
+    for durability in DURABILITY_LEVELS:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = create_database(Path(tmpdir))
+            elapsed = bench_write_behind(
+                db_path,
+                args.threads,
+                args.guesses,
+                durability=durability,
+                interval=args.interval,
+                max_pending=args.max_pending,
+            )
+            conn = sqlite3.connect(db_path)
+            total = conn.execute("SELECT SUM(count) FROM guesses").fetchone()[0]
+            conn.close()
+            mode = f"write-behind ({durability})"
+            print(f"{mode:<28}{elapsed:>10.3f}{args.guesses / elapsed:>14,.0f}")
+            if total != args.guesses // args.threads * args.threads:
+                print(f"  WARNING: expected {args.guesses} guesses, found {total}")
+
+
+if __name__ == "__main__":
+    main()
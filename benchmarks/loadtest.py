@@ -0,0 +1,551 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Load test /submit and /results, in-process or against a running server.
+
+Two workloads are available:
+
+synthetic
+    A mix of reads (GET /results) and guesses (POST /submit) in the ratio
+    given by --read-ratio. Surnames are drawn from the imported leaderboard
+    with Zipf-distributed popularity: the n-th most guessed surname is
+    picked with a weight of 1 / n^s. Guesses come from --clients distinct
+    addresses, passed in X-Forwarded-For, so that rate limiting sees many
+    clients rather than one.
+replay
+    Replays the guesses recorded in audit.log files (rotated and gzipped
+    ones too) from their original addresses, at the original pace
+    multiplied by --speed, or as fast as possible with --speed 0.
+
+By default the requests go to the app in this process through the Flask
+test client, with a temporary database populated from the bundled
+Lintukoto page. With --url they are sent over HTTP to a running server
+instead, e.g. one started with ``python serve.py``.
+
+A guess is followed by the GET of the results page it redirects to, as a
+browser would; both are measured separately. The report gives the
+throughput and the p50/p95/p99 latency of each operation. --output saves
+it as JSON, and --baseline compares the run with a saved report and exits
+with status 1 if any operation got slower or its throughput dropped by
+more than --tolerance.
+
+Examples:
+    python -m benchmarks.loadtest synthetic --requests 5000 --concurrency 8
+    python -m benchmarks.loadtest synthetic --url http://127.0.0.1:5000
+    python -m benchmarks.loadtest replay logs/audit.log* --speed 60
+    python -m benchmarks.loadtest synthetic --output run.json --baseline base.json
+
+"""
+
+import argparse
+import contextlib
+import gzip
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Protocol
+from urllib.parse import urlencode, urlsplit
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+AUDIT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+
+OPERATION_SUBMIT = "submit"
+OPERATION_RESULTS = "results"
+
+# What a browser sends, so that compression is part of the measurement
+DEFAULT_HEADERS = {"Accept-Encoding": "br, gzip"}
+
+# Statistics compared with the baseline, and whether lower is better
+COMPARED_STATS = {"p50_ms": True, "p95_ms": True, "p99_ms": True, "throughput": False}
+
+
+@dataclass(frozen=True)
+class PlannedRequest:
+    operation: str
+    method: str
+    path: str
+    form: dict[str, str] | None = None
+    client_ip: str | None = None
+    # Seconds after the start of the run at which to send, None for now
+    at: float | None = None
+
+
+@dataclass
+class Measurements:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    # Response status counts per operation, 0 for connection errors
+    statuses: dict[str, Counter[int]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, operation: str, latency: float, status: int) -> None:
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(latency)
+            self.statuses.setdefault(operation, Counter())[status] += 1
+            if not 0 < status < 400:  # noqa: PLR2004
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def measure(self, target: "Target", request: PlannedRequest) -> str | None:
+        """Send a request, record its latency and return its redirect location."""
+        start = time.perf_counter()
+        try:
+            status, location = target.send(request)
+        except (OSError, http.client.HTTPException):
+            status, location = 0, None
+        self.record(request.operation, time.perf_counter() - start, status)
+        return location
+
+
+class Target(Protocol):
+    def send(self, request: PlannedRequest) -> tuple[int, str | None]:
+        """Send a request and return its status and redirect location."""
+        ...
+
+    def close(self) -> None:
+        """Release the connection, if any."""
+        ...
+
+
+class InProcessTarget:
+    """Send requests to the app through a Flask test client."""
+
+    def __init__(self) -> None:
+        """Send requests to the app in this process through Flask's test client."""
+        from app import app  # noqa: PLC0415
+
+        self.client = app.test_client()
+
+    def send(self, request: PlannedRequest) -> tuple[int, str | None]:
+        headers = dict(DEFAULT_HEADERS)
+        if request.client_ip:
+            headers["X-Forwarded-For"] = request.client_ip
+        response = self.client.open(
+            request.path,
+            method=request.method,
+            data=request.form,
+            headers=headers,
+        )
+        response.get_data()
+        return response.status_code, response.headers.get("Location")
+
+    def close(self) -> None:
+        pass
+
+
+class HttpTarget:
+    """Send requests over a keep-alive HTTP connection to a running server."""
+
+    def __init__(self, url: str, timeout: float) -> None:
+        """Send requests to the server at url, waiting up to timeout seconds."""
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.connection: http.client.HTTPConnection | None = None
+
+    def send(self, request: PlannedRequest) -> tuple[int, str | None]:
+        headers = dict(DEFAULT_HEADERS)
+        body = None
+        if request.form is not None:
+            body = urlencode(request.form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if request.client_ip:
+            headers["X-Forwarded-For"] = request.client_ip
+        path = request.path
+        if not path.startswith(self.prefix + "/"):
+            path = self.prefix + path
+        try:
+            connection = self.connection or self._connect()
+            connection.request(request.method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self.close()
+            raise
+        if response.getheader("Connection", "").lower() == "close":
+            self.close()
+        return response.status, response.getheader("Location")
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        self.connection = http.client.HTTPConnection(
+            self.host,
+            self.port,
+            timeout=self.timeout,
+        )
+        return self.connection
+
+
+def zipf_cumulative_weights(count: int, exponent: float) -> list[float]:
+    """Return cumulative weights for picking the rank n with weight 1 / n^s."""
+    return list(
+        itertools.accumulate(1 / rank**exponent for rank in range(1, count + 1)),
+    )
+
+
+def client_addresses(count: int, rng: random.Random) -> list[str]:
+    """Return distinct addresses spread over many /24 subnets."""
+    addresses: set[str] = set()
+    while len(addresses) < count:
+        addresses.add(
+            f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+        )
+    return sorted(addresses)
+
+
+def synthetic_workload(  # noqa: PLR0913
+    surnames: list[str],
+    *,
+    requests: int,
+    read_ratio: float,
+    zipf_exponent: float,
+    clients: int,
+    rate: float | None,
+    seed: int,
+) -> list[PlannedRequest]:
+    """Plan a read/write mix over surnames ranked by popularity."""
+    rng = random.Random(seed)  # noqa: S311
+    weights = zipf_cumulative_weights(len(surnames), zipf_exponent)
+    addresses = client_addresses(clients, rng)
+    planned = []
+    for index in range(requests):
+        at = index / rate if rate else None
+        if rng.random() < read_ratio:
+            planned.append(
+                PlannedRequest(OPERATION_RESULTS, "GET", "/results", at=at),
+            )
+        else:
+            surname = rng.choices(surnames, cum_weights=weights)[0]
+            planned.append(
+                PlannedRequest(
+                    OPERATION_SUBMIT,
+                    "POST",
+                    "/submit",
+                    form={"surname": surname},
+                    client_ip=rng.choice(addresses),
+                    at=at,
+                ),
+            )
+    return planned
+
+
+def parse_audit_line(line: str) -> tuple[float, str, str] | None:
+    """Parse ``<asctime> - <client ip> - <surname>`` into (time, ip, surname)."""
+    parts = line.rstrip("\n").split(" - ", 2)
+    if len(parts) != 3:  # noqa: PLR2004
+        return None
+    timestamp, client_ip, surname = parts
+    try:
+        logged_at = datetime.strptime(timestamp, AUDIT_TIME_FORMAT)  # noqa: DTZ007
+    except ValueError:
+        return None
+    return logged_at.timestamp(), client_ip, surname
+
+
+def read_audit_logs(paths: Iterable[Path]) -> Iterator[tuple[float, str, str]]:
+    """Yield the parsed records of audit logs, gzipped or not."""
+    for path in paths:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = parse_audit_line(line)
+                if record is not None:
+                    yield record
+
+
+def replay_workload(
+    records: Iterable[tuple[float, str, str]],
+    *,
+    speed: float,
+) -> list[PlannedRequest]:
+    """Plan the guesses of audit records, spaced as logged divided by speed."""
+    records = sorted(records)
+    if not records:
+        return []
+    first = records[0][0]
+    return [
+        PlannedRequest(
+            OPERATION_SUBMIT,
+            "POST",
+            "/submit",
+            form={"surname": surname},
+            client_ip=None if client_ip == "unknown" else client_ip,
+            at=(logged_at - first) / speed if speed > 0 else None,
+        )
+        for logged_at, client_ip, surname in records
+    ]
+
+
+def redirected(request: PlannedRequest, location: str) -> PlannedRequest:
+    """Return the GET of the results page a guess redirected to."""
+    parts = urlsplit(location)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    return PlannedRequest(OPERATION_RESULTS, "GET", path, client_ip=request.client_ip)
+
+
+def run(
+    make_target: Callable[[], Target],
+    planned: list[PlannedRequest],
+    *,
+    concurrency: int,
+    follow_redirects: bool,
+) -> tuple[Measurements, float]:
+    """Send the planned requests from concurrent workers.
+
+    Returns the measurements and the wall-clock duration of the run.
+    """
+    measurements = Measurements()
+    pending: queue.SimpleQueue[PlannedRequest | None] = queue.SimpleQueue()
+    for request in planned:
+        pending.put(request)
+    for _ in range(concurrency):
+        pending.put(None)
+
+    def worker() -> None:
+        target = make_target()
+        while (request := pending.get()) is not None:
+            if request.at is not None:
+                delay = started + request.at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            location = measurements.measure(target, request)
+            if follow_redirects and location and request.method == "POST":
+                measurements.measure(target, redirected(request, location))
+        target.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return measurements, time.perf_counter() - started
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Return the nearest-rank percentile of sorted values."""
+    rank = round(fraction * len(sorted_values))
+    index = max(0, min(len(sorted_values) - 1, rank - 1))
+    return sorted_values[index]
+
+
+def summarize(measurements: Measurements, elapsed: float) -> dict[str, dict]:
+    """Return throughput and latency statistics per operation."""
+    summary = {}
+    for operation, latencies in sorted(measurements.latencies.items()):
+        values = sorted(latencies)
+        summary[operation] = {
+            "requests": len(values),
+            "errors": measurements.errors.get(operation, 0),
+            "statuses": {
+                str(status): count
+                for status, count in sorted(measurements.statuses[operation].items())
+            },
+            "throughput": len(values) / elapsed,
+            "mean_ms": sum(values) / len(values) * 1000,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+    return summary
+
+
+def compare(
+    current: dict[str, dict],
+    baseline: dict[str, dict],
+    tolerance: float,
+) -> list[str]:
+    """Return a description of every statistic that regressed beyond tolerance."""
+    regressions = []
+    for operation, stats in current.items():
+        reference = baseline.get(operation)
+        if reference is None:
+            continue
+        for name, lower_is_better in COMPARED_STATS.items():
+            old, new = reference.get(name), stats.get(name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change if lower_is_better else -change) > tolerance:
+                regressions.append(
+                    f"{operation} {name}: {old:.2f} -> {new:.2f} ({change:+.0%})",
+                )
+        if stats["errors"] > reference.get("errors", 0):
+            old_errors = reference.get("errors", 0)
+            regressions.append(
+                f"{operation} errors: {old_errors} -> {stats['errors']}",
+            )
+    return regressions
+
+
+def print_report(summary: dict[str, dict], elapsed: float) -> None:
+    print(f"\n{elapsed:.1f} s")
+    print(
+        f"{'operation':<10}{'requests':>10}{'errors':>8}{'req/s':>10}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}",
+    )
+    for operation, stats in summary.items():
+        print(
+            f"{operation:<10}{stats['requests']:>10}{stats['errors']:>8}"
+            f"{stats['throughput']:>10.1f}{stats['p50_ms']:>9.2f}"
+            f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['max_ms']:>9.2f}",
+        )
+
+
+def load_surnames(database: Path | None) -> list[str]:
+    """Return surnames ordered by popularity, from a database or the page."""
+    if database is not None:
+        conn = sqlite3.connect(database)
+        rows = conn.execute(
+            "SELECT surname FROM guesses ORDER BY count DESC, surname ASC",
+        ).fetchall()
+        conn.close()
+        return [surname for (surname,) in rows]
+
+    from parse_surnames import aggregate_surnames, parse_html_table  # noqa: PLC0415
+
+    with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+        surnames, _ = parse_html_table(str(HTML_PATH))
+    totals = aggregate_surnames(surnames)
+    return sorted(totals, key=lambda surname: (-totals[surname], surname))
+
+
+def prepare_in_process(directory: Path) -> None:
+    """Point the app at a fresh database populated from the bundled page."""
+    os.environ["DATABASE_DIR"] = str(directory)
+    os.environ["LOGS_DIR"] = str(directory)
+
+    from parse_surnames import parse_html_table, populate_database  # noqa: PLC0415
+
+    with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+        surnames, _ = parse_html_table(str(HTML_PATH))
+        populate_database(surnames, str(directory / "ben.db"))
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("workload", choices=("synthetic", "replay"))
+    parser.add_argument("logs", nargs="*", type=Path, help="audit logs to replay")
+    parser.add_argument("--url", help="server to test instead of the app in-process")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--read-ratio", type=float, default=0.8)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="requests per second to send (open loop), default as fast as possible",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="replay speed-up factor, 0 for as fast as possible",
+    )
+    parser.add_argument("--database", type=Path, help="seed surnames from a database")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--no-follow",
+        action="store_true",
+        help="do not load the results page a guess redirects to",
+    )
+    parser.add_argument("--output", type=Path, help="save the report as JSON")
+    parser.add_argument("--baseline", type=Path, help="report to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change that counts as a regression (default 0.1)",
+    )
+    args = parser.parse_args(argv)
+    if args.workload == "replay" and not args.logs:
+        parser.error("replay needs at least one audit log")
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.url:
+            url = args.url
+
+            def make_target() -> Target:
+                return HttpTarget(url, args.timeout)
+
+        else:
+            prepare_in_process(Path(tmpdir))
+            make_target = InProcessTarget
+
+        if args.workload == "replay":
+            planned = replay_workload(read_audit_logs(args.logs), speed=args.speed)
+        else:
+            planned = synthetic_workload(
+                load_surnames(args.database),
+                requests=args.requests,
+                read_ratio=args.read_ratio,
+                zipf_exponent=args.zipf,
+                clients=args.clients,
+                rate=args.rate,
+                seed=args.seed,
+            )
+        print(f"{args.workload}: {len(planned)} requests, {args.concurrency} workers")
+        measurements, elapsed = run(
+            make_target,
+            planned,
+            concurrency=args.concurrency,
+            follow_redirects=not args.no_follow,
+        )
+
+    summary = summarize(measurements, elapsed)
+    print_report(summary, elapsed)
+
+    report: dict[str, Any] = {
+        "workload": args.workload,
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "requests": len(planned),
+        "elapsed_s": elapsed,
+        "created_at": time.time(),
+        "operations": summary,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(summary, baseline["operations"], args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Loopback stand-in for a Redis server, for tests and benchmarks.
+
+It implements only the commands RedisStorage sends (strings, integer
+counters, sorted sets, lists, expiry, MULTI/EXEC) over the same protocol,
+keeping the data in memory. It is not a Redis replacement: there is no
+persistence, expired keys are only dropped when a later command looks for
+them, and a single lock covers everything, which also makes every
+MULTI/EXEC block atomic. Point REDIS_URL at a real server to measure one.
+
+    python -m benchmarks.resp_server --port 6380
+"""
+
+import argparse
+import bisect
+import socketserver
+import threading
+import time
+from typing import BinaryIO
+
+type Reply = bytes | int | list[Reply] | Exception | None
+
+
+class SortedSet:
+    """Members ordered by (score, member), as ZRANGE returns them."""
+
+    def __init__(self) -> None:
+        """Create an empty sorted set."""
+        self.scores: dict[bytes, float] = {}
+        self.entries: list[tuple[float, bytes]] = []
+
+    def increment(self, member: bytes, amount: float) -> float:
+        score = self.scores.get(member)
+        if score is not None:
+            del self.entries[bisect.bisect_left(self.entries, (score, member))]
+        score = (score or 0.0) + amount
+        self.scores[member] = score
+        bisect.insort(self.entries, (score, member))
+        return score
+
+
+def format_score(score: float) -> bytes:
+    return f"{score:.17g}".encode()
+
+
+def parse_bound(bound: bytes) -> tuple[float, bool]:
+    """Return the score of a ZCOUNT bound and whether it is exclusive."""
+    exclusive = bound.startswith(b"(")
+    return float(bound[exclusive:]), exclusive
+
+
+class Store:
+    """The keyspace and the commands that operate on it."""
+
+    def __init__(self) -> None:
+        """Create an empty keyspace and the table of supported commands."""
+        self.lock = threading.Lock()
+        self.values: dict[bytes, bytes | SortedSet | list[bytes]] = {}
+        # Unix time at which each key with an expiry is dropped
+        self.expires: dict[bytes, float] = {}
+        self.commands = {
+            b"PING": lambda: b"PONG",
+            b"SELECT": lambda _db: b"OK",
+            b"FLUSHDB": self.flushdb,
+            b"DEL": self.delete,
+            b"GET": self.get,
+            b"MGET": lambda *keys: [self.get(key) for key in keys],
+            b"SET": self.set,
+            b"INCR": lambda key: self.incrby(key, b"1"),
+            b"INCRBY": self.incrby,
+            b"ZINCRBY": self.zincrby,
+            b"ZCARD": lambda key: len(self.sorted_set(key).scores),
+            b"ZSCORE": self.zscore,
+            b"ZRANGE": self.zrange,
+            b"ZRANK": self.zrank,
+            b"ZCOUNT": self.zcount,
+            b"ZUNIONSTORE": self.zunionstore,
+            b"RPUSH": self.rpush,
+            b"LLEN": lambda key: len(self.items(key)),
+            b"LRANGE": self.lrange,
+            b"LTRIM": self.ltrim,
+            b"EXPIRE": self.expire,
+        }
+
+    def execute(self, name: bytes, arguments: list[bytes]) -> Reply:
+        command = self.commands.get(name.upper())
+        if command is None:
+            return ValueError(f"ERR unknown command '{name.decode()}'")
+        now = time.time()
+        for key in [key for key, deadline in self.expires.items() if deadline <= now]:
+            del self.expires[key]
+            self.values.pop(key, None)
+        try:
+            return command(*arguments)
+        except (TypeError, ValueError) as e:
+            return ValueError(f"ERR {e}")
+
+    def flushdb(self) -> bytes:
+        self.values.clear()
+        self.expires.clear()
+        return b"OK"
+
+    def delete(self, *keys: bytes) -> int:
+        for key in keys:
+            self.expires.pop(key, None)
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def expire(self, key: bytes, seconds: bytes) -> int:
+        if key not in self.values:
+            return 0
+        self.expires[key] = time.time() + int(seconds)
+        return 1
+
+    def get(self, key: bytes) -> bytes | None:
+        value = self.values.get(key)
+        if value is not None and not isinstance(value, bytes):
+            msg = "WRONGTYPE"
+            raise TypeError(msg)
+        return value
+
+    def set(self, key: bytes, value: bytes) -> bytes:
+        self.values[key] = value
+        self.expires.pop(key, None)
+        return b"OK"
+
+    def incrby(self, key: bytes, amount: bytes) -> int:
+        value = int(self.get(key) or 0) + int(amount)
+        self.values[key] = str(value).encode()
+        return value
+
+    def sorted_set(self, key: bytes) -> SortedSet:
+        value = self.values.get(key)
+        if value is None:
+            return SortedSet()
+        if not isinstance(value, SortedSet):
+            msg = "WRONGTYPE"
+            raise TypeError(msg)
+        return value
+
+    def zincrby(self, key: bytes, amount: bytes, member: bytes) -> bytes:
+        value = self.values.setdefault(key, SortedSet())
+        if not isinstance(value, SortedSet):
+            msg = "WRONGTYPE"
+            raise TypeError(msg)
+        return format_score(value.increment(member, float(amount)))
+
+    def zscore(self, key: bytes, member: bytes) -> bytes | None:
+        score = self.sorted_set(key).scores.get(member)
+        return None if score is None else format_score(score)
+
+    def zrange(self, key: bytes, start: bytes, stop: bytes, *options: bytes) -> list:
+        entries = self.sorted_set(key).entries
+        selected = entries[index_range(len(entries), start, stop)]
+        if [option.upper() for option in options] == [b"WITHSCORES"]:
+            return [
+                item
+                for score, member in selected
+                for item in (member, format_score(score))
+            ]
+        return [member for _, member in selected]
+
+    def zrank(self, key: bytes, member: bytes) -> int | None:
+        sorted_set = self.sorted_set(key)
+        score = sorted_set.scores.get(member)
+        if score is None:
+            return None
+        return bisect.bisect_left(sorted_set.entries, (score, member))
+
+    def zcount(self, key: bytes, minimum: bytes, maximum: bytes) -> int:
+        entries = self.sorted_set(key).entries
+        low, low_exclusive = parse_bound(minimum)
+        high, high_exclusive = parse_bound(maximum)
+        start = (
+            bisect.bisect_right(entries, low, key=lambda entry: entry[0])
+            if low_exclusive
+            else bisect.bisect_left(entries, low, key=lambda entry: entry[0])
+        )
+        end = (
+            bisect.bisect_left(entries, high, key=lambda entry: entry[0])
+            if high_exclusive
+            else bisect.bisect_right(entries, high, key=lambda entry: entry[0])
+        )
+        return max(end - start, 0)
+
+    def zunionstore(self, destination: bytes, count: bytes, *keys: bytes) -> int:
+        union = SortedSet()
+        for key in keys[: int(count)]:
+            for member, score in self.sorted_set(key).scores.items():
+                union.increment(member, score)
+        self.delete(destination)
+        if union.scores:
+            self.values[destination] = union
+        return len(union.scores)
+
+    def items(self, key: bytes) -> list[bytes]:
+        value = self.values.get(key)
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            msg = "WRONGTYPE"
+            raise TypeError(msg)
+        return value
+
+    def rpush(self, key: bytes, *items: bytes) -> int:
+        value = self.values.setdefault(key, [])
+        if not isinstance(value, list):
+            msg = "WRONGTYPE"
+            raise TypeError(msg)
+        value.extend(items)
+        return len(value)
+
+    def lrange(self, key: bytes, start: bytes, stop: bytes) -> list[bytes]:
+        items = self.items(key)
+        return items[index_range(len(items), start, stop)]
+
+    def ltrim(self, key: bytes, start: bytes, stop: bytes) -> bytes:
+        items = self.items(key)
+        items[:] = items[index_range(len(items), start, stop)]
+        if not items:
+            self.delete(key)
+        return b"OK"
+
+
+def index_range(length: int, start: bytes, stop: bytes) -> slice:
+    """Return the slice of an inclusive Redis index range, negatives from the end."""
+    first, last = int(start), int(stop)
+    first = max(first + length if first < 0 else first, 0)
+    last = last + length if last < 0 else last
+    return slice(first, max(last + 1, first))
+
+
+def read_command(stream: BinaryIO) -> list[bytes] | None:
+    """Read one command array, or return None at the end of the stream."""
+    header = stream.readline()
+    if not header:
+        return None
+    if not header.startswith(b"*"):
+        msg = f"expected an array, got {header!r}"
+        raise ValueError(msg)
+    arguments = []
+    for _ in range(int(header[1:])):
+        length = int(stream.readline()[1:])
+        arguments.append(stream.read(length + 2)[:-2])
+    return arguments
+
+
+def encode_reply(reply: Reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-%s\r\n" % str(reply).encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(map(encode_reply, reply))
+    if reply in (b"OK", b"PONG", b"QUEUED"):
+        return b"+%s\r\n" % reply
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    server: "RespServer"
+    disable_nagle_algorithm = True
+
+    def handle(self) -> None:
+        store = self.server.store
+        queued: list[list[bytes]] | None = None
+        while (command := read_command(self.rfile)) is not None:
+            name = command[0].upper()
+            if name == b"MULTI":
+                queued, reply = [], b"OK"
+            elif name == b"EXEC" and queued is not None:
+                with store.lock:
+                    reply = [store.execute(c[0], c[1:]) for c in queued]
+                queued = None
+            elif name == b"DISCARD" and queued is not None:
+                queued, reply = None, b"OK"
+            elif queued is not None:
+                queued.append(command)
+                reply = b"QUEUED"
+            else:
+                with store.lock:
+                    reply = store.execute(name, command[1:])
+            self.wfile.write(encode_reply(reply))
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int]) -> None:
+        """Bind to address; serve_forever() then answers clients."""
+        super().__init__(address, RespHandler)
+        self.store = Store()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0) -> RespServer:
+    """Serve on a background thread and return the server; port 0 picks one."""
+    server = RespServer((host, port))
+    threading.Thread(
+        target=server.serve_forever,
+        # Short, so that shutdown() returns quickly
+        kwargs={"poll_interval": 0.05},
+        daemon=True,
+    ).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    with RespServer((args.host, args.port)) as server:
+        print(f"Serving {server.url}", flush=True)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Response compression with a store of precompressed bodies.
+
+Responses are compressed with brotli or gzip, whichever the client prefers
+through Accept-Encoding. Brotli is optional: without the ``brotli``
+package only gzip is offered.
+
+A response with a strong ETag has a body that is fully determined by that
+tag, for example the leaderboard at one data version. Its compressed body
+is kept in a bounded LRU store keyed by (ETag, encoding), so each version
+of a page is compressed once rather than on every request. A view whose
+ETag covers more than the body shows can give a key of the body itself
+instead: /results keys a page highlighting a row that is not on it like
+the plain page. The ETag of a compressed response gets the encoding as a
+suffix, because the encoded bytes are a different representation.
+
+A 304 gets ``Vary: Accept-Encoding`` as well, as the response it stands
+for would have.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+
+from flask import Request, Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+# In order of preference when the client accepts both equally
+ENCODINGS = (ENCODING_BROTLI, ENCODING_GZIP)
+
+# Levels picked with benchmarks/bench_compression.py: roughly the same CPU
+# time for both, well below the cost of brotli's maximum quality
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = frozenset(
+    {
+        "application/javascript",
+        "application/json",
+        "text/css",
+        "text/html",
+        "text/javascript",
+        "text/plain",
+    },
+)
+
+
+def available_encodings() -> tuple[str, ...]:
+    if brotli is None:
+        return (ENCODING_GZIP,)
+    return ENCODINGS
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """Return the ETag of the body compressed with the encoding."""
+    return f"{etag}-{encoding}"
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == ENCODING_BROTLI:
+        return brotli.compress(data, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+    if encoding == ENCODING_GZIP:
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    msg = f"Unsupported encoding {encoding!r}"
+    raise ValueError(msg)
+
+
+class CompressedStore:
+    """LRU store of compressed bodies, bounded by their total size."""
+
+    def __init__(self, max_bytes: int) -> None:
+        """Create an empty store holding at most max_bytes of bodies."""
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[Hashable, str], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple[Hashable, str]) -> bytes | None:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: tuple[Hashable, str], body: bytes) -> None:
+        """Store a body, evicting the least recently used ones to make room."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def reset_after_fork(self) -> None:
+        """Forget the entries and lock inherited from the parent process."""
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def compress_response(
+    request: Request,
+    response: Response,
+    store: CompressedStore | None,
+    min_bytes: int,
+    body_key: Hashable | None = None,
+) -> Response:
+    """Compress the response body if the client accepts it and it pays off.
+
+    The compressed body is stored under body_key, or under the ETag if that
+    is strong and no body_key is given.
+    """
+    if response.status_code == 304:  # noqa: PLR2004
+        response.vary.add("Accept-Encoding")
+        return response
+    if (
+        response.status_code != 200  # noqa: PLR2004
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < min_bytes:
+        return response
+
+    etag, weak = response.get_etag()
+    if body_key is None and etag and not weak:
+        body_key = etag
+    key = (body_key, encoding) if body_key is not None else None
+    body = store.get(key) if store is not None and key is not None else None
+    if body is None:
+        body = compress(data, encoding)
+        if store is not None and key is not None:
+            store.put(key, body)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    if etag and not weak:
+        response.set_etag(encoded_etag(etag, encoding))
+    return response
@@ -0,0 +1,80 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Conditional GET support: ETag and Last-Modified validators.
+
+Routes compute their validators from cheap inputs (a data version, a
+template digest) and call not_modified() before doing any real work, so a
+client whose cached copy is current gets a bodyless 304 without the page
+being queried or rendered.
+"""
+
+import hashlib
+import time
+from collections.abc import Hashable
+
+from flask import Request, Response
+
+from compression import ENCODINGS, encoded_etag
+
+
+def make_etag(*parts: Hashable) -> str:
+    """Return a strong entity tag that changes whenever any part changes."""
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode())
+    return digest.hexdigest()[:32]
+
+
+def not_modified(
+    request: Request,
+    etag: str,
+    last_modified: float | None,
+) -> Response | None:
+    """Return a 304 response if the client's cached copy is still current.
+
+    If-None-Match takes precedence over If-Modified-Since, as required by
+    RFC 9110. The tags of compressed copies of the body match as well.
+    """
+    if request.if_none_match:
+        candidates = (etag, *(encoded_etag(etag, encoding) for encoding in ENCODINGS))
+        matched = next(
+            (tag for tag in candidates if request.if_none_match.contains_weak(tag)),
+            None,
+        )
+        fresh = matched is not None
+        etag = matched or etag
+    elif request.if_modified_since is not None and last_modified is not None:
+        fresh = int(last_modified) <= request.if_modified_since.timestamp()
+    else:
+        return None
+    if not fresh:
+        return None
+    response = Response(status=304)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(
+    response: Response,
+    etag: str,
+    last_modified: float | None,
+) -> Response:
+    """Set ETag, Last-Modified and a Cache-Control that forces revalidation."""
+    response.set_etag(etag)
+    # Last-Modified has one-second resolution. While the second of the last
+    # change is still running, another change could follow with the same
+    # timestamp, so the header is only sent once that second has passed.
+    if last_modified is not None and int(last_modified) < int(time.time()):
+        response.last_modified = int(last_modified)
+    response.cache_control.no_cache = True
+    return response
+
+
+def cache_for(response: Response, etag: str, max_age: int) -> Response:
+    """Set an ETag and let clients reuse the response for max_age seconds.
+
+    Once max_age has passed the client revalidates with the ETag. A
+    max_age of 0 forces revalidation every time, like set_validators().
+    """
+    response.set_etag(etag)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
@@ -0,0 +1,175 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Per-process SQLite connection pool.
+
+Connections are opened once and reused across requests instead of being
+opened and closed for every request. Reads and writes use separate
+connections: a small set of reader connections and a single writer, since
+SQLite allows only one writer at a time anyway. Waiting for the writer
+connection inside the process is cheaper than retrying on ``database is
+locked``; writers in other processes are waited for by ``busy_timeout``.
+
+Every connection is configured with the pragmas from PoolConfig, which by
+default puts the database in WAL mode so that readers never block the
+writer.
+
+A request that finds every reader taken waits up to
+PoolConfig.acquire_timeout_ms for one to be released and then gets
+PoolTimeoutError, which the app answers with 503, rather than queueing
+without bound behind slow requests.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from settings import env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class PoolTimeoutError(Exception):
+    """No pooled connection became free within the acquire timeout."""
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    readers: int = 4
+    journal_mode: str = "WAL"
+    busy_timeout_ms: int = 5000
+    acquire_timeout_ms: int = 5000
+    synchronous: str = "NORMAL"
+    cache_size_kib: int = 8192
+    mmap_size: int = 64 * 1024 * 1024
+    cached_statements: int = 256
+
+    @classmethod
+    def from_env(cls) -> "PoolConfig":
+        """Read the pool configuration from DB_* environment variables."""
+        defaults = cls()
+        journal_mode = env_str("DB_JOURNAL_MODE", defaults.journal_mode).upper()
+        if journal_mode not in JOURNAL_MODES:
+            msg = f"DB_JOURNAL_MODE must be one of {', '.join(JOURNAL_MODES)}"
+            raise ValueError(msg)
+        synchronous = env_str("DB_SYNCHRONOUS", defaults.synchronous).upper()
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            msg = f"DB_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_LEVELS)}"
+            raise ValueError(msg)
+        return cls(
+            readers=max(env_int("DB_POOL_SIZE", defaults.readers), 1),
+            journal_mode=journal_mode,
+            busy_timeout_ms=env_int("DB_BUSY_TIMEOUT_MS", defaults.busy_timeout_ms),
+            acquire_timeout_ms=env_int(
+                "DB_POOL_TIMEOUT_MS",
+                defaults.acquire_timeout_ms,
+            ),
+            synchronous=synchronous,
+            cache_size_kib=env_int("DB_CACHE_SIZE_KIB", defaults.cache_size_kib),
+            mmap_size=env_int("DB_MMAP_SIZE", defaults.mmap_size),
+            cached_statements=env_int(
+                "DB_STATEMENT_CACHE",
+                defaults.cached_statements,
+            ),
+        )
+
+
+class ConnectionPool:
+    """Reader connections plus one writer connection for a database file."""
+
+    def __init__(self, database_path: Path, config: PoolConfig) -> None:
+        """Create the pool; connections are opened on first use."""
+        self.database_path = Path(database_path)
+        self.config = config
+        self.pid = os.getpid()
+        self._readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._writer: queue.Queue[sqlite3.Connection] = queue.Queue()
+        self._lock = threading.Lock()
+        self._opened_readers = 0
+        self._writer_opened = False
+        self._connections: list[sqlite3.Connection] = []
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a new configured connection that is not managed by the pool."""
+        config = self.config
+        conn = sqlite3.connect(
+            self.database_path,
+            timeout=config.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=config.cached_statements,
+        )
+        conn.row_factory = sqlite3.Row  # Allows accessing columns by name
+        conn.execute(f"PRAGMA journal_mode = {config.journal_mode}")
+        conn.execute(f"PRAGMA busy_timeout = {int(config.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA synchronous = {config.synchronous}")
+        conn.execute(f"PRAGMA cache_size = -{int(config.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.mmap_size)}")
+        return conn
+
+    def acquire_reader(self) -> sqlite3.Connection:
+        """Take a reader connection, opening one if the pool is not yet full.
+
+        Raises PoolTimeoutError if every reader stays taken for longer than
+        the acquire timeout.
+        """
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened_readers < self.config.readers:
+                self._opened_readers += 1
+                return self._open()
+        try:
+            return self._readers.get(timeout=self.config.acquire_timeout_ms / 1000)
+        except queue.Empty:
+            timeout = self.config.acquire_timeout_ms
+            msg = f"No reader connection free after {timeout} ms"
+            raise PoolTimeoutError(msg) from None
+
+    def release_reader(self, conn: sqlite3.Connection) -> None:
+        self._reset(conn)
+        self._readers.put(conn)
+
+    def acquire_writer(self) -> sqlite3.Connection:
+        """Take the writer connection, waiting while another thread holds it."""
+        with self._lock:
+            if not self._writer_opened:
+                self._writer_opened = True
+                return self._open()
+        return self._writer.get()
+
+    def release_writer(self, conn: sqlite3.Connection) -> None:
+        self._reset(conn)
+        self._writer.put(conn)
+
+    def close(self) -> None:
+        """Checkpoint the WAL and close every connection opened by the pool."""
+        if self.pid != os.getpid():
+            return
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                if self.config.journal_mode == "WAL":
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+            except sqlite3.Error:
+                logger.exception("Failed to close pooled connection")
+
+    def _open(self) -> sqlite3.Connection:
+        conn = self.connect()
+        self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _reset(conn: sqlite3.Connection) -> None:
+        # Never hand out a connection with a transaction left open by an
+        # aborted request
+        if conn.in_transaction:
+            conn.rollback()
@@ -0,0 +1,147 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Guess history in hourly and daily buckets, for the trending queries.
+
+Every write path records its per-surname deltas in ``guess_hours`` next to
+the counts themselves (record()), so "what was guessed in the last 24
+hours" is a range scan of a few thousand rows instead of a pass over the
+audit log. Guesses buffered by the write-behind counter are bucketed by
+the time they are flushed, seconds after they were made.
+
+The first write that finds an hour older than the hourly retention rolls
+every such hour up into ``guess_days``, and into the per-day totals of
+``guess_day_totals``, and deletes days older than the daily retention.
+Hours and days are UTC.
+
+Imports of the Lintukoto page are not guesses made at any particular time
+and are not recorded.
+"""
+
+import sqlite3
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from settings import env_int
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+RECORD_SQL = (
+    "INSERT INTO guess_hours (hour, surname, count) VALUES (?, ?, ?) "
+    "ON CONFLICT(hour, surname) DO UPDATE SET count = count + excluded.count"
+)
+
+ROLL_UP_SQL = (
+    "INSERT INTO guess_days (day, surname, count) "
+    "SELECT hour - hour % 86400, surname, SUM(count) FROM guess_hours "
+    "WHERE hour < ? GROUP BY 1, 2 "
+    "ON CONFLICT(day, surname) DO UPDATE SET count = count + excluded.count"
+)
+
+ROLL_UP_TOTALS_SQL = (
+    "INSERT INTO guess_day_totals (day, count) "
+    "SELECT hour - hour % 86400, SUM(count) FROM guess_hours "
+    "WHERE hour < ? GROUP BY 1 "
+    "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count"
+)
+
+
+@dataclass(frozen=True)
+class Retention:
+    hours: int = 48
+    days: int = 90
+
+    @classmethod
+    def from_env(cls) -> "Retention":
+        """Read the retention from HISTORY_HOURS and HISTORY_DAYS."""
+        defaults = cls()
+        return cls(
+            hours=max(env_int("HISTORY_HOURS", defaults.hours), 1),
+            days=max(env_int("HISTORY_DAYS", defaults.days), 1),
+        )
+
+
+def hour_of(timestamp: float) -> int:
+    """Return the start of the hour the timestamp falls in."""
+    return int(timestamp // HOUR * HOUR)
+
+
+def day_of(timestamp: float) -> int:
+    """Return the start of the UTC day the timestamp falls in."""
+    return int(timestamp // DAY * DAY)
+
+
+def record(
+    db: sqlite3.Connection,
+    deltas: Mapping[str, int],
+    now: float | None = None,
+    retention: Retention | None = None,
+) -> None:
+    """Add guess deltas to the current hour, in the caller's transaction."""
+    now = time.time() if now is None else now
+    retention = Retention.from_env() if retention is None else retention
+    hour = hour_of(now)
+    db.executemany(
+        RECORD_SQL,
+        [(hour, surname, delta) for surname, delta in deltas.items()],
+    )
+    # The oldest hour is the first entry of the primary key
+    oldest = db.execute("SELECT MIN(hour) FROM guess_hours").fetchone()[0]
+    if oldest is not None and oldest < hour - retention.hours * HOUR:
+        roll_up(db, now, retention)
+
+
+def roll_up(db: sqlite3.Connection, now: float, retention: Retention) -> int:
+    """Move hours past the retention into days and drop expired days.
+
+    Returns the number of hourly rows rolled up. Runs in the caller's
+    transaction.
+    """
+    cutoff = hour_of(now) - retention.hours * HOUR
+    db.execute(ROLL_UP_SQL, (cutoff,))
+    db.execute(ROLL_UP_TOTALS_SQL, (cutoff,))
+    rolled_up = db.execute("DELETE FROM guess_hours WHERE hour < ?", (cutoff,))
+    expired = day_of(now) - retention.days * DAY
+    db.execute("DELETE FROM guess_days WHERE day < ?", (expired,))
+    db.execute("DELETE FROM guess_day_totals WHERE day < ?", (expired,))
+    return rolled_up.rowcount
+
+
+def top_surnames(
+    db: sqlite3.Connection,
+    since: int,
+    limit: int,
+) -> list[tuple[str, int]]:
+    """Return (surname, guesses) of the most guessed surnames since an hour."""
+    return db.execute(
+        "SELECT surname, SUM(count) AS guesses FROM guess_hours WHERE hour >= ? "
+        "GROUP BY surname ORDER BY guesses DESC, surname ASC LIMIT ?",
+        (since, limit),
+    ).fetchall()
+
+
+def hourly_totals(db: sqlite3.Connection, since: int) -> dict[int, int]:
+    """Return the guesses made in each hour since an hour, by hour."""
+    return dict(
+        db.execute(
+            "SELECT hour, SUM(count) FROM guess_hours WHERE hour >= ? GROUP BY hour",
+            (since,),
+        ).fetchall(),
+    )
+
+
+def daily_totals(db: sqlite3.Connection, since: int) -> dict[int, int]:
+    """Return the guesses made on each day since a day, by day.
+
+    Hours not rolled up yet are added to the days they belong to.
+    """
+    return dict(
+        db.execute(
+            "SELECT day, SUM(count) FROM ("
+            "  SELECT day, count FROM guess_day_totals WHERE day >= ?"
+            "  UNION ALL SELECT hour - hour % 86400, count FROM guess_hours"
+            "  WHERE hour >= ?"
+            ") GROUP BY day",
+            (since, since),
+        ).fetchall(),
+    )
@@ -0,0 +1,236 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Reading and validating guess batches posted to /api/guesses/batch.
+
+A batch is a JSON array or NDJSON, one item per line. An item is a surname,
+a ``[surname, count]`` pair or ``{"surname": ..., "count": ...}``; the
+count defaults to 1. Surnames are cleaned like /submit does (first word,
+validation, lowercase) and accepted items are summed per surname, so that
+a batch becomes a single increment however many items it holds.
+
+The body is decoded one item at a time as it is read, so only the summed
+counts and the first MAX_REPORTED_REJECTIONS rejections are kept in
+memory, never the whole body.
+"""
+
+import codecs
+import json
+import re
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from itertools import batched
+from typing import IO, Any
+
+from validation import validate_batch
+
+FORMAT_JSON = "json"
+FORMAT_NDJSON = "ndjson"
+CONTENT_TYPES = {
+    "application/json": FORMAT_JSON,
+    "application/x-ndjson": FORMAT_NDJSON,
+    "application/jsonl": FORMAT_NDJSON,
+}
+
+# Rejections of items that never reach surname validation
+INVALID_ITEM = "invalid_item"
+INVALID_COUNT = "invalid_count"
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Longest item accepted, in characters; anything longer is malformed
+MAX_ITEM_LENGTH = 1024
+MAX_LINE_BYTES = MAX_ITEM_LENGTH * 4
+# Items validated together
+VALIDATE_BATCH_SIZE = 1000
+# Rejections reported individually; the rest are only counted
+MAX_REPORTED_REJECTIONS = 100
+
+
+class BatchError(ValueError):
+    """The body is not a well-formed batch; nothing of it is applied."""
+
+
+class BatchTooLargeError(BatchError):
+    """The batch holds more items or guesses than are accepted at once."""
+
+
+@dataclass
+class BatchResult:
+    counts: Counter[str] = field(default_factory=Counter)
+    items: int = 0
+    # {"index": ..., "reason": ...} of the first rejected items, in order
+    rejections: list[dict[str, Any]] = field(default_factory=list)
+    # Rejected items by reason, including those not reported individually
+    reasons: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def rejected(self) -> int:
+        return self.reasons.total()
+
+    @property
+    def accepted(self) -> int:
+        return self.items - self.rejected
+
+
+def iter_ndjson(stream: IO[bytes]) -> Iterator[object]:
+    """Decode one item per non-blank line."""
+    line_number = 0
+    while line := stream.readline(MAX_LINE_BYTES + 1):
+        line_number += 1
+        if len(line) > MAX_LINE_BYTES and not line.endswith(b"\n"):
+            msg = f"line {line_number} is too long"
+            raise BatchError(msg)
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            msg = f"line {line_number}: {e}"
+            raise BatchError(msg) from e
+
+
+class JsonArrayReader:
+    """Decode the elements of a JSON array read from a byte stream in chunks."""
+
+    def __init__(self, stream: IO[bytes], chunk_size: int = CHUNK_SIZE) -> None:
+        """Read from stream chunk_size bytes at a time."""
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def __iter__(self) -> Iterator[object]:
+        """Yield each element as soon as it has been read."""
+        if self._next_char() != "[":
+            msg = "expected a JSON array"
+            raise BatchError(msg)
+        self.position += 1
+        if self._next_char() == "]":
+            self.position += 1
+        else:
+            while True:
+                yield self._decode_value()
+                separator = self._next_char()
+                self.position += 1
+                if separator == "]":
+                    break
+                if separator != ",":
+                    msg = f"expected ',' or ']' at {separator!r}"
+                    raise BatchError(msg)
+        if self._next_char():
+            msg = "unexpected data after the array"
+            raise BatchError(msg)
+
+    def _fill(self) -> None:
+        try:
+            chunk = self.stream.read(self.chunk_size)
+            text = self.text_decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as e:
+            msg = "the body is not UTF-8"
+            raise BatchError(msg) from e
+        self.eof = not chunk
+        self.buffer = self.buffer[self.position :] + text
+        self.position = 0
+
+    def _next_char(self) -> str:
+        """Skip whitespace and return the next character, or "" at the end."""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if self.eof:
+                return ""
+            self._fill()
+
+    def _decode_value(self) -> object:
+        while True:
+            self._next_char()
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError as e:
+                if self.eof or len(self.buffer) - self.position > MAX_ITEM_LENGTH:
+                    msg = f"malformed item: {e}"
+                    raise BatchError(msg) from e
+            else:
+                # A number may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            self._fill()
+
+
+def parse_item(item: object, max_count: int) -> tuple[str, int] | str:
+    """Return the candidate surname and count of an item, or why it is invalid."""
+    if isinstance(item, str):
+        surname, count = item, 1
+    elif isinstance(item, list) and len(item) == 2:  # noqa: PLR2004
+        surname, count = item
+    elif isinstance(item, dict) and item.keys() <= {"surname", "count"}:
+        surname, count = item.get("surname"), item.get("count", 1)
+    else:
+        return INVALID_ITEM
+    if not isinstance(surname, str):
+        return INVALID_ITEM
+    if type(count) is not int or not 1 <= count <= max_count:
+        return INVALID_COUNT
+    # First word only, as on /submit
+    words = surname.split()
+    return (words[0] if words else "", count)
+
+
+def read_batch(
+    items: Iterable[object],
+    max_items: int,
+    max_count: int,
+    max_guesses: int,
+) -> BatchResult:
+    """Validate the items and sum the counts of the valid ones per surname.
+
+    Raises BatchTooLargeError once more than max_items items have been read
+    or the valid ones add up to more than max_guesses guesses.
+    """
+    result = BatchResult()
+    guesses = 0
+    for chunk in batched(items, VALIDATE_BATCH_SIZE, strict=False):
+        first_index = result.items
+        result.items += len(chunk)
+        if result.items > max_items:
+            msg = f"a batch holds at most {max_items} items"
+            raise BatchTooLargeError(msg)
+
+        candidates = []
+        rejections = []
+        for index, item in enumerate(chunk, first_index):
+            parsed = parse_item(item, max_count)
+            if isinstance(parsed, str):
+                rejections.append({"index": index, "reason": parsed})
+            else:
+                candidates.append((index, *parsed))
+        validated = validate_batch(surname for _, surname, _ in candidates)
+        for (index, _, count), (surname, reason) in zip(
+            candidates,
+            validated,
+            strict=True,
+        ):
+            if reason is None:
+                result.counts[surname] += count
+                guesses += count
+            else:
+                rejections.append(
+                    {"index": index, "surname": surname, "reason": str(reason)},
+                )
+        if guesses > max_guesses:
+            msg = f"a batch adds at most {max_guesses} guesses"
+            raise BatchTooLargeError(msg)
+
+        result.reasons.update(rejection["reason"] for rejection in rejections)
+        # Chunks come in order, so the first rejections are those kept so far
+        # and then this chunk's
+        wanted = MAX_REPORTED_REJECTIONS - len(result.rejections)
+        if wanted > 0:
+            rejections.sort(key=lambda rejection: rejection["index"])
+            result.rejections += rejections[:wanted]
+    return result
@@ -0,0 +1,209 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Leaderboard queries over the guesses table.
+
+The leaderboard is ordered by ``(count DESC, surname ASC)``. Pages are
+fetched with keyset (seek) pagination on that key, backed by the
+``guesses_leaderboard`` index, so fetching a page deep in the list costs
+the same as fetching the first one.
+
+While sharded counter slots are pending (sharded_counter.py), the counts
+are read from the ``guess_counts`` view instead, which adds the slots to
+the guesses rows at the cost of a scan. Compaction empties the slots and
+returns the queries to the index.
+"""
+
+import sqlite3
+from typing import Any
+
+# A position in the leaderboard: the (count, surname) of a row
+LeaderboardKey = tuple[int, str]
+
+MAX_PAGE_SIZE = 500
+
+# Add a delta to a surname's count, creating the row on its first guess
+UPSERT_SQL = (
+    "INSERT INTO guesses (surname, count) VALUES (?, ?) "
+    "ON CONFLICT(surname) DO UPDATE SET count = count + excluded.count"
+)
+
+
+def encode_cursor(row: sqlite3.Row | dict[str, Any]) -> str:
+    """Return an opaque cursor pointing at the given row."""
+    return f"{row['count']}:{row['surname']}"
+
+
+def decode_cursor(cursor: str) -> LeaderboardKey:
+    """Parse a cursor produced by encode_cursor, raising ValueError if invalid."""
+    count, separator, surname = cursor.partition(":")
+    if not separator or not surname:
+        msg = f"Invalid cursor: {cursor!r}"
+        raise ValueError(msg)
+    return int(count), surname
+
+
+def counts_source(db: sqlite3.Connection) -> str:
+    """Return the relation to read counts from: guesses or guess_counts."""
+    try:
+        pending = db.execute("SELECT EXISTS (SELECT 1 FROM guess_shards)").fetchone()
+    except sqlite3.OperationalError:
+        # A database created before counter slots existed
+        return "guesses"
+    return "guess_counts" if pending[0] else "guesses"
+
+
+def fetch_top(db: sqlite3.Connection, limit: int | None = None) -> list[sqlite3.Row]:
+    """Return the first rows of the leaderboard, or all of it without a limit."""
+    return db.execute(
+        f"SELECT surname, count FROM {counts_source(db)} "  # noqa: S608
+        "ORDER BY count DESC, surname ASC LIMIT ?",
+        (-1 if limit is None else limit,),
+    ).fetchall()
+
+
+def fetch_after(
+    db: sqlite3.Connection,
+    key: LeaderboardKey,
+    limit: int,
+    *,
+    inclusive: bool = False,
+) -> list[sqlite3.Row]:
+    """Return up to limit rows that follow the key in leaderboard order."""
+    count, surname = key
+    comparison = ">=" if inclusive else ">"
+    return db.execute(
+        f"SELECT surname, count FROM {counts_source(db)} "  # noqa: S608
+        f"WHERE count <= ? AND (count < ? OR surname {comparison} ?) "
+        "ORDER BY count DESC, surname ASC LIMIT ?",
+        (count, count, surname, limit),
+    ).fetchall()
+
+
+def fetch_before(
+    db: sqlite3.Connection,
+    key: LeaderboardKey,
+    limit: int,
+) -> list[sqlite3.Row]:
+    """Return up to limit rows that precede the key, in leaderboard order."""
+    count, surname = key
+    rows = db.execute(
+        f"SELECT surname, count FROM {counts_source(db)} "  # noqa: S608
+        "WHERE count >= ? AND (count > ? OR surname < ?) "
+        "ORDER BY count ASC, surname DESC LIMIT ?",
+        (count, count, surname, limit),
+    ).fetchall()
+    rows.reverse()
+    return rows
+
+
+def fetch_page(
+    db: sqlite3.Connection,
+    limit: int,
+    *,
+    after: LeaderboardKey | None = None,
+    before: LeaderboardKey | None = None,
+    around: str | None = None,
+) -> tuple[list[sqlite3.Row], bool, bool] | None:
+    """Return one page of rows and whether rows precede and follow it.
+
+    The page starts after the key ``after``, ends before the key ``before``
+    or is centred on the surname ``around``; without any of them it is the
+    top of the leaderboard. Returns None if the around surname is unknown.
+    """
+    has_prev = has_next = False
+    if around:
+        key = fetch_key(db, around)
+        if key is None:
+            return None
+        preceding_limit = limit // 2
+        preceding = fetch_before(db, key, preceding_limit + 1)
+        if len(preceding) > preceding_limit:
+            has_prev = True
+            preceding = preceding[1:]
+        following_limit = limit - len(preceding)
+        following = fetch_after(db, key, following_limit + 1, inclusive=True)
+        has_next = len(following) > following_limit
+        rows = preceding + following[:following_limit]
+    elif before is not None:
+        rows = fetch_before(db, before, limit + 1)
+        has_prev, has_next = len(rows) > limit, True
+        rows = rows[-limit:]
+    else:
+        if after is not None:
+            rows = fetch_after(db, after, limit + 1)
+            has_prev = True
+        else:
+            rows = fetch_top(db, limit + 1)
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+    return rows, has_prev, has_next
+
+
+def fetch_key(db: sqlite3.Connection, surname: str) -> LeaderboardKey | None:
+    """Return the leaderboard key of a surname, or None if it is unknown."""
+    row = db.execute(
+        f"SELECT count FROM {counts_source(db)} WHERE surname = ?",  # noqa: S608
+        (surname,),
+    ).fetchone()
+    return None if row is None else (row[0], surname)
+
+
+def fetch_counts(db: sqlite3.Connection, surnames: list[str]) -> dict[str, int]:
+    """Return the count of each of the surnames that is in the leaderboard."""
+    if not surnames:
+        return {}
+    placeholders = ", ".join("?" * len(surnames))
+    return dict(
+        db.execute(
+            f"SELECT surname, count FROM {counts_source(db)} "  # noqa: S608
+            f"WHERE surname IN ({placeholders})",
+            surnames,
+        ).fetchall(),
+    )
+
+
+def count_ahead(
+    db: sqlite3.Connection,
+    key: LeaderboardKey,
+    *,
+    exclude: str | None = None,
+) -> int:
+    """Return how many rows precede the key, optionally ignoring one surname."""
+    count, surname = key
+    return db.execute(
+        f"SELECT COUNT(*) FROM {counts_source(db)} "  # noqa: S608
+        "WHERE count >= ? AND (count > ? OR surname < ?) AND surname IS NOT ?",
+        (count, count, surname, exclude),
+    ).fetchone()[0]
+
+
+def fetch_totals(db: sqlite3.Connection) -> tuple[int, int]:
+    """Return (number of variations, total number of guesses).
+
+    Read from the guess_stats row that triggers keep in sync with guesses,
+    rather than scanning the table, plus the guesses still pending in
+    counter slots, which are only a few rows between compactions.
+    """
+    total_variations, total_count = db.execute(
+        "SELECT total_variations, total_count + "
+        "(SELECT COALESCE(SUM(count), 0) FROM guess_shards) "
+        "FROM guess_stats WHERE id = 1",
+    ).fetchone()
+    return total_variations, total_count
+
+
+def with_percentages(
+    rows: list[sqlite3.Row],
+    total_count: int,
+) -> list[dict[str, Any]]:
+    """Convert rows to dicts with each guess's share of all guesses."""
+    guesses_with_percentages = []
+    for guess in rows:
+        percentage = (guess["count"] / total_count * 100) if total_count > 0 else 0
+        guesses_with_percentages.append(
+            {
+                "surname": guess["surname"],
+                "count": guess["count"],
+                "percentage": round(percentage, 2),
+            },
+        )
+    return guesses_with_percentages
@@ -0,0 +1,323 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Live leaderboard updates, pushed to /results as Server-Sent Events.
+
+Every write to guesses also appends its per-surname deltas to the
+``guess_events`` table, in the same transaction (publish()). Each server
+process runs one poller thread that reads the new events once per interval
+and summarises them in a single frame: the current count, rank and rank
+change of every surname involved, plus the new totals. A frame is built
+and serialised once and shared by all streams of the process that are at
+the same position, so a burst of guesses costs the same however many tabs
+are open. Worker processes need no broker: they all poll the database
+they already share. The poller reads through the app's storage backend
+(storage.py), so with a shared Redis storage every host sees every guess.
+
+Frames carry absolute counts, so applying one twice is harmless. The SSE
+id of a frame is the last event it covers; a reconnecting browser sends it
+back as Last-Event-ID and gets everything it missed in one frame, or a
+``reset`` event if those events have already been pruned.
+
+A held stream occupies a server thread, so at most max_streams streams per
+process are held open, each for at most hold seconds. Any further stream
+only waits for the next poll, gets its frame and closes, and the browser
+reconnects after a longer retry delay: those tabs fall back to polling.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import AbstractContextManager
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from leaderboard import count_ahead, fetch_key, fetch_totals
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_SQL = "INSERT INTO guess_events (surname, delta) VALUES (?, ?)"
+
+# Every rank in a frame costs an index range count, so a frame that touches
+# more surnames than this tells clients to reload the page instead
+MAX_FRAME_ROWS = 100
+
+# Streams that are not held open reconnect this many intervals later
+POLLING_BACKOFF = 5
+
+
+def publish(db: sqlite3.Connection, deltas: Mapping[str, int]) -> None:
+    """Record guess deltas for the live stream, in the caller's transaction."""
+    db.executemany(PUBLISH_SQL, deltas.items())
+
+
+def latest_event_id(db: sqlite3.Connection) -> int:
+    """Return the id of the most recent guess event, or 0 if there are none."""
+    return db.execute("SELECT COALESCE(MAX(id), 0) FROM guess_events").fetchone()[0]
+
+
+def read_deltas(
+    db: sqlite3.Connection,
+    since: int,
+) -> tuple[int, list[tuple[str, int]]] | None:
+    """Return the latest event id and the deltas per surname of the events after since.
+
+    Returns None if some of those events have already been pruned. Call it
+    in a transaction when the result is checked against other tables.
+    """
+    first_id, last_id = db.execute(
+        "SELECT (SELECT MIN(id) FROM guess_events), (SELECT MAX(id) FROM guess_events)",
+    ).fetchone()
+    if last_id is None or last_id <= since:
+        return since, []
+    if first_id > since + 1:
+        return None
+    deltas = db.execute(
+        "SELECT surname, SUM(delta) FROM guess_events WHERE id > ? GROUP BY surname",
+        (since,),
+    ).fetchall()
+    return last_id, deltas
+
+
+def format_event(event: str, event_id: int, data: dict[str, Any]) -> bytes:
+    """Encode one Server-Sent Event."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+
+@dataclass(frozen=True)
+class Frame:
+    """An encoded event covering the guess events in (since, id]."""
+
+    since: int
+    id: int
+    message: bytes
+
+
+def build_frame(db: sqlite3.Connection, since: int) -> Frame | None:
+    """Summarise the guess events after since, or return None if there are none.
+
+    Everything is read from one snapshot, so that counts, ranks and totals
+    agree with each other.
+    """
+    db.execute("BEGIN")
+    try:
+        first_id, last_id = db.execute(
+            "SELECT (SELECT MIN(id) FROM guess_events), "
+            "(SELECT MAX(id) FROM guess_events)",
+        ).fetchone()
+        if last_id is None or last_id <= since:
+            return None
+        deltas = db.execute(
+            "SELECT surname, SUM(delta) FROM guess_events WHERE id > ? "
+            "GROUP BY surname LIMIT ?",
+            (since, MAX_FRAME_ROWS + 1),
+        ).fetchall()
+        if since + 1 < first_id or len(deltas) > MAX_FRAME_ROWS:
+            return Frame(since, last_id, format_event("reset", last_id, {}))
+
+        rows = []
+        for surname, delta in deltas:
+            key = fetch_key(db, surname)
+            if key is None:
+                continue
+            count = key[0]
+            rank = count_ahead(db, (count, surname)) + 1
+            previous_count = count - delta
+            rank_change = None
+            if previous_count > 0:
+                previous_rank = (
+                    count_ahead(db, (previous_count, surname), exclude=surname) + 1
+                )
+                rank_change = previous_rank - rank
+            rows.append(
+                {
+                    "surname": surname,
+                    "count": count,
+                    "rank": rank,
+                    "rank_change": rank_change,
+                },
+            )
+        total_variations, total_count = fetch_totals(db)
+    finally:
+        db.commit()
+
+    rows.sort(key=lambda row: row["rank"])
+    data = {
+        "rows": rows,
+        "total_variations": total_variations,
+        "total_count": total_count,
+    }
+    return Frame(since, last_id, format_event("delta", last_id, data))
+
+
+class FrameSource(Protocol):
+    def events_since(self, since: int) -> Frame | None:
+        """Summarise the guess events after since, or return None if there are none."""
+
+
+class LiveUpdates:
+    """Poll the guess events and share the frames among this process's streams.
+
+    open_source returns a context manager that the poller thread holds for
+    as long as it runs, giving it the FrameSource to poll.
+    """
+
+    def __init__(
+        self,
+        open_source: Callable[[], AbstractContextManager[FrameSource]],
+        *,
+        interval: float = 1.0,
+        hold: float = 25.0,
+        max_streams: int = 2,
+    ) -> None:
+        """Create the poller; open_source gives the poller thread its events."""
+        self.open_source = open_source
+        self.interval = interval
+        self.hold = hold
+        self.max_streams = max_streams
+
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._closed = False
+        self._pid = os.getpid()
+        self._thread: threading.Thread | None = None
+        # Position of every waiting stream, keyed by a per-stream token
+        self._waiting: dict[object, int] = {}
+        self._held = 0
+        # Frames of the latest poll, by the position they start from
+        self._frames: dict[int, Frame] = {}
+        self._polls_started = 0
+        self._polls_finished = 0
+
+        self.frames_built = 0
+
+    def stream(self, since: int) -> Iterator[bytes]:
+        """Yield the messages for a client that has seen the events up to since."""
+        self._ensure_started()
+        token = object()
+        with self._condition:
+            held = self._held < self.max_streams and not self._closed
+            if held:
+                self._held += 1
+        retry = self.interval * (1 if held else POLLING_BACKOFF)
+        deadline = time.monotonic() + (self.hold if held else 0)
+        try:
+            yield f"retry: {int(retry * 1000)}\n\n".encode()
+            while True:
+                frame = self._next_frame(token, since, deadline)
+                if frame is not None:
+                    yield frame.message
+                    since = frame.id
+                if frame is None or not held or time.monotonic() >= deadline:
+                    return
+        finally:
+            with self._condition:
+                self._waiting.pop(token, None)
+                if held:
+                    self._held -= 1
+
+    def close(self) -> None:
+        """Stop the poller and end every open stream."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.interval, 1.0) * 2)
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            return {
+                "held_streams": self._held,
+                "waiting_streams": len(self._waiting),
+                "polls": self._polls_finished,
+                "frames": self.frames_built,
+            }
+
+    def _next_frame(
+        self,
+        token: object,
+        since: int,
+        deadline: float,
+    ) -> Frame | None:
+        """Wait for a frame that starts at since.
+
+        Returns None once the deadline has passed, but not before a poll
+        that started after this call has completed, so that a stream that
+        is not held still gets the frame it came for.
+        """
+        with self._condition:
+            self._waiting[token] = since
+            self._condition.notify_all()
+            needed = self._polls_started + 1
+            while not self._closed:
+                frame = self._frames.get(since)
+                if frame is not None:
+                    return frame
+                remaining = deadline - time.monotonic()
+                if self._polls_finished >= needed and remaining <= 0:
+                    return None
+                self._condition.wait(remaining if remaining > 0 else self.interval)
+            return None
+
+    def _ensure_started(self) -> None:
+        if self._pid != os.getpid():
+            # We were forked: the poller thread belongs to the parent process
+            self._reset_after_fork()
+        if self._thread is None or not self._thread.is_alive():
+            with self._condition:
+                if self._thread is not None and self._thread.is_alive():
+                    return
+                self._closed = False
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="live-updates-poller",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _reset_after_fork(self) -> None:
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._waiting = {}
+        self._held = 0
+        self._frames = {}
+        self._thread = None
+        self._pid = os.getpid()
+
+    def _run(self) -> None:
+        with self.open_source() as source:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._waiting or self._closed,
+                    )
+                    if self._closed:
+                        return
+                    positions = set(self._waiting.values())
+                    self._polls_started += 1
+                try:
+                    frames = self._poll(source, positions)
+                except Exception:
+                    logger.exception("Failed to poll guess events, will retry")
+                    frames = {}
+                with self._condition:
+                    self._frames = frames
+                    self._polls_finished += 1
+                    self._condition.notify_all()
+                self._stop.wait(self.interval)
+
+    def _poll(self, source: FrameSource, positions: set[int]) -> dict[int, Frame]:
+        """Build one frame per distinct position of the waiting streams."""
+        frames = {}
+        for since in positions:
+            frame = source.events_since(since)
+            if frame is not None:
+                frames[since] = frame
+                self.frames_built += 1
+        return frames
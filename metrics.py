@@ -0,0 +1,418 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Prometheus metrics, recorded without locks and shared by worker processes.
+
+Every thread records into its own store, a growable buffer of keyed
+doubles that no other thread writes, so counting a request or observing a
+latency is a dict lookup and one or two in-place additions. The bucket
+counters and sum of a histogram are allocated together the first time a
+thread observes a label set; later observations allocate nothing.
+
+With METRICS_DIR set, each store is a file in that directory mapped into
+memory, and /metrics adds up every file in it. That covers every gunicorn
+worker, including ones that have since exited; serve.py points METRICS_DIR
+at a fresh directory for each server run. Without it, stores live in
+process memory and /metrics covers this process only.
+"""
+
+import bisect
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+
+from settings import env_str
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a revalidated page up to a full rebuild of the leaderboard
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+STORE_SUFFIX = ".metrics"
+INITIAL_STORE_BYTES = 64 * 1024
+
+# A store starts with the number of bytes in use, followed by entries of a
+# key length, the UTF-8 key padded to 8 bytes and the value as a double
+_USED = struct.Struct("<Q")
+_KEY_LENGTH = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+
+
+class ThreadStore:
+    """The values recorded by one thread, in memory or in a mapped file."""
+
+    def __init__(self, path: Path | None = None) -> None:
+        """Create a store in memory, or in the file at path to share it."""
+        self.path = path
+        # (metric name, label values) -> indices of its values
+        self.children: dict[tuple[str, tuple[str, ...]], tuple[int, ...]] = {}
+        self._indices: dict[str, int] = {}
+        self._used = _USED.size
+        self._fd = None
+        if path is not None:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        self.buffer: bytearray | mmap.mmap = bytearray()
+        self.values = memoryview(self.buffer)
+        self._resize(INITIAL_STORE_BYTES)
+
+    def index(self, key: str) -> int:
+        """Return the index in values of the key, adding it with 0 if new."""
+        index = self._indices.get(key)
+        if index is not None:
+            return index
+        encoded = key.encode()
+        padded = len(encoded) + (-(_KEY_LENGTH.size + len(encoded)) % 8)
+        size = _KEY_LENGTH.size + padded + _VALUE.size
+        if self._used + size > len(self.buffer):
+            self._resize(max(len(self.buffer) * 2, self._used + size))
+
+        start = self._used
+        _KEY_LENGTH.pack_into(self.buffer, start, len(encoded))
+        key_start = start + _KEY_LENGTH.size
+        self.buffer[key_start : key_start + len(encoded)] = encoded
+        index = (key_start + padded) // _VALUE.size
+        self.values[index] = 0.0
+        # Publish the entry only once it is complete
+        self._used += size
+        _USED.pack_into(self.buffer, 0, self._used)
+        self._indices[key] = index
+        return index
+
+    def snapshot(self) -> bytes:
+        return bytes(self.buffer[: self._used])
+
+    def _resize(self, size: int) -> None:
+        old_buffer, old_values = self.buffer, self.values
+        if self._fd is None:
+            buffer: bytearray | mmap.mmap = bytearray(size)
+            buffer[: len(old_buffer)] = old_buffer
+        else:
+            os.ftruncate(self._fd, size)
+            buffer = mmap.mmap(self._fd, size)
+        self.buffer = buffer
+        self.values = memoryview(buffer).cast("d")
+        old_values.release()
+        if isinstance(old_buffer, mmap.mmap):
+            old_buffer.close()
+
+
+def clear_directory(directory: Path) -> None:
+    """Remove the stores left in a directory by a previous run."""
+    for path in directory.glob(f"*{STORE_SUFFIX}"):
+        path.unlink(missing_ok=True)
+
+
+def read_store(data: bytes) -> Iterator[tuple[str, float]]:
+    """Yield the (key, value) entries of a store's contents."""
+    if len(data) < _USED.size:
+        return
+    used = min(_USED.unpack_from(data)[0], len(data))
+    position = _USED.size
+    while position + _KEY_LENGTH.size <= used:
+        (length,) = _KEY_LENGTH.unpack_from(data, position)
+        key_start = position + _KEY_LENGTH.size
+        value_start = key_start + length + (-(_KEY_LENGTH.size + length) % 8)
+        if value_start + _VALUE.size > used:
+            return
+        yield (
+            data[key_start : key_start + length].decode(),
+            _VALUE.unpack_from(data, value_start)[0],
+        )
+        position = value_start + _VALUE.size
+
+
+class Registry:
+    """The metrics of the app and the stores of the threads recording them."""
+
+    def __init__(self, directory: Path | None = None) -> None:
+        """Create a registry; the directory defaults to METRICS_DIR."""
+        self.metrics: dict[str, Metric] = {}
+        self._directory = directory
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    @property
+    def directory(self) -> Path | None:
+        if self._directory is not None:
+            return self._directory
+        directory = env_str("METRICS_DIR", "")
+        return Path(directory) if directory else None
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self.metrics:
+            msg = f"Metric {metric.name} is already registered"
+            raise ValueError(msg)
+        self.metrics[metric.name] = metric
+
+    def store(self) -> ThreadStore:
+        """Return the calling thread's store, creating it on first use."""
+        try:
+            return self._local.store
+        except AttributeError:
+            pass
+        directory = self.directory
+        with self._lock:
+            if directory is None:
+                store = ThreadStore()
+            else:
+                directory.mkdir(parents=True, exist_ok=True)
+                # Never reuse a file: it may hold the counts of an exited
+                # worker that had the same pid
+                while True:
+                    name = f"{os.getpid()}-{next(self._sequence)}{STORE_SUFFIX}"
+                    try:
+                        store = ThreadStore(directory / name)
+                        break
+                    except FileExistsError:
+                        continue
+            self._stores.append(store)
+        self._local.store = store
+        return store
+
+    def collect(self) -> dict[str, float]:
+        """Return every key with its value summed over all stores."""
+        directory = self.directory
+        if directory is not None:
+            sources = [path.read_bytes() for path in directory.glob(f"*{STORE_SUFFIX}")]
+        else:
+            with self._lock:
+                sources = [store.snapshot() for store in self._stores]
+        totals: dict[str, float] = defaultdict(float)
+        for data in sources:
+            for key, value in read_store(data):
+                totals[key] += value
+        return totals
+
+    def expose(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        samples: dict[str, dict[tuple, float]] = defaultdict(dict)
+        for key, value in self.collect().items():
+            name, suffix, labels = json.loads(key)
+            samples[name][suffix, tuple(labels)] = value
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.expose(samples.get(metric.name, {})))
+        return "\n".join(lines) + "\n"
+
+    def _reset(self) -> None:
+        # Stores inherited over fork() belong to the parent
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stores: list[ThreadStore] = []
+        self._sequence = itertools.count()
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        """Create the metric and register it in registry."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.registry = registry
+        registry.register(self)
+
+    def keys(self, labels: tuple[str, ...]) -> list[str]:
+        """Return the store keys of the values of a label set."""
+        raise NotImplementedError
+
+    def expose(self, samples: dict[tuple, float]) -> list[str]:
+        raise NotImplementedError
+
+    def _allocate(self, store: ThreadStore, labels: tuple[str, ...]) -> tuple[int, ...]:
+        if len(labels) != len(self.labelnames):
+            msg = f"{self.name} takes labels {self.labelnames}, got {labels}"
+            raise ValueError(msg)
+        indices = tuple(store.index(key) for key in self.keys(labels))
+        store.children[self.name, labels] = indices
+        return indices
+
+    def _key(self, suffix: str, labels: tuple[str, ...], *extra: str) -> str:
+        return json.dumps([self.name, suffix, [*labels, *extra]])
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        store = self.registry.store()
+        indices = store.children.get((self.name, labels))
+        if indices is None:
+            indices = self._allocate(store, labels)
+        store.values[indices[0]] += amount
+
+    def keys(self, labels: tuple[str, ...]) -> list[str]:
+        return [self._key("", labels)]
+
+    def expose(self, samples: dict[tuple, float]) -> list[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for (_, labels), value in sorted(samples.items())
+        ]
+
+
+# [seconds, blocks] timed by Histogram.time per metric name, for each thread
+# inside record_breakdown(). Empty otherwise, which is all a timed block
+# then checks.
+_breakdowns: dict[int, defaultdict[str, list[float]]] = {}
+
+
+@contextmanager
+def record_breakdown() -> Iterator[defaultdict[str, list[float]]]:
+    """Add up the blocks this thread times, as [seconds, blocks] per metric."""
+    ident = threading.get_ident()
+    breakdown = _breakdowns[ident] = defaultdict(lambda: [0.0, 0])
+    try:
+        yield breakdown
+    finally:
+        del _breakdowns[ident]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        """Create the histogram with the given bucket bounds in seconds."""
+        self.bounds = tuple(sorted(buckets))
+        self._bucket_labels = [format_value(bound) for bound in self.bounds]
+        self._bucket_labels.append("+Inf")
+        super().__init__(name, documentation, labelnames, registry=registry)
+
+    def observe(self, value: float, *labels: str) -> None:
+        store = self.registry.store()
+        indices = store.children.get((self.name, labels))
+        if indices is None:
+            indices = self._allocate(store, labels)
+        values = store.values
+        values[indices[bisect.bisect_left(self.bounds, value)]] += 1
+        values[indices[-1]] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the seconds spent in the with block."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.observe(elapsed, *labels)
+            if _breakdowns:
+                breakdown = _breakdowns.get(threading.get_ident())
+                if breakdown is not None:
+                    entry = breakdown[self.name]
+                    entry[0] += elapsed
+                    entry[1] += 1
+
+    def keys(self, labels: tuple[str, ...]) -> list[str]:
+        # Counts per bucket (not cumulative) and the sum of observations
+        keys = [self._key("_bucket", labels, le) for le in self._bucket_labels]
+        keys.append(self._key("_sum", labels))
+        return keys
+
+    def expose(self, samples: dict[tuple, float]) -> list[str]:
+        label_sets = sorted({labels for suffix, labels in samples if suffix == "_sum"})
+        lines = []
+        for labels in label_sets:
+            cumulative = 0.0
+            for le in self._bucket_labels:
+                cumulative += samples.get(("_bucket", (*labels, le)), 0.0)
+                bucket_labels = format_labels((*self.labelnames, "le"), (*labels, le))
+                lines.append(
+                    f"{self.name}_bucket{bucket_labels} {format_value(cumulative)}",
+                )
+            formatted = format_labels(self.labelnames, labels)
+            total = samples[("_sum", labels)]
+            lines.append(f"{self.name}_sum{formatted} {format_value(total)}")
+            lines.append(f"{self.name}_count{formatted} {format_value(cumulative)}")
+        return lines
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label(value)}"'
+        for name, value in zip(names, values, strict=True)
+    )
+    return f"{{{pairs}}}"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+REQUESTS = Counter(
+    "ben_http_requests_total",
+    "HTTP requests by route, method and status.",
+    ("route", "method", "status"),
+)
+REQUEST_SECONDS = Histogram(
+    "ben_http_request_duration_seconds",
+    "Time to handle a request, compression included, by route.",
+    ("route",),
+)
+DB_SECONDS = Histogram(
+    "ben_db_seconds",
+    "Time spent in SQLite queries and commits, by view and operation.",
+    ("view", "operation"),
+)
+RENDER_SECONDS = Histogram(
+    "ben_template_render_seconds",
+    "Time to render a template.",
+    ("template",),
+)
+AUDIT_WRITE_SECONDS = Histogram(
+    "ben_audit_write_seconds",
+    "Time for the audit writer to write one batch of records to audit.log.",
+)
+VALIDATION_REJECTIONS = Counter(
+    "ben_validation_rejections_total",
+    "Submitted surnames rejected by validation, by reason.",
+    ("reason",),
+)
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+# Copyright (c) 2025 Jaakko Vuori
 # /// script
 # requires-python = ">=3.8"
 # dependencies = [
@@ -15,101 +16,174 @@ This script:
 4. Provides detailed statistics about the import process
 """
 
+import argparse
+import codecs
+import hashlib
 import re
 import sqlite3
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
 from pathlib import Path
 
-from bs4 import BeautifulSoup
+from leaderboard import UPSERT_SQL, counts_source
+from setup_db import get_database_path, upgrade_db
+from validation import Rejection, is_valid_surname, normalize_surname, validate_batch
 
-# Constants for validation
-MIN_SURNAME_LENGTH = 6
-MAX_SURNAME_LENGTH = 15
 MIN_TABLE_COLUMNS = 3
-VALID_STARTING_LETTERS = ("z", "s", "t", "c")
 
+# Compiled once: the importer runs these for every one of ~25 000 names
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+WHITESPACE_PATTERN = re.compile(r"\s+")
 
-def is_valid_surname(surname: str) -> bool:
-    """Validate a surname using the same rules as the web application.
+MODE_MERGE = "merge"
+MODE_REPLACE = "replace"
+MODE_ADOPT = "adopt"
+IMPORT_MODES = (MODE_MERGE, MODE_REPLACE, MODE_ADOPT)
 
-    - Must start with 'z', 's', 't', or 'c'
-    - Length 6-15 characters
-    - Only letters (including Nordic letters)
-    """
-    if (
-        not surname
-        or len(surname) < MIN_SURNAME_LENGTH
-        or len(surname) > MAX_SURNAME_LENGTH
-    ):
-        return False
-
-    # Convert to lowercase for checking
-    surname_lower = surname.lower()
-
-    # Must start with z, s, t, or c
-    if not surname_lower.startswith(VALID_STARTING_LETTERS):
-        return False
+REJECTION_MESSAGES = {
+    Rejection.TOO_SHORT: "REJECTED (short): '{surname}' len={length} cnt={count}",
+    Rejection.TOO_LONG: "REJECTED (long): '{surname}' len={length} cnt={count}",
+    Rejection.WRONG_START: "REJECTED (start): '{surname}' '{start}' cnt={count}",
+    Rejection.INVALID_CHARS: "REJECTED (chars): '{surname}' cnt={count}",
+}
 
-    # Check if only letters (including Nordic letters and accented y)
-    return bool(re.match(r"^[a-zA-ZäöåÄÖÅüÜýÝÿŸ]+$", surname))
+# Number of changed variants listed by print_diff
+DIFF_REPORT_LIMIT = 50
 
 
 def clean_surname(surname: str) -> str:
     """Clean a surname by removing HTML tags and normalizing whitespace."""
     # Remove HTML tags if any
-    surname = re.sub(r"<[^>]+>", "", surname)
+    surname = HTML_TAG_PATTERN.sub("", surname)
 
     # Normalize whitespace
-    surname = re.sub(r"\s+", " ", surname)
+    surname = WHITESPACE_PATTERN.sub(" ", surname)
 
     # Strip leading/trailing whitespace
     return surname.strip()
 
 
-def get_database_path() -> Path:
-    """Get the path to the database file."""
-    return Path("ben.db")
+def new_validation_stats() -> dict[str, int]:
+    """Return zeroed validation statistics."""
+    return {
+        "total_entries": 0,
+        "total_submissions": 0,
+        "valid_entries": 0,
+        "valid_submissions": 0,
+        "rejected_too_short": 0,
+        "rejected_wrong_start": 0,
+        "rejected_invalid_chars": 0,
+        "rejected_too_long": 0,
+    }
+
+
+class VaaleinRowParser(HTMLParser):
+    """Tokenizer that collects the cell texts of ``<tr class="vaalein">`` rows.
 
+    Cell texts are built like BeautifulSoup's ``get_text(strip=True)``: every
+    text node inside the cell is stripped and the non-empty ones are joined.
+    Completed rows are appended to ``rows`` as the input is fed in.
+    """
 
-def parse_html_table(
+    def __init__(self) -> None:
+        """Create a parser with no rows collected yet."""
+        super().__init__(convert_charrefs=True)
+        self.rows: list[list[str]] = []
+        self._cells: list[list[str]] | None = None
+        self._open_cells: list[list[str]] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag == "tr":
+            self._end_row()
+            classes = " ".join(value or "" for name, value in attrs if name == "class")
+            if "vaalein" in classes.split():
+                self._cells = []
+        elif tag == "td" and self._cells is not None:
+            cell: list[str] = []
+            self._cells.append(cell)
+            self._open_cells.append(cell)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "td" and self._open_cells:
+            self._open_cells.pop()
+        elif tag in ("tr", "tbody", "table"):
+            self._end_row()
+
+    def handle_data(self, data: str) -> None:
+        if not self._open_cells:
+            return
+        text = data.strip()
+        if text:
+            for cell in self._open_cells:
+                cell.append(text)
+
+    def close(self) -> None:
+        super().close()
+        self._end_row()
+
+    def _end_row(self) -> None:
+        if self._cells is not None:
+            self.rows.append(["".join(cell) for cell in self._cells])
+        self._cells = None
+        self._open_cells = []
+
+
+def iter_table_rows(
     html_file_path: str,
-) -> tuple[list[tuple[str, int]], dict[str, int]]:
-    """Parse HTML file and extract surname variations with their counts.
+    chunk_size: int = 64 * 1024,
+) -> Iterator[list[str]]:
+    """Yield the cell texts of each vaalein row while streaming the file.
 
-    Returns a tuple of (surnames_data, validation_stats) where surnames_data
-    is a list of (surname, count) tuples for valid surnames only.
+    The windows-1252 file is decoded incrementally, so memory use does not
+    grow with the size of the file.
+    """
+    decoder = codecs.getincrementaldecoder("windows-1252")()
+    parser = VaaleinRowParser()
+    with Path(html_file_path).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            parser.feed(decoder.decode(chunk))
+            yield from parser.rows
+            parser.rows.clear()
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield from parser.rows
+
+
+def iter_soup_table_rows(html_file_path: str) -> Iterator[list[str]]:
+    """Yield the cell texts of each vaalein row from a BeautifulSoup tree.
+
+    This is the original parser. It reads the whole file into memory and is
+    kept to cross-check the streaming parser.
     """
+    from bs4 import BeautifulSoup  # noqa: PLC0415
+
     with Path(html_file_path).open(encoding="windows-1252") as f:
         content = f.read()
 
     soup = BeautifulSoup(content, "html.parser")
 
     # Find all table rows
-    rows = soup.find_all("tr", class_="vaalein")
+    for row in soup.find_all("tr", class_="vaalein"):
+        yield [cell.get_text(strip=True) for cell in row.find_all("td")]
 
-    surnames_data = []
-    validation_stats = {
-        "total_entries": 0,
-        "total_submissions": 0,
-        "valid_entries": 0,
-        "valid_submissions": 0,
-        "rejected_too_short": 0,
-        "rejected_wrong_start": 0,
-        "rejected_invalid_chars": 0,
-        "rejected_too_long": 0,
-    }
 
-    for row in rows:
-        cells = row.find_all("td")
+def iter_surnames(
+    rows: Iterable[list[str]],
+    validation_stats: dict[str, int],
+) -> Iterator[tuple[str, int]]:
+    """Yield (surname, count) for valid surnames, updating validation_stats."""
+    for cells in rows:
         if len(cells) < MIN_TABLE_COLUMNS:
             continue
 
         # Get the surname(s) from the second cell
-        surname_cell = cells[1]
-        surname_text = surname_cell.get_text(strip=True)
+        surname_text = cells[1]
 
         # Get the count from the third cell
-        count_cell = cells[2]
-        count_text = count_cell.get_text(strip=True)
+        count_text = cells[2]
 
         # Handle the correct answer row specially
         if "oikea vastaus" in surname_text:
@@ -127,13 +201,15 @@ def parse_html_table(
                 validation_stats["total_submissions"] += count
 
                 if is_valid_surname(correct_answer):
-                    surnames_data.append((correct_answer.lower(), count))
                     validation_stats["valid_entries"] += 1
                     validation_stats["valid_submissions"] += count
+                    yield normalize_surname(correct_answer), count
                 else:
-                    # Even if the correct answer doesn't pass validation, we should note it
+                    # Even if the correct answer doesn't pass validation,
+                    # we should note it
                     print(
-                        f"Warning: Correct answer '{correct_answer}' doesn't pass validation!",
+                        f"Warning: Correct answer '{correct_answer}' "
+                        "doesn't pass validation!",
                     )
             continue
 
@@ -145,36 +221,46 @@ def parse_html_table(
             continue
 
         # Handle multiple surnames separated by commas
-        surnames = [name.strip() for name in surname_text.split(",")]
-
-        for surname_raw in surnames:
-            # Clean up the surname
-            surname = clean_surname(surname_raw)
-            if not surname:
-                continue
+        candidates = [clean_surname(name) for name in surname_text.split(",")]
+        candidates = [surname for surname in candidates if surname]
+        validation_stats["total_entries"] += len(candidates)
+        validation_stats["total_submissions"] += count * len(candidates)
 
-            validation_stats["total_entries"] += 1
-            validation_stats["total_submissions"] += count
-
-            # Apply validation
-            if is_valid_surname(surname):
-                surnames_data.append((surname.lower(), count))
+        for surname, reason in validate_batch(candidates):
+            if reason is None:
                 validation_stats["valid_entries"] += 1
                 validation_stats["valid_submissions"] += count
-            elif len(surname) < MIN_SURNAME_LENGTH:
-                print(f"REJECTED (short): '{surname}' len={len(surname)} cnt={count}")
-                validation_stats["rejected_too_short"] += 1
-            elif len(surname) > MAX_SURNAME_LENGTH:
-                print(f"REJECTED (long): '{surname}' len={len(surname)} cnt={count}")
-                validation_stats["rejected_too_long"] += 1
-            elif not surname.lower().startswith(VALID_STARTING_LETTERS):
-                start_char = surname[0] if surname else "N/A"
-                print(f"REJECTED (start): '{surname}' '{start_char}' cnt={count}")
-                validation_stats["rejected_wrong_start"] += 1
+                yield surname, count
             else:
-                print(f"REJECTED (chars): '{surname}' cnt={count}")
-                validation_stats["rejected_invalid_chars"] += 1
+                print(
+                    REJECTION_MESSAGES[reason].format(
+                        surname=surname,
+                        length=len(surname),
+                        start=surname[0],
+                        count=count,
+                    ),
+                )
+                validation_stats[f"rejected_{reason}"] += 1
+
 
+def parse_html_table(
+    html_file_path: str,
+    *,
+    streaming: bool = True,
+) -> tuple[list[tuple[str, int]], dict[str, int]]:
+    """Parse HTML file and extract surname variations with their counts.
+
+    Returns a tuple of (surnames_data, validation_stats) where surnames_data
+    is a list of (surname, count) tuples for valid surnames only. With
+    streaming=False the file is parsed with BeautifulSoup instead.
+    """
+    rows = (
+        iter_table_rows(html_file_path)
+        if streaming
+        else iter_soup_table_rows(html_file_path)
+    )
+    validation_stats = new_validation_stats()
+    surnames_data = list(iter_surnames(rows, validation_stats))
     return surnames_data, validation_stats
 
 
@@ -183,69 +269,294 @@ def create_database_connection(db_path: str) -> sqlite3.Connection:
     return sqlite3.connect(db_path)
 
 
-def populate_database(
-    surnames_data: list[tuple[str, int]],
-    db_path: str,
-) -> None:
-    """Populate database with surname data, handling duplicates by adding counts.
+@dataclass
+class ImportDiff:
+    """Changes an import makes to the guesses table, by surname."""
 
-    This function always clears and repopulates the database.
-    It should only be called by CI/CD when the database file is missing.
+    # New variants and their counts
+    added: dict[str, int] = field(default_factory=dict)
+    # Count deltas for existing variants
+    changed: dict[str, int] = field(default_factory=dict)
+    # Variants deleted because no guesses would remain, with their counts
+    removed: dict[str, int] = field(default_factory=dict)
+    # Variants no guesses would remain for that were left as they are, since
+    # deleting was not asked for (audit_index.py rebuild without --prune)
+    kept: dict[str, int] = field(default_factory=dict)
+    # True if the source is unchanged since the last import
+    unchanged: bool = False
 
-    Args:
-        surnames_data: List of (surname, count) tuples
-        db_path: Path to the SQLite database file
+    def __bool__(self) -> bool:
+        """Return True if the import changes any counts."""
+        return bool(self.added or self.changed or self.removed)
 
-    """
-    conn = create_database_connection(db_path)
-    cursor = conn.cursor()
 
-    # Create schema first (in case database is completely new)
-    schema_path = Path(__file__).parent / "schema.sql"
-    if schema_path.exists():
-        with schema_path.open() as f:
-            cursor.executescript(f.read())
-    else:
-        # Fallback: create table manually if schema.sql not found
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS guesses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                surname TEXT NOT NULL UNIQUE,
-                count INTEGER NOT NULL DEFAULT 0
-            )
-        """)
+def source_digest(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while chunk := f.read(64 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    # Clear existing data and repopulate
-    cursor.execute("DELETE FROM guesses")
 
-    # Aggregate duplicate surnames
+def aggregate_surnames(surnames_data: Iterable[tuple[str, int]]) -> dict[str, int]:
+    """Sum the counts of duplicate surnames."""
     surname_totals: dict[str, int] = {}
     for surname, count in surnames_data:
-        if surname in surname_totals:
-            surname_totals[surname] += count
+        surname_totals[surname] = surname_totals.get(surname, 0) + count
+    return surname_totals
+
+
+def table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (name,),
+        ).fetchone()
+        is not None
+    )
+
+
+def latest_import_digest(conn: sqlite3.Connection) -> str | None:
+    """Return the source hash of the most recent import, if any."""
+    if not table_exists(conn, "imports"):
+        return None
+    row = conn.execute("SELECT sha256 FROM imports ORDER BY id DESC LIMIT 1").fetchone()
+    return None if row is None else row[0]
+
+
+def latest_import(conn: sqlite3.Connection) -> tuple[int, float] | None:
+    """Return the id and time of the most recent import, if any.
+
+    In-memory indexes of the guesses compare it between refreshes to
+    notice an import, which rewrites counts without guess events.
+    """
+    if not table_exists(conn, "imports"):
+        return None
+    return conn.execute(
+        "SELECT id, imported_at FROM imports ORDER BY id DESC LIMIT 1",
+    ).fetchone()
+
+
+def diff_import(
+    conn: sqlite3.Connection,
+    surname_totals: dict[str, int],
+    mode: str,
+) -> ImportDiff:
+    """Work out what importing the totals in the given mode would change."""
+    diff = ImportDiff()
+    if mode == MODE_ADOPT:
+        return diff
+
+    current = {}
+    if table_exists(conn, "guesses"):
+        # Including any counts still pending in sharded counter slots
+        current = dict(
+            conn.execute(f"SELECT surname, count FROM {counts_source(conn)}"),  # noqa: S608
+        )
+    if mode == MODE_REPLACE:
+        baseline = current
+    else:
+        baseline = {}
+        if table_exists(conn, "import_counts"):
+            baseline = dict(conn.execute("SELECT surname, count FROM import_counts"))
+        if not baseline and current and latest_import_digest(conn) is None:
+            msg = (
+                "The database has guesses but no recorded import to merge with. "
+                "Use --mode adopt to record the source as the existing baseline."
+            )
+            raise ValueError(msg)
+
+    for surname in surname_totals.keys() | baseline.keys():
+        delta = surname_totals.get(surname, 0) - baseline.get(surname, 0)
+        existing = current.get(surname)
+        if not delta or (existing is None and delta < 0):
+            continue
+        if existing is None:
+            diff.added[surname] = delta
+        elif existing + delta <= 0:
+            diff.removed[surname] = existing
         else:
-            surname_totals[surname] = count
+            diff.changed[surname] = delta
+    return diff
+
+
+def populate_database(  # noqa: PLR0913
+    surnames_data: Iterable[tuple[str, int]],
+    db_path: str,
+    *,
+    mode: str = MODE_MERGE,
+    source: str = "",
+    source_hash: str | None = None,
+    dry_run: bool = False,
+) -> ImportDiff:
+    """Populate database with surname data, handling duplicates by adding counts.
+
+    Modes:
+        merge: apply the difference to the previous import as count deltas,
+            keeping guesses submitted since then. Importing a source whose
+            hash matches the last import does nothing.
+        replace: replace every guess with the import, in one transaction.
+            Import records and guess history are kept.
+        adopt: record the import as the baseline of an existing database
+            without changing any counts.
 
-    # Insert aggregated data
-    for surname, total_count in surname_totals.items():
-        cursor.execute(
-            "INSERT INTO guesses (surname, count) VALUES (?, ?)",
-            (surname, total_count),
+    A database with guesses but no recorded import cannot be merged into,
+    since there is no baseline to take deltas from: merge raises
+    ValueError there, and the database has to be adopted first.
+
+    Args:
+        surnames_data: (surname, count) tuples
+        db_path: Path to the SQLite database file
+        mode: One of IMPORT_MODES
+        source: Name of the imported file, stored with the import record
+        source_hash: SHA-256 of the imported file, see source_digest
+        dry_run: Only compute the changes, do not write anything
+
+    Returns the changes made, or that would be made in a dry run.
+
+    """
+    if mode not in IMPORT_MODES:
+        msg = f"Unknown import mode {mode!r}"
+        raise ValueError(msg)
+
+    surname_totals = aggregate_surnames(surnames_data)
+    conn = create_database_connection(db_path)
+    try:
+        if (
+            mode == MODE_MERGE
+            and source_hash is not None
+            and latest_import_digest(conn) == source_hash
+        ):
+            return ImportDiff(unchanged=True)
+
+        diff = diff_import(conn, surname_totals, mode)
+        if dry_run:
+            return diff
+
+        upgrade_db(conn)
+        # Replace deletes every guess before loading the totals
+        applied = ImportDiff(added=surname_totals) if mode == MODE_REPLACE else diff
+        apply_import(
+            conn,
+            surname_totals,
+            applied,
+            mode=mode,
+            source=source,
+            source_hash=source_hash,
+        )
+    finally:
+        conn.close()
+    return diff
+
+
+def apply_import(  # noqa: PLR0913
+    conn: sqlite3.Connection,
+    surname_totals: dict[str, int],
+    diff: ImportDiff,
+    *,
+    mode: str,
+    source: str,
+    source_hash: str | None,
+) -> None:
+    """Write an import and its new baseline in a single transaction.
+
+    In replace mode every guess, including counts pending in sharded counter
+    slots, is deleted first; a removed surname loses its slots as well. The
+    guess_stats aggregates follow along through the triggers defined in
+    schema.sql.
+    """
+    with conn:
+        if mode == MODE_REPLACE:
+            conn.execute("DELETE FROM guess_shards")
+            conn.execute("DELETE FROM guesses")
+        conn.executemany(
+            UPSERT_SQL,
+            [*diff.added.items(), *diff.changed.items()],
+        )
+        removed = [(surname,) for surname in diff.removed]
+        conn.executemany("DELETE FROM guess_shards WHERE surname = ?", removed)
+        conn.executemany("DELETE FROM guesses WHERE surname = ?", removed)
+        conn.execute("DELETE FROM import_counts")
+        conn.executemany(
+            "INSERT INTO import_counts (surname, count) VALUES (?, ?)",
+            surname_totals.items(),
+        )
+        conn.execute(
+            "INSERT INTO imports "
+            "(source, sha256, mode, imported_at, variants, submissions) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                source,
+                source_hash or "",
+                mode,
+                time.time(),
+                len(surname_totals),
+                sum(surname_totals.values()),
+            ),
         )
 
-    conn.commit()
-    conn.close()
 
-    print(f"Database populated with {len(surname_totals)} unique surnames.")
+def print_diff(diff: ImportDiff, *, limit: int = DIFF_REPORT_LIMIT) -> None:
+    """Print a summary of the changes followed by up to limit variants."""
+    print(
+        f"{len(diff.added)} variants added, {len(diff.changed)} changed, "
+        f"{len(diff.removed)} removed.",
+    )
+    lines = [
+        *(f"  + {surname} {count:+d}" for surname, count in diff.added.items()),
+        *(f"  ~ {surname} {delta:+d}" for surname, delta in diff.changed.items()),
+        *(f"  - {surname} {-count:+d}" for surname, count in diff.removed.items()),
+    ]
+    for line in lines[:limit]:
+        print(line)
+    if len(lines) > limit:
+        print(f"  ... and {len(lines) - limit} more")
 
 
 def main() -> None:
     """Parse HTML and populate database."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--parser",
+        choices=("stream", "soup"),
+        default="stream",
+        help="streaming tokenizer (default) or the BeautifulSoup tree parser",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=IMPORT_MODES,
+        default=MODE_MERGE,
+        help="merge as deltas since the last import (default), replace all "
+        "guesses, or adopt the source as the baseline of an existing database",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report which variants would change without writing anything",
+    )
+    parser.add_argument("--database", default=str(get_database_path()))
+    args = parser.parse_args()
+
     html_file_path = "Lintukoto _ Viihde _ Ben.html"
-    db_path = "ben.db"
+    db_path = args.database
+
+    source_hash = source_digest(html_file_path)
+    if args.mode == MODE_MERGE and Path(db_path).exists():
+        conn = create_database_connection(db_path)
+        try:
+            unchanged = latest_import_digest(conn) == source_hash
+        finally:
+            conn.close()
+        if unchanged:
+            print("Source unchanged since the last import, nothing to do.")
+            return
 
     print("Parsing HTML file...")
-    surnames_data, stats = parse_html_table(html_file_path)
+    surnames_data, stats = parse_html_table(
+        html_file_path,
+        streaming=args.parser == "stream",
+    )
 
     # Print validation statistics
     print("\nValidation Statistics:")
@@ -263,9 +574,31 @@ def main() -> None:
     print(f"Rejected - wrong start: {stats['rejected_wrong_start']}")
     print(f"Rejected - invalid chars: {stats['rejected_invalid_chars']}")
 
-    print("\nPopulating database...")
-    populate_database(surnames_data, db_path)
-    print("Database population complete!")
+    print(
+        f"\n{'Comparing' if args.dry_run else 'Populating'} database ({args.mode})...",
+    )
+    try:
+        diff = populate_database(
+            surnames_data,
+            db_path,
+            mode=args.mode,
+            source=Path(html_file_path).name,
+            source_hash=source_hash,
+            dry_run=args.dry_run,
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if diff.unchanged:
+        print("Source unchanged since the last import, nothing to do.")
+        return
+    print_diff(diff)
+    print(
+        "Dry run, database not modified."
+        if args.dry_run
+        else "Database population complete!",
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Opt-in profiles of single requests.
+
+With PROFILE=1 the app is wrapped in ProfilingMiddleware, which profiles a
+request when it carries the PROFILE_TOKEN in an ``X-Profile`` header, or at
+random one in PROFILE_SAMPLE_RATE requests. Without PROFILE=1 nothing is
+wrapped and requests run exactly as before.
+
+A profiled request is measured from the call into the app until it returns
+the response, which covers rendering and compression but not the sending
+of a streamed body. Two profilers are available (PROFILE_MODE):
+
+- ``sample`` (the default) walks the stack of the request's thread from a
+  background thread every PROFILE_INTERVAL_MS and writes speedscope JSON.
+  Other threads are not affected and the request runs at nearly full
+  speed. A busy thread only gives up the GIL every
+  sys.getswitchinterval() (5 ms), so short requests get few samples.
+- ``cprofile`` records every call with cProfile and writes a pstats file.
+  It is exact but slows the request down several times. Since Python 3.12
+  cProfile sees every thread of the process, so one request at a time is
+  profiled per process and the profile includes whatever other threads did
+  meanwhile.
+
+Every profiled request also adds a line to profiles.log with its total
+time split into the time in SQLite (or the storage server), in template
+rendering and the rest, taken from the DB and render timers of /metrics.
+Profiles are written to PROFILE_DIR and only the latest PROFILE_KEEP are
+kept. Open the JSON at https://www.speedscope.app/ and the pstats files
+with ``python -m pstats`` or snakeviz.
+"""
+
+import cProfile
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from metrics import DB_SECONDS, RENDER_SECONDS, record_breakdown
+from settings import env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+MODES = (MODE_SAMPLE, MODE_CPROFILE)
+
+HEADER_ENVIRON_KEY = "HTTP_X_PROFILE"
+LOG_NAME = "profiles.log"
+UNSAFE_PATH_CHARACTERS = re.compile(r"[^A-Za-z0-9_-]+")
+
+type WSGIApp = Callable[[dict[str, Any], Callable[..., Any]], Iterable[bytes]]
+
+
+@dataclass(frozen=True)
+class ProfileConfig:
+    directory: Path
+    token: str | None = None
+    # Profile one in this many requests; 0 profiles on the header alone
+    sample_rate: int = 0
+    mode: str = MODE_SAMPLE
+    interval: float = 0.001
+    keep: int = 100
+
+    @classmethod
+    def from_env(cls, default_directory: Path) -> "ProfileConfig":
+        """Read the configuration from PROFILE_* environment variables."""
+        defaults = cls(default_directory)
+        mode = env_str("PROFILE_MODE", defaults.mode).lower()
+        if mode not in MODES:
+            msg = f"PROFILE_MODE must be one of {', '.join(MODES)}"
+            raise ValueError(msg)
+        config = cls(
+            directory=Path(env_str("PROFILE_DIR", str(default_directory))),
+            token=env_str("PROFILE_TOKEN", "") or None,
+            sample_rate=max(env_int("PROFILE_SAMPLE_RATE", 0), 0),
+            mode=mode,
+            interval=env_int("PROFILE_INTERVAL_MS", 1) / 1000,
+            keep=env_int("PROFILE_KEEP", defaults.keep),
+        )
+        if config.token is None and not config.sample_rate:
+            msg = "PROFILE=1 needs PROFILE_TOKEN or PROFILE_SAMPLE_RATE"
+            raise ValueError(msg)
+        return config
+
+
+class StackSampler:
+    """Sample the Python stack of one thread from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        """Sample the stack of thread_id every interval seconds once started."""
+        self.thread_id = thread_id
+        self.interval = interval
+        # speedscope frames, and the index of each (name, file, line)
+        self.frames: list[dict[str, Any]] = []
+        self._frame_indices: dict[tuple[str, str, int], int] = {}
+        # Frame indices from the outermost call, and the seconds each stands for
+        self.samples: list[list[int]] = []
+        self.weights: list[float] = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="profile-sampler",
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def speedscope(self, name: str) -> dict[str, Any]:
+        """Return the samples as a speedscope file."""
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "ben profiling.py",
+            "shared": {"frames": self.frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(self.weights),
+                    "samples": self.samples,
+                    "weights": self.weights,
+                },
+            ],
+        }
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+            now = time.perf_counter()
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_index(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.append(stack)
+                self.weights.append(now - last)
+            last = now
+
+    def _frame_index(self, code: Any) -> int:  # noqa: ANN401
+        key = (code.co_qualname, code.co_filename, code.co_firstlineno)
+        index = self._frame_indices.get(key)
+        if index is None:
+            index = self._frame_indices[key] = len(self.frames)
+            self.frames.append({"name": key[0], "file": key[1], "line": key[2]})
+        return index
+
+
+class ProfilingMiddleware:
+    """Profile the requests chosen by a ProfileConfig and pass on the rest."""
+
+    def __init__(self, app: WSGIApp, config: ProfileConfig) -> None:
+        """Wrap app, writing profiles and their log to config.directory."""
+        self.app = app
+        self.config = config
+        self._sequence = itertools.count()
+        # cProfile allows one active profiler per process
+        self._cprofile_lock = threading.Lock()
+        config.directory.mkdir(parents=True, exist_ok=True)
+        log_path = str((config.directory / LOG_NAME).absolute())
+        if all(
+            getattr(handler, "baseFilename", None) != log_path
+            for handler in logger.handlers
+        ):
+            handler = logging.FileHandler(log_path)
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+    def __call__(
+        self,
+        environ: dict[str, Any],
+        start_response: Callable[..., Any],
+    ) -> Iterable[bytes]:
+        """Run the app, profiling the request if it is chosen."""
+        if not self.wants_profile(environ):
+            return self.app(environ, start_response)
+        if self.config.mode == MODE_CPROFILE:
+            if not self._cprofile_lock.acquire(blocking=False):
+                return self.app(environ, start_response)
+            try:
+                return self._profile(environ, start_response)
+            finally:
+                self._cprofile_lock.release()
+        return self._profile(environ, start_response)
+
+    def wants_profile(self, environ: dict[str, Any]) -> bool:
+        token = environ.get(HEADER_ENVIRON_KEY)
+        if token and self.config.token is not None:
+            return hmac.compare_digest(token.encode(), self.config.token.encode())
+        rate = self.config.sample_rate
+        return bool(rate) and random.randrange(rate) == 0  # noqa: S311
+
+    def _profile(
+        self,
+        environ: dict[str, Any],
+        start_response: Callable[..., Any],
+    ) -> Iterable[bytes]:
+        sampler = profiler = None
+        if self.config.mode == MODE_CPROFILE:
+            profiler = cProfile.Profile()
+        else:
+            sampler = StackSampler(threading.get_ident(), self.config.interval)
+
+        with record_breakdown() as breakdown:
+            start = time.perf_counter()
+            if profiler is not None:
+                profiler.enable()
+            else:
+                sampler.start()
+            try:
+                body = self.app(environ, start_response)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                else:
+                    sampler.stop()
+                elapsed = time.perf_counter() - start
+
+        request_line = f"{environ['REQUEST_METHOD']} {environ.get('PATH_INFO', '/')}"
+        path = self._output_path(environ)
+        if profiler is not None:
+            profiler.dump_stats(path)
+        else:
+            with path.open("w") as f:
+                json.dump(sampler.speedscope(request_line), f)
+        self._prune()
+
+        db, queries = breakdown[DB_SECONDS.name]
+        template, renders = breakdown[RENDER_SECONDS.name]
+        logger.info(
+            "%s %.1f ms: db %.1f ms (%d), template %.1f ms (%d), python %.1f ms - %s",
+            request_line,
+            elapsed * 1000,
+            db * 1000,
+            queries,
+            template * 1000,
+            renders,
+            max(elapsed - db - template, 0) * 1000,
+            path.name,
+        )
+        return body
+
+    def _output_path(self, environ: dict[str, Any]) -> Path:
+        path = environ.get("PATH_INFO", "/").strip("/")
+        slug = UNSAFE_PATH_CHARACTERS.sub("-", path)[:60] or "index"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = "pstats" if self.config.mode == MODE_CPROFILE else "speedscope.json"
+        name = f"{stamp}-{os.getpid()}-{next(self._sequence):06d}-{slug}.{suffix}"
+        return self.config.directory / name
+
+    def _prune(self) -> None:
+        if self.config.keep <= 0:
+            return
+        # Names start with the time they were written
+        profiles = sorted(
+            path for path in self.config.directory.iterdir() if path.name != LOG_NAME
+        )
+        for old in profiles[: -self.config.keep]:
+            old.unlink(missing_ok=True)
@@ -0,0 +1,339 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Token-bucket rate limiting of guess submissions.
+
+Every client has a bucket per IP address and, when a subnet limit is
+given, one per subnet (/24 for IPv4, /64 for IPv6), so a script cannot get
+around the per-IP limit by rotating through neighbouring addresses. The
+subnet limit is opt-in: behind carrier-grade NAT or a campus network one
+subnet may hold many honest players. A request takes one token from each
+of its buckets and is refused if any of them is empty; buckets refill at a
+constant rate up to their burst size.
+
+A bucket that has been idle long enough to be full again is equivalent to
+no bucket at all, so idle buckets are evicted without changing any
+decision. Two stores are provided:
+
+- MemoryBucketStore keeps the buckets in an LRU dict of bounded size. It
+  is the fastest, but every server process enforces the limits on its own.
+- SQLiteBucketStore keeps them in a small database file of their own,
+  shared by all processes on the host, so the limits hold across workers
+  without contending for the write lock of the guesses database.
+"""
+
+import ipaddress
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+STORE_MEMORY = "memory"
+STORE_SQLITE = "sqlite"
+STORES = (STORE_MEMORY, STORE_SQLITE)
+
+SCOPE_IP = "ip"
+SCOPE_SUBNET = "subnet"
+SCOPES = (SCOPE_IP, SCOPE_SUBNET)
+
+IPV4_SUBNET_PREFIX = 24
+IPV6_SUBNET_PREFIX = 64
+
+# The SQLite store evicts idle buckets once per this many requests
+PRUNE_EVERY = 1000
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Sustained rate in requests per second and the largest burst allowed."""
+
+    rate: float
+    burst: float
+
+    @property
+    def refill_seconds(self) -> float:
+        """Return how long an empty bucket takes to fill up again."""
+        return self.burst / self.rate
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    # Seconds until the request would be allowed, 0 if it was
+    retry_after: float = 0.0
+    # Scope of the bucket that refused the request
+    scope: str | None = None
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(math.ceil(self.retry_after), 1))
+
+
+def client_buckets(address: str, *, subnet: bool = True) -> list[tuple[str, str]]:
+    """Return the (scope, bucket key) pairs that limit a client address."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        # Not an IP address (e.g. a Unix socket peer): one bucket for all
+        return [(SCOPE_IP, f"{SCOPE_IP}:{address}")]
+    if not subnet:
+        return [(SCOPE_IP, f"{SCOPE_IP}:{ip}")]
+    prefix = IPV4_SUBNET_PREFIX if ip.version == 4 else IPV6_SUBNET_PREFIX  # noqa: PLR2004
+    subnet = ipaddress.ip_network(f"{ip}/{prefix}", strict=False)
+    return [
+        (SCOPE_IP, f"{SCOPE_IP}:{ip}"),
+        (SCOPE_SUBNET, f"{SCOPE_SUBNET}:{subnet}"),
+    ]
+
+
+def refill(tokens: float, updated_at: float, now: float, limit: Limit) -> float:
+    """Return the tokens of a bucket after refilling it until now."""
+    return min(limit.burst, tokens + max(now - updated_at, 0.0) * limit.rate)
+
+
+def decide(
+    levels: Sequence[tuple[str, float]],
+    limits: dict[str, Limit],
+) -> Decision:
+    """Decide from the refilled (scope, tokens) of every bucket of a request."""
+    empty = [(scope, tokens) for scope, tokens in levels if tokens < 1]
+    if not empty:
+        return Decision(allowed=True)
+    scope, retry_after = max(
+        ((scope, (1 - tokens) / limits[scope].rate) for scope, tokens in empty),
+        key=lambda item: item[1],
+    )
+    return Decision(allowed=False, retry_after=retry_after, scope=scope)
+
+
+class MemoryBucketStore:
+    """Buckets of this process, in an LRU dict of at most max_keys entries."""
+
+    name = STORE_MEMORY
+
+    def __init__(self, max_keys: int) -> None:
+        """Create a store keeping the buckets of at most max_keys keys."""
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(("allowed", *SCOPES, "evicted"), 0)
+
+    def take(
+        self,
+        buckets: Sequence[tuple[str, str]],
+        limits: dict[str, Limit],
+        now: float,
+    ) -> Decision:
+        with self._lock:
+            levels = []
+            for scope, key in buckets:
+                state = self._buckets.pop(key, None)
+                limit = limits[scope]
+                tokens = limit.burst if state is None else refill(*state, now, limit)
+                levels.append((scope, tokens))
+            decision = decide(levels, limits)
+            spent = 1 if decision.allowed else 0
+            for (_, key), (_, tokens) in zip(buckets, levels, strict=True):
+                self._buckets[key] = (tokens - spent, now)
+            self._evict(now - max(limit.refill_seconds for limit in limits.values()))
+            self._count(decision)
+            return decision
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"buckets": len(self._buckets), **self._counters}
+
+    def reset_after_fork(self) -> None:
+        """Forget the buckets and lock inherited from the parent process."""
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def _evict(self, idle_before: float) -> None:
+        """Evict buckets that are full again, then the least recently used."""
+        buckets = self._buckets
+        while buckets and (
+            len(buckets) > self.max_keys
+            or next(iter(buckets.values()))[1] < idle_before
+        ):
+            buckets.popitem(last=False)
+            self._counters["evicted"] += 1
+
+    def _count(self, decision: Decision) -> None:
+        self._counters[decision.scope or "allowed"] += 1
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file shared by every process on the host."""
+
+    name = STORE_SQLITE
+
+    def __init__(self, path: Path, max_keys: int) -> None:
+        """Keep the buckets in the database at path, at most max_keys of them."""
+        self.path = Path(path)
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid = os.getpid()
+        self._requests = 0
+
+    def take(
+        self,
+        buckets: Sequence[tuple[str, str]],
+        limits: dict[str, Limit],
+        now: float,
+    ) -> Decision:
+        keys = [key for _, key in buckets]
+        with self._lock:
+            conn = self._connect()
+            # Take the write lock up front, so that concurrent requests from
+            # other processes cannot both spend the same token
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ", ".join("?" * len(keys))
+                stored = {
+                    key: (tokens, updated_at)
+                    for key, tokens, updated_at in conn.execute(
+                        "SELECT key, tokens, updated_at FROM buckets "  # noqa: S608
+                        f"WHERE key IN ({placeholders})",
+                        keys,
+                    )
+                }
+                levels = []
+                for scope, key in buckets:
+                    limit = limits[scope]
+                    state = stored.get(key)
+                    tokens = (
+                        limit.burst if state is None else refill(*state, now, limit)
+                    )
+                    levels.append((scope, tokens))
+                decision = decide(levels, limits)
+                spent = 1 if decision.allowed else 0
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) "
+                    "VALUES (?, ?, ?)",
+                    [
+                        (key, tokens - spent, now)
+                        for key, (_, tokens) in zip(keys, levels, strict=True)
+                    ],
+                )
+                conn.execute(
+                    "UPDATE counters SET value = value + 1 WHERE name = ?",
+                    (decision.scope or "allowed",),
+                )
+                self._requests += 1
+                if self._requests % PRUNE_EVERY == 0:
+                    self._prune(conn, now, limits)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return decision
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            conn = self._connect()
+            counters = dict(conn.execute("SELECT name, value FROM counters"))
+            buckets = conn.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        return {"buckets": buckets, **counters}
+
+    def reset_after_fork(self) -> None:
+        """Drop the connection inherited from the parent without touching it."""
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = os.getpid()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._conn = None
+            self._pid = os.getpid()
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                self.path,
+                timeout=5,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode = WAL")
+            # Buckets are disposable: losing the last writes in a power cut
+            # only hands out a few extra tokens
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                  key TEXT PRIMARY KEY,
+                  tokens REAL NOT NULL,
+                  updated_at REAL NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS buckets_updated_at ON buckets (updated_at);
+                CREATE TABLE IF NOT EXISTS counters (
+                  name TEXT PRIMARY KEY,
+                  value INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                """,
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                [(name,) for name in ("allowed", *SCOPES, "evicted")],
+            )
+            self._conn = conn
+        return self._conn
+
+    def _prune(
+        self,
+        conn: sqlite3.Connection,
+        now: float,
+        limits: dict[str, Limit],
+    ) -> None:
+        """Evict buckets that are full again, then the oldest beyond max_keys."""
+        idle = max(limit.refill_seconds for limit in limits.values())
+        evicted = conn.execute(
+            "DELETE FROM buckets WHERE updated_at < ?",
+            (now - idle,),
+        ).rowcount
+        evicted += conn.execute(
+            "DELETE FROM buckets WHERE key IN ("
+            "SELECT key FROM buckets ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_keys,),
+        ).rowcount
+        conn.execute(
+            "UPDATE counters SET value = value + ? WHERE name = 'evicted'",
+            (evicted,),
+        )
+
+
+class RateLimiter:
+    """Apply per-IP and, optionally, per-subnet limits to client addresses."""
+
+    def __init__(
+        self,
+        store: MemoryBucketStore | SQLiteBucketStore,
+        *,
+        ip_limit: Limit,
+        subnet_limit: Limit | None = None,
+    ) -> None:
+        """Limit each address, and its subnet if subnet_limit is given."""
+        self.store = store
+        self.limits = {SCOPE_IP: ip_limit}
+        if subnet_limit is not None:
+            self.limits[SCOPE_SUBNET] = subnet_limit
+
+    def check(self, address: str, now: float | None = None) -> Decision:
+        """Take a token for a request from the address, if it has one."""
+        return self.store.take(
+            client_buckets(address, subnet=SCOPE_SUBNET in self.limits),
+            self.limits,
+            time.time() if now is None else now,
+        )
+
+    def stats(self) -> dict[str, int | str]:
+        return {"store": self.store.name, **self.store.stats()}
@@ -0,0 +1,127 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Versioned cache for the rendered leaderboard page.
+
+The page is rendered once per data version and kept as three strings: the
+markup before the table rows, the concatenated row fragments, and the
+markup after them. Highlighting a row only re-renders that one row and
+splices it into the cached body, instead of rendering the whole table.
+"""
+
+import threading
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    version: int
+    head: str
+    body: str
+    tail: str
+    rows: list[dict[str, Any]] = field(repr=False)
+    # Maps a surname to (start, end, row index) of its fragment within body
+    offsets: dict[str, tuple[int, int, int]] = field(repr=False)
+    # Rendering options the page was built with, such as the row limit
+    variant: Hashable = None
+    # Unix time of the write that produced the version, for Last-Modified
+    updated_at: float = 0.0
+
+    @classmethod
+    def from_fragments(  # noqa: PLR0913
+        cls,
+        version: int,
+        head: str,
+        tail: str,
+        rows: list[dict[str, Any]],
+        fragments: list[str],
+        *,
+        variant: Hashable = None,
+        updated_at: float = 0.0,
+    ) -> "RenderedPage":
+        offsets = {}
+        position = 0
+        for index, (row, fragment) in enumerate(zip(rows, fragments, strict=True)):
+            offsets[row["surname"]] = (position, position + len(fragment), index)
+            position += len(fragment)
+        return cls(
+            version,
+            head,
+            "".join(fragments),
+            tail,
+            rows,
+            offsets,
+            variant,
+            updated_at,
+        )
+
+    def render(
+        self,
+        highlight: str | None = None,
+        render_row: Callable[[dict[str, Any]], str] | None = None,
+    ) -> str:
+        """Return the full page, re-rendering only the highlighted row."""
+        location = self.offsets.get(highlight) if highlight else None
+        if location is None or render_row is None:
+            return self.head + self.body + self.tail
+        start, end, index = location
+        return "".join(
+            (
+                self.head,
+                self.body[:start],
+                render_row(self.rows[index]),
+                self.body[end:],
+                self.tail,
+            ),
+        )
+
+
+class VersionedPageCache:
+    """Hold the most recent rendered page and rebuild it when data changes.
+
+    Concurrent misses are coalesced: one request rebuilds the page while the
+    others wait on the lock and then reuse its result.
+    """
+
+    def __init__(self, build: Callable[[Hashable], RenderedPage]) -> None:
+        """Create an empty cache that renders pages with build(variant)."""
+        self._build = build
+        self._lock = threading.Lock()
+        self._page: RenderedPage | None = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, version: int, variant: Hashable = None) -> RenderedPage:
+        """Return a page rendered from data at least as new as the version."""
+        page = self._page
+        if page is not None and page.version >= version and page.variant == variant:
+            self.hits += 1
+            return page
+
+        with self._lock:
+            page = self._page
+            if page is not None and page.version >= version and page.variant == variant:
+                # Another request rebuilt the page while we were waiting
+                self.coalesced += 1
+                return page
+            self.misses += 1
+            page = self._page = self._build(variant)
+            return page
+
+    def clear(self) -> None:
+        self._page = None
+
+    def reset_after_fork(self) -> None:
+        """Forget the page and lock inherited from the parent process."""
+        self._lock = threading.Lock()
+        self._page = None
+
+    def stats(self) -> dict[str, int | None]:
+        page = self._page
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "version": page.version if page is not None else None,
+        }
@@ -0,0 +1,240 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Minimal client for servers that speak the Redis protocol (RESP2).
+
+Only what RedisStorage needs: commands are sent as arrays of bulk strings,
+several at a time (pipelined) when the caller has a batch, and replies are
+read back in order. Connections are pooled per process; one that fails in
+the middle of a pipeline is closed rather than returned, since replies may
+still be in flight on it.
+"""
+
+import os
+import queue
+import socket
+import threading
+from collections.abc import Sequence
+from dataclasses import dataclass
+from urllib.parse import unquote, urlsplit
+
+DEFAULT_PORT = 6379
+
+type Reply = bytes | int | list[Reply] | None
+type Command = Sequence[str | bytes | int | float]
+
+
+class RespError(Exception):
+    """The server could not be reached or answered with an error."""
+
+
+@dataclass(frozen=True)
+class ServerAddress:
+    host: str
+    port: int = DEFAULT_PORT
+    db: int = 0
+    password: str | None = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "ServerAddress":
+        """Parse redis://[:password@]host[:port][/db]."""
+        parts = urlsplit(url)
+        if parts.scheme != "redis" or not parts.hostname:
+            msg = f"Not a redis:// URL: {url!r}"
+            raise ValueError(msg)
+        path = parts.path.strip("/")
+        return cls(
+            host=parts.hostname,
+            port=parts.port or DEFAULT_PORT,
+            db=int(path) if path else 0,
+            password=unquote(parts.password) if parts.password else None,
+        )
+
+
+def encode_command(command: Command) -> bytes:
+    """Encode a command as a RESP array of bulk strings."""
+    chunks = [b"*%d\r\n" % len(command)]
+    for argument in command:
+        value = argument if isinstance(argument, bytes) else str(argument).encode()
+        chunks.append(b"$%d\r\n%s\r\n" % (len(value), value))
+    return b"".join(chunks)
+
+
+class RespConnection:
+    """One socket to the server."""
+
+    def __init__(self, address: ServerAddress, timeout: float) -> None:
+        """Connect to the server and authenticate and select the database."""
+        try:
+            self._socket = socket.create_connection(
+                (address.host, address.port),
+                timeout=timeout,
+            )
+        except OSError as e:
+            msg = f"cannot connect to {address.host}:{address.port}: {e}"
+            raise RespError(msg) from e
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile("rb")
+        # False once a send or read has failed part way
+        self.healthy = True
+        try:
+            if address.password is not None:
+                self.execute(("AUTH", address.password))
+            if address.db:
+                self.execute(("SELECT", address.db))
+        except RespError:
+            self.close()
+            raise
+
+    def execute(self, command: Command) -> Reply:
+        return self.pipeline([command])[0]
+
+    def pipeline(self, commands: Sequence[Command]) -> list[Reply]:
+        """Send the commands in one write and return their replies.
+
+        Raises RespError for the first error reply, after every reply has
+        been read so that the connection stays usable.
+        """
+        try:
+            self._socket.sendall(b"".join(map(encode_command, commands)))
+            replies = [self._read_reply() for _ in commands]
+        except OSError as e:
+            self.healthy = False
+            msg = f"connection to the server failed: {e}"
+            raise RespError(msg) from e
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def close(self) -> None:
+        self._reader.close()
+        self._socket.close()
+
+    def _read_reply(self) -> Reply | RespError:
+        line = self._read_line()
+        kind, payload = line[:1], line[1:]
+        if kind == b"$":
+            return self._read_bulk(int(payload))
+        if kind == b"*":
+            return self._read_array(int(payload))
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            return RespError(payload.decode(errors="replace"))
+        if kind == b":":
+            return int(payload)
+        msg = f"unexpected reply {line!r}"
+        raise ConnectionError(msg)
+
+    def _read_line(self) -> bytes:
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            msg = "connection closed by the server"
+            raise ConnectionError(msg)
+        return line[:-2]
+
+    def _read_bulk(self, length: int) -> bytes | None:
+        if length < 0:
+            return None
+        data = self._reader.read(length + 2)
+        if len(data) != length + 2:
+            msg = "connection closed by the server"
+            raise ConnectionError(msg)
+        return data[:-2]
+
+    def _read_array(self, length: int) -> list[Reply] | RespError | None:
+        if length < 0:
+            return None
+        items = [self._read_reply() for _ in range(length)]
+        # An error inside the replies of EXEC fails the whole transaction
+        for item in items:
+            if isinstance(item, RespError):
+                return item
+        return items
+
+
+class RespPool:
+    """Connections to one server, opened on demand up to max_connections."""
+
+    def __init__(
+        self,
+        address: ServerAddress,
+        max_connections: int = 8,
+        timeout: float = 5.0,
+    ) -> None:
+        """Create a pool of at most max_connections idle connections."""
+        self.address = address
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle: queue.LifoQueue[RespConnection] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.connects = 0
+        self.failures = 0
+
+    def pipeline(self, commands: Sequence[Command]) -> list[Reply]:
+        """Run the commands on a pooled connection in one round trip."""
+        conn = self._acquire()
+        try:
+            replies = conn.pipeline(commands)
+        except RespError:
+            if conn.healthy:
+                self._idle.put(conn)
+            else:
+                self.failures += 1
+                self._discard(conn)
+            raise
+        self._idle.put(conn)
+        return replies
+
+    def execute(self, command: Command) -> Reply:
+        return self.pipeline([command])[0]
+
+    def close(self) -> None:
+        """Close the idle connections; busy ones are closed on release."""
+        if self.pid != os.getpid():
+            return
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "connections": self._opened,
+            "idle": self._idle.qsize(),
+            "connects": self.connects,
+            "failures": self.failures,
+        }
+
+    def _acquire(self) -> RespConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            opening = self._opened < self.max_connections
+            if opening:
+                self._opened += 1
+        if not opening:
+            try:
+                return self._idle.get(timeout=self.timeout)
+            except queue.Empty as e:
+                msg = f"no free connection to the server within {self.timeout} s"
+                raise RespError(msg) from e
+        try:
+            conn = RespConnection(self.address, self.timeout)
+        except RespError:
+            with self._lock:
+                self._opened -= 1
+            self.failures += 1
+            raise
+        self.connects += 1
+        return conn
+
+    def _discard(self, conn: RespConnection) -> None:
+        conn.close()
+        with self._lock:
+            self._opened -= 1
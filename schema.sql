@@ -1,7 +1,188 @@
+-- Tables that init_db recreates from scratch. Everything after the DROP
+-- statements must stay idempotent: setup_db.upgrade_db runs the rest of this
+-- file against existing databases to add objects introduced since.
 DROP TABLE IF EXISTS guesses;
+DROP TABLE IF EXISTS guess_stats;
+DROP TABLE IF EXISTS guess_shards;
+DROP TABLE IF EXISTS import_counts;
+DROP TABLE IF EXISTS imports;
+DROP TABLE IF EXISTS guess_hours;
+DROP TABLE IF EXISTS guess_days;
+DROP TABLE IF EXISTS guess_day_totals;
 
-CREATE TABLE guesses (
+CREATE TABLE IF NOT EXISTS guesses (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   surname TEXT NOT NULL UNIQUE,
   count INTEGER NOT NULL DEFAULT 0
 );
+
+-- Leaderboard order, used for keyset pagination (leaderboard.py)
+CREATE INDEX IF NOT EXISTS guesses_leaderboard ON guesses (count DESC, surname ASC);
+
+-- Surname counts contributed by the most recent import of the Lintukoto
+-- page (parse_surnames.py). A merge import applies only the difference to
+-- this baseline, so guesses submitted since the last import are kept.
+CREATE TABLE IF NOT EXISTS import_counts (
+  surname TEXT PRIMARY KEY,
+  count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Applied imports. Importing a source whose hash matches the latest import
+-- is a no-op.
+CREATE TABLE IF NOT EXISTS imports (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  source TEXT NOT NULL,
+  sha256 TEXT NOT NULL,
+  mode TEXT NOT NULL,
+  imported_at REAL NOT NULL,
+  variants INTEGER NOT NULL,
+  submissions INTEGER NOT NULL
+);
+
+-- Journal segments applied by the write-behind guess counter (write_behind.py).
+-- A row lives only while its segment file is being removed, so that a replay
+-- after a crash does not count the same guesses twice.
+CREATE TABLE IF NOT EXISTS write_behind_segments (
+  segment TEXT PRIMARY KEY,
+  applied_at REAL NOT NULL
+);
+
+-- Monotonic data version of the guesses table, bumped by every write. Caches
+-- of derived data (such as the rendered leaderboard) are keyed by it. It is
+-- never reset, so that a re-initialised database gets a version no process
+-- has cached yet.
+CREATE TABLE IF NOT EXISTS data_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL,
+  updated_at REAL NOT NULL
+);
+
+INSERT OR IGNORE INTO data_version (id, version, updated_at)
+VALUES (1, 0, (julianday('now') - 2440587.5) * 86400.0);
+
+-- A re-initialised database starts a new version, so that no process serves
+-- a page cached from before init_db. Upgrading a database that has guesses
+-- leaves the version, and the caches keyed by it, alone.
+UPDATE data_version
+SET version = version + 1, updated_at = (julianday('now') - 2440587.5) * 86400.0
+WHERE id = 1 AND NOT EXISTS (SELECT 1 FROM guesses);
+
+CREATE TRIGGER IF NOT EXISTS guesses_version_insert AFTER INSERT ON guesses
+BEGIN
+  UPDATE data_version
+  SET version = version + 1, updated_at = (julianday('now') - 2440587.5) * 86400.0
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesses_version_update AFTER UPDATE OF count ON guesses
+BEGIN
+  UPDATE data_version
+  SET version = version + 1, updated_at = (julianday('now') - 2440587.5) * 86400.0
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesses_version_delete AFTER DELETE ON guesses
+BEGIN
+  UPDATE data_version
+  SET version = version + 1, updated_at = (julianday('now') - 2440587.5) * 86400.0
+  WHERE id = 1;
+END;
+
+-- Aggregates over guesses, kept in sync by the triggers below so that pages
+-- do not need COUNT(*) and SUM(count) scans. `python setup_db.py --check`
+-- recomputes them and reports any drift.
+CREATE TABLE IF NOT EXISTS guess_stats (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  total_variations INTEGER NOT NULL,
+  total_count INTEGER NOT NULL
+);
+
+-- Seeded from guesses only while the row is missing, so that upgrades of a
+-- database that has it do not scan the guesses table
+INSERT INTO guess_stats (id, total_variations, total_count)
+SELECT 1, (SELECT COUNT(*) FROM guesses), (SELECT COALESCE(SUM(count), 0) FROM guesses)
+WHERE NOT EXISTS (SELECT 1 FROM guess_stats WHERE id = 1);
+
+CREATE TRIGGER IF NOT EXISTS guesses_stats_insert AFTER INSERT ON guesses
+BEGIN
+  UPDATE guess_stats
+  SET total_variations = total_variations + 1, total_count = total_count + NEW.count
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesses_stats_update AFTER UPDATE OF count ON guesses
+BEGIN
+  UPDATE guess_stats SET total_count = total_count + NEW.count - OLD.count WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesses_stats_delete AFTER DELETE ON guesses
+BEGIN
+  UPDATE guess_stats
+  SET total_variations = total_variations - 1, total_count = total_count - OLD.count
+  WHERE id = 1;
+END;
+
+-- Guess deltas for the live leaderboard stream (live_updates.py), appended
+-- in the same transaction as the counts they describe. Every process polls
+-- this table, so the database doubles as the fan-out channel between server
+-- workers. Only the most recent rows are kept; a client that falls further
+-- behind reloads the page instead.
+CREATE TABLE IF NOT EXISTS guess_events (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  surname TEXT NOT NULL,
+  delta INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS guess_events_prune AFTER INSERT ON guess_events
+WHEN NEW.id % 1000 = 0
+BEGIN
+  DELETE FROM guess_events WHERE id <= NEW.id - 10000;
+END;
+
+-- Counter slots of the optional sharded write path (sharded_counter.py). A
+-- guess for an existing surname is added to one of its slots instead of
+-- its guesses row; the slots are folded back into guesses periodically.
+-- Slot writes touch neither guess_stats nor data_version, which would put a
+-- hot row back into every write: the fold updates them through the guesses
+-- triggers. Readers add pending slots through the guess_counts view and
+-- leaderboard.fetch_totals.
+CREATE TABLE IF NOT EXISTS guess_shards (
+  surname TEXT NOT NULL,
+  shard INTEGER NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (surname, shard)
+) WITHOUT ROWID;
+
+CREATE VIEW IF NOT EXISTS guess_counts AS
+SELECT
+  surname,
+  count + COALESCE(
+    (SELECT SUM(s.count) FROM guess_shards AS s WHERE s.surname = guesses.surname),
+    0
+  ) AS count
+FROM guesses;
+
+-- Guesses per surname in hourly buckets (history.py), recorded by the same
+-- transactions that count them. Hours past the hourly retention are rolled
+-- up into daily buckets, and days past the daily retention are deleted, so
+-- both tables stay bounded. Buckets start at UTC epoch seconds.
+CREATE TABLE IF NOT EXISTS guess_hours (
+  hour INTEGER NOT NULL,
+  surname TEXT NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (hour, surname)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS guess_days (
+  day INTEGER NOT NULL,
+  surname TEXT NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (day, surname)
+) WITHOUT ROWID;
+
+-- guess_days summed over surnames, so that a series of daily totals does
+-- not scan every surname of every day
+CREATE TABLE IF NOT EXISTS guess_day_totals (
+  day INTEGER PRIMARY KEY,
+  count INTEGER NOT NULL
+);
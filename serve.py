@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Copyright (c) 2025 Jaakko Vuori
+"""Production server for the Ben surname guessing game.
+
+Runs the Flask app under gunicorn with WEB_WORKERS worker processes of
+WEB_THREADS threads each. The app is imported once in the master process
+and forked into the workers; every worker then sets up its own connection
+pool, caches and background threads in the post_worker_init hook.
+
+Workers record metrics into files in METRICS_DIR, so that /metrics adds up
+all of them. Unless METRICS_DIR is set, a temporary directory is created
+for each run of the server and removed when it stops.
+
+Send SIGHUP to the master to gracefully replace the workers, or SIGTERM to
+stop after in-flight requests have finished (within WEB_GRACEFUL_TIMEOUT).
+``python app.py`` still starts Flask's development server.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.arbiter import Arbiter
+from gunicorn.workers.base import Worker
+
+from metrics import clear_directory
+from settings import env_flag, env_int, env_str
+
+# The production host is a Raspberry Pi and all workers share one SQLite
+# writer, so more processes than this rarely pay off
+MAX_DEFAULT_WORKERS = 4
+
+
+def default_workers() -> int:
+    return min((os.cpu_count() or 1) + 1, MAX_DEFAULT_WORKERS)
+
+
+def post_worker_init(worker: Worker) -> None:
+    """Set up per-process state once the worker has been forked."""
+    from app import init_worker  # noqa: PLC0415
+
+    init_worker()
+    worker.log.info("Worker %s initialised", worker.pid)
+
+
+def worker_exit(_server: Arbiter, _worker: Worker) -> None:
+    """Flush buffered guesses and audit records before the worker exits."""
+    from app import shutdown_worker  # noqa: PLC0415
+
+    shutdown_worker()
+
+
+def server_options() -> dict[str, Any]:
+    """Build the gunicorn settings from environment variables."""
+    access_log = "-" if env_flag("WEB_ACCESS_LOG") else None
+    return {
+        "bind": f"{env_str('HOST', '0.0.0.0')}:{env_int('PORT', 5000)}",  # noqa: S104
+        "workers": max(env_int("WEB_WORKERS", default_workers()), 1),
+        "threads": max(env_int("WEB_THREADS", 4), 1),
+        "worker_class": "gthread",
+        "keepalive": env_int("WEB_KEEPALIVE", 5),
+        "timeout": env_int("WEB_TIMEOUT", 30),
+        "graceful_timeout": env_int("WEB_GRACEFUL_TIMEOUT", 30),
+        "max_requests": env_int("WEB_MAX_REQUESTS", 0),
+        "max_requests_jitter": env_int("WEB_MAX_REQUESTS_JITTER", 0),
+        "preload_app": env_flag("WEB_PRELOAD", default=True),
+        "accesslog": access_log,
+        "errorlog": "-",
+        "loglevel": env_str("LOG_LEVEL", "info").lower(),
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+    }
+
+
+class Server(BaseApplication):
+    """Gunicorn application configured from code instead of a config file."""
+
+    def __init__(self, options: dict[str, Any]) -> None:
+        """Create the application with the given gunicorn settings."""
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):  # noqa: ANN201
+        from app import app  # noqa: PLC0415
+
+        return app
+
+
+def main() -> None:
+    metrics_dir = env_str("METRICS_DIR", "")
+    if metrics_dir:
+        # Counters start from zero with every run, as after a restart
+        clear_directory(Path(metrics_dir))
+        Server(server_options()).run()
+        return
+    with tempfile.TemporaryDirectory(prefix="ben-metrics-") as directory:
+        os.environ["METRICS_DIR"] = directory
+        Server(server_options()).run()
+
+
+if __name__ == "__main__":
+    main()
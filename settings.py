@@ -0,0 +1,42 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Helpers for reading runtime configuration from environment variables.
+
+Values are read on every call so that tests and operators can change the
+environment at runtime, in the same way ``DATABASE_DIR`` is handled.
+"""
+
+import os
+
+TRUTHY_VALUES = frozenset({"1", "true", "yes", "on"})
+
+
+def env_flag(name: str, *, default: bool = False) -> bool:
+    """Return True if the environment variable is set to a truthy value."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in TRUTHY_VALUES
+
+
+def env_int(name: str, default: int) -> int:
+    """Return the environment variable as an int, or the default if unset."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+def env_float(name: str, default: float) -> float:
+    """Return the environment variable as a float, or the default if unset."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+def env_str(name: str, default: str) -> str:
+    """Return the stripped environment variable, or the default if unset."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip()
@@ -1,18 +1,36 @@
 #!/usr/bin/env python3
+# Copyright (c) 2025 Jaakko Vuori
 """Database setup script for the Ben surname guessing game.
 Creates the database schema without requiring the Flask application.
 """
 
+import argparse
 import os
 import sqlite3
+import sys
 from pathlib import Path
 
+SCHEMA_PATH = Path(__file__).parent / "schema.sql"
+
+# The guess_stats aggregates recomputed from scratch. Counts still pending in
+# sharded counter slots are not part of them until they are folded.
+ACTUAL_STATS_SQL = (
+    "SELECT (SELECT COUNT(*) FROM guesses), "
+    "(SELECT COALESCE(SUM(count), 0) FROM guesses)"
+)
+
+
+def get_database_path() -> Path:
+    """Get the database path from DATABASE_DIR, or the default data directory."""
+    database_dir = Path(os.getenv("DATABASE_DIR", Path(__file__).parent / "data"))
+    return database_dir / "ben.db"
+
 
 def init_db():
     """Initialize the database with the schema."""
     # Get database directory from environment or use default
-    database_dir = Path(os.getenv("DATABASE_DIR", Path(__file__).parent / "data"))
-    database_path = database_dir / "ben.db"
+    database_path = get_database_path()
+    database_dir = database_path.parent
 
     # Ensure the database directory exists
     database_dir.mkdir(parents=True, exist_ok=True)
@@ -21,8 +39,7 @@ def init_db():
     conn = sqlite3.connect(database_path)
 
     # Read and execute schema
-    schema_path = Path(__file__).parent / "schema.sql"
-    with open(schema_path) as f:
+    with open(SCHEMA_PATH) as f:
         conn.executescript(f.read())
 
     conn.commit()
@@ -31,5 +48,98 @@ def init_db():
     print(f"Database initialized at {database_path}")
 
 
+def schema_statements(schema: str) -> list[str]:
+    """Split a SQL script into complete statements, dropping comment lines."""
+    statements = []
+    pending = ""
+    for line in schema.splitlines(keepends=True):
+        if not pending and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        pending += line
+        if sqlite3.complete_statement(pending):
+            statements.append(pending.strip())
+            pending = ""
+    return statements
+
+
+def upgrade_db(conn: sqlite3.Connection) -> None:
+    """Add schema objects introduced since the database was created.
+
+    Runs every statement of schema.sql except the DROP statements, which
+    only init_db may execute. Existing guesses are never touched.
+    """
+    statements = [
+        statement
+        for statement in schema_statements(SCHEMA_PATH.read_text())
+        if not statement.upper().startswith("DROP ")
+    ]
+    conn.executescript("\n".join(statements))
+    conn.commit()
+
+
+def check_stats(conn: sqlite3.Connection) -> dict[str, tuple[int, int]]:
+    """Recompute the guess_stats aggregates and return any drift.
+
+    Returns a mapping of column name to (stored, actual) for every column
+    whose stored value differs from the value recomputed from guesses.
+    """
+    stored = conn.execute(
+        "SELECT total_variations, total_count FROM guess_stats WHERE id = 1",
+    ).fetchone() or (0, 0)
+    actual = conn.execute(ACTUAL_STATS_SQL).fetchone()
+    columns = ("total_variations", "total_count")
+    return {
+        column: (stored_value, actual_value)
+        for column, stored_value, actual_value in zip(
+            columns,
+            stored,
+            actual,
+            strict=True,
+        )
+        if stored_value != actual_value
+    }
+
+
+def repair_stats(conn: sqlite3.Connection) -> None:
+    """Overwrite the guess_stats aggregates with values recomputed from guesses."""
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO guess_stats (id, total_variations, total_count) "  # noqa: S608
+            f"SELECT 1, * FROM ({ACTUAL_STATS_SQL})",
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Set up the Ben database.")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="recompute the guess_stats aggregates and report drift",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="with --check, overwrite drifted aggregates",
+    )
+    args = parser.parse_args()
+
+    if not args.check:
+        init_db()
+        return
+
+    conn = sqlite3.connect(get_database_path())
+    upgrade_db(conn)
+    drift = check_stats(conn)
+    if not drift:
+        print("guess_stats is consistent with guesses.")
+    for column, (stored, actual) in drift.items():
+        print(f"DRIFT {column}: stored={stored} actual={actual} diff={stored - actual}")
+    if drift and args.repair:
+        repair_stats(conn)
+        print("guess_stats repaired.")
+    conn.close()
+    sys.exit(1 if drift and not args.repair else 0)
+
+
 if __name__ == "__main__":
-    init_db()
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Copyright (c) 2025 Jaakko Vuori
+"""Prebuilt database snapshot for fast first boots.
+
+``python snapshot.py build`` imports the bundled Lintukoto page into a
+fresh database when the Docker image is built, and writes it next to a
+manifest with its checksum and the digests of the schema and the page it
+was built from. ``python snapshot.py restore``, run by entrypoint.sh,
+copies that file into an empty DATABASE_DIR, which takes milliseconds. If
+the snapshot is missing, corrupt or stale (built from another schema.sql
+or page) the page is imported live instead. An existing database is never
+touched.
+
+Both paths write to a temporary file that is renamed into place, so an
+interrupted first boot leaves no half-imported database behind.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from parse_surnames import MODE_REPLACE, parse_html_table, populate_database
+from parse_surnames import source_digest as file_digest
+from setup_db import SCHEMA_PATH, get_database_path
+
+# Bumped whenever the layout of a snapshot changes
+SNAPSHOT_FORMAT = 1
+
+DEFAULT_SNAPSHOT_DIR = Path(__file__).parent / "snapshot"
+DEFAULT_HTML_PATH = Path(__file__).parent / "Lintukoto _ Viihde _ Ben.html"
+SNAPSHOT_NAME = "ben.db"
+MANIFEST_NAME = "manifest.json"
+
+
+class SnapshotError(Exception):
+    """The snapshot cannot be restored; the message says why."""
+
+
+@dataclass(frozen=True)
+class Manifest:
+    format: int
+    # SHA-256 of the database file
+    sha256: str
+    size: int
+    schema_sha256: str
+    source: str
+    source_sha256: str
+    variants: int
+    submissions: int
+    created_at: float
+
+
+def import_page(html_path: Path, database_path: Path) -> tuple[int, int]:
+    """Import the page into a new database file and return its totals.
+
+    Without the page the database is created empty. The rejected-surname
+    report of the parser is not printed.
+    """
+    if not html_path.exists():
+        conn = sqlite3.connect(database_path)
+        try:
+            conn.executescript(SCHEMA_PATH.read_text())
+        finally:
+            conn.close()
+        return 0, 0
+
+    with Path(os.devnull).open("w") as devnull, contextlib.redirect_stdout(devnull):
+        surnames_data, _ = parse_html_table(str(html_path))
+    diff = populate_database(
+        surnames_data,
+        str(database_path),
+        mode=MODE_REPLACE,
+        source=html_path.name,
+        source_hash=file_digest(str(html_path)),
+    )
+    return len(diff.added), sum(diff.added.values())
+
+
+def build_snapshot(html_path: Path, directory: Path) -> Manifest:
+    """Import the page into a snapshot in the directory and return its manifest."""
+    directory.mkdir(parents=True, exist_ok=True)
+    staging = directory / f"{SNAPSHOT_NAME}.tmp"
+    staging.unlink(missing_ok=True)
+
+    variants, submissions = import_page(html_path, staging)
+    # A single self-contained file, as small as it gets
+    conn = sqlite3.connect(staging)
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    manifest = Manifest(
+        format=SNAPSHOT_FORMAT,
+        sha256=file_digest(str(staging)),
+        size=staging.stat().st_size,
+        schema_sha256=file_digest(str(SCHEMA_PATH)),
+        source=html_path.name,
+        source_sha256=file_digest(str(html_path)) if html_path.exists() else "",
+        variants=variants,
+        submissions=submissions,
+        created_at=time.time(),
+    )
+    staging.replace(directory / SNAPSHOT_NAME)
+    (directory / MANIFEST_NAME).write_text(json.dumps(asdict(manifest), indent=2))
+    return manifest
+
+
+def read_manifest(directory: Path) -> Manifest:
+    try:
+        fields = json.loads((directory / MANIFEST_NAME).read_text())
+        return Manifest(**fields)
+    except FileNotFoundError as e:
+        msg = f"no snapshot in {directory}"
+        raise SnapshotError(msg) from e
+    except (ValueError, TypeError) as e:
+        msg = f"unreadable manifest: {e}"
+        raise SnapshotError(msg) from e
+
+
+def check_snapshot(directory: Path, html_path: Path) -> Manifest:
+    """Return the manifest of a snapshot that is current and intact.
+
+    Raises SnapshotError if the snapshot is missing, was built with another
+    format, schema or page, or does not match its checksum.
+    """
+    manifest = read_manifest(directory)
+    if manifest.format != SNAPSHOT_FORMAT:
+        msg = f"snapshot format {manifest.format}, expected {SNAPSHOT_FORMAT}"
+        raise SnapshotError(msg)
+    if manifest.schema_sha256 != file_digest(str(SCHEMA_PATH)):
+        msg = "built from another schema.sql"
+        raise SnapshotError(msg)
+    source_sha256 = file_digest(str(html_path)) if html_path.exists() else ""
+    if manifest.source_sha256 != source_sha256:
+        msg = f"built from another {html_path.name}"
+        raise SnapshotError(msg)
+    snapshot = directory / SNAPSHOT_NAME
+    if not snapshot.exists() or file_digest(str(snapshot)) != manifest.sha256:
+        msg = f"{snapshot} does not match its checksum"
+        raise SnapshotError(msg)
+    return manifest
+
+
+def install[T](database_path: Path, write: Callable[[Path], T]) -> T:
+    """Write a new database through write(path) and move it into place.
+
+    Returns what write returned.
+    """
+    database_path.parent.mkdir(parents=True, exist_ok=True)
+    # A journal left behind by a previous database must not be replayed
+    # into the new one
+    for suffix in ("-wal", "-shm", "-journal"):
+        Path(f"{database_path}{suffix}").unlink(missing_ok=True)
+    staging = database_path.with_name(f"{database_path.name}.tmp")
+    staging.unlink(missing_ok=True)
+    result = write(staging)
+    with staging.open("rb") as f:
+        os.fsync(f.fileno())
+    staging.replace(database_path)
+    return result
+
+
+def restore(
+    database_path: Path,
+    directory: Path = DEFAULT_SNAPSHOT_DIR,
+    html_path: Path = DEFAULT_HTML_PATH,
+) -> str:
+    """Create the database from the snapshot, or from the page if it is unusable.
+
+    Returns a report of what was done and how long it took. Does nothing if
+    the database already exists.
+    """
+    if database_path.exists():
+        return f"Database found at {database_path}."
+
+    start = time.perf_counter()
+    try:
+        manifest = check_snapshot(directory, html_path)
+    except SnapshotError as e:
+        variants, submissions = install(
+            database_path,
+            lambda path: import_page(html_path, path),
+        )
+        how = f"imported {html_path.name} live (snapshot unusable: {e})"
+    else:
+        install(
+            database_path,
+            lambda path: shutil.copyfile(directory / SNAPSHOT_NAME, path),
+        )
+        variants, submissions = manifest.variants, manifest.submissions
+        how = "restored the snapshot"
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return (
+        f"Created {database_path}: {how}, {variants} variants, "
+        f"{submissions} submissions in {elapsed_ms:.0f} ms."
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshot", type=Path, default=DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument("--html", type=Path, default=DEFAULT_HTML_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="import the page into a snapshot")
+    restore_parser = subparsers.add_parser(
+        "restore",
+        help="create the database from the snapshot unless it exists",
+    )
+    restore_parser.add_argument("--database", type=Path, default=get_database_path())
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        manifest = build_snapshot(args.html, args.snapshot)
+        elapsed = time.perf_counter() - start
+        print(
+            f"Snapshot of {manifest.variants} variants ({manifest.size} bytes) "
+            f"written to {args.snapshot} in {elapsed:.2f} s.",
+        )
+        return
+
+    try:
+        print(restore(args.database, args.snapshot, args.html))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not create {args.database}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
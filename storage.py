@@ -0,0 +1,829 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Where the views read and write guess counts.
+
+A Storage covers every read and write of the guess counts that the views
+and the in-memory indexes perform: adding guesses, the leaderboard page
+and the /api/results pages with their totals and data version, the data
+version alone for conditional GETs, the guess events that the live stream
+and the suggestion and variant indexes follow, the hourly and daily
+history behind /api/trending, and a health ping.
+
+- SQLiteStorage runs them on ben.db through given connections, exactly as
+  the views did before, including the guess events, the hourly history
+  and the sharded counter slots.
+- RedisStorage keeps the same data on a server that speaks the Redis
+  protocol, shared by any number of app nodes, so that the game can run
+  on more than one host:
+
+  - ``guesses`` is a sorted set scored by the negated count, so that
+    ZRANGE returns it in leaderboard order: count descending, then
+    surname ascending. ``total_count``, ``version`` and ``updated_at`` go
+    with it.
+  - ``events`` holds the latest EVENTS_KEPT guess events as
+    "delta surname" strings, the last of them numbered ``event_id``.
+  - ``hour:<start>`` sorted sets and ``hour_total:<start>`` and
+    ``day_total:<start>`` counters hold the history, and expire once they
+    are past the HISTORY_HOURS and HISTORY_DAYS retention.
+
+  A commit writes all of them in one MULTI/EXEC block.
+
+Imports (parse_surnames.py), count rebuilds (audit_index.py) and the
+write-behind counter work on ben.db only; ``python storage.py`` copies the
+counts of a database to an empty Redis storage.
+"""
+
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from itertools import batched
+from typing import Any, Protocol
+
+from history import (
+    DAY,
+    HOUR,
+    Retention,
+    daily_totals,
+    day_of,
+    hour_of,
+    hourly_totals,
+    record,
+    top_surnames,
+)
+from leaderboard import (
+    UPSERT_SQL,
+    LeaderboardKey,
+    counts_source,
+    fetch_counts,
+    fetch_page,
+    fetch_top,
+    fetch_totals,
+)
+from live_updates import (
+    MAX_FRAME_ROWS,
+    Frame,
+    build_frame,
+    format_event,
+    latest_event_id,
+    publish,
+    read_deltas,
+)
+from parse_surnames import latest_import
+from resp import RespError, RespPool, ServerAddress
+from setup_db import get_database_path
+from sharded_counter import add_to_shard
+
+BACKEND_SQLITE = "sqlite"
+BACKEND_REDIS = "redis"
+BACKENDS = (BACKEND_SQLITE, BACKEND_REDIS)
+
+# Guess events a RedisStorage keeps, as many as the guess_events trigger keeps
+EVENTS_KEPT = 10000
+
+# Where an in-memory index is in the counts: the latest import it has seen
+# and the last guess event it has applied
+type ChangePosition = tuple[object, int]
+
+
+@dataclass(frozen=True)
+class LeaderboardPage:
+    """Leaderboard rows and totals read together, labelled with their version."""
+
+    version: int
+    # Rows with "surname" and "count", in leaderboard order
+    rows: list[Any]
+    total_variations: int
+    total_count: int
+    # Unix time of the write that produced the version
+    updated_at: float
+
+
+@dataclass(frozen=True)
+class KeysetPage:
+    """One page of /api/results, read together with its totals and version."""
+
+    version: int
+    # Rows with "surname" and "count", in leaderboard order
+    rows: list[Any]
+    has_prev: bool
+    has_next: bool
+    total_variations: int
+    total_count: int
+
+
+@dataclass(frozen=True)
+class CountChanges:
+    """How the counts changed since a position, with the totals they add up to."""
+
+    position: ChangePosition
+    # (surname, delta) of every surname guessed since the position or, when
+    # reset, (surname, count) of every surname
+    counts: list[tuple[str, int]]
+    reset: bool
+    total_variations: int
+    total_count: int
+
+
+@dataclass(frozen=True)
+class Trending:
+    # (surname, guesses), most guessed first
+    top: list[tuple[str, int]]
+    # Guesses by the start of the hour and of the UTC day
+    per_hour: dict[int, int]
+    per_day: dict[int, int]
+
+
+class Storage(Protocol):
+    name: str
+    # Where the counts are kept, which in-memory indexes of them are keyed by
+    location: str
+
+    def increment(self, deltas: Mapping[str, int]) -> None:
+        """Add guesses per surname; they are stored by the next commit()."""
+
+    def commit(self) -> None: ...
+
+    def read_page(self, limit: int | None) -> LeaderboardPage:
+        """Return the first limit rows of the leaderboard, or all of them."""
+
+    def page(
+        self,
+        limit: int,
+        *,
+        after: LeaderboardKey | None = None,
+        before: LeaderboardKey | None = None,
+        around: str | None = None,
+    ) -> KeysetPage | None:
+        """Return a page of /api/results, or None if around is unknown.
+
+        See leaderboard.fetch_page for the meaning of the keys.
+        """
+
+    def counts(self, surnames: list[str]) -> dict[str, int]:
+        """Return the count of each of the surnames that has been guessed."""
+
+    def data_modified(self) -> tuple[int, float]:
+        """Return the data version and the Unix time of the last write."""
+
+    def latest_event_id(self) -> int:
+        """Return the id of the most recent guess event, or 0."""
+
+    def events_since(self, since: int) -> Frame | None:
+        """Summarise the guess events after since for the live stream."""
+
+    def count_changes(self, position: ChangePosition | None) -> CountChanges:
+        """Return the changes since position, or every count if they are lost."""
+
+    def trending(self, first_hour: int, first_day: int, limit: int) -> Trending:
+        """Return the top surnames since first_hour and the guesses per period."""
+
+    def ping(self) -> None:
+        """Raise if the storage cannot be read."""
+
+    def stats(self) -> dict[str, Any]: ...
+
+
+class SQLiteStorage:
+    """Guess counts in ben.db, read and written through given connections.
+
+    With shards > 1 guesses go to the sharded counter slots, which a
+    ShardCompactor must fold back into guesses.
+    """
+
+    name = BACKEND_SQLITE
+
+    def __init__(
+        self,
+        reader: Callable[[], sqlite3.Connection],
+        writer: Callable[[], sqlite3.Connection],
+        shards: int = 0,
+        location: str = "",
+    ) -> None:
+        """Read and write through connections returned by reader and writer."""
+        self._reader = reader
+        self._writer = writer
+        self.shards = shards
+        self.location = location
+
+    def increment(self, deltas: Mapping[str, int]) -> None:
+        db = self._writer()
+        if self.shards > 1:
+            for surname, delta in deltas.items():
+                add_to_shard(db, surname, delta, self.shards)
+        else:
+            db.executemany(UPSERT_SQL, deltas.items())
+        publish(db, deltas)
+        record(db, deltas)
+
+    def commit(self) -> None:
+        self._writer().commit()
+
+    def read_page(self, limit: int | None) -> LeaderboardPage:
+        db = self._reader()
+        # Read the version and the rows from the same snapshot, so that the
+        # page is never labelled with a version older than the data it shows
+        db.execute("BEGIN")
+        try:
+            version, updated_at = db.execute(
+                "SELECT version, updated_at FROM data_version WHERE id = 1",
+            ).fetchone()
+            rows = fetch_top(db, limit)
+            total_variations, total_count = fetch_totals(db)
+        finally:
+            db.commit()
+        return LeaderboardPage(
+            version,
+            rows,
+            total_variations,
+            total_count,
+            updated_at,
+        )
+
+    def page(
+        self,
+        limit: int,
+        *,
+        after: LeaderboardKey | None = None,
+        before: LeaderboardKey | None = None,
+        around: str | None = None,
+    ) -> KeysetPage | None:
+        db = self._reader()
+        db.execute("BEGIN")
+        try:
+            version = db.execute(
+                "SELECT version FROM data_version WHERE id = 1",
+            ).fetchone()[0]
+            fetched = fetch_page(db, limit, after=after, before=before, around=around)
+            if fetched is None:
+                return None
+            total_variations, total_count = fetch_totals(db)
+        finally:
+            db.commit()
+        rows, has_prev, has_next = fetched
+        return KeysetPage(
+            version,
+            rows,
+            has_prev,
+            has_next,
+            total_variations,
+            total_count,
+        )
+
+    def counts(self, surnames: list[str]) -> dict[str, int]:
+        return fetch_counts(self._reader(), surnames)
+
+    def latest_event_id(self) -> int:
+        return latest_event_id(self._reader())
+
+    def events_since(self, since: int) -> Frame | None:
+        return build_frame(self._reader(), since)
+
+    def count_changes(self, position: ChangePosition | None) -> CountChanges:
+        db = self._reader()
+        # Imports rewrite counts without guess events, so the changes only
+        # follow from the events while the latest import stays the same
+        db.execute("BEGIN")
+        try:
+            imported = latest_import(db)
+            changes = None
+            if position is not None and position[0] == imported:
+                changes = read_deltas(db, position[1])
+            if changes is None:
+                event_id = latest_event_id(db)
+                counts = db.execute(
+                    f"SELECT surname, count FROM {counts_source(db)}",  # noqa: S608
+                ).fetchall()
+            else:
+                event_id, counts = changes
+            total_variations, total_count = fetch_totals(db)
+        finally:
+            db.commit()
+        return CountChanges(
+            (imported, event_id),
+            counts,
+            changes is None,
+            total_variations,
+            total_count,
+        )
+
+    def trending(self, first_hour: int, first_day: int, limit: int) -> Trending:
+        db = self._reader()
+        db.execute("BEGIN")
+        try:
+            top = top_surnames(db, first_hour, limit)
+            per_hour = hourly_totals(db, first_hour)
+            per_day = daily_totals(db, first_day)
+        finally:
+            db.commit()
+        return Trending(top, per_hour, per_day)
+
+    def data_modified(self) -> tuple[int, float]:
+        version, updated_at = (
+            self._reader()
+            .execute("SELECT version, updated_at FROM data_version WHERE id = 1")
+            .fetchone()
+        )
+        return version, updated_at
+
+    def ping(self) -> None:
+        self._reader().execute("SELECT COUNT(*) FROM guesses LIMIT 1").fetchone()
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": self.name, "shards": self.shards}
+
+
+class RedisStorage:
+    """Guess counts on a Redis-protocol server shared by every app node.
+
+    Increments are buffered per thread until commit(), which sends them
+    with the totals, the version bump, the guess events and the history as
+    one MULTI/EXEC block in a single round trip, however many surnames the
+    batch holds. Reads that must agree with each other are one MULTI/EXEC
+    block as well.
+
+    A rank is the number of rows ahead of a key. For a surname that is at
+    its key it is ZRANK; otherwise, as for the rank a surname had before
+    its latest guesses, the rows with the key's count are a run of ranks
+    in surname order that is binary searched, one round trip per step for
+    all the keys being looked up.
+    """
+
+    name = BACKEND_REDIS
+
+    def __init__(self, pool: RespPool, prefix: str = "ben:") -> None:
+        """Keep the counts under keys starting with prefix."""
+        self.pool = pool
+        self.prefix = prefix
+        address = pool.address
+        self.location = f"redis://{address.host}:{address.port}/{address.db}#{prefix}"
+        self.guesses_key = f"{prefix}guesses"
+        self.total_key = f"{prefix}total_count"
+        self.version_key = f"{prefix}version"
+        self.updated_at_key = f"{prefix}updated_at"
+        self.events_key = f"{prefix}events"
+        self.event_id_key = f"{prefix}event_id"
+        self._pending = threading.local()
+        self.commits = 0
+        self.committed_guesses = 0
+
+    def hour_key(self, hour: int) -> str:
+        return f"{self.prefix}hour:{hour}"
+
+    def hour_total_key(self, hour: int) -> str:
+        return f"{self.prefix}hour_total:{hour}"
+
+    def day_total_key(self, day: int) -> str:
+        return f"{self.prefix}day_total:{day}"
+
+    def increment(self, deltas: Mapping[str, int]) -> None:
+        pending = getattr(self._pending, "deltas", None)
+        if pending is None:
+            pending = self._pending.deltas = Counter()
+        pending.update(deltas)
+
+    def commit(self) -> None:
+        deltas = getattr(self._pending, "deltas", None)
+        self._pending.deltas = None
+        if not deltas:
+            return
+        now = time.time()
+        retention = Retention.from_env()
+        hour_key = self.hour_key(hour_of(now))
+        hour_total_key = self.hour_total_key(hour_of(now))
+        day_total_key = self.day_total_key(day_of(now))
+        # Kept until the hour or day falls out of the retention
+        hour_ttl = (retention.hours + 1) * HOUR
+        day_ttl = (retention.days + 1) * DAY
+        total = deltas.total()
+
+        commands: list[tuple[str | int | float, ...]] = [("MULTI",)]
+        for surname, delta in deltas.items():
+            commands += [
+                ("ZINCRBY", self.guesses_key, -delta, surname),
+                ("ZINCRBY", hour_key, -delta, surname),
+            ]
+        commands += [
+            ("INCRBY", self.total_key, total),
+            ("INCR", self.version_key),
+            ("SET", self.updated_at_key, repr(now)),
+            (
+                "RPUSH",
+                self.events_key,
+                *(f"{delta} {surname}" for surname, delta in deltas.items()),
+            ),
+            ("INCRBY", self.event_id_key, len(deltas)),
+            ("LTRIM", self.events_key, -EVENTS_KEPT, -1),
+            ("INCRBY", hour_total_key, total),
+            ("INCRBY", day_total_key, total),
+            ("EXPIRE", hour_key, hour_ttl),
+            ("EXPIRE", hour_total_key, hour_ttl),
+            ("EXPIRE", day_total_key, day_ttl),
+            ("EXEC",),
+        ]
+        self.pool.pipeline(commands)
+        self.commits += 1
+        self.committed_guesses += total
+
+    def load(self, counts: Mapping[str, int]) -> None:
+        """Add counts to the leaderboard without recording them as guesses.
+
+        Unlike commit(), this writes no guess events and no history, so
+        counts copied from ben.db do not show up as guessed this hour in
+        /api/trending or in the live stream. The version still moves on,
+        which invalidates cached pages and marks the storage as not empty.
+        """
+        if not counts:
+            return
+        commands: list[tuple[str | int | float, ...]] = [("MULTI",)]
+        commands += [
+            ("ZINCRBY", self.guesses_key, -count, surname)
+            for surname, count in counts.items()
+        ]
+        commands += [
+            ("INCRBY", self.total_key, sum(counts.values())),
+            ("INCR", self.version_key),
+            ("SET", self.updated_at_key, repr(time.time())),
+            ("EXEC",),
+        ]
+        self.pool.pipeline(commands)
+
+    def read_page(self, limit: int | None) -> LeaderboardPage:
+        stop = -1 if limit is None else limit - 1
+        *_, replies = self.pool.pipeline(
+            [
+                ("MULTI",),
+                ("MGET", self.version_key, self.updated_at_key),
+                ("ZRANGE", self.guesses_key, 0, stop, "WITHSCORES"),
+                ("ZCARD", self.guesses_key),
+                ("GET", self.total_key),
+                ("EXEC",),
+            ],
+        )
+        (version, updated_at), flat_rows, total_variations, total_count = replies
+        return LeaderboardPage(
+            int(version or 0),
+            parse_rows(flat_rows),
+            total_variations,
+            int(total_count or 0),
+            float(updated_at or 0),
+        )
+
+    def page(
+        self,
+        limit: int,
+        *,
+        after: LeaderboardKey | None = None,
+        before: LeaderboardKey | None = None,
+        around: str | None = None,
+    ) -> KeysetPage | None:
+        has_prev = has_next = False
+        # Rows start to stop, inclusive, are read; a page that may have rows
+        # after it reads one more to find out
+        if around:
+            score = self.pool.execute(("ZSCORE", self.guesses_key, around))
+            if score is None:
+                return None
+            [(position, _)] = self.positions([(parse_count(score), around)])
+            preceding = min(position, limit // 2)
+            has_prev = position > limit // 2
+            start = position - preceding
+            stop = start + limit
+        elif before is not None:
+            [(position, _)] = self.positions([before])
+            start, stop = max(position - limit, 0), position - 1
+            has_prev, has_next = position > limit, True
+        else:
+            start = 0
+            if after is not None:
+                [(position, at_key)] = self.positions([after])
+                start = position + at_key
+                has_prev = True
+            stop = start + limit
+
+        commands: list[tuple[str | int, ...]] = [
+            ("MULTI",),
+            ("GET", self.version_key),
+            ("ZCARD", self.guesses_key),
+            ("GET", self.total_key),
+        ]
+        if stop >= start:
+            commands.append(("ZRANGE", self.guesses_key, start, stop, "WITHSCORES"))
+        commands.append(("EXEC",))
+        *_, replies = self.pool.pipeline(commands)
+        version, total_variations, total_count, *flat_rows = replies
+        rows = parse_rows(flat_rows[0]) if flat_rows else []
+        if before is None:
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+        return KeysetPage(
+            int(version or 0),
+            rows,
+            has_prev,
+            has_next,
+            total_variations,
+            int(total_count or 0),
+        )
+
+    def positions(self, keys: list[LeaderboardKey]) -> list[tuple[int, bool]]:
+        """Return how many rows precede each key and whether a row is at it."""
+        commands: list[tuple[str | int, ...]] = [("MULTI",)]
+        for count, surname in keys:
+            commands += [
+                ("ZSCORE", self.guesses_key, surname),
+                ("ZRANK", self.guesses_key, surname),
+                ("ZCOUNT", self.guesses_key, "-inf", f"({-count}"),
+                ("ZCOUNT", self.guesses_key, "-inf", -count),
+            ]
+        commands.append(("EXEC",))
+        *_, replies = self.pool.pipeline(commands)
+
+        positions = []
+        # [low, high) rank range left to search, per index into keys
+        searches = {}
+        for index, ((count, _), (score, rank, ahead, through)) in enumerate(
+            zip(keys, batched(replies, 4, strict=True), strict=True),
+        ):
+            if score is not None and parse_count(score) == count:
+                positions.append((rank, True))
+            else:
+                positions.append((ahead, False))
+                if ahead < through:
+                    searches[index] = (ahead, through)
+        while searches:
+            probes = {
+                index: (low + high) // 2 for index, (low, high) in searches.items()
+            }
+            replies = self.pool.pipeline(
+                [("ZRANGE", self.guesses_key, rank, rank) for rank in probes.values()],
+            )
+            for (index, rank), members in zip(probes.items(), replies, strict=True):
+                low, high = searches.pop(index)
+                if members and members[0] < keys[index][1].encode():
+                    low = rank + 1
+                else:
+                    high = rank
+                if low < high:
+                    searches[index] = (low, high)
+                else:
+                    positions[index] = (low, False)
+        return positions
+
+    def counts(self, surnames: list[str]) -> dict[str, int]:
+        if not surnames:
+            return {}
+        *_, scores = self.pool.pipeline(
+            [
+                ("MULTI",),
+                *(("ZSCORE", self.guesses_key, surname) for surname in surnames),
+                ("EXEC",),
+            ],
+        )
+        return {
+            surname: parse_count(score)
+            for surname, score in zip(surnames, scores, strict=True)
+            if score is not None
+        }
+
+    def data_modified(self) -> tuple[int, float]:
+        version, updated_at = self.pool.execute(
+            ("MGET", self.version_key, self.updated_at_key),
+        )
+        return int(version or 0), float(updated_at or 0)
+
+    def latest_event_id(self) -> int:
+        return int(self.pool.execute(("GET", self.event_id_key)) or 0)
+
+    def read_events(
+        self,
+        since: int,
+    ) -> tuple[int, Counter[str] | None, int, int]:
+        """Return the latest event id, the deltas since, and the totals.
+
+        The deltas are None if some of those events have been trimmed.
+        """
+        last_id = self.latest_event_id()
+        while True:
+            wanted = max(last_id - since, 0)
+            commands: list[tuple[str | int, ...]] = [
+                ("MULTI",),
+                ("GET", self.event_id_key),
+                ("LLEN", self.events_key),
+                ("ZCARD", self.guesses_key),
+                ("GET", self.total_key),
+            ]
+            if wanted:
+                commands.append(("LRANGE", self.events_key, -wanted, -1))
+            commands.append(("EXEC",))
+            *_, replies = self.pool.pipeline(commands)
+            current, kept, total_variations, total_count, *entries = replies
+            # Read again if events were added since the id was read
+            if int(current or 0) == last_id:
+                break
+            last_id = int(current or 0)
+        if wanted > kept:
+            return last_id, None, total_variations, int(total_count or 0)
+        deltas: Counter[str] = Counter()
+        for entry in entries[0] if entries else []:
+            delta, surname = entry.decode().split(" ", 1)
+            deltas[surname] += int(delta)
+        return last_id, deltas, total_variations, int(total_count or 0)
+
+    def events_since(self, since: int) -> Frame | None:
+        last_id, deltas, total_variations, total_count = self.read_events(since)
+        if deltas is None or len(deltas) > MAX_FRAME_ROWS:
+            return Frame(since, last_id, format_event("reset", last_id, {}))
+        if not deltas:
+            return None
+
+        counts = self.counts(list(deltas))
+        keys = [(count, surname) for surname, count in counts.items()]
+        previous = [
+            (count - deltas[surname], surname)
+            for count, surname in keys
+            if count > deltas[surname]
+        ]
+        positions = self.positions(keys + previous)
+        previous_ranks = {
+            # The surname itself now precedes its previous key
+            surname: position
+            for (_, surname), (position, _) in zip(
+                previous,
+                positions[len(keys) :],
+                strict=True,
+            )
+        }
+        rows = []
+        for (count, surname), (position, _) in zip(
+            keys,
+            positions[: len(keys)],
+            strict=True,
+        ):
+            rank = position + 1
+            previous_rank = previous_ranks.get(surname)
+            rows.append(
+                {
+                    "surname": surname,
+                    "count": count,
+                    "rank": rank,
+                    "rank_change": (
+                        None if previous_rank is None else previous_rank - rank
+                    ),
+                },
+            )
+        rows.sort(key=lambda row: row["rank"])
+        data = {
+            "rows": rows,
+            "total_variations": total_variations,
+            "total_count": total_count,
+        }
+        return Frame(since, last_id, format_event("delta", last_id, data))
+
+    def count_changes(self, position: ChangePosition | None) -> CountChanges:
+        if position is not None:
+            last_id, deltas, total_variations, total_count = self.read_events(
+                position[1],
+            )
+            if deltas is not None:
+                return CountChanges(
+                    (None, last_id),
+                    list(deltas.items()),
+                    reset=False,
+                    total_variations=total_variations,
+                    total_count=total_count,
+                )
+        *_, replies = self.pool.pipeline(
+            [
+                ("MULTI",),
+                ("GET", self.event_id_key),
+                ("ZRANGE", self.guesses_key, 0, -1, "WITHSCORES"),
+                ("GET", self.total_key),
+                ("EXEC",),
+            ],
+        )
+        event_id, flat_rows, total_count = replies
+        counts = [(row["surname"], row["count"]) for row in parse_rows(flat_rows)]
+        return CountChanges(
+            (None, int(event_id or 0)),
+            counts,
+            reset=True,
+            total_variations=len(counts),
+            total_count=int(total_count or 0),
+        )
+
+    def trending(self, first_hour: int, first_day: int, limit: int) -> Trending:
+        now = time.time()
+        hours = range(first_hour, hour_of(now) + 1, HOUR)
+        days = range(first_day, day_of(now) + 1, DAY)
+        union_key = f"{self.prefix}trending"
+        *_, replies = self.pool.pipeline(
+            [
+                ("MULTI",),
+                (
+                    "ZUNIONSTORE",
+                    union_key,
+                    len(hours),
+                    *(self.hour_key(hour) for hour in hours),
+                ),
+                ("ZRANGE", union_key, 0, limit - 1, "WITHSCORES"),
+                ("DEL", union_key),
+                ("MGET", *(self.hour_total_key(hour) for hour in hours)),
+                ("MGET", *(self.day_total_key(day) for day in days)),
+                ("EXEC",),
+            ],
+        )
+        _, flat_rows, _, hour_totals, day_totals = replies
+        return Trending(
+            [(row["surname"], row["count"]) for row in parse_rows(flat_rows)],
+            {
+                hour: int(total)
+                for hour, total in zip(hours, hour_totals, strict=True)
+                if total is not None
+            },
+            {
+                day: int(total)
+                for day, total in zip(days, day_totals, strict=True)
+                if total is not None
+            },
+        )
+
+    def ping(self) -> None:
+        self.pool.execute(("PING",))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": self.name,
+            "commits": self.commits,
+            "committed_guesses": self.committed_guesses,
+            **self.pool.stats(),
+        }
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def parse_count(score: bytes) -> int:
+    """Return the count a score in the guesses sorted sets stands for."""
+    return -int(float(score))
+
+
+def parse_rows(flat_rows: list[bytes]) -> list[dict[str, Any]]:
+    """Turn a ZRANGE WITHSCORES reply into leaderboard rows."""
+    return [
+        {"surname": surname.decode(), "count": parse_count(score)}
+        for surname, score in batched(flat_rows, 2, strict=True)
+    ]
+
+
+def copy_counts(
+    db: sqlite3.Connection,
+    storage: RedisStorage,
+    batch_size: int = 1000,
+) -> int:
+    """Add every count in the database to the storage and return how many.
+
+    Each batch of surnames is loaded in a single round trip. The counts go
+    to the leaderboard only, not to the guess events or the history.
+    """
+    copied = 0
+    rows = db.execute(
+        f"SELECT surname, count FROM {counts_source(db)} WHERE count > 0",  # noqa: S608
+    )
+    for batch in batched(rows, batch_size, strict=False):
+        storage.load(dict(batch))
+        copied += len(batch)
+    return copied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Copy the guess counts of ben.db to an empty Redis storage.",
+    )
+    parser.add_argument("url", help="redis://host:port/db")
+    parser.add_argument("--prefix", default="ben:")
+    parser.add_argument("--database", default=str(get_database_path()))
+    args = parser.parse_args()
+
+    storage = RedisStorage(RespPool(ServerAddress.from_url(args.url)), args.prefix)
+    try:
+        if storage.data_modified()[0]:
+            print(f"{args.url} already holds guesses under {args.prefix!r}")
+            sys.exit(1)
+        db = sqlite3.connect(args.database)
+        try:
+            copied = copy_counts(db, storage)
+        finally:
+            db.close()
+    except RespError as e:
+        print(f"Could not copy the counts: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        storage.close()
+    print(f"Copied {copied} surnames to {args.url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Prefix suggestions for the surname input, ranked by count.
+
+Surnames are kept in a sorted list, so the variants that start with a
+prefix are one bisect range. The top suggestions of a prefix are computed
+from that range when it is first asked for and kept in a bounded cache;
+later guesses update the cached lists in place, so a popular prefix is not
+recomputed after every guess.
+
+Counts follow the guess events that every write to the storage appends
+(Storage.count_changes). Imports and count rebuilds do not publish
+events. An import is noticed by its record in ``imports``, a rebuild
+because the storage's totals no longer match the counts held here, and
+the index is then rebuilt from every count, as it is when the events it
+needs have already been pruned.
+"""
+
+import bisect
+import heapq
+import threading
+from collections import OrderedDict
+
+from storage import ChangePosition, CountChanges, Storage
+
+# Suggestions kept per prefix, and so the most a lookup can return
+MAX_SUGGESTIONS = 20
+
+# Prefixes whose suggestions are cached, least recently used evicted first
+DEFAULT_MAX_PREFIXES = 5000
+
+# Sorts after any character a surname can contain
+PREFIX_END = chr(0x10FFFF)
+
+
+class SuggestIndex:
+    """In-memory surname counts for prefix suggestions.
+
+    Lookups and refreshes may come from several threads; a lock keeps the
+    counts from changing while a lookup reads them.
+    """
+
+    def __init__(
+        self,
+        location: str | None = None,
+        max_prefixes: int = DEFAULT_MAX_PREFIXES,
+    ) -> None:
+        """Create an empty index of at most max_prefixes prefixes."""
+        self.location = location
+        self.max_prefixes = max_prefixes
+        self._lock = threading.Lock()
+        self._surnames: list[str] = []
+        self._counts: dict[str, int] = {}
+        self._total_count = 0
+        # Top surnames of each cached prefix, in leaderboard order
+        self._top: OrderedDict[str, list[str]] = OrderedDict()
+        self.position: ChangePosition | None = None
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def _rank(self, surname: str) -> tuple[int, str]:
+        return -self._counts[surname], surname
+
+    def refresh(self, storage: Storage) -> None:
+        """Apply the changes since the last refresh, or rebuild."""
+        with self._lock:
+            changes = storage.count_changes(self.position)
+            if not changes.reset:
+                for surname, delta in changes.counts:
+                    self._apply(surname, delta)
+                if (len(self._counts), self._total_count) != (
+                    changes.total_variations,
+                    changes.total_count,
+                ):
+                    changes = storage.count_changes(None)
+            if changes.reset:
+                self._rebuild(changes)
+            self.position = changes.position
+
+    def _rebuild(self, changes: CountChanges) -> None:
+        self._counts = dict(changes.counts)
+        self._surnames = sorted(self._counts)
+        self._total_count = sum(self._counts.values())
+        self._top.clear()
+        self.rebuilds += 1
+
+    def _apply(self, surname: str, delta: int) -> None:
+        count = self._counts.get(surname)
+        if count is None:
+            bisect.insort(self._surnames, surname)
+            count = 0
+        self._counts[surname] = count + delta
+        self._total_count += delta
+
+        rank = self._rank(surname)
+        for end in range(1, len(surname) + 1):
+            prefix = surname[:end]
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            if delta < 0:
+                # A surname falling out of the top needs the range rescanned
+                del self._top[prefix]
+                continue
+            if surname in top:
+                top.remove(surname)
+            elif len(top) == MAX_SUGGESTIONS and rank > self._rank(top[-1]):
+                continue
+            bisect.insort(top, surname, key=self._rank)
+            del top[MAX_SUGGESTIONS:]
+
+    def suggest(self, prefix: str, limit: int) -> list[tuple[str, int]]:
+        """Return (surname, count) of the most guessed surnames with the prefix."""
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is not None:
+                self.hits += 1
+                self._top.move_to_end(prefix)
+            else:
+                self.misses += 1
+                start = bisect.bisect_left(self._surnames, prefix)
+                end = bisect.bisect_right(self._surnames, prefix + PREFIX_END, start)
+                top = self._top[prefix] = heapq.nsmallest(
+                    MAX_SUGGESTIONS,
+                    self._surnames[start:end],
+                    key=self._rank,
+                )
+                if len(self._top) > self.max_prefixes:
+                    self._top.popitem(last=False)
+            return [(surname, self._counts[surname]) for surname in top[:limit]]
+
+    def stats(self) -> dict[str, int | None]:
+        return {
+            "surnames": len(self._surnames),
+            "cached_prefixes": len(self._top),
+            "event_id": None if self.position is None else self.position[1],
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+        }
@@ -1 +1,2 @@
+# Copyright (c) 2025 Jaakko Vuori
 """Tests for the Ben surname guessing game."""
@@ -1,3 +1,4 @@
+# Copyright (c) 2025 Jaakko Vuori
 """Test configuration and fixtures for the Ben project."""
 
 import os
@@ -21,6 +22,10 @@ def client() -> Generator[FlaskClient]:
     # Override the database path for testing
     os.environ["DATABASE_DIR"] = str(Path(db_path).parent)
 
+    # Start every test with fresh rate-limit buckets
+    os.environ["RATE_LIMIT_STORE"] = "memory"
+    app.extensions.pop("rate_limiter", None)
+
     with app.test_client() as client:
         with app.app_context():
             # Initialize test database with schema
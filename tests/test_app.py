@@ -1,3 +1,4 @@
+# Copyright (c) 2025 Jaakko Vuori
 """Tests for the Flask application."""
 
 import json
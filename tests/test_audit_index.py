@@ -0,0 +1,148 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the audit log index and count rebuild."""
+
+import gzip
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from audit_index import (
+    audit_counts,
+    index_logs,
+    query_surname,
+    rebuild_counts,
+    top,
+)
+from parse_surnames import populate_database
+
+START = 1_750_000_000
+
+
+def log_line(offset: float, ip: str, surname: str) -> str:
+    """Return an audit line logged the given seconds after START."""
+    moment = START + offset
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(moment))
+    return f"{stamp},{int(moment * 1000) % 1000:03d} - {ip} - {surname}\n"
+
+
+def count(index_path: Path, surname: str) -> int:
+    conn = sqlite3.connect(index_path)
+    try:
+        return query_surname(conn, surname)[0]
+    finally:
+        conn.close()
+
+
+def test_index_follows_appends_and_rotation(tmp_path: Path) -> None:
+    """Test that entries are indexed once, however the files move."""
+    index_path = tmp_path / "audit-index.db"
+    current = tmp_path / "audit.log"
+    with gzip.open(tmp_path / "audit.log.20250101-000000.gz", "wt") as f:
+        f.write(log_line(0, "192.0.2.1", "zyskowicz"))
+    current.write_text(
+        log_line(60, "192.0.2.2", "zyskowicz") + "not an audit line\n",
+    )
+    logs = [tmp_path / "audit.log.20250101-000000.gz", current]
+    stats = index_logs(index_path, logs, jobs=1)
+    assert (stats.entries_added, stats.lines_skipped) == (2, 1)
+
+    # Only complete lines are indexed; the rest waits for the next run
+    with current.open("a") as f:
+        f.write(log_line(120, "192.0.2.3", "sylkowski") + "2025-")
+    assert index_logs(index_path, logs).entries_added == 1
+    with current.open("a") as f:
+        f.write(log_line(121, "192.0.2.3", "sylkowski")[5:])
+    assert index_logs(index_path, logs).entries_added == 1
+    assert index_logs(index_path, logs).files_read == 0
+
+    # Rotated without compression: the same file, renamed
+    rotated = tmp_path / "audit.log.20250102-000000"
+    current.rename(rotated)
+    current.write_text(log_line(180, "192.0.2.1", "zyskowicz"))
+    logs = [logs[0], rotated, current]
+    assert index_logs(index_path, logs).entries_added == 1
+    assert (count(index_path, "zyskowicz"), count(index_path, "sylkowski")) == (3, 2)
+
+    # Compressed later: the plain file's entries are replaced by the archive's
+    with gzip.open(rotated.with_suffix(".gz"), "wb") as f:
+        f.write(rotated.read_bytes())
+    rotated.unlink()
+    logs = [logs[0], rotated.with_suffix(".gz"), current]
+    stats = index_logs(index_path, logs)
+    assert (stats.files_dropped, stats.entries_added) == (1, 3)
+    assert (count(index_path, "zyskowicz"), count(index_path, "sylkowski")) == (3, 2)
+
+
+def test_queries_by_surname_time_and_ip(tmp_path: Path) -> None:
+    """Test surname and top-IP queries over a time range."""
+    index_path = tmp_path / "audit-index.db"
+    log = tmp_path / "audit.log"
+    log.write_text(
+        log_line(0, "192.0.2.1", "zyskowicz")
+        + log_line(10, "192.0.2.1", "zyskowicz")
+        + log_line(20, "192.0.2.2", "sylkowski")
+        + log_line(30, "192.0.2.2", "zyskowicz")
+        + log_line(3600, "192.0.2.3", "zyskowicz"),
+    )
+    index_logs(index_path, [log])
+
+    conn = sqlite3.connect(index_path)
+    guesses, latest = query_surname(conn, "zyskowicz", START + 5, START + 60, limit=1)
+    assert (guesses, latest) == (2, [(START + 30, "192.0.2.2")])
+    assert top(conn, "ip", START, START + 60) == [
+        ("192.0.2.1", 2),
+        ("192.0.2.2", 2),
+    ]
+    assert top(conn, "surname", START + 60, limit=1) == [("zyskowicz", 1)]
+    assert audit_counts(conn) == {"zyskowicz": 4, "sylkowski": 1}
+    conn.close()
+
+
+def test_rebuild_sets_counts_to_import_plus_log(tmp_path: Path) -> None:
+    """Test that rebuilt counts are the import baseline plus logged guesses."""
+    db_path = tmp_path / "ben.db"
+    populate_database(
+        [("zyskowicz", 10), ("sylkowski", 3), ("tsygowicz", 1)],
+        str(db_path),
+        mode="replace",
+        source="test.html",
+    )
+    conn = sqlite3.connect(db_path)
+    # Counts that drifted from the log, e.g. through a lost write-behind batch
+    conn.execute("UPDATE guesses SET count = 99 WHERE surname = 'sylkowski'")
+    # A guess whose log was pruned
+    conn.execute("INSERT INTO guesses (surname, count) VALUES ('zykowicz', 5)")
+    conn.commit()
+
+    logged = {"zyskowicz": 2, "zetkowicz": 1}
+    assert rebuild_counts(conn, logged, dry_run=True)
+    diff = rebuild_counts(conn, logged)
+    assert (diff.added, diff.changed, diff.removed, diff.kept) == (
+        {"zetkowicz": 1},
+        {"zyskowicz": 2, "sylkowski": -96},
+        {},
+        {"zykowicz": 5},
+    )
+    assert dict(conn.execute("SELECT surname, count FROM guesses")) == {
+        "zyskowicz": 12,
+        "sylkowski": 3,
+        "tsygowicz": 1,
+        "zykowicz": 5,
+        "zetkowicz": 1,
+    }
+    assert not rebuild_counts(conn, logged)
+
+    diff = rebuild_counts(conn, logged, prune=True)
+    assert (diff.removed, diff.kept) == ({"zykowicz": 5}, {})
+    assert conn.execute(
+        "SELECT total_variations, total_count FROM guess_stats",
+    ).fetchone() == (4, 17)
+    assert not rebuild_counts(conn, logged, prune=True)
+
+    conn.execute("DELETE FROM imports")
+    conn.commit()
+    with pytest.raises(ValueError, match="no recorded import"):
+        rebuild_counts(conn, logged)
+    conn.close()
@@ -1,14 +1,21 @@
+# Copyright (c) 2025 Jaakko Vuori
 """Tests for audit logging functionality."""
 
+import gzip
 import logging
 import tempfile
+import threading
 from pathlib import Path
 from unittest.mock import patch
 
-from app import log_user_guess, setup_audit_logger
+import pytest
 
+from app import log_user_guess, log_user_guesses, setup_audit_logger
+from audit_index import parse_file
+from audit_log import DEFAULT_BACKUP_COUNT, AsyncAuditHandler, AuditFormatter
 
-def test_setup_audit_logger():
+
+def test_setup_audit_logger() -> None:
     """Test that audit logger is set up correctly."""
     with tempfile.TemporaryDirectory() as tmpdir:
         with patch.dict("os.environ", {"LOGS_DIR": tmpdir}):
@@ -23,7 +30,7 @@ def test_setup_audit_logger():
             assert log_file.exists()
 
 
-def test_log_user_guess():
+def test_log_user_guess() -> None:
     """Test that user guesses are logged correctly."""
     with tempfile.TemporaryDirectory() as tmpdir:
         log_file = Path(tmpdir) / "audit.log"
@@ -60,7 +67,7 @@ def test_log_user_guess():
             assert "zyskowicz" in log_parts
 
 
-def test_log_user_guess_with_unknown_ip():
+def test_log_user_guess_with_unknown_ip() -> None:
     """Test logging with unknown IP address."""
     with tempfile.TemporaryDirectory() as tmpdir:
         log_file = Path(tmpdir) / "audit.log"
@@ -86,7 +93,7 @@ def test_log_user_guess_with_unknown_ip():
             assert "testname" in log_content
 
 
-def test_log_multiple_guesses():
+def test_log_multiple_guesses() -> None:
     """Test that multiple guesses are logged correctly."""
     with tempfile.TemporaryDirectory() as tmpdir:
         log_file = Path(tmpdir) / "audit.log"
@@ -122,3 +129,207 @@ def test_log_multiple_guesses():
 
             assert "surname" in log_lines[2]
             assert "10.0.0.1" in log_lines[2]
+
+
+def make_async_logger(name: str, handler: AsyncAuditHandler) -> logging.Logger:
+    """Create a logger that only writes to the given async handler."""
+    handler.setFormatter(AuditFormatter("%(asctime)s - %(message)s"))
+    test_logger = logging.getLogger(name)
+    test_logger.setLevel(logging.INFO)
+    test_logger.propagate = False
+    test_logger.handlers = [handler]
+    return test_logger
+
+
+def test_async_handler_preserves_order(tmp_path: Path) -> None:
+    """Test that records from the queue are written in submission order."""
+    handler = AsyncAuditHandler(tmp_path / "audit.log", batch_size=7)
+    test_logger = make_async_logger("test_audit_async_order", handler)
+
+    with patch("app.audit_logger", test_logger):
+        for i in range(100):
+            log_user_guess(f"surname{i}", "10.0.0.1")
+        handler.flush()
+
+    lines = (tmp_path / "audit.log").read_text().splitlines()
+    assert [line.rsplit(" - ", 1)[1] for line in lines] == [
+        f"surname{i}" for i in range(100)
+    ]
+    assert handler.stats() == {"queued": 0, "written": 100, "dropped": 0}
+    handler.close()
+
+
+def test_batch_record_is_written_as_a_line_per_guess(tmp_path: Path) -> None:
+    """Test that a logged batch reads back like guesses logged one by one."""
+    handler = AsyncAuditHandler(tmp_path / "audit.log", queue_size=2)
+    test_logger = make_async_logger("test_audit_async_batch", handler)
+
+    with patch("app.audit_logger", test_logger):
+        log_user_guess("zyskowicz", "10.0.0.1")
+        log_user_guesses({"zyskowitz": 3, "syskowitz": 1}, "10.0.0.2")
+        handler.flush()
+
+    lines = (tmp_path / "audit.log").read_text().splitlines()
+    assert [line.split(" - ", 1)[1] for line in lines] == [
+        "10.0.0.1 - zyskowicz",
+        *["10.0.0.2 - zyskowitz"] * 3,
+        "10.0.0.2 - syskowitz",
+    ]
+    assert handler.stats() == {"queued": 0, "written": 5, "dropped": 0}
+    parsed = parse_file(str(tmp_path / "audit.log"), 0)
+    assert (len(parsed.times), parsed.skipped) == (5, 0)
+    handler.close()
+
+
+def test_large_batch_is_written_in_chunks(tmp_path: Path) -> None:
+    """Test that a batch's lines are formatted and written a chunk at a time."""
+    handler = AsyncAuditHandler(tmp_path / "audit.log")
+    test_logger = make_async_logger("test_audit_async_chunks", handler)
+
+    with (
+        patch("app.audit_logger", test_logger),
+        patch("audit_log.WRITE_CHUNK_LINES", 10),
+        patch.object(handler, "_write_data", wraps=handler._write_data) as write,  # noqa: SLF001
+    ):
+        log_user_guesses({"zyskowitz": 25, "syskowitz": 4}, "10.0.0.2")
+        handler.flush()
+
+    assert [call.args[0].count("\n") for call in write.call_args_list] == [
+        10,
+        10,
+        9,
+    ]
+    lines = (tmp_path / "audit.log").read_text().splitlines()
+    assert [line.split(" - ", 1)[1] for line in lines] == [
+        *["10.0.0.2 - zyskowitz"] * 25,
+        *["10.0.0.2 - syskowitz"] * 4,
+    ]
+    handler.close()
+
+
+def test_async_handler_writes_queued_records_on_close(tmp_path: Path) -> None:
+    """Test that closing the handler at shutdown drains the queue."""
+    handler = AsyncAuditHandler(tmp_path / "audit.log")
+    test_logger = make_async_logger("test_audit_async_close", handler)
+
+    release = threading.Event()
+    original_write = handler._write  # noqa: SLF001
+
+    def slow_write(records: list[logging.LogRecord]) -> None:
+        release.wait()
+        original_write(records)
+
+    with patch.object(handler, "_write", slow_write):
+        for i in range(10):
+            test_logger.info("10.0.0.1 - surname%d", i)
+        release.set()
+        handler.close()
+
+    lines = (tmp_path / "audit.log").read_text().splitlines()
+    assert [line.rsplit(" - ", 1)[1] for line in lines] == [
+        f"surname{i}" for i in range(10)
+    ]
+
+
+def test_async_handler_drops_when_queue_is_full(tmp_path: Path) -> None:
+    """Test that the drop policy discards and counts records it cannot queue."""
+    handler = AsyncAuditHandler(
+        tmp_path / "audit.log",
+        queue_size=2,
+        full_policy="drop",
+    )
+    test_logger = make_async_logger("test_audit_async_drop", handler)
+
+    writing = threading.Event()
+    release = threading.Event()
+    original_write = handler._write  # noqa: SLF001
+
+    def blocked_write(records: list[logging.LogRecord]) -> None:
+        writing.set()
+        release.wait()
+        original_write(records)
+
+    with patch.object(handler, "_write", blocked_write):
+        test_logger.info("first")
+        # Wait until the writer holds the first record, then fill the queue
+        assert writing.wait(1)
+        for i in range(5):
+            test_logger.info("record %d", i)
+        release.set()
+        handler.close()
+
+    written = (tmp_path / "audit.log").read_text().splitlines()
+    assert (len(written), handler.dropped) == (3, 3)
+
+
+def test_async_handler_blocks_when_configured(tmp_path: Path) -> None:
+    """Test that the block policy waits for queue space before dropping."""
+    handler = AsyncAuditHandler(
+        tmp_path / "audit.log",
+        queue_size=1,
+        full_policy="block",
+        block_timeout=0.01,
+    )
+    handler._queue.put_nowait(  # noqa: SLF001
+        logging.makeLogRecord({"msg": "queued"}),
+    )
+    with patch.object(handler, "_ensure_started"):
+        handler.emit(logging.makeLogRecord({"msg": "waiting"}))
+    assert handler.dropped == 1
+    handler.close()
+
+    with pytest.raises(ValueError, match="policy"):
+        AsyncAuditHandler(tmp_path / "other.log", full_policy="sometimes")
+
+
+def test_async_handler_rotates_and_compresses(tmp_path: Path) -> None:
+    """Test size based rotation with gzip compression and pruning."""
+    max_bytes, backup_count = 200, 2
+    handler = AsyncAuditHandler(
+        tmp_path / "audit.log",
+        max_bytes=max_bytes,
+        backup_count=backup_count,
+        compress=True,
+    )
+    test_logger = make_async_logger("test_audit_async_rotate", handler)
+
+    for i in range(30):
+        test_logger.info("10.0.0.1 - surname%d", i)
+        handler.flush()
+    handler.close()
+
+    rotated = sorted(tmp_path.glob("audit.log.*.gz"))
+    assert len(rotated) == backup_count
+    assert (tmp_path / "audit.log").stat().st_size <= max_bytes
+    with gzip.open(rotated[-1], "rt") as f:
+        assert "surname" in f.read()
+
+
+def test_async_handler_prunes_oldest_rotated_files(tmp_path: Path) -> None:
+    """Test that pruning keeps the newest backups, suffixed or compressed."""
+    for name in (
+        "audit.log.20250728-110000.gz",
+        "audit.log.20250728-120000.gz",
+        "audit.log.20250728-120000-1.gz",
+        "audit.log.20250728-120000-2",
+        "audit.log.lock",
+    ):
+        (tmp_path / name).write_text("old\n")
+    (tmp_path / "audit.log").write_text("current\n")
+    handler = AsyncAuditHandler(tmp_path / "audit.log", max_bytes=1, backup_count=3)
+
+    with patch("audit_log.time.strftime", return_value="20250728-130000"):
+        handler._rotate(0)  # noqa: SLF001
+    handler.close()
+
+    assert sorted(path.name for path in tmp_path.glob("audit.log.*")) == [
+        "audit.log.20250728-120000-1.gz",
+        "audit.log.20250728-120000-2",
+        "audit.log.20250728-130000",
+        "audit.log.lock",
+    ]
+
+    handler = AsyncAuditHandler(tmp_path / "other.log")
+    assert handler.backup_count == DEFAULT_BACKUP_COUNT
+    assert handler.full_policy == "block"
+    handler.close()
@@ -0,0 +1,92 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for response compression and the precompressed body store."""
+
+import gzip
+from http import HTTPStatus
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app
+from compression import CompressedStore
+
+
+def test_results_are_compressed_once_per_version(client: FlaskClient) -> None:
+    """Test that the page is gzipped and the stored copy is reused."""
+    plain = client.get("/results")
+    response = client.get("/results", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == plain.data
+    assert response.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+
+    store = app.extensions["compressed_store"]
+    hits = store.hits
+    again = client.get("/results", headers={"Accept-Encoding": "gzip"})
+    assert again.data == response.data
+    assert store.hits == hits + 1
+
+    # The compressed tag revalidates the same page
+    response = client.get(
+        "/results",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": again.headers["ETag"]},
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+
+def test_highlights_off_the_page_share_the_stored_body(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that the store is keyed by the body sent, not by the ETag."""
+    monkeypatch.setenv("RESULTS_INITIAL_ROWS", "1")
+    gzipped = {"Accept-Encoding": "gzip"}
+    plain = client.get("/results", headers=gzipped)
+    store = app.extensions["compressed_store"]
+    hits = store.hits
+
+    # TestSurname is not among the rows rendered, AnotherTest is
+    response = client.get("/results?highlight=TestSurname", headers=gzipped)
+    assert response.headers["ETag"] != plain.headers["ETag"]
+    assert (response.data, store.hits) == (plain.data, hits + 1)
+
+    highlighted = client.get("/results?highlight=AnotherTest", headers=gzipped)
+    assert highlighted.data != plain.data
+    again = client.get("/results?highlight=AnotherTest", headers=gzipped)
+    assert (again.data, store.hits) == (highlighted.data, hits + 2)
+
+
+def test_brotli_is_preferred(client: FlaskClient) -> None:
+    """Test that brotli is chosen when the client accepts it."""
+    brotli = pytest.importorskip("brotli")
+    plain = client.get("/")
+    response = client.get("/", headers={"Accept-Encoding": "gzip, deflate, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data) == plain.data
+
+
+def test_small_and_unaccepted_responses_are_not_compressed(
+    client: FlaskClient,
+) -> None:
+    """Test that tiny bodies and identity-only clients get plain bodies."""
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/results", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_store_evicts_least_recently_used() -> None:
+    """Test that the store stays within its size limit in LRU order."""
+    store = CompressedStore(max_bytes=10)
+    store.put(("a", "gzip"), b"1234")
+    store.put(("b", "gzip"), b"1234")
+    assert store.get(("a", "gzip")) == b"1234"
+    store.put(("c", "gzip"), b"1234")
+    assert store.get(("b", "gzip")) is None
+    assert store.get(("a", "gzip")) == b"1234"
+    stats = store.stats()
+    assert (stats["bytes"], stats["evictions"]) == (8, 1)
+
+    store.put(("huge", "gzip"), b"x" * 11)
+    assert store.get(("huge", "gzip")) is None
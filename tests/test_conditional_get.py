@@ -0,0 +1,88 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for ETag and Last-Modified revalidation of / and /results."""
+
+import sqlite3
+from http import HTTPStatus
+from unittest.mock import patch
+
+from flask.testing import FlaskClient
+
+from app import get_database_path, results_cache
+from storage import SQLiteStorage
+
+
+def test_results_not_modified_until_a_guess(client: FlaskClient) -> None:
+    """Test that /results answers 304 until the data version changes."""
+    response = client.get("/results")
+    etag = response.headers["ETag"]
+    assert response.status_code == HTTPStatus.OK
+    assert "no-cache" in response.headers["Cache-Control"]
+
+    misses = results_cache.stats()["misses"]
+    with patch.object(SQLiteStorage, "read_page") as read_page:
+        response = client.get("/results", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    # Neither the leaderboard nor the page was touched
+    read_page.assert_not_called()
+    assert results_cache.stats()["misses"] == misses
+
+    client.post("/submit", data={"surname": "zyskowicz"})
+    response = client.get("/results", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["ETag"] != etag
+
+
+def test_last_modified_describes_the_page_sent(client: FlaskClient) -> None:
+    """Test that a page newer than the version read is labelled as itself."""
+    conn = sqlite3.connect(get_database_path())
+    with conn:
+        conn.execute("UPDATE data_version SET updated_at = 1000000000")
+    conn.close()
+    results_cache.clear()
+
+    # The page is built after a guess that landed between reading the
+    # version and fetching the page
+    with (
+        patch("app.template_fingerprint", return_value=("templates", 0.0)),
+        patch.object(SQLiteStorage, "data_modified", return_value=(0, 0.0)),
+    ):
+        response = client.get("/results")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["Last-Modified"] == "Sun, 09 Sep 2001 01:46:40 GMT"
+
+
+def test_highlight_is_part_of_the_validator(client: FlaskClient) -> None:
+    """Test that highlighted and plain views never share an ETag."""
+    plain = client.get("/results").headers["ETag"]
+    highlighted = client.get("/results?highlight=testsurname").headers["ETag"]
+    assert plain != highlighted
+
+    response = client.get(
+        "/results?highlight=testsurname",
+        headers={"If-None-Match": plain},
+    )
+    assert response.status_code == HTTPStatus.OK
+    response = client.get(
+        "/results?highlight=testsurname",
+        headers={"If-None-Match": highlighted},
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_index_not_modified(client: FlaskClient) -> None:
+    """Test that / revalidates by template content and modification time."""
+    response = client.get("/")
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+
+    with patch("app.render_template") as render_template:
+        response = client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        response = client.get("/", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        render_template.assert_not_called()
+
+    response = client.get("/", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == HTTPStatus.OK
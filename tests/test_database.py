@@ -0,0 +1,110 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the database schema and setup helpers."""
+
+import sqlite3
+from collections.abc import Generator
+
+import pytest
+
+from setup_db import SCHEMA_PATH, check_stats, repair_stats, upgrade_db
+
+
+@pytest.fixture
+def conn() -> Generator[sqlite3.Connection]:
+    """Create an in-memory database with the full schema."""
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA_PATH.read_text())
+    yield conn
+    conn.close()
+
+
+def read_stats(conn: sqlite3.Connection) -> tuple[int, int]:
+    """Return the stored (total_variations, total_count)."""
+    return conn.execute(
+        "SELECT total_variations, total_count FROM guess_stats",
+    ).fetchone()
+
+
+def test_triggers_keep_stats_in_sync(conn: sqlite3.Connection) -> None:
+    """Test that every kind of write keeps guess_stats up to date."""
+    assert read_stats(conn) == (0, 0)
+
+    conn.executemany(
+        "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+        [("zyskowicz", 10), ("syskowicz", 3)],
+    )
+    assert read_stats(conn) == (2, 13)
+
+    conn.execute(
+        "INSERT INTO guesses (surname, count) VALUES ('zyskowicz', 1) "
+        "ON CONFLICT(surname) DO UPDATE SET count = count + excluded.count",
+    )
+    assert read_stats(conn) == (2, 14)
+
+    conn.execute("DELETE FROM guesses WHERE surname = 'syskowicz'")
+    assert read_stats(conn) == (1, 11)
+    assert check_stats(conn) == {}
+
+
+def test_init_resets_stats(conn: sqlite3.Connection) -> None:
+    """Test that re-running the schema starts from empty aggregates."""
+    conn.execute("INSERT INTO guesses (surname, count) VALUES ('zyskowicz', 10)")
+    conn.commit()
+    conn.executescript(SCHEMA_PATH.read_text())
+    assert read_stats(conn) == (0, 0)
+
+
+def test_check_and_repair_drift(conn: sqlite3.Connection) -> None:
+    """Test that drift is reported and can be repaired."""
+    conn.execute("INSERT INTO guesses (surname, count) VALUES ('zyskowicz', 10)")
+    conn.execute("UPDATE guess_stats SET total_count = 7")
+
+    assert check_stats(conn) == {"total_count": (7, 10)}
+    repair_stats(conn)
+    assert check_stats(conn) == {}
+    assert read_stats(conn) == (1, 10)
+
+
+def test_upgrade_initialises_stats_from_existing_guesses() -> None:
+    """Test that an existing database gets aggregates matching its guesses."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE guesses (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "surname TEXT NOT NULL UNIQUE, count INTEGER NOT NULL DEFAULT 0)",
+    )
+    conn.executemany(
+        "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+        [("zyskowicz", 10), ("syskowicz", 3)],
+    )
+    conn.commit()
+
+    upgrade_db(conn)
+    upgrade_db(conn)
+    assert read_stats(conn) == (2, 13)
+    conn.close()
+
+
+def test_upgrade_leaves_version_and_stats_alone(conn: sqlite3.Connection) -> None:
+    """Test that upgrading a database with guesses keeps its version and stats."""
+    conn.execute("INSERT INTO guesses (surname, count) VALUES ('zyskowicz', 10)")
+    conn.execute("UPDATE guess_stats SET total_count = 7")
+    conn.commit()
+    version = conn.execute("SELECT version, updated_at FROM data_version").fetchone()
+
+    upgrade_db(conn)
+    assert (
+        conn.execute("SELECT version, updated_at FROM data_version").fetchone()
+        == version
+    )
+    # Not reseeded: the drift is left for --check to report
+    assert check_stats(conn) == {"total_count": (7, 10)}
+
+
+def test_init_moves_the_version_on(conn: sqlite3.Connection) -> None:
+    """Test that re-running the schema gives the emptied table a new version."""
+    conn.execute("INSERT INTO guesses (surname, count) VALUES ('zyskowicz', 10)")
+    conn.commit()
+    version = conn.execute("SELECT version FROM data_version").fetchone()[0]
+
+    conn.executescript(SCHEMA_PATH.read_text())
+    assert conn.execute("SELECT version FROM data_version").fetchone()[0] > version
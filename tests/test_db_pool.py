@@ -0,0 +1,147 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the SQLite connection pool."""
+
+import sqlite3
+import threading
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app, close_pool, get_pool
+from db_pool import ConnectionPool, PoolConfig, PoolTimeoutError
+
+
+@pytest.fixture
+def pool(tmp_path: Path) -> ConnectionPool:
+    """Create a pool with two readers for a fresh database."""
+    pool = ConnectionPool(tmp_path / "ben.db", PoolConfig(readers=2))
+    writer = pool.acquire_writer()
+    writer.execute("CREATE TABLE guesses (surname TEXT PRIMARY KEY, count INTEGER)")
+    writer.commit()
+    pool.release_writer(writer)
+    return pool
+
+
+def test_connections_are_configured(pool: ConnectionPool) -> None:
+    """Test that pooled connections get the configured pragmas."""
+    defaults = PoolConfig()
+    conn = pool.acquire_reader()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    busy_timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    assert busy_timeout == defaults.busy_timeout_ms
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    # A negative cache_size is in KiB rather than pages
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    assert cache_size == -defaults.cache_size_kib
+    pool.release_reader(conn)
+    pool.close()
+
+
+def test_readers_are_reused(pool: ConnectionPool) -> None:
+    """Test that released readers are handed out again."""
+    first = pool.acquire_reader()
+    pool.release_reader(first)
+    assert pool.acquire_reader() is first
+    pool.close()
+
+
+def test_writer_is_exclusive(pool: ConnectionPool) -> None:
+    """Test that a second thread waits until the writer is released."""
+    writer = pool.acquire_writer()
+    acquired = threading.Event()
+
+    def take_writer() -> None:
+        conn = pool.acquire_writer()
+        acquired.set()
+        pool.release_writer(conn)
+
+    thread = threading.Thread(target=take_writer)
+    thread.start()
+    assert not acquired.wait(0.05)
+    pool.release_writer(writer)
+    assert acquired.wait(1)
+    thread.join()
+    pool.close()
+
+
+def test_reader_wait_times_out(tmp_path: Path) -> None:
+    """Test that waiting for a free reader gives up after the timeout."""
+    pool = ConnectionPool(
+        tmp_path / "ben.db",
+        PoolConfig(readers=1, acquire_timeout_ms=10),
+    )
+    reader = pool.acquire_reader()
+    with pytest.raises(PoolTimeoutError, match="10 ms"):
+        pool.acquire_reader()
+    pool.release_reader(reader)
+    assert pool.acquire_reader() is reader
+    pool.close()
+
+
+def test_release_rolls_back_open_transaction(pool: ConnectionPool) -> None:
+    """Test that an aborted request cannot leak an open transaction."""
+    writer = pool.acquire_writer()
+    writer.execute("INSERT INTO guesses VALUES ('zyskowicz', 1)")
+    assert writer.in_transaction
+    pool.release_writer(writer)
+
+    writer = pool.acquire_writer()
+    assert not writer.in_transaction
+    assert writer.execute("SELECT COUNT(*) FROM guesses").fetchone()[0] == 0
+    pool.release_writer(writer)
+    pool.close()
+
+
+def test_config_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that pool settings are read from environment variables."""
+    monkeypatch.setenv("DB_POOL_SIZE", "8")
+    monkeypatch.setenv("DB_SYNCHRONOUS", "full")
+    monkeypatch.setenv("DB_BUSY_TIMEOUT_MS", "250")
+    monkeypatch.setenv("DB_POOL_TIMEOUT_MS", "100")
+    config = PoolConfig.from_env()
+    assert (
+        config.readers,
+        config.synchronous,
+        config.busy_timeout_ms,
+        config.acquire_timeout_ms,
+    ) == (8, "FULL", 250, 100)
+
+    monkeypatch.setenv("DB_SYNCHRONOUS", "sometimes")
+    with pytest.raises(ValueError, match="DB_SYNCHRONOUS"):
+        PoolConfig.from_env()
+
+
+def test_requests_return_connections_to_pool(client: FlaskClient) -> None:
+    """Test that request connections are released at teardown."""
+    client.get("/results")
+    client.post("/submit", data={"surname": "zyskowicz"})
+    pool = app.extensions["db_pool"]
+    assert pool._readers.qsize() == pool._opened_readers  # noqa: SLF001
+    assert pool._writer.qsize() == 1  # noqa: SLF001
+    conn = sqlite3.connect(pool.database_path)
+    count = conn.execute(
+        "SELECT count FROM guesses WHERE surname = 'zyskowicz'",
+    ).fetchone()[0]
+    conn.close()
+    assert count == 1
+
+
+def test_exhausted_pool_answers_503(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that a request gets 503 when no reader becomes free in time."""
+    monkeypatch.setenv("DB_POOL_SIZE", "1")
+    monkeypatch.setenv("DB_POOL_TIMEOUT_MS", "10")
+    close_pool()
+    pool = get_pool()
+    reader = pool.acquire_reader()
+    try:
+        response = client.get("/results")
+    finally:
+        pool.release_reader(reader)
+        close_pool()
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,94 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the hourly guess history and /api/trending."""
+
+import sqlite3
+from http import HTTPStatus
+
+from flask.testing import FlaskClient
+
+from app import get_db, get_write_db
+from history import (
+    DAY,
+    HOUR,
+    Retention,
+    daily_totals,
+    hourly_totals,
+    record,
+    top_surnames,
+)
+from setup_db import SCHEMA_PATH
+from write_behind import apply_deltas
+
+# Midnight UTC
+START = 1_700_006_400
+
+
+def test_old_hours_are_rolled_up_into_days() -> None:
+    """Test that rollups keep every guess within the retention."""
+    db = sqlite3.connect(":memory:")
+    db.executescript(SCHEMA_PATH.read_text())
+    retention = Retention(hours=3, days=2)
+    for half_hour in range(4 * 48):
+        now = START + half_hour * HOUR / 2
+        record(db, {"zyskowicz": 2, "zyskowitz": 1}, now, retention)
+
+    now = START + 4 * DAY - 1
+    assert db.execute("SELECT COUNT(DISTINCT hour) FROM guess_hours").fetchone() == (4,)
+    assert hourly_totals(db, START + 3 * DAY + 20 * HOUR) == {
+        START + 3 * DAY + 20 * HOUR: 6,
+        START + 3 * DAY + 21 * HOUR: 6,
+        START + 3 * DAY + 22 * HOUR: 6,
+        START + 3 * DAY + 23 * HOUR: 6,
+    }
+    # The first day has expired, the last is split between days and hours
+    assert daily_totals(db, START) == {
+        START + DAY: 144,
+        START + 2 * DAY: 144,
+        START + 3 * DAY: 144,
+    }
+    assert db.execute(
+        "SELECT count FROM guess_days WHERE day = ? AND surname = 'zyskowicz'",
+        (START + 3 * DAY,),
+    ).fetchone() == (2 * 2 * 20,)
+    assert top_surnames(db, now - 2 * HOUR, 5) == [
+        ("zyskowicz", 8),
+        ("zyskowitz", 4),
+    ]
+
+
+def test_write_behind_flushes_are_recorded(client: FlaskClient) -> None:
+    """Test that deltas applied by the write-behind counter are bucketed."""
+    with client.application.app_context():
+        apply_deltas(get_write_db(), {"zyskowitz": 3, "zsykowicz": 1})
+        rows = get_db().execute(
+            "SELECT surname, count FROM guess_hours ORDER BY surname",
+        )
+        assert [tuple(row) for row in rows] == [("zsykowicz", 1), ("zyskowitz", 3)]
+
+
+def test_api_trending(client: FlaskClient) -> None:
+    """Test the top surnames, the series and the cache headers."""
+    for surname in ["zyskowicz", "zyskowicz", "zsykowicz"]:
+        client.post("/submit", data={"surname": surname})
+
+    response = client.get("/api/trending?hours=3&days=2")
+    data = response.get_json()
+    assert data["top"] == [
+        {"surname": "zyskowicz", "count": 2},
+        {"surname": "zsykowicz", "count": 1},
+    ]
+    assert [hour["count"] for hour in data["per_hour"]] == [0, 0, 3]
+    assert data["per_hour"][1]["hour"] - data["per_hour"][0]["hour"] == HOUR
+    assert [day["count"] for day in data["per_day"]] == [0, 3]
+    assert "max-age=60" in response.headers["Cache-Control"]
+
+    again = client.get(
+        "/api/trending?hours=3&days=2",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert again.status_code == HTTPStatus.NOT_MODIFIED
+
+    capped = client.get("/api/trending?hours=1000&limit=1").get_json()
+    assert capped["hours"] == len(capped["per_hour"]) == Retention().hours
+    assert capped["top"] == [{"surname": "zyskowicz", "count": 2}]
+    assert client.get("/api/trending?hours=x").status_code == HTTPStatus.BAD_REQUEST
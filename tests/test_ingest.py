@@ -0,0 +1,172 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for batch guess ingestion through /api/guesses/batch."""
+
+import io
+import json
+from collections.abc import Generator
+from http import HTTPStatus
+from unittest.mock import MagicMock, patch
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app, get_db
+from ingest import MAX_REPORTED_REJECTIONS, JsonArrayReader, iter_ndjson
+
+TOKEN = "kiosk-secret"  # noqa: S105
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+
+
+@pytest.fixture
+def ingest_client(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> FlaskClient:
+    monkeypatch.setenv("INGEST_TOKENS", f"other-token,{TOKEN}")
+    return client
+
+
+@pytest.fixture
+def audit() -> Generator[MagicMock]:
+    with patch("app.log_user_guesses") as log_user_guesses:
+        yield log_user_guesses
+
+
+def count_of(surname: str) -> int | None:
+    with app.app_context():
+        row = (
+            get_db()
+            .execute(
+                "SELECT count FROM guesses WHERE surname = ?",
+                (surname,),
+            )
+            .fetchone()
+        )
+    return None if row is None else row[0]
+
+
+def test_reader_decodes_items_split_across_chunks() -> None:
+    """Test the streaming JSON reader with chunks smaller than an item."""
+    items = ["Zyskowicz", ["Äyskowitz", 12345], {"surname": "syskowitz"}, 7, None]
+    body = " [ " + " ,\n".join(json.dumps(item) for item in items) + " ]\n"
+    for chunk_size in (1, 2, 3, 64):
+        reader = JsonArrayReader(io.BytesIO(body.encode()), chunk_size=chunk_size)
+        assert list(reader) == items
+    assert list(JsonArrayReader(io.BytesIO(b"[]"))) == []
+    assert list(iter_ndjson(io.BytesIO(b'"a"\n\n[1, 2]'))) == ["a", [1, 2]]
+
+
+def test_batch_is_applied_in_one_transaction(
+    ingest_client: FlaskClient,
+    audit: MagicMock,
+) -> None:
+    """Test a JSON batch with accepted and rejected items of every kind."""
+    items = [
+        "Zyskowicz",
+        ["zyskowicz", 4],
+        {"surname": "Zyskowitz Junior", "count": 2},
+        "Ben",
+        ["zyskowicz", 0],
+        {"surname": "zyskowicz", "extra": 1},
+        "xyskowicz",
+    ]
+    response = ingest_client.post("/api/guesses/batch", json=items, headers=AUTH)
+    assert response.status_code == HTTPStatus.OK
+    assert response.get_json() == {
+        "items": 7,
+        "accepted": 3,
+        "guesses": 7,
+        "surnames": 2,
+        "rejected": [
+            {"index": 3, "surname": "Ben", "reason": "too_short"},
+            {"index": 4, "reason": "invalid_count"},
+            {"index": 5, "reason": "invalid_item"},
+            {"index": 6, "surname": "xyskowicz", "reason": "wrong_start"},
+        ],
+        "rejected_count": 4,
+    }
+    assert (count_of("zyskowicz"), count_of("zyskowitz")) == (5, 2)
+    audit.assert_called_once_with(
+        {"zyskowicz": 5, "zyskowitz": 2},
+        "127.0.0.1",
+    )
+
+
+@pytest.mark.usefixtures("audit")
+def test_ndjson_batch_is_streamed(ingest_client: FlaskClient) -> None:
+    """Test a chunked NDJSON body, sent without a Content-Length."""
+    body = b'"Zyskowicz"\n' * 2500 + b'["Syskowitz", 3]'
+    response = ingest_client.post(
+        "/api/guesses/batch",
+        input_stream=io.BytesIO(body),
+        content_type="application/x-ndjson",
+        headers={**AUTH, "Transfer-Encoding": "chunked"},
+        # As gunicorn does once it has decoded the chunks
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+    assert (
+        response.get_json()["guesses"],
+        count_of("zyskowicz"),
+        count_of("syskowitz"),
+    ) == (2503, 2500, 3)
+
+
+@pytest.mark.usefixtures("audit")
+def test_rejections_and_guesses_are_bounded(
+    ingest_client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that only the first rejections are listed and guesses are capped."""
+    items = ["Ben"] * 2500 + [["Zyskowicz", 5]]
+    response = ingest_client.post("/api/guesses/batch", json=items, headers=AUTH)
+    data = response.get_json()
+    assert (data["accepted"], data["rejected_count"]) == (1, 2500)
+    assert [rejection["index"] for rejection in data["rejected"]] == list(
+        range(MAX_REPORTED_REJECTIONS),
+    )
+    accepted = count_of("zyskowicz")
+
+    monkeypatch.setenv("INGEST_MAX_GUESSES", "4")
+    response = ingest_client.post("/api/guesses/batch", json=items, headers=AUTH)
+    assert response.status_code == HTTPStatus.CONTENT_TOO_LARGE
+    assert count_of("zyskowicz") == accepted
+
+
+def test_invalid_batches_change_nothing(
+    ingest_client: FlaskClient,
+    audit: MagicMock,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that a bad request is refused before anything is written."""
+    url = "/api/guesses/batch"
+    assert (
+        ingest_client.post(url, json=["Zyskowicz"]).status_code
+        == HTTPStatus.UNAUTHORIZED
+    )
+    response = ingest_client.post(
+        url,
+        json=["Zyskowicz"],
+        headers={"Authorization": "Bearer wrong"},
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    response = ingest_client.post(url, data="Zyskowicz", headers=AUTH)
+    assert response.status_code == HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+    response = ingest_client.post(
+        url,
+        data='["Zyskowicz", "Syskowitz" "Tsyskowitsch"]',
+        content_type="application/json",
+        headers=AUTH,
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    monkeypatch.setenv("INGEST_MAX_ITEMS", "2")
+    response = ingest_client.post(url, json=["Zyskowicz"] * 3, headers=AUTH)
+    assert response.status_code == HTTPStatus.CONTENT_TOO_LARGE
+    assert count_of("zyskowicz") is None
+    audit.assert_not_called()
+
+    monkeypatch.delenv("INGEST_TOKENS")
+    assert (
+        ingest_client.post(url, json=[], headers=AUTH).status_code
+        == HTTPStatus.NOT_FOUND
+    )
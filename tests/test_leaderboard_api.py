@@ -0,0 +1,92 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the paginated leaderboard JSON API and incremental results page."""
+
+from http import HTTPStatus
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import get_db
+
+SURNAMES = [f"syskowic{letter}" for letter in "abcdefghij"]
+
+
+@pytest.fixture
+def leaderboard(client: FlaskClient) -> FlaskClient:
+    """Add ten guesses with distinct counts to the test database."""
+    with client.application.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+            [(surname, 100 - i) for i, surname in enumerate(SURNAMES)],
+        )
+        db.commit()
+    return client
+
+
+def test_pages_walk_the_leaderboard_in_order(leaderboard: FlaskClient) -> None:
+    """Test that following next cursors returns every row exactly once."""
+    seen = []
+    params = {"limit": "4"}
+    while True:
+        data = leaderboard.get("/api/results", query_string=params).get_json()
+        seen.extend(row["surname"] for row in data["rows"])
+        if data["next"] is None:
+            break
+        params = {"limit": "4", "after": data["next"]}
+
+    assert seen[: len(SURNAMES)] == SURNAMES
+    assert seen[len(SURNAMES) :] == ["AnotherTest", "TestSurname"]
+    assert data["total_variations"] == len(seen)
+
+
+def test_before_cursor_returns_previous_page(leaderboard: FlaskClient) -> None:
+    """Test that a prev cursor leads back to the preceding rows."""
+    first = leaderboard.get("/api/results?limit=3").get_json()
+    second = leaderboard.get(f"/api/results?limit=3&after={first['next']}").get_json()
+    assert second["prev"] is not None
+
+    back = leaderboard.get(f"/api/results?limit=3&before={second['prev']}").get_json()
+    assert back["rows"] == first["rows"]
+    assert back["prev"] is None
+
+
+def test_around_returns_page_containing_surname(leaderboard: FlaskClient) -> None:
+    """Test that the page around a surname contains it."""
+    data = leaderboard.get("/api/results?limit=4&around=SyskowicF").get_json()
+    surnames = [row["surname"] for row in data["rows"]]
+    assert surnames == SURNAMES[3:7]
+    assert data["prev"] is not None
+    assert data["next"] is not None
+
+
+def test_invalid_parameters(leaderboard: FlaskClient) -> None:
+    """Test that bad cursors and unknown surnames are rejected."""
+    assert (
+        leaderboard.get("/api/results?after=nonsense").status_code
+        == HTTPStatus.BAD_REQUEST
+    )
+    assert leaderboard.get("/api/results?limit=x").status_code == HTTPStatus.BAD_REQUEST
+    assert (
+        leaderboard.get("/api/results?around=syskowicz").status_code
+        == HTTPStatus.NOT_FOUND
+    )
+
+
+def test_incremental_mode_renders_top_rows_only(
+    leaderboard: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that only the top rows are rendered in incremental mode."""
+    initial_rows = 3
+    monkeypatch.setenv("RESULTS_INITIAL_ROWS", str(initial_rows))
+    response = leaderboard.get("/results?highlight=syskowicb")
+    assert response.data.count(b'id="guess-') == initial_rows
+    assert b'data-next="98:syskowicc"' in response.data
+    assert b'class="highlight"' in response.data
+
+    monkeypatch.delenv("RESULTS_INITIAL_ROWS")
+    total = leaderboard.get("/api/results").get_json()["total_variations"]
+    response = leaderboard.get("/results")
+    assert response.data.count(b'id="guess-') == total
+    assert b'data-next="' not in response.data
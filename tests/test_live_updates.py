@@ -0,0 +1,165 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the live leaderboard stream."""
+
+import json
+import sqlite3
+from collections.abc import Generator, Iterator
+from contextlib import contextmanager
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app, default_max_streams
+from leaderboard import UPSERT_SQL
+from live_updates import MAX_FRAME_ROWS, LiveUpdates, build_frame, publish
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    """Create a database with a small leaderboard."""
+    path = tmp_path / "ben.db"
+    conn = sqlite3.connect(path)
+    conn.executescript((Path(__file__).parent.parent / "schema.sql").read_text())
+    conn.executemany(
+        "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+        [("zyskowicz", 10), ("zyskovic", 5), ("syskowicz", 4)],
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def guess(db_path: Path, deltas: dict[str, int]) -> None:
+    """Count guesses and publish them, as the write path does."""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(UPSERT_SQL, deltas.items())
+        publish(conn, deltas)
+    conn.close()
+
+
+@contextmanager
+def sqlite_source(db_path: Path) -> Iterator[SQLiteStorage]:
+    conn = sqlite3.connect(db_path)
+    try:
+        yield SQLiteStorage(lambda: conn, lambda: conn)
+    finally:
+        conn.close()
+
+
+def parse_event(message: bytes) -> tuple[str, int, dict]:
+    """Return the (event, id, data) of an encoded Server-Sent Event."""
+    fields = dict(line.split(": ", 1) for line in message.decode().splitlines() if line)
+    return fields["event"], int(fields["id"]), json.loads(fields["data"])
+
+
+def test_frame_summarises_deltas_since_position(db_path: Path) -> None:
+    """Test that a frame carries counts, rank changes and the new totals."""
+    guess(db_path, {"syskowicz": 1})
+    guess(db_path, {"syskowicz": 1, "sylkowski": 1})
+
+    frame = build_frame(sqlite3.connect(db_path), 0)
+    assert frame is not None
+    event, event_id, data = parse_event(frame.message)
+    assert (event, event_id, frame.id) == ("delta", 3, 3)
+    assert data["rows"] == [
+        {"surname": "syskowicz", "count": 6, "rank": 2, "rank_change": 1},
+        {"surname": "sylkowski", "count": 1, "rank": 4, "rank_change": None},
+    ]
+    assert (data["total_variations"], data["total_count"]) == (4, 22)
+
+    assert build_frame(sqlite3.connect(db_path), 3) is None
+
+
+def test_frame_resets_when_events_are_missing(db_path: Path) -> None:
+    """Test that clients behind pruned events or big bursts reload instead."""
+    guess(db_path, {f"sylkowski{i}": 1 for i in range(MAX_FRAME_ROWS + 1)})
+    frame = build_frame(sqlite3.connect(db_path), 0)
+    assert frame is not None
+    assert parse_event(frame.message)[0] == "reset"
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM guess_events WHERE id < 10")
+    conn.commit()
+    frame = build_frame(conn, 5)
+    assert frame is not None
+    assert parse_event(frame.message)[0] == "reset"
+
+
+def test_streams_share_one_frame_per_position(db_path: Path) -> None:
+    """Test that streams at the same position are served from one frame."""
+    live = LiveUpdates(lambda: sqlite_source(db_path), interval=0.01, hold=0)
+    streams = [live.stream(0) for _ in range(3)]
+    for stream in streams:
+        assert next(stream).startswith(b"retry: ")
+
+    guess(db_path, {"zyskovic": 1})
+    messages = [next(stream) for stream in streams]
+    live.close()
+
+    assert len(set(messages)) == 1
+    rows = parse_event(messages[0])[2]["rows"]
+    assert [(row["surname"], row["count"]) for row in rows] == [("zyskovic", 6)]
+    assert live.stats()["frames"] == 1
+
+
+@pytest.fixture
+def live_client(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Generator[FlaskClient]:
+    """Poll quickly and hold streams briefly."""
+    monkeypatch.setenv("LIVE_UPDATES_INTERVAL", "0.01")
+    monkeypatch.setenv("LIVE_UPDATES_HOLD", "0.1")
+    live = app.extensions.pop("live_updates", None)
+    if live is not None:
+        live.close()
+    yield client
+    live = app.extensions.pop("live_updates", None)
+    if live is not None:
+        live.close()
+
+
+def test_submitted_guess_is_streamed(live_client: FlaskClient) -> None:
+    """Test that /results/stream pushes a guess submitted after the page."""
+    page = live_client.get("/results").get_data(as_text=True)
+    assert 'data-stream="/results/stream"' in page
+    since = page.split('data-since="')[1].split('"')[0]
+
+    live_client.post("/submit", data={"surname": "Zyskowicz"})
+    response = live_client.get(
+        "/results/stream",
+        headers={"Last-Event-ID": since},
+        buffered=True,
+    )
+    assert response.mimetype == "text/event-stream"
+    assert "Content-Encoding" not in response.headers
+    messages = response.get_data().split(b"\n\n")
+    event, event_id, data = parse_event(messages[1] + b"\n\n")
+    assert event == "delta"
+    assert event_id == int(since) + 1
+    assert data["rows"] == [
+        {"surname": "zyskowicz", "count": 1, "rank": 3, "rank_change": None},
+    ]
+
+
+def test_stream_rejects_invalid_event_id(live_client: FlaskClient) -> None:
+    """Test that a malformed Last-Event-ID is a client error."""
+    response = live_client.get("/results/stream", headers={"Last-Event-ID": "x"})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_max_streams_default_to_half_the_threads(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that held streams leave threads free for other requests."""
+    streams = []
+    for threads in ("8", "1"):
+        monkeypatch.setenv("WEB_THREADS", threads)
+        streams.append(default_max_streams())
+    monkeypatch.delenv("WEB_THREADS")
+    streams.append(default_max_streams())
+    assert streams == [4, 0, 2]
@@ -0,0 +1,106 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the load-testing harness."""
+
+import gzip
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from benchmarks.loadtest import (
+    OPERATION_RESULTS,
+    OPERATION_SUBMIT,
+    InProcessTarget,
+    compare,
+    read_audit_logs,
+    replay_workload,
+    run,
+    summarize,
+    synthetic_workload,
+)
+
+
+def test_replay_keeps_the_logged_pace(tmp_path: Path) -> None:
+    """Test that audit records are scheduled as logged, divided by the speed."""
+    (tmp_path / "audit.log").write_text(
+        "2025-07-28 12:00:10,500 - 192.0.2.2 - zyskowicz\nnot an audit line\n",
+    )
+    with gzip.open(tmp_path / "audit.log.20250728-120000.gz", "wt") as f:
+        f.write("2025-07-28 12:00:00,500 - 192.0.2.1 - sylkowski\n")
+
+    planned = replay_workload(
+        read_audit_logs(sorted(tmp_path.iterdir())),
+        speed=2,
+    )
+    assert [(r.form, r.client_ip, r.at) for r in planned] == [
+        ({"surname": "sylkowski"}, "192.0.2.1", 0.0),
+        ({"surname": "zyskowicz"}, "192.0.2.2", 5.0),
+    ]
+
+
+def test_synthetic_workload_favours_popular_surnames() -> None:
+    """Test the read/write mix and the Zipf skew of a seeded workload."""
+    requests, read_ratio, clients = 2000, 0.5, 10
+    planned = synthetic_workload(
+        ["first", "second", "third", "fourth"],
+        requests=requests,
+        read_ratio=read_ratio,
+        zipf_exponent=1.5,
+        clients=clients,
+        rate=None,
+        seed=1,
+    )
+    guesses = [r.form["surname"] for r in planned if r.form]
+    assert len(guesses) == pytest.approx(requests * (1 - read_ratio), rel=0.1)
+    assert guesses.count("first") > guesses.count("second") > guesses.count("fourth")
+    assert len({r.client_ip for r in planned if r.form}) == clients
+
+
+def test_in_process_run_follows_redirects(client: FlaskClient) -> None:
+    """Test a small run against the app and its summary."""
+    planned = synthetic_workload(
+        ["zyskowicz", "sylkowski"],
+        requests=20,
+        read_ratio=0.5,
+        zipf_exponent=1.0,
+        clients=20,
+        rate=None,
+        seed=2,
+    )
+    writes = sum(1 for r in planned if r.operation == OPERATION_SUBMIT)
+    measurements, elapsed = run(
+        InProcessTarget,
+        planned,
+        concurrency=2,
+        follow_redirects=True,
+    )
+    summary = summarize(measurements, elapsed)
+    assert summary[OPERATION_SUBMIT]["requests"] == writes
+    # Each submit redirects to /results, so every request ends on the page
+    assert summary[OPERATION_RESULTS]["requests"] == len(planned)
+    assert not any(stats["errors"] for stats in summary.values())
+    assert client.get("/health").status_code == HTTPStatus.OK
+
+
+def test_compare_flags_regressions_beyond_tolerance() -> None:
+    """Test that slower percentiles, lower throughput and new errors are flagged."""
+    baseline = {
+        "results": {"p50_ms": 2.0, "p95_ms": 5.0, "p99_ms": 9.0, "throughput": 100.0},
+    }
+    baseline["results"]["errors"] = 0
+    current = {
+        "results": {
+            "p50_ms": 2.1,
+            "p95_ms": 6.0,
+            "p99_ms": 9.0,
+            "throughput": 80.0,
+            "errors": 1,
+        },
+    }
+    assert compare(current, baseline, tolerance=0.1) == [
+        "results p95_ms: 5.00 -> 6.00 (+20%)",
+        "results throughput: 100.00 -> 80.00 (-20%)",
+        "results errors: 0 -> 1",
+    ]
+    assert compare(current, baseline, tolerance=0.25) == ["results errors: 0 -> 1"]
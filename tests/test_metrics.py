@@ -0,0 +1,127 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the Prometheus metrics and the /metrics endpoint."""
+
+import re
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+from flask.testing import FlaskClient
+
+from app import audit_logger
+from metrics import Counter, Histogram, Registry
+
+
+def sample(text: str, name: str) -> float:
+    """Return the value of a sample in an exposition, or 0 if it is absent."""
+    match = re.search(rf"^{re.escape(name)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    """Test the exposition of a histogram and a counter."""
+    registry = Registry()
+    latency = Histogram(
+        "t_seconds",
+        "Latency.",
+        ("view",),
+        buckets=(0.1, 1),
+        registry=registry,
+    )
+    rejections = Counter("t_total", "Rejections.", ("reason",), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, "results")
+    rejections.inc('say "hi"')
+    rejections.inc('say "hi"', amount=2)
+
+    assert registry.expose().splitlines() == [
+        "# HELP t_seconds Latency.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{view="results",le="0.1"} 2',
+        't_seconds_bucket{view="results",le="1"} 3',
+        't_seconds_bucket{view="results",le="+Inf"} 4',
+        't_seconds_sum{view="results"} 3.65',
+        't_seconds_count{view="results"} 4',
+        "# HELP t_total Rejections.",
+        "# TYPE t_total counter",
+        't_total{reason="say \\"hi\\""} 3',
+    ]
+
+
+# Records a label 0..1999 each in another process, enough to grow its store
+CHILD_SCRIPT = """
+import sys
+from pathlib import Path
+from metrics import Counter, Registry
+
+registry = Registry(Path(sys.argv[1]))
+counter = Counter("t_total", "Events.", ("label",), registry=registry)
+for label in range(2000):
+    counter.inc(str(label))
+"""
+
+
+def test_stores_are_added_up_across_processes_and_threads(tmp_path: Path) -> None:
+    """Test that every process and thread writing to the directory is counted."""
+    registry = Registry(tmp_path)
+    counter = Counter("t_total", "Events.", ("label",), registry=registry)
+    counter.inc("0")
+
+    subprocess.run(  # noqa: S603
+        [sys.executable, "-c", CHILD_SCRIPT, str(tmp_path)],
+        check=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    thread = threading.Thread(target=lambda: [counter.inc(str(n)) for n in range(2)])
+    thread.start()
+    thread.join()
+
+    text = registry.expose()
+    # One file each for this process, the child and the thread
+    assert (
+        sample(text, 't_total{label="0"}'),
+        sample(text, 't_total{label="1"}'),
+        sample(text, 't_total{label="1999"}'),
+        len(list(tmp_path.glob("*.metrics"))),
+    ) == (3, 2, 1, 3)
+
+
+def test_metrics_endpoint_reports_the_submit_and_results_paths(
+    client: FlaskClient,
+) -> None:
+    """Test that requests, queries, renders and rejections are recorded."""
+    names = {
+        "submits": (
+            'ben_http_requests_total{route="/submit",method="POST",status="302"}'
+        ),
+        "rejected": 'ben_validation_rejections_total{reason="wrong_start"}',
+        "commits": 'ben_db_seconds_count{view="submit_guess",operation="commit"}',
+        "queries": 'ben_db_seconds_count{view="results",operation="query"}',
+        "renders": 'ben_template_render_seconds_count{template="results.html"}',
+        "latency": 'ben_http_request_duration_seconds_count{route="/results"}',
+        "audit": "ben_audit_write_seconds_count",
+    }
+    before = client.get("/metrics").get_data(as_text=True)
+
+    client.post("/submit", data={"surname": "abcdefg"})
+    client.post("/submit", data={"surname": "zyskowicz"})
+    client.get("/results?highlight=zyskowicz")
+    for handler in audit_logger.handlers:
+        handler.flush()
+
+    response = client.get("/metrics")
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    after = response.get_data(as_text=True)
+    changes = {
+        key: sample(after, name) - sample(before, name) for key, name in names.items()
+    }
+    assert changes == {
+        "submits": 2,
+        "rejected": 1,
+        "commits": 1,
+        "queries": 2,
+        "renders": 1,
+        "latency": 1,
+        "audit": 1,
+    }
@@ -0,0 +1,205 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the HTML surname importer."""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from parse_surnames import (
+    MODE_ADOPT,
+    MODE_REPLACE,
+    iter_table_rows,
+    parse_html_table,
+    populate_database,
+)
+from setup_db import check_stats
+from sharded_counter import add_to_shard
+
+HTML_PATH = Path(__file__).parent.parent / "Lintukoto _ Viihde _ Ben.html"
+
+PAGE = """<html><body><table><tbody>
+<tr><th>&nbsp;</th><th>Ehdotus</th><th>Lkm</th></tr>
+<tr class="vaalein">
+<td class="oikea">1.</td>
+<td><span class="oikein"><strong>Zyskowicz</strong> (oikea vastaus)</span>
+</td>
+<td class="oikea">45 131</td>
+</tr>
+<tr class="vaalein">
+<td class="oikea">2.</td>
+<td>Zyskowich, Syskövitz,
+ Tsyskowitsch&amp;co, Zyzkowitschowitzky</td>
+<td class="oikea">1&nbsp;042</td>
+</tr>
+<tr class="tumma"><td>3.</td><td>Zyzkowich</td><td>5</td></tr>
+</tbody></table></body></html>
+"""
+
+
+@pytest.fixture
+def page(tmp_path: Path) -> Path:
+    """Write the sample page in the encoding of the real one."""
+    path = tmp_path / "ben.html"
+    path.write_bytes(PAGE.encode("windows-1252"))
+    return path
+
+
+def test_stream_rows_across_chunk_boundaries(page: Path) -> None:
+    """Test that rows are the same however the input is split into chunks."""
+    expected = [
+        ["1.", "Zyskowicz(oikea vastaus)", "45 131"],
+        [
+            "2.",
+            "Zyskowich, Syskövitz,\n Tsyskowitsch&co, Zyzkowitschowitzky",
+            "1\xa0042",
+        ],
+    ]
+    assert list(iter_table_rows(str(page))) == expected
+    assert list(iter_table_rows(str(page), chunk_size=7)) == expected
+
+
+def test_parse_html_table_validates_rows(page: Path) -> None:
+    """Test that the streaming parser applies the validation rules."""
+    surnames, stats = parse_html_table(str(page))
+    assert surnames == [
+        ("zyskowicz", 45131),
+        ("zyskowich", 1042),
+        ("syskövitz", 1042),
+    ]
+    assert stats["valid_submissions"] == 45131 + 2 * 1042
+    assert stats["rejected_invalid_chars"] == 1
+    assert stats["rejected_too_long"] == 1
+    assert (
+        stats["total_entries"]
+        == len(surnames) + stats["rejected_invalid_chars"] + stats["rejected_too_long"]
+    )
+
+
+def test_stream_matches_soup_parser() -> None:
+    """Test that both parsers give identical results for the bundled page."""
+    pytest.importorskip("bs4")
+    assert parse_html_table(str(HTML_PATH)) == parse_html_table(
+        str(HTML_PATH),
+        streaming=False,
+    )
+
+
+def read_guesses(db_path: Path) -> dict[str, int]:
+    conn = sqlite3.connect(db_path)
+    guesses = dict(conn.execute("SELECT surname, count FROM guesses"))
+    conn.close()
+    return guesses
+
+
+def add_live_guess(db_path: Path, surname: str, count: int = 1) -> None:
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO guesses (surname, count) VALUES (?, ?) "
+            "ON CONFLICT(surname) DO UPDATE SET count = count + excluded.count",
+            (surname, count),
+        )
+    conn.close()
+
+
+def test_merge_keeps_live_guesses(tmp_path: Path) -> None:
+    """Test that a merge applies only the change since the last import."""
+    db_path = tmp_path / "ben.db"
+    populate_database(
+        [("zyskowicz", 10), ("zyskowich", 4), ("zyskowich", 1)],
+        str(db_path),
+        source_hash="a",
+    )
+    assert read_guesses(db_path) == {"zyskowicz": 10, "zyskowich": 5}
+
+    add_live_guess(db_path, "zyskowicz", 2)
+    add_live_guess(db_path, "syskowicz")
+
+    diff = populate_database(
+        [("zyskowicz", 15), ("zyzkowitz", 3)],
+        str(db_path),
+        source_hash="b",
+    )
+    assert diff.added == {"zyzkowitz": 3}
+    assert diff.changed == {"zyskowicz": 5}
+    assert diff.removed == {"zyskowich": 5}
+    assert read_guesses(db_path) == {"zyskowicz": 17, "syskowicz": 1, "zyzkowitz": 3}
+
+    conn = sqlite3.connect(db_path)
+    stats = conn.execute("SELECT total_variations, total_count FROM guess_stats")
+    assert stats.fetchone() == (3, 21)
+    conn.close()
+
+
+def test_removed_surnames_take_their_counter_slots(tmp_path: Path) -> None:
+    """Test that a surname removed by a merge leaves no pending slots behind."""
+    db_path = tmp_path / "ben.db"
+    populate_database([("zyskowicz", 10), ("zyskowich", 5)], str(db_path))
+    conn = sqlite3.connect(db_path)
+    # Fewer guesses left than the import gave, one of them still in a slot
+    conn.execute("UPDATE guesses SET count = 1 WHERE surname = 'zyskowich'")
+    add_to_shard(conn, "zyskowich", 1, shards=4)
+    conn.commit()
+    conn.close()
+
+    diff = populate_database([("zyskowicz", 10)], str(db_path))
+    assert diff.removed == {"zyskowich": 2}
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM guess_shards").fetchone() == (0,)
+    assert check_stats(conn) == {}
+    conn.close()
+
+
+def test_unchanged_source_is_skipped(tmp_path: Path) -> None:
+    """Test that importing the same source again is a no-op."""
+    db_path = tmp_path / "ben.db"
+    populate_database([("zyskowicz", 10)], str(db_path), source_hash="a")
+    diff = populate_database([("zyskowicz", 99)], str(db_path), source_hash="a")
+    assert diff.unchanged
+    assert read_guesses(db_path) == {"zyskowicz": 10}
+
+
+def test_dry_run_does_not_write(tmp_path: Path) -> None:
+    """Test that a dry run reports the diff without changing the database."""
+    db_path = tmp_path / "ben.db"
+    populate_database([("zyskowicz", 10)], str(db_path), source_hash="a")
+    diff = populate_database(
+        [("zyskowicz", 12), ("zyskowich", 1)],
+        str(db_path),
+        source_hash="b",
+        dry_run=True,
+    )
+    assert diff.added == {"zyskowich": 1}
+    assert diff.changed == {"zyskowicz": 2}
+    assert read_guesses(db_path) == {"zyskowicz": 10}
+
+
+def test_replace_and_adopt_modes(tmp_path: Path) -> None:
+    """Test replacing all guesses and adopting an existing database."""
+    db_path = tmp_path / "ben.db"
+    populate_database([("zyskowicz", 10)], str(db_path), mode=MODE_REPLACE)
+    add_live_guess(db_path, "syskowicz")
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("DELETE FROM imports")
+        conn.execute("DELETE FROM import_counts")
+    conn.close()
+
+    with pytest.raises(ValueError, match="adopt"):
+        populate_database([("zyskowicz", 10)], str(db_path))
+
+    populate_database([("zyskowicz", 10)], str(db_path), mode=MODE_ADOPT)
+    populate_database([("zyskowicz", 11)], str(db_path))
+    assert read_guesses(db_path) == {"zyskowicz": 11, "syskowicz": 1}
+
+    populate_database([("zyskowich", 2)], str(db_path), mode=MODE_REPLACE)
+    assert read_guesses(db_path) == {"zyskowich": 2}
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT mode FROM imports ORDER BY id").fetchall() == [
+        ("adopt",),
+        ("merge",),
+        ("replace",),
+    ]
+    assert check_stats(conn) == {}
+    conn.close()
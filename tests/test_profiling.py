@@ -0,0 +1,92 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the opt-in request profiling middleware."""
+
+import json
+import pstats
+import re
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app, results_cache
+from profiling import MODE_CPROFILE, ProfileConfig, ProfilingMiddleware
+
+TOKEN = "profile-secret"  # noqa: S105
+
+
+def profile_with(monkeypatch: pytest.MonkeyPatch, config: ProfileConfig) -> None:
+    monkeypatch.setattr(app, "wsgi_app", ProfilingMiddleware(app.wsgi_app, config))
+
+
+def profiles(directory: Path, suffix: str) -> list[Path]:
+    return sorted(directory.glob(f"*{suffix}"))
+
+
+def test_header_profiles_one_request(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+) -> None:
+    """Test a sampled profile and the time breakdown of /results."""
+    profile_with(monkeypatch, ProfileConfig(tmp_path, token=TOKEN))
+    client.get("/")
+    client.get("/", headers={"X-Profile": "wrong"})
+    assert profiles(tmp_path, ".speedscope.json") == []
+
+    results_cache.clear()
+    response = client.get("/results", headers={"X-Profile": TOKEN})
+    assert response.status_code == HTTPStatus.OK
+    [path] = profiles(tmp_path, ".speedscope.json")
+    assert path.name.endswith("-results.speedscope.json")
+    speedscope = json.loads(path.read_text())
+    [profile] = speedscope["profiles"]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"])
+
+    log = (tmp_path / "profiles.log").read_text()
+    match = re.search(
+        r"GET /results [\d.]+ ms: db [\d.]+ ms \((\d+)\), "
+        r"template [\d.]+ ms \((\d+)\), python [\d.]+ ms - (\S+)",
+        log,
+    )
+    assert match is not None
+    queries, renders, name = match.groups()
+    # The data version, then the leaderboard page; the page, then its rows
+    assert (int(queries), int(renders), name) == (2, 2, path.name)
+
+
+def test_sampling_with_cprofile_keeps_the_latest(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+) -> None:
+    """Test pstats output for every request and pruning to PROFILE_KEEP."""
+    config = ProfileConfig(tmp_path, sample_rate=1, mode=MODE_CPROFILE, keep=2)
+    profile_with(monkeypatch, config)
+    requested = ["/", "/", "/", "/results"]
+    for url in requested:
+        client.get(url)
+
+    paths = profiles(tmp_path, ".pstats")
+    assert [path.name.rsplit("-", 1)[1] for path in paths] == [
+        "index.pstats",
+        "results.pstats",
+    ]
+    functions = {function for _, _, function in pstats.Stats(str(paths[1])).stats}
+    assert "render" in functions
+    log = (tmp_path / "profiles.log").read_text()
+    assert len(log.splitlines()) == len(requested)
+
+
+def test_config_needs_a_way_to_choose_requests(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+) -> None:
+    with pytest.raises(ValueError, match="PROFILE_TOKEN or PROFILE_SAMPLE_RATE"):
+        ProfileConfig.from_env(tmp_path)
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "10")
+    monkeypatch.setenv("PROFILE_MODE", "CProfile")
+    config = ProfileConfig.from_env(tmp_path)
+    assert (config.sample_rate, config.mode, config.token) == (10, MODE_CPROFILE, None)
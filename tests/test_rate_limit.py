@@ -0,0 +1,121 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the /submit rate limiter."""
+
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app
+from rate_limit import (
+    SCOPE_IP,
+    SCOPE_SUBNET,
+    Limit,
+    MemoryBucketStore,
+    RateLimiter,
+    SQLiteBucketStore,
+)
+
+
+def make_limiter(store: MemoryBucketStore | SQLiteBucketStore) -> RateLimiter:
+    """Allow 2 requests per IP and 3 per subnet, refilled at 1 per second."""
+    return RateLimiter(
+        store,
+        ip_limit=Limit(rate=1.0, burst=2),
+        subnet_limit=Limit(rate=1.0, burst=3),
+    )
+
+
+def test_bucket_refuses_after_burst_and_refills() -> None:
+    """Test that a client is refused once its burst is spent, until refilled."""
+    limiter = make_limiter(MemoryBucketStore(max_keys=100))
+    assert limiter.check("192.0.2.1", now=100).allowed
+    assert limiter.check("192.0.2.1", now=100).allowed
+
+    decision = limiter.check("192.0.2.1", now=100.25)
+    assert not decision.allowed
+    assert decision.scope == SCOPE_IP
+    assert decision.retry_after == pytest.approx(0.75)
+    assert decision.retry_after_header == "1"
+
+    assert limiter.check("192.0.2.1", now=101).allowed
+
+
+def test_subnet_bucket_limits_neighbouring_addresses() -> None:
+    """Test that rotating addresses within a subnet does not lift the limit."""
+    limiter = make_limiter(MemoryBucketStore(max_keys=100))
+    for host in (1, 2, 3):
+        assert limiter.check(f"192.0.2.{host}", now=100).allowed
+    decision = limiter.check("192.0.2.4", now=100)
+    assert (decision.allowed, decision.scope) == (False, SCOPE_SUBNET)
+
+    assert limiter.check("198.51.100.1", now=100).allowed
+    assert limiter.check("2001:db8::1", now=100).allowed
+    assert limiter.stats()["subnet"] == 1
+
+    # Without a subnet limit only the addresses themselves are limited
+    limiter = RateLimiter(
+        MemoryBucketStore(max_keys=100),
+        ip_limit=Limit(rate=1.0, burst=2),
+    )
+    hosts = range(9)
+    assert all(limiter.check(f"192.0.2.{host}", now=100).allowed for host in hosts)
+    assert limiter.stats()["buckets"] == len(hosts)
+
+
+def test_memory_store_evicts_idle_and_least_recent_buckets() -> None:
+    """Test that the number of buckets stays bounded."""
+    max_keys = 4
+    store = MemoryBucketStore(max_keys=max_keys)
+    limiter = make_limiter(store)
+    for host in range(10):
+        limiter.check(f"10.0.{host}.1", now=100)
+    assert store.stats()["buckets"] == max_keys
+
+    # By now every bucket has refilled, so all but the new ones are evicted
+    limiter.check("10.0.0.1", now=200)
+    stats = store.stats()
+    assert (stats["buckets"], stats["evicted"]) == (2, 20)
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path: Path) -> None:
+    """Test that stores on the same file (one per worker) share buckets."""
+    first = make_limiter(SQLiteBucketStore(tmp_path / "ratelimit.db", 100))
+    second = make_limiter(SQLiteBucketStore(tmp_path / "ratelimit.db", 100))
+    assert first.check("192.0.2.1", now=100).allowed
+    assert second.check("192.0.2.1", now=100).allowed
+    assert not first.check("192.0.2.1", now=100).allowed
+
+    stats = second.stats()
+    assert (stats["allowed"], stats["ip"], stats["buckets"]) == (2, 1, 2)
+    first.store.close()
+    second.store.close()
+
+
+def test_submit_is_throttled_with_retry_after(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that /submit answers 429 once a client's burst is spent."""
+    monkeypatch.setenv("RATE_LIMIT_BURST", "2")
+    app.extensions.pop("rate_limiter", None)
+
+    # Only the address appended by the trusted proxy counts
+    for spoofed in ("198.51.100.1", "198.51.100.2"):
+        response = client.post(
+            "/submit",
+            data={"surname": "zyskowicz"},
+            headers={"X-Forwarded-For": f"{spoofed}, 192.0.2.1"},
+        )
+        assert response.status_code == HTTPStatus.FOUND
+
+    response = client.post(
+        "/submit",
+        data={"surname": "zyskowicz"},
+        headers={"X-Forwarded-For": "203.0.113.9, 192.0.2.1"},
+    )
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+    assert client.get("/health").json["rate_limit"]["ip"] == 1
+    app.extensions.pop("rate_limiter", None)
@@ -0,0 +1,116 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the versioned leaderboard render cache."""
+
+import sqlite3
+import threading
+import time
+
+from flask.testing import FlaskClient
+
+from app import results_cache
+from render_cache import RenderedPage, VersionedPageCache
+from setup_db import upgrade_db
+
+
+def make_page(version: int) -> RenderedPage:
+    """Build a small page with two rows."""
+    rows = [{"surname": "zyskowicz"}, {"surname": "syskowicz"}]
+    return RenderedPage.from_fragments(
+        version,
+        "<table>",
+        "</table>",
+        rows,
+        ["<tr>zyskowicz</tr>", "<tr>syskowicz</tr>"],
+    )
+
+
+def test_page_splices_highlighted_row() -> None:
+    """Test that only the highlighted row is re-rendered."""
+    page = make_page(1)
+    assert page.render() == "<table><tr>zyskowicz</tr><tr>syskowicz</tr></table>"
+
+    rendered = page.render("syskowicz", lambda row: f"<tr hl>{row['surname']}</tr>")
+    assert rendered == "<table><tr>zyskowicz</tr><tr hl>syskowicz</tr></table>"
+
+    # Unknown surnames render the plain page
+    assert page.render("unknown", lambda _: "x") == page.render()
+
+
+def test_cache_hits_and_misses() -> None:
+    """Test that a page is rebuilt only when the data version moves on."""
+    versions = iter([1, 2])
+    cache = VersionedPageCache(lambda _: make_page(next(versions)))
+
+    assert [cache.get(version).version for version in (1, 1, 2)] == [1, 1, 2]
+    assert cache.stats() == {"hits": 1, "misses": 2, "coalesced": 0, "version": 2}
+
+
+def test_concurrent_misses_are_coalesced() -> None:
+    """Test that only one of many concurrent misses rebuilds the page."""
+    builds = []
+
+    def build(_variant: object) -> RenderedPage:
+        builds.append(1)
+        time.sleep(0.05)
+        return make_page(1)
+
+    cache = VersionedPageCache(build)
+    threads = [threading.Thread(target=cache.get, args=(1,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert cache.misses == 1
+    assert cache.hits + cache.coalesced == len(threads) - 1
+
+
+def test_submit_invalidates_cached_results(client: FlaskClient) -> None:
+    """Test that a new guess shows up on a previously cached page."""
+    client.get("/results")
+    response = client.get("/results")
+    assert b"Syskowiczz" not in response.data
+
+    misses = results_cache.misses
+    response = client.post("/submit", data={"surname": "syskowiczz"})
+    response = client.get(response.location)
+    assert results_cache.misses == misses + 1
+    assert b'<tr class="highlight"\n                        id="guess-syskowiczz">' in (
+        response.data
+    )
+    assert response.data.count(b'class="highlight"') == 1
+
+    # The plain page served from the cache has no highlighted row
+    response = client.get("/results")
+    assert b'class="highlight"' not in response.data
+
+
+def test_health_reports_cache_counters(client: FlaskClient) -> None:
+    """Test that the cache counters are exposed by the health check."""
+    client.get("/results")
+    data = client.get("/health").get_json()
+    assert set(data["results_cache"]) == {"hits", "misses", "coalesced", "version"}
+
+
+def test_upgrade_db_adds_version_tracking() -> None:
+    """Test that an existing database gets the data version table."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE guesses (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "surname TEXT NOT NULL UNIQUE, count INTEGER NOT NULL DEFAULT 0)",
+    )
+    conn.execute("INSERT INTO guesses (surname, count) VALUES ('zyskowicz', 5)")
+    conn.commit()
+
+    upgrade_db(conn)
+    upgrade_db(conn)
+    version = conn.execute("SELECT version FROM data_version").fetchone()[0]
+
+    conn.execute("UPDATE guesses SET count = count + 1")
+    conn.commit()
+    row = conn.execute(
+        "SELECT (SELECT version FROM data_version), count FROM guesses",
+    ).fetchone()
+    assert row == (version + 1, 6)
+    conn.close()
@@ -0,0 +1,39 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the production server entry point and worker hooks."""
+
+from http import HTTPStatus
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app, init_worker, results_cache, shutdown_worker
+from serve import server_options
+
+
+def test_server_options_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that gunicorn settings are read from environment variables."""
+    monkeypatch.setenv("PORT", "8080")
+    monkeypatch.setenv("WEB_WORKERS", "3")
+    monkeypatch.setenv("WEB_THREADS", "8")
+    monkeypatch.setenv("WEB_KEEPALIVE", "10")
+    options = server_options()
+    assert options["bind"] == "0.0.0.0:8080"
+    assert (options["workers"], options["threads"], options["keepalive"]) == (3, 8, 10)
+    assert options["worker_class"] == "gthread"
+    assert options["preload_app"] is True
+
+
+def test_init_worker_replaces_inherited_state(client: FlaskClient) -> None:
+    """Test that a worker gets its own pool and an empty page cache."""
+    client.get("/results")
+    inherited_pool = app.extensions["db_pool"]
+    assert results_cache.stats()["version"] is not None
+
+    init_worker()
+    assert app.extensions["db_pool"] is not inherited_pool
+    assert results_cache.stats()["version"] is None
+
+    response = client.post("/submit", data={"surname": "zyskowicz"})
+    assert response.status_code == HTTPStatus.FOUND
+    shutdown_worker()
+    assert "db_pool" not in app.extensions
@@ -0,0 +1,123 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for sharded guess counters."""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app
+from leaderboard import counts_source, fetch_key, fetch_top, fetch_totals
+from setup_db import check_stats
+from sharded_counter import add_to_shard, compact
+
+
+@pytest.fixture
+def conn(tmp_path: Path) -> sqlite3.Connection:
+    """Create a database with a small leaderboard."""
+    conn = sqlite3.connect(tmp_path / "ben.db")
+    conn.executescript((Path(__file__).parent.parent / "schema.sql").read_text())
+    conn.executemany(
+        "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+        [("zyskowicz", 3), ("zyskovic", 4)],
+    )
+    conn.commit()
+    return conn
+
+
+def data_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+
+
+def test_reads_include_pending_slots(conn: sqlite3.Connection) -> None:
+    """Test that counts and totals add up the slots until they are folded."""
+    for _ in range(5):
+        add_to_shard(conn, "zyskowicz", 1, shards=4)
+    add_to_shard(conn, "sylkowski", 1, shards=4)
+    conn.commit()
+    version = data_version(conn)
+    add_to_shard(conn, "zyskowicz", 1, shards=4)
+    conn.commit()
+    assert data_version(conn) == version
+
+    assert counts_source(conn) == "guess_counts"
+    assert [tuple(row) for row in fetch_top(conn)] == [
+        ("zyskowicz", 9),
+        ("zyskovic", 4),
+        ("sylkowski", 1),
+    ]
+    assert fetch_key(conn, "sylkowski") == (1, "sylkowski")
+    assert fetch_totals(conn) == (3, 14)
+    assert check_stats(conn) == {}
+
+    pending = conn.execute("SELECT SUM(count) FROM guess_shards").fetchone()[0]
+    assert compact(conn) == pending
+    assert data_version(conn) > version
+    assert counts_source(conn) == "guesses"
+    assert dict(conn.execute("SELECT surname, count FROM guesses")) == {
+        "zyskowicz": 9,
+        "zyskovic": 4,
+        "sylkowski": 1,
+    }
+    assert fetch_totals(conn) == (3, 14)
+    assert check_stats(conn) == {}
+    assert compact(conn) == 0
+
+
+def test_submit_writes_to_slots(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that /submit uses the slots when COUNTER_SHARDS is set."""
+    monkeypatch.setenv("COUNTER_SHARDS", "4")
+    monkeypatch.setenv("COUNTER_COMPACT_INTERVAL", "3600")
+    for _ in range(3):
+        client.post("/submit", data={"surname": "Zyskowicz"})
+
+    response = client.get("/api/results")
+    counts = {row["surname"]: row["count"] for row in response.json["rows"]}
+    assert (counts["zyskowicz"], response.json["total_count"]) == (3, 6)
+
+    compactor = app.extensions.pop("shard_compactor")
+    compactor.close()
+    assert compactor.stats() == {"compactions": 1, "folded": 3}
+
+
+def test_health_starts_no_compactor(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that /health reports the compactor only once a guess started it."""
+    monkeypatch.setenv("COUNTER_SHARDS", "4")
+    monkeypatch.setenv("COUNTER_COMPACT_INTERVAL", "3600")
+    health = client.get("/health").json
+    assert (health["counter_shards"], health["rate_limit"]) == (None, None)
+    assert "shard_compactor" not in app.extensions
+
+    client.post("/submit", data={"surname": "Zyskowicz"})
+    health = client.get("/health").json
+    assert health["counter_shards"] == {"compactions": 0, "folded": 0}
+    app.extensions.pop("shard_compactor").close()
+
+
+def test_results_fold_the_highlighted_surname(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that the submitter sees their guess on the cached /results page."""
+    monkeypatch.setenv("COUNTER_SHARDS", "4")
+    monkeypatch.setenv("COUNTER_COMPACT_INTERVAL", "3600")
+    client.post("/submit", data={"surname": "Sylkowski"})
+    assert b'id="guess-zyskowicz"' not in client.get("/results").data
+
+    response = client.post(
+        "/submit",
+        data={"surname": "Zyskowicz"},
+        follow_redirects=True,
+    )
+    assert b'id="guess-zyskowicz"' in response.data
+    # Only the highlighted surname is folded; the other waits for the compactor
+    compactor = app.extensions.pop("shard_compactor")
+    compactor.close()
+    assert compactor.stats() == {"compactions": 1, "folded": 1}
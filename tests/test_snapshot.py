@@ -0,0 +1,89 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the first-boot database snapshot."""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from snapshot import MANIFEST_NAME, SNAPSHOT_NAME, build_snapshot, restore
+
+PAGE = """<html><body><table><tbody>
+<tr><th>&nbsp;</th><th>Ehdotus</th><th>Lkm</th></tr>
+<tr class="vaalein"><td>1.</td><td>Zyskowicz (oikea vastaus)</td><td>45 131</td></tr>
+<tr class="vaalein"><td>2.</td><td>Zyskowich, Syskövitz</td><td>1&nbsp;042</td></tr>
+</tbody></table></body></html>
+"""
+
+
+@pytest.fixture
+def page(tmp_path: Path) -> Path:
+    path = tmp_path / "ben.html"
+    path.write_bytes(PAGE.encode("windows-1252"))
+    return path
+
+
+def read_guesses(database_path: Path) -> list[tuple[str, int]]:
+    conn = sqlite3.connect(database_path)
+    try:
+        return conn.execute(
+            "SELECT surname, count FROM guesses ORDER BY surname",
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def test_restore_copies_the_snapshot_once(tmp_path: Path, page: Path) -> None:
+    """Test that a restore matches the page and leaves a database alone."""
+    manifest = build_snapshot(page, tmp_path / "snapshot")
+    assert (manifest.variants, manifest.submissions) == (3, 45131 + 2 * 1042)
+
+    database_path = tmp_path / "data" / "ben.db"
+    report = restore(database_path, tmp_path / "snapshot", page)
+    assert "restored the snapshot" in report
+    assert read_guesses(database_path) == [
+        ("syskövitz", 1042),
+        ("zyskowich", 1042),
+        ("zyskowicz", 45131),
+    ]
+
+    conn = sqlite3.connect(database_path)
+    conn.execute("UPDATE guesses SET count = 1")
+    conn.commit()
+    conn.close()
+    assert restore(database_path, tmp_path / "snapshot", page).startswith(
+        "Database found",
+    )
+    assert {count for _, count in read_guesses(database_path)} == {1}
+
+
+def test_unusable_snapshot_falls_back_to_a_live_import(
+    tmp_path: Path,
+    page: Path,
+) -> None:
+    """Test a stale page, a corrupt file and a missing snapshot."""
+    directory = tmp_path / "snapshot"
+    build_snapshot(page, directory)
+    expected = read_guesses(directory / SNAPSHOT_NAME)
+
+    page.write_bytes(PAGE.replace("45 131", "45 132").encode("windows-1252"))
+    stale = tmp_path / "stale.db"
+    assert "built from another ben.html" in restore(stale, directory, page)
+    assert ("zyskowicz", 45132) in read_guesses(stale)
+
+    build_snapshot(page, directory)
+    with (directory / SNAPSHOT_NAME).open("r+b") as f:
+        f.seek(100)
+        f.write(b"\0")
+    corrupt = tmp_path / "corrupt.db"
+    # A journal of an earlier database must not be replayed into the new one
+    Path(f"{corrupt}-wal").write_bytes(b"junk")
+    assert "does not match its checksum" in restore(corrupt, directory, page)
+    assert read_guesses(corrupt) == [*expected[:2], ("zyskowicz", 45132)]
+    assert not Path(f"{corrupt}-wal").exists()
+
+    (directory / MANIFEST_NAME).unlink()
+    missing = tmp_path / "missing.db"
+    assert "no snapshot" in restore(missing, directory, page)
+    assert read_guesses(missing) == read_guesses(corrupt)
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,297 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the storage backends and the Redis-protocol client."""
+
+import random
+import socket
+import sqlite3
+import threading
+import time
+from collections.abc import Generator
+from http import HTTPStatus
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app, results_cache
+from benchmarks.resp_server import RespServer, start_server
+from history import DAY, HOUR, day_of, hour_of
+from leaderboard import MAX_PAGE_SIZE
+from resp import RespError, RespPool, ServerAddress
+from setup_db import SCHEMA_PATH
+from storage import RedisStorage, SQLiteStorage, Trending, copy_counts
+
+
+@pytest.fixture
+def server() -> Generator[RespServer]:
+    server = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_storage(server: RespServer) -> Generator[RedisStorage]:
+    storage = RedisStorage(RespPool(ServerAddress.from_url(server.url)))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def sqlite_storage() -> Generator[SQLiteStorage]:
+    db = sqlite3.connect(":memory:", check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA_PATH.read_text())
+    yield SQLiteStorage(lambda: db, lambda: db)
+    db.close()
+
+
+def guess_randomly(
+    storages: tuple[SQLiteStorage, RedisStorage],
+    surnames: list[str],
+    batches: int,
+    seed: int,
+) -> None:
+    rng = random.Random(seed)  # noqa: S311
+    for _ in range(batches):
+        batch = {surname: rng.randint(1, 3) for surname in rng.sample(surnames, 3)}
+        for storage in storages:
+            storage.increment(batch)
+            storage.commit()
+
+
+def test_backends_agree_on_the_leaderboard(
+    sqlite_storage: SQLiteStorage,
+    redis_storage: RedisStorage,
+) -> None:
+    """Test the same batches of guesses against both backends."""
+    surnames = ["zyskowicz", "zyskowitz", "zsykowicz", "syskowitz", "tsyskowitsch"]
+    batches = 30
+    guess_randomly((sqlite_storage, redis_storage), surnames, batches, seed=5)
+
+    sqlite_page = sqlite_storage.read_page(None)
+    redis_page = redis_storage.read_page(None)
+    assert [dict(row) for row in sqlite_page.rows] == redis_page.rows
+    assert redis_page.total_variations == sqlite_page.total_variations == len(surnames)
+    assert redis_page.total_count == sqlite_page.total_count
+    assert redis_storage.read_page(2).rows == redis_page.rows[:2]
+    assert redis_page.version == redis_storage.data_modified()[0] == batches
+
+
+def test_backends_agree_on_pages_events_and_history(
+    sqlite_storage: SQLiteStorage,
+    redis_storage: RedisStorage,
+) -> None:
+    """Test /api/results pages, live frames, index changes and trending.
+
+    Versions are left out: ben.db bumps its version once per surname written.
+    """
+    storages = (sqlite_storage, redis_storage)
+    # Few surnames and small counts, so that many rows tie
+    surnames = [f"zyskowic{letter}" for letter in "abcdefgh"]
+    batches = 12
+    guess_randomly(storages, surnames, batches, seed=7)
+
+    def pages(storage: SQLiteStorage | RedisStorage) -> list:
+        keys = [(row["count"], row["surname"]) for row in storage.read_page(None).rows]
+        # Keys that are no row's, between and beyond the rows
+        keys += [(count + 1, surname) for count, surname in keys] + [(1, "a")]
+        results = [storage.page(3, around="unknown")]
+        for limit in (1, 3, MAX_PAGE_SIZE):
+            results.append(storage.page(limit))
+            results += [storage.page(limit, around=surname) for surname in surnames]
+            results += [storage.page(limit, after=key) for key in keys]
+            results += [storage.page(limit, before=key) for key in keys]
+        return [
+            None
+            if page is None
+            else (
+                [dict(row) for row in page.rows],
+                page.has_prev,
+                page.has_next,
+                page.total_variations,
+                page.total_count,
+            )
+            for page in results
+        ]
+
+    assert pages(sqlite_storage) == pages(redis_storage)
+    assert sqlite_storage.counts([*surnames, "unknown"]) == redis_storage.counts(
+        [*surnames, "unknown"],
+    )
+
+    last_id = sqlite_storage.latest_event_id()
+    # One event per surname written, three to a batch
+    assert redis_storage.latest_event_id() == last_id == batches * 3
+    for since in (0, last_id - 3, last_id - 1):
+        sqlite_frame = sqlite_storage.events_since(since)
+        assert sqlite_frame is not None
+        assert redis_storage.events_since(since) == sqlite_frame
+    assert redis_storage.events_since(last_id) is None
+
+    # Index changes carry the same deltas, or every count after a reset
+    for storage in storages:
+        reset = storage.count_changes(None)
+        assert reset.reset
+        assert sorted(map(tuple, reset.counts)) == sorted(
+            (row["surname"], row["count"]) for row in storage.read_page(None).rows
+        )
+        assert reset.total_count == sum(count for _, count in reset.counts)
+    guess_randomly(storages, surnames, 2, seed=8)
+    imported = sqlite_storage.count_changes(None).position[0]
+    sqlite_changes = sqlite_storage.count_changes((imported, last_id))
+    redis_changes = redis_storage.count_changes((None, last_id))
+    assert not sqlite_changes.reset
+    assert not redis_changes.reset
+    assert sorted(map(tuple, sqlite_changes.counts)) == sorted(redis_changes.counts)
+    assert redis_changes.total_count == sqlite_changes.total_count
+
+    now = time.time()
+    first_hour, first_day = hour_of(now) - 2 * HOUR, day_of(now) - DAY
+    sqlite_trending = sqlite_storage.trending(first_hour, first_day, 3)
+    redis_trending = redis_storage.trending(first_hour, first_day, 3)
+    assert [tuple(row) for row in sqlite_trending.top] == redis_trending.top
+    assert sqlite_trending.per_hour == redis_trending.per_hour
+    assert sqlite_trending.per_day == redis_trending.per_day
+
+
+def test_copied_counts_are_not_guesses(redis_storage: RedisStorage) -> None:
+    """Test that copy_counts fills the leaderboard but not the trending or events."""
+    db = sqlite3.connect(":memory:")
+    db.executescript(SCHEMA_PATH.read_text())
+    db.executemany(
+        "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+        [("zyskowicz", 5), ("zyskowitz", 2)],
+    )
+    copied = copy_counts(db, redis_storage, batch_size=1)
+    db.close()
+
+    page = redis_storage.read_page(None)
+    assert page.rows == [
+        {"surname": "zyskowicz", "count": 5},
+        {"surname": "zyskowitz", "count": 2},
+    ]
+    # One version per batch of one surname
+    assert (copied, page.version, page.total_count) == (2, 2, 7)
+    now = time.time()
+    trending = redis_storage.trending(hour_of(now) - HOUR, day_of(now) - DAY, 10)
+    assert trending == Trending([], {}, {})
+    assert redis_storage.latest_event_id() == 0
+
+
+def test_increments_are_sent_at_commit(redis_storage: RedisStorage) -> None:
+    """Test that a thread's increments are batched into one commit."""
+    redis_storage.increment({"zyskowicz": 1})
+    redis_storage.increment({"zyskowicz": 2, "zyskowitz": 1})
+
+    other = threading.Thread(target=redis_storage.commit)
+    other.start()
+    other.join()
+    assert redis_storage.read_page(None).rows == []
+
+    redis_storage.commit()
+    page = redis_storage.read_page(None)
+    assert page.rows == [
+        {"surname": "zyskowicz", "count": 3},
+        {"surname": "zyskowitz", "count": 1},
+    ]
+    assert (page.version, page.total_count) == (1, 4)
+    assert redis_storage.stats()["commits"] == 1
+
+
+def test_pool_replaces_broken_connections(server: RespServer) -> None:
+    """Test error replies, a dropped connection and an unreachable server."""
+    pool = RespPool(ServerAddress.from_url(server.url), max_connections=1)
+    assert pool.execute(("SET", "key", "value")) == b"OK"
+    with pytest.raises(RespError, match="WRONGTYPE"):
+        pool.pipeline([("ZINCRBY", "key", 1, "member"), ("PING",)])
+    # An error reply leaves the connection in a usable state
+    assert pool.execute(("GET", "key")) == b"value"
+    assert pool.stats()["connects"] == 1
+
+    server.shutdown()
+    server.server_close()
+    conn = pool._acquire()  # noqa: SLF001
+    conn._socket.shutdown(socket.SHUT_RDWR)  # noqa: SLF001
+    pool._idle.put(conn)  # noqa: SLF001
+    with pytest.raises(RespError, match="connection to the server failed"):
+        pool.execute(("PING",))
+    assert pool.stats()["connections"] == 0
+    with pytest.raises(RespError, match="cannot connect"):
+        pool.execute(("PING",))
+
+
+def test_app_with_the_redis_backend(
+    client: FlaskClient,
+    server: RespServer,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test /submit, /results and /health with counts kept on the server."""
+    monkeypatch.setenv("STORAGE_BACKEND", "redis")
+    monkeypatch.setenv("REDIS_URL", server.url)
+    app.extensions.pop("storage", None)
+    results_cache.clear()
+    try:
+        etag = client.get("/results").headers["ETag"]
+        client.post("/submit", data={"surname": "Zyskowitz"})
+        response = client.get("/results", headers={"If-None-Match": etag})
+        assert response.status_code == HTTPStatus.OK
+        assert "Zyskowitz" in response.get_data(as_text=True)
+        assert "Testsurname" not in response.get_data(as_text=True)
+
+        health = client.get("/health").get_json()
+        assert health["storage"]["backend"] == "redis"
+        assert health["storage"]["committed_guesses"] == 1
+    finally:
+        monkeypatch.delenv("STORAGE_BACKEND")
+        app.extensions.pop("storage").close()
+
+    # The guess went to the server, not to ben.db
+    health = client.get("/health").get_json()
+    assert health["storage"]["backend"] == "sqlite"
+    assert "Zyskowitz" not in client.get("/results").get_data(as_text=True)
+
+
+def test_live_reads_with_the_redis_backend(
+    client: FlaskClient,
+    server: RespServer,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test /api/results and /results/stream reading counts from the server."""
+    monkeypatch.setenv("STORAGE_BACKEND", "redis")
+    monkeypatch.setenv("REDIS_URL", server.url)
+    monkeypatch.setenv("LIVE_UPDATES_INTERVAL", "0.01")
+    monkeypatch.setenv("LIVE_UPDATES_HOLD", "0.1")
+    for name in ("storage", "live_updates"):
+        extension = app.extensions.pop(name, None)
+        if extension is not None:
+            extension.close()
+    results_cache.clear()
+    try:
+        client.post("/submit", data={"surname": "Zyskowicz"})
+        client.post("/submit", data={"surname": "Zyskowitz"})
+        since = client.get("/results").get_data(as_text=True)
+        since = since.split('data-since="')[1].split('"')[0]
+        client.post("/submit", data={"surname": "Zyskowitz"})
+
+        results = client.get("/api/results?around=zyskowicz").get_json()
+        assert [row["surname"] for row in results["rows"]] == [
+            "zyskowitz",
+            "zyskowicz",
+        ]
+        assert (results["total_count"], results["version"]) == (3, 3)
+        assert client.get("/api/results?around=ben").status_code == HTTPStatus.NOT_FOUND
+
+        response = client.get(
+            "/results/stream",
+            headers={"Last-Event-ID": since},
+            buffered=True,
+        )
+        messages = response.get_data().split(b"\n\n")
+        assert messages[1].startswith(f"id: {int(since) + 1}\nevent: delta".encode())
+        assert (
+            b'{"surname":"zyskowitz","count":2,"rank":1,"rank_change":1}' in messages[1]
+        )
+    finally:
+        monkeypatch.delenv("STORAGE_BACKEND")
+        app.extensions.pop("live_updates").close()
+        app.extensions.pop("storage").close()
@@ -0,0 +1,103 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the prefix suggestion index and /api/suggest."""
+
+import random
+from http import HTTPStatus
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import get_db, get_storage, get_suggest_index, get_write_db
+from leaderboard import UPSERT_SQL
+from live_updates import publish
+from suggest import SuggestIndex
+
+SURNAMES = {"zyskowicz": 50, "zyskowitz": 9, "zyskovicz": 9, "sylkowski": 3}
+
+
+@pytest.fixture
+def suggestions(client: FlaskClient) -> FlaskClient:
+    """Add a few guesses, the way imports do: without guess events."""
+    with client.application.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+            SURNAMES.items(),
+        )
+        db.commit()
+    return client
+
+
+def test_suggestions_are_ranked_by_count(suggestions: FlaskClient) -> None:
+    """Test the ranking, the prefix match and the cache headers."""
+    response = suggestions.get("/api/suggest?q=ZYSKO")
+    assert response.get_json() == {
+        "q": "zysko",
+        "suggestions": [["zyskowicz", 50], ["zyskovicz", 9], ["zyskowitz", 9]],
+    }
+    assert "max-age=30" in response.headers["Cache-Control"]
+    assert response.cache_control.public
+
+    again = suggestions.get(
+        "/api/suggest?q=zysko",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert again.status_code == HTTPStatus.NOT_MODIFIED
+    assert suggestions.get("/api/suggest?q=zyskoq").get_json()["suggestions"] == []
+    limited = suggestions.get("/api/suggest?q=z&limit=1").get_json()
+    assert limited["suggestions"] == [["zyskowicz", 50]]
+    assert suggestions.get("/api/suggest?q=").status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_guesses_update_cached_suggestions(suggestions: FlaskClient) -> None:
+    """Test that submitted guesses are reflected without a rebuild."""
+    assert suggestions.get("/api/suggest?q=zysko&limit=2").get_json()[
+        "suggestions"
+    ] == [["zyskowicz", 50], ["zyskovicz", 9]]
+    suggestions.post("/submit", data={"surname": "zyskowitz"})
+    suggestions.post("/submit", data={"surname": "zyskowiczz"})
+
+    assert suggestions.get("/api/suggest?q=zysko&limit=2").get_json()[
+        "suggestions"
+    ] == [["zyskowicz", 50], ["zyskowitz", 10]]
+    assert suggestions.get("/api/suggest?q=zyskowicz").get_json()["suggestions"] == [
+        ["zyskowicz", 50],
+        ["zyskowiczz", 1],
+    ]
+    with suggestions.application.app_context():
+        assert get_suggest_index().stats()["rebuilds"] == 1
+
+        # Writes without events, such as an import, are caught by the totals
+        db = get_db()
+        db.execute("UPDATE guesses SET count = 1 WHERE surname = 'zyskowicz'")
+        db.commit()
+    assert suggestions.get("/api/suggest?q=zysko&limit=1").get_json()[
+        "suggestions"
+    ] == [["zyskowitz", 10]]
+
+
+def test_updated_lists_match_a_fresh_index(client: FlaskClient) -> None:
+    """Test random guesses against an index built from scratch afterwards."""
+    rng = random.Random(3)  # noqa: S311
+    surnames = ["".join(rng.choices("zsyk", k=rng.randint(2, 5))) for _ in range(200)]
+    prefixes = sorted({surname[:length] for surname in surnames for length in (1, 2)})
+    with client.application.app_context():
+        index = SuggestIndex()
+        index.refresh(get_storage())
+        for prefix in prefixes:
+            index.suggest(prefix, 20)
+
+        db = get_write_db()
+        for _ in range(20):
+            batch = rng.choices(surnames, k=30)
+            for surname in batch:
+                db.execute(UPSERT_SQL, (surname, 1))
+                publish(db, {surname: 1})
+            db.commit()
+            index.refresh(get_storage())
+
+        fresh = SuggestIndex()
+        fresh.refresh(get_storage())
+        for prefix in prefixes:
+            assert index.suggest(prefix, 20) == fresh.suggest(prefix, 20)
+        assert index.stats()["rebuilds"] == 1
@@ -0,0 +1,65 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the shared surname validation."""
+
+import pytest
+from flask.testing import FlaskClient
+
+from validation import (
+    SURNAME_HTML_PATTERN,
+    Rejection,
+    is_valid_surname,
+    rejection_reason,
+    validate_batch,
+)
+
+CANDIDATES = [
+    "Zyskowicz",
+    "syskövitz",
+    "TSYSKOVITZ",
+    "Chyckowic",
+    "zysk",
+    "",
+    "Zyzkowitschowitzky",
+    "kononowicz",
+    "Äyskowicz",
+    "zysko-wicz",
+    "zyskowicz\n",
+    "zyskowicz1",
+]
+
+
+@pytest.mark.parametrize(
+    ("surname", "reason"),
+    [
+        ("Zyskowicz", None),
+        ("syskövitz", None),
+        ("zysk", Rejection.TOO_SHORT),
+        ("", Rejection.TOO_SHORT),
+        ("Zyzkowitschowitzky", Rejection.TOO_LONG),
+        ("kononowicz", Rejection.WRONG_START),
+        ("Äyskowicz", Rejection.WRONG_START),
+        ("zysko-wicz", Rejection.INVALID_CHARS),
+        ("zyskowicz\n", Rejection.INVALID_CHARS),
+    ],
+)
+def test_rejection_reason(surname: str, reason: Rejection | None) -> None:
+    """Test that each rule reports its own rejection reason."""
+    assert rejection_reason(surname) == reason
+    assert is_valid_surname(surname) == (reason is None)
+
+
+def test_batch_matches_single_validation() -> None:
+    """Test that the batch API normalises valid names and keeps the rest."""
+    results = validate_batch(CANDIDATES)
+    assert len(results) == len(CANDIDATES)
+    for candidate, (surname, reason) in zip(CANDIDATES, results, strict=True):
+        assert reason == rejection_reason(candidate)
+        assert surname == (candidate.lower() if reason is None else candidate)
+
+
+def test_index_uses_shared_rule(client: FlaskClient) -> None:
+    """Test that the input on the page is validated with the same rule."""
+    response = client.get("/")
+    assert f'pattern="{SURNAME_HTML_PATTERN}"'.encode() in response.data
+    assert b'minlength="6"' in response.data
+    assert b'maxlength="15"' in response.data
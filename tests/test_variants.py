@@ -0,0 +1,140 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the closest-variant index and /api/variants."""
+
+import random
+from http import HTTPStatus
+
+from flask.testing import FlaskClient
+
+from app import get_db, get_storage
+from parse_surnames import MODE_MERGE, ImportDiff, apply_import
+from variants import VariantIndex, damerau_levenshtein
+
+
+def test_distance_allows_edits_of_transposed_letters() -> None:
+    """Test the unrestricted distance, where optimal string alignment gives 3."""
+    distances = {
+        ("zyskowicz", "zyskowicz"): 0,
+        ("zyskowicz", "zsykowicz"): 1,
+        ("zyskowicz", "syskovitch"): 4,
+        ("ca", "abc"): 2,
+        ("", "abc"): 3,
+    }
+    assert {pair: damerau_levenshtein(*pair) for pair in distances} == distances
+
+
+def test_index_matches_a_brute_force_scan() -> None:
+    """Test lookups against every indexed surname compared one by one."""
+    rng = random.Random(1)  # noqa: S311
+    surnames = {"".join(rng.choices("zsyk", k=rng.randint(3, 6))) for _ in range(500)}
+    index = VariantIndex()
+    for surname in surnames:
+        index.add(surname)
+    for query in [*rng.sample(sorted(surnames), 50), "zzzzzzz", "s"]:
+        expected = sorted(
+            (surname, distance)
+            for surname in surnames
+            if surname != query
+            and (distance := damerau_levenshtein(query, surname)) <= 1
+        )
+        assert index.closest(query) == expected
+
+
+def test_widened_lookups_match_a_brute_force_scan() -> None:
+    """Test that too few variants within one edit widens the search to two."""
+    rng = random.Random(2)  # noqa: S311
+    surnames = {"".join(rng.choices("zsykå", k=rng.randint(4, 8))) for _ in range(300)}
+    index = VariantIndex()
+    for surname in surnames:
+        index.add(surname)
+    wanted = 3
+    for query in [*rng.sample(sorted(surnames), 50), "zzzzzzzzz", "kkkå"]:
+        distances = {
+            surname: damerau_levenshtein(query, surname)
+            for surname in surnames
+            if surname != query
+        }
+        near = sum(distance == 1 for distance in distances.values())
+        radius = 1 if near >= wanted else 2
+        expected = sorted(
+            (surname, distance)
+            for surname, distance in distances.items()
+            if distance <= radius
+        )
+        assert index.closest(query, wanted=wanted) == expected
+
+
+def test_refresh_follows_events_and_rebuilds_after_imports(
+    client: FlaskClient,
+) -> None:
+    """Test that guesses are read from the events and imports by a rebuild."""
+    index = VariantIndex()
+    with client.application.app_context():
+        assert [index.refresh(get_storage()) for _ in range(2)] == [2, 0]
+    client.post("/submit", data={"surname": "Zyskowicz"})
+    client.post("/submit", data={"surname": "Zyskowitz"})
+    client.post("/submit", data={"surname": "Zyskowitz"})
+    with client.application.app_context():
+        refreshed = index.refresh(get_storage())
+        assert (refreshed, index.closest("zyskowicz")) == (2, [("zyskowitz", 1)])
+
+        # An import writes no events and may leave the totals as they were
+        db = get_db()
+        diff = ImportDiff(added={"syskowicz": 2}, removed={"zyskowitz": 2})
+        apply_import(
+            db,
+            {"syskowicz": 2},
+            diff,
+            mode=MODE_MERGE,
+            source="test",
+            source_hash=None,
+        )
+        refreshed = index.refresh(get_storage())
+        assert (refreshed, index.stats()["rebuilds"]) == (4, 2)
+        assert index.closest("zyskowicz") == [("syskowicz", 1)]
+
+        # A count rebuild writes no import record, but changes the totals
+        db.execute("DELETE FROM guesses WHERE surname = 'syskowicz'")
+        db.commit()
+        refreshed = index.refresh(get_storage())
+        assert (refreshed, index.closest("zyskowicz")) == (3, [])
+
+
+def test_api_lists_close_variants_most_guessed_first(client: FlaskClient) -> None:
+    """Test that new guesses are found and ranked by count."""
+    with client.application.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO guesses (surname, count) VALUES (?, ?)",
+            [("zyskowicz", 50), ("zyskowitz", 5), ("zyskovicz", 9), ("tsyskowicz", 1)],
+        )
+        db.commit()
+    # Fewer than limit variants are one edit away, so those two away follow
+    assert client.get("/api/variants?surname=zyskowicz").get_json()["variants"] == [
+        {"surname": "zyskovicz", "count": 9, "distance": 1},
+        {"surname": "zyskowitz", "count": 5, "distance": 1},
+        {"surname": "tsyskowicz", "count": 1, "distance": 2},
+    ]
+
+    # A guess submitted since the index was built is picked up
+    client.post("/submit", data={"surname": "Zsykowicz"})
+    data = client.get("/api/variants?surname=ZYSKOWICZ&limit=1").get_json()
+    assert data == {
+        "surname": "zyskowicz",
+        "variants": [{"surname": "zyskovicz", "count": 9, "distance": 1}],
+    }
+    data = client.get("/api/variants?surname=zyskowiczz&limit=4").get_json()
+    assert [variant["surname"] for variant in data["variants"]] == [
+        "zyskowicz",
+        "zyskovicz",
+        "zyskowitz",
+        "zsykowicz",
+    ]
+    data = client.get("/api/variants?surname=zsykowicz").get_json()
+    assert data["variants"][0] == {"surname": "zyskowicz", "count": 50, "distance": 1}
+
+    assert client.get("/api/variants?surname=abc").status_code == HTTPStatus.BAD_REQUEST
+    assert (
+        client.get("/api/variants?surname=zyskowicz&limit=x").status_code
+        == HTTPStatus.BAD_REQUEST
+    )
@@ -0,0 +1,150 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Tests for the write-behind guess counter."""
+
+import sqlite3
+from collections.abc import Generator
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import app
+from write_behind import DURABILITY_NONE, WriteBehindCounter, read_journal
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    """Create a database with the guesses table."""
+    path = tmp_path / "ben.db"
+    conn = sqlite3.connect(path)
+    conn.executescript((Path(__file__).parent.parent / "schema.sql").read_text())
+    conn.execute("INSERT INTO guesses (surname, count) VALUES ('zyskowicz', 10)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def make_counter(db_path: Path, **kwargs: object) -> WriteBehindCounter:
+    """Create a counter whose flusher effectively never runs on its own."""
+    options = {"flush_interval": 3600, "max_pending": 10_000, **kwargs}
+    return WriteBehindCounter(
+        lambda: sqlite3.connect(db_path),
+        db_path.parent / "journal",
+        **options,  # type: ignore[arg-type]
+    )
+
+
+def read_counts(db_path: Path) -> dict[str, int]:
+    """Return all guess counts from the database."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT surname, count FROM guesses").fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def test_flush_aggregates_deltas(db_path: Path) -> None:
+    """Test that buffered guesses are written in one aggregated flush."""
+    counter = make_counter(db_path)
+    for _ in range(5):
+        counter.add("zyskowicz")
+    counter.add("syskowicz")
+    counter.add("syskowicz")
+
+    assert (counter.pending(), counter.pending("syskowicz")) == (7, 2)
+    assert read_counts(db_path) == {"zyskowicz": 10}
+
+    flushed = counter.flush()
+    assert (flushed, counter.pending()) == (7, 0)
+    assert read_counts(db_path) == {"zyskowicz": 15, "syskowicz": 2}
+    assert not list((db_path.parent / "journal").glob("*.journal"))
+    counter.close()
+
+
+def test_size_threshold_triggers_flush(db_path: Path) -> None:
+    """Test that hitting the size threshold wakes the background flusher."""
+    counter = make_counter(db_path, max_pending=3)
+    for _ in range(3):
+        counter.add("zyskowicz")
+    counter.close()
+    assert read_counts(db_path) == {"zyskowicz": 13}
+
+
+def test_recover_replays_abandoned_journal(db_path: Path) -> None:
+    """Test that deltas journaled by a crashed process are recovered once."""
+    journal_dir = db_path.parent / "journal"
+    journal_dir.mkdir()
+    # A torn last line must be ignored
+    segment = journal_dir / "write-behind-1-1.journal"
+    segment.write_text("zyskowicz\t1\nsyskowicz\t1\nzyskowicz\t1\nsys")
+
+    counter = make_counter(db_path)
+    recovered = counter.recover()
+    assert (recovered, read_counts(db_path)) == (3, {"zyskowicz": 12, "syskowicz": 1})
+    assert not segment.exists()
+
+    assert counter.recover() == 0
+    assert read_counts(db_path) == {"zyskowicz": 12, "syskowicz": 1}
+
+
+def test_recover_skips_already_applied_segment(db_path: Path) -> None:
+    """Test that a segment committed before a crash is not applied twice."""
+    journal_dir = db_path.parent / "journal"
+    journal_dir.mkdir()
+    segment = journal_dir / "write-behind-1-2.journal"
+    segment.write_text("zyskowicz\t5\n")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO write_behind_segments (segment, applied_at) VALUES (?, 0)",
+        (segment.name,),
+    )
+    conn.commit()
+    conn.close()
+
+    assert make_counter(db_path).recover() == 0
+    assert read_counts(db_path) == {"zyskowicz": 10}
+    assert not segment.exists()
+
+
+def test_no_journal_without_durability(db_path: Path) -> None:
+    """Test that durability level 'none' does not write a journal."""
+    counter = make_counter(db_path, durability=DURABILITY_NONE)
+    counter.add("zyskowicz")
+    assert not (db_path.parent / "journal").exists()
+    counter.close()
+    assert read_counts(db_path) == {"zyskowicz": 11}
+
+
+def test_read_journal_ignores_garbage() -> None:
+    """Test that malformed journal lines are skipped."""
+    lines = ["zyskowicz\t1\n", "broken\n", "zyskowicz\t2\n"]
+    assert read_journal(lines) == {"zyskowicz": 3}
+
+
+@pytest.fixture
+def write_behind_client(
+    client: FlaskClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Generator[FlaskClient]:
+    """Enable write-behind mode for the test client."""
+    monkeypatch.setenv("WRITE_BEHIND", "1")
+    monkeypatch.setenv("WRITE_BEHIND_INTERVAL", "3600")
+    yield client
+    counter = app.extensions.pop("write_behind", None)
+    if counter is not None:
+        counter.close()
+
+
+def test_submit_is_buffered_and_visible_on_results(
+    write_behind_client: FlaskClient,
+) -> None:
+    """Test that a buffered guess is flushed before it is highlighted."""
+    response = write_behind_client.post("/submit", data={"surname": "Zyskowiczz"})
+    assert response.status_code == HTTPStatus.FOUND
+    assert app.extensions["write_behind"].pending("zyskowiczz") == 1
+
+    response = write_behind_client.get(response.location)
+    assert response.status_code == HTTPStatus.OK
+    assert b'id="guess-zyskowiczz"' in response.data
+    assert app.extensions["write_behind"].pending() == 0
@@ -0,0 +1,84 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Surname validation shared by the web app and the surname importer.
+
+The rules are based on the real Lintukoto submissions:
+
+- Must start with 'z', 's', 't', or 'c' (covers ~99.6% of valid submissions)
+- Length 6-15 characters (filters out obvious test words)
+- Only letters (including Nordic letters and accented y)
+
+All rules are compiled into a single regular expression, so a valid
+surname is accepted with one match. The reason for a rejection is only
+worked out for candidates that fail it.
+"""
+
+import re
+from collections.abc import Iterable
+from enum import StrEnum
+
+MIN_SURNAME_LENGTH = 6
+MAX_SURNAME_LENGTH = 15
+VALID_STARTING_LETTERS = ("z", "s", "t", "c")
+SURNAME_LETTERS = "a-zA-ZäöåÄÖÅüÜýÝÿŸ"
+
+_STARTING_LETTERS = "".join(VALID_STARTING_LETTERS)
+_RULE = (
+    f"[{_STARTING_LETTERS}{_STARTING_LETTERS.upper()}]"
+    f"[{SURNAME_LETTERS}]{{{MIN_SURNAME_LENGTH - 1},{MAX_SURNAME_LENGTH - 1}}}"
+)
+SURNAME_PATTERN = re.compile(_RULE)
+
+# The same rule for the pattern attribute of the HTML input
+SURNAME_HTML_PATTERN = f"^{_RULE}$"
+
+
+class Rejection(StrEnum):
+    """Why a candidate is not a valid surname, in order of precedence."""
+
+    TOO_SHORT = "too_short"
+    TOO_LONG = "too_long"
+    WRONG_START = "wrong_start"
+    INVALID_CHARS = "invalid_chars"
+
+
+def rejection_reason(surname: str) -> Rejection | None:
+    """Return why the surname is rejected, or None if it is valid."""
+    if SURNAME_PATTERN.fullmatch(surname):
+        return None
+    return _classify(surname)
+
+
+def is_valid_surname(surname: str) -> bool:
+    """Return True if the surname passes every validation rule."""
+    return SURNAME_PATTERN.fullmatch(surname) is not None
+
+
+def normalize_surname(surname: str) -> str:
+    """Return the form surnames are stored in."""
+    return surname.lower()
+
+
+def validate_batch(candidates: Iterable[str]) -> list[tuple[str, Rejection | None]]:
+    """Validate and normalise many candidates in one pass.
+
+    Returns a (surname, reason) pair for every candidate, in order: the
+    normalised surname and None if it is valid, otherwise the candidate as
+    given and its rejection reason.
+    """
+    match = SURNAME_PATTERN.fullmatch
+    return [
+        (candidate.lower(), None)
+        if match(candidate)
+        else (candidate, _classify(candidate))
+        for candidate in candidates
+    ]
+
+
+def _classify(surname: str) -> Rejection:
+    if len(surname) < MIN_SURNAME_LENGTH:
+        return Rejection.TOO_SHORT
+    if len(surname) > MAX_SURNAME_LENGTH:
+        return Rejection.TOO_LONG
+    if not surname.lower().startswith(VALID_STARTING_LETTERS):
+        return Rejection.WRONG_START
+    return Rejection.INVALID_CHARS
@@ -0,0 +1,302 @@
+# Copyright (c) 2025 Jaakko Vuori
+"""Write-behind aggregation of guess counts.
+
+Guesses are buffered in memory as per-surname deltas and written to SQLite
+in a single upsert transaction, either periodically or once enough deltas
+have accumulated. Buffered deltas are also appended to a local journal so
+that they survive a crash of the process.
+
+Journal segments are named after the process that wrote them and are held
+under an exclusive ``flock`` while in use, so that recovery only replays
+segments whose writer is gone. Every flush records the segment name in the
+``write_behind_segments`` table in the same transaction as the counts,
+which makes replaying a segment idempotent.
+"""
+
+import atexit
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import TextIO
+
+from history import record
+from leaderboard import UPSERT_SQL
+from live_updates import publish
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_NONE = "none"  # No journal: a crash loses up to one flush interval
+DURABILITY_FLUSH = "flush"  # Journal reaches the OS: survives process crashes
+DURABILITY_FSYNC = "fsync"  # Journal is fsynced: survives power loss
+DURABILITY_LEVELS = (DURABILITY_NONE, DURABILITY_FLUSH, DURABILITY_FSYNC)
+
+JOURNAL_SUFFIX = ".journal"
+
+SEGMENTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS write_behind_segments (
+        segment TEXT PRIMARY KEY,
+        applied_at REAL NOT NULL
+    )
+"""
+
+
+def apply_deltas(
+    db: sqlite3.Connection,
+    deltas: dict[str, int],
+    segments: Iterable[str] = (),
+) -> None:
+    """Apply surname deltas in one transaction, marking journal segments.
+
+    The deltas are published to the live leaderboard stream and recorded
+    in the hourly history as well.
+    """
+    now = time.time()
+    with db:
+        db.executemany(UPSERT_SQL, deltas.items())
+        publish(db, deltas)
+        record(db, deltas, now)
+        db.executemany(
+            "INSERT OR IGNORE INTO write_behind_segments (segment, applied_at) "
+            "VALUES (?, ?)",
+            [(segment, now) for segment in segments],
+        )
+
+
+def read_journal(lines: Iterable[str]) -> dict[str, int]:
+    """Aggregate journal lines of the form ``surname<TAB>delta``.
+
+    A torn last line, left behind by a crash in the middle of a write, is
+    ignored.
+    """
+    deltas: dict[str, int] = {}
+    for line in lines:
+        if not line.endswith("\n"):
+            break
+        surname, _, delta = line.rstrip("\n").partition("\t")
+        try:
+            deltas[surname] = deltas.get(surname, 0) + int(delta)
+        except ValueError:
+            continue
+    return deltas
+
+
+class WriteBehindCounter:
+    """Buffer guess increments and flush them to SQLite in batches."""
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        journal_dir: Path,
+        *,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+        durability: str = DURABILITY_FLUSH,
+    ) -> None:
+        """Create the counter; guesses are journaled in journal_dir."""
+        if durability not in DURABILITY_LEVELS:
+            msg = f"Unknown durability level {durability!r}"
+            raise ValueError(msg)
+        self.connect = connect
+        self.journal_dir = Path(journal_dir)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.durability = durability
+
+        self._buffer: dict[str, int] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._pid = os.getpid()
+        self._thread: threading.Thread | None = None
+        self._journal: TextIO | None = None
+        self._segment: str | None = None
+        # Segments whose deltas are buffered but not yet committed
+        self._sealed: list[tuple[TextIO, str]] = []
+
+        self.flushes = 0
+        self.flushed_guesses = 0
+
+    @property
+    def journaled(self) -> bool:
+        return self.durability != DURABILITY_NONE
+
+    def add(self, surname: str, delta: int = 1) -> None:
+        """Buffer a guess; wakes the flusher once the size threshold is hit."""
+        self._ensure_started()
+        with self._lock:
+            if self.journaled:
+                journal = self._journal or self._open_segment()
+                journal.write(f"{surname}\t{delta}\n")
+                journal.flush()
+                if self.durability == DURABILITY_FSYNC:
+                    os.fsync(journal.fileno())
+            self._buffer[surname] = self._buffer.get(surname, 0) + delta
+            self._pending += delta
+            threshold_hit = self._pending >= self.max_pending
+        if threshold_hit:
+            self._wakeup.set()
+
+    def pending(self, surname: str | None = None) -> int:
+        """Return buffered guesses, in total or for a single surname."""
+        with self._lock:
+            if surname is None:
+                return self._pending
+            return self._buffer.get(surname, 0)
+
+    def flush(self) -> int:
+        """Write all buffered deltas in one transaction and return the count."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                batch, self._buffer = self._buffer, {}
+                flushed, self._pending = self._pending, 0
+                if self._journal is not None and self._segment is not None:
+                    self._sealed.append((self._journal, self._segment))
+                    self._journal = self._segment = None
+                sealed, self._sealed = self._sealed, []
+
+            db = self.connect()
+            try:
+                if sealed:
+                    db.execute(SEGMENTS_TABLE_SQL)
+                apply_deltas(db, batch, [segment for _, segment in sealed])
+            except sqlite3.Error:
+                # Put the batch back so it is retried on the next flush. The
+                # sealed segments stay open and locked until they are applied.
+                logger.exception("Write-behind flush failed, will retry")
+                with self._lock:
+                    for surname, delta in batch.items():
+                        self._buffer[surname] = self._buffer.get(surname, 0) + delta
+                    self._pending += flushed
+                    self._sealed[:0] = sealed
+                db.close()
+                return 0
+
+            for journal, segment in sealed:
+                self._discard_segment(db, journal, segment)
+            db.close()
+
+            self.flushes += 1
+            self.flushed_guesses += flushed
+            return flushed
+
+    def recover(self) -> int:
+        """Replay journal segments left behind by processes that are gone."""
+        if not self.journal_dir.exists():
+            return 0
+        recovered = 0
+        for path in sorted(self.journal_dir.glob(f"*{JOURNAL_SUFFIX}")):
+            if path.name == self._segment or any(
+                path.name == segment for _, segment in self._sealed
+            ):
+                continue
+            try:
+                journal = path.open("r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another live process is still appending to this segment
+                journal.close()
+                continue
+
+            deltas = read_journal(journal)
+            db = self.connect()
+            db.execute(SEGMENTS_TABLE_SQL)
+            already_applied = db.execute(
+                "SELECT 1 FROM write_behind_segments WHERE segment = ?",
+                (path.name,),
+            ).fetchone()
+            if deltas and not already_applied:
+                apply_deltas(db, deltas, [path.name])
+                recovered += sum(deltas.values())
+            self._discard_segment(db, journal, path.name)
+            db.close()
+
+        if recovered:
+            logger.info("Recovered %d buffered guesses from journal", recovered)
+        return recovered
+
+    def close(self) -> None:
+        """Stop the background flusher and write out anything still buffered."""
+        self._closed = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.flush_interval, 1.0) * 2)
+        self.flush()
+
+    def _ensure_started(self) -> None:
+        if self._pid != os.getpid():
+            # We were forked: the buffer, journal and flusher thread belong to
+            # the parent process.
+            self._reset_after_fork()
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is not None and self._thread.is_alive():
+                    return
+                self._closed = False
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="write-behind-flusher",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._buffer = {}
+        self._pending = 0
+        self._journal = None
+        self._segment = None
+        self._sealed = []
+        self._thread = None
+        self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Unexpected error in write-behind flusher")
+
+    def _open_segment(self) -> TextIO:
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        segment = f"write-behind-{os.getpid()}-{time.time_ns()}{JOURNAL_SUFFIX}"
+        journal = (self.journal_dir / segment).open("a", encoding="utf-8")
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        self._journal, self._segment = journal, segment
+        return journal
+
+    def _discard_segment(
+        self,
+        db: sqlite3.Connection,
+        journal: TextIO,
+        segment: str,
+    ) -> None:
+        (self.journal_dir / segment).unlink(missing_ok=True)
+        journal.close()
+        # The marker row is only needed while the segment file exists
+        with db:
+            db.execute(
+                "DELETE FROM write_behind_segments WHERE segment = ?",
+                (segment,),
+            )
+
+
+def register_shutdown_flush(counter: WriteBehindCounter) -> None:
+    """Flush the counter when the interpreter exits normally."""
+    atexit.register(counter.close)